@@ -0,0 +1,213 @@
+# نظام الإدارة الطبية المتكامل - المصادقة الموحدة
+# Medical Management System - Unified authentication dependencies
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import jwt
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from database import get_database
+
+# JWT Configuration (same secret as server.py)
+JWT_SECRET_KEY = "your-secret-key-change-in-production"
+JWT_ALGORITHM = "HS256"
+JWT_EXPIRATION_HOURS = 24
+
+security = HTTPBearer()
+
+
+def decode_jwt_token(token: str) -> dict:
+    """التحقق من JWT token وفك تشفيره"""
+    try:
+        return jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+class PrincipalCache:
+    """ذاكرة مؤقتة للمستخدمين المصادق عليهم - Bounded TTL/LRU cache of principals keyed by token
+
+    The cache is per process. Invalidation only reaches the local worker, so the
+    TTL is what bounds staleness across workers.
+
+    The claims path never reads the whole user. It checks the user's token
+    status instead: is_active and tokens_valid_after, kept on the user document
+    so every worker sees them. The status is cached per user for
+    status_ttl_seconds, which bounds how long another worker keeps accepting a
+    deactivated or demoted user.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: int = 60, status_ttl_seconds: int = 5):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.status_ttl_seconds = status_ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[str, set] = {}
+        # user_id -> (status, expires_at) - status is None for users that no longer exist
+        self._statuses: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._discard(token)
+            return None
+        self._entries.move_to_end(token)
+        return principal
+
+    def put(self, token: str, principal: dict, token_exp: Optional[float] = None):
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            # لا نحتفظ بالمستخدم بعد انتهاء صلاحية التوكن
+            ttl = min(ttl, max(0.0, token_exp - time.time()))
+        if ttl <= 0:
+            return
+        self._discard(token)
+        self._entries[token] = (principal, time.monotonic() + ttl)
+        self._tokens_by_user.setdefault(principal.get("id"), set()).add(token)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+
+    def get_status(self, user_id: str) -> Optional[tuple]:
+        """حالة التوكنات المخزنة - (status,) while fresh, None when it must be read again"""
+        entry = self._statuses.get(user_id)
+        if entry is None:
+            return None
+        status, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._statuses[user_id]
+            return None
+        return (status,)
+
+    def put_status(self, user_id: str, status: Optional[dict]):
+        self._statuses.pop(user_id, None)
+        self._statuses[user_id] = (status, time.monotonic() + self.status_ttl_seconds)
+        while len(self._statuses) > self.max_size:
+            self._statuses.popitem(last=False)
+
+    def invalidate_user(self, user_id: str):
+        """إلغاء المستخدم من الذاكرة المؤقتة عند تعديله أو إيقافه"""
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._discard(token)
+        self._statuses.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+        self._statuses.clear()
+
+    def _discard(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[0].get("id")
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+principal_cache = PrincipalCache(
+    max_size=int(os.environ.get('AUTH_CACHE_MAX_SIZE', '10000')),
+    ttl_seconds=int(os.environ.get('AUTH_CACHE_TTL_SECONDS', '60')),
+    status_ttl_seconds=int(os.environ.get('AUTH_STATUS_TTL_SECONDS', '5'))
+)
+
+
+async def invalidate_user(db: AsyncIOMotorDatabase, user_id: str, revoke: bool = False, expire_tokens: bool = False):
+    """يُستدعى عند تغيير دور المستخدم أو إيقافه أو حذفه
+
+    revoke / expire_tokens: the user was deactivated or their role changed -
+    tokens issued before now carry the old role and are refused on the claims
+    path of every worker (users.tokens_valid_after), until the user logs in again.
+    """
+    if revoke or expire_tokens:
+        await db.users.update_one({"id": user_id}, {"$set": {"tokens_valid_after": int(time.time())}})
+    principal_cache.invalidate_user(user_id)
+
+
+async def _token_status(db: AsyncIOMotorDatabase, user_id: str) -> Optional[dict]:
+    """is_active و tokens_valid_after للمستخدم - None when the user no longer exists"""
+    cached = principal_cache.get_status(user_id)
+    if cached is not None:
+        return cached[0]
+    status = await db.users.find_one({"id": user_id}, {"_id": 0, "is_active": 1, "tokens_valid_after": 1})
+    principal_cache.put_status(user_id, status)
+    return status
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+) -> dict:
+    """الحصول على المستخدم الحالي من قاعدة البيانات مع ذاكرة مؤقتة - Current user document (cached)"""
+    if not credentials:
+        raise HTTPException(status_code=401, detail="Missing authorization header")
+
+    token = credentials.credentials
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return dict(principal)
+
+    payload = decode_jwt_token(token)
+    user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0, "password_hash": 0, "password": 0})
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    if not user.get("is_active", True):
+        raise HTTPException(status_code=401, detail="Account is deactivated")
+
+    user["user_id"] = user["id"]
+    principal_cache.put(token, user, payload.get("exp"))
+    return dict(user)
+
+
+async def get_current_user_claims(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+) -> dict:
+    """المسار السريع - Trust the signed token claims, checking only the user's token status
+
+    Use on endpoints that only need id/username/role. Instead of the whole user
+    it reads is_active and tokens_valid_after, cached for a few seconds
+    (AUTH_STATUS_TTL_SECONDS): a deactivated user, and tokens issued before a
+    role change, are refused on every worker within that time.
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="Missing authorization header")
+
+    token = credentials.credentials
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return dict(principal)
+
+    payload = decode_jwt_token(token)
+    user_id = payload.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    status = await _token_status(db, user_id)
+    if status is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    if not status.get("is_active", True):
+        raise HTTPException(status_code=401, detail="Account is deactivated")
+    # التوكنات لا تحمل iat - وقت الإصدار من وقت الانتهاء
+    issued_at = payload.get("iat") or payload.get("exp", 0) - JWT_EXPIRATION_HOURS * 3600
+    if issued_at < status.get("tokens_valid_after", 0):
+        raise HTTPException(status_code=401, detail="Role changed, please login again")
+
+    return {
+        "id": user_id,
+        "user_id": user_id,
+        "username": payload.get("username"),
+        "role": payload.get("role"),
+        "full_name": payload.get("full_name", "")
+    }
@@ -0,0 +1,72 @@
+# نظام الإدارة الطبية المتكامل - اتصال قاعدة البيانات المشترك
+# Medical Management System - Shared MongoDB connection
+
+import os
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+
+class MongoSettings:
+    """إعدادات اتصال MongoDB - MongoDB connection settings (from environment)"""
+
+    def __init__(self):
+        self.url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+        self.db_name = os.environ.get('DB_NAME', 'test_database')
+        self.max_pool_size = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+        self.min_pool_size = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+        self.max_idle_time_ms = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+        self.server_selection_timeout_ms = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+        self.connect_timeout_ms = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+        self.socket_timeout_ms = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '30000'))
+        self.wait_queue_timeout_ms = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000'))
+        self.read_preference = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+
+    def client_options(self) -> dict:
+        return {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "maxIdleTimeMS": self.max_idle_time_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "readPreference": self.read_preference,
+        }
+
+
+_client: Optional[AsyncIOMotorClient] = None
+_settings: Optional[MongoSettings] = None
+
+
+def get_client() -> AsyncIOMotorClient:
+    """العميل المشترك لكل العمليات - Process-wide Motor client (created lazily)"""
+    global _client, _settings
+    if _client is None:
+        _settings = MongoSettings()
+        _client = AsyncIOMotorClient(_settings.url, **_settings.client_options())
+    return _client
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    """تبعية FastAPI لقاعدة البيانات - FastAPI dependency returning the shared database"""
+    client = get_client()
+    return client[_settings.db_name]
+
+
+async def connect_to_mongo():
+    """فتح الاتصال عند بدء التطبيق - Open the pool and verify the server on startup"""
+    client = get_client()
+    try:
+        await client.admin.command("ping")
+        print(f"✅ MongoDB connected (pool size: {_settings.max_pool_size}, read preference: {_settings.read_preference})")
+    except Exception as e:
+        # لا نوقف التطبيق - Motor يعيد المحاولة عند أول استعلام
+        print(f"⚠️ MongoDB ping failed on startup: {str(e)}")
+
+
+async def close_mongo_connection():
+    """إغلاق الاتصال عند إيقاف التطبيق - Close the pool on shutdown"""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# نظام الإدارة الطبية المتكامل - سجل الفهارس
+# Medical Management System - Declarative index registry
+#
+# Applied idempotently at startup (see server.py lifespan). Run directly to
+# inspect or apply changes:
+#
+#   python indexes.py --dry-run          # show what would be created
+#   python indexes.py                    # create missing indexes
+#   python indexes.py --report-unused    # also list indexes never used since restart
+
+import argparse
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import IndexModel, ASCENDING, DESCENDING, GEOSPHERE
+
+
+class IndexSpec:
+    """تعريف فهرس - A single index definition"""
+
+    def __init__(self, keys: List[Tuple[str, int]], unique: bool = False, sparse: bool = False,
+                 name: Optional[str] = None, **options):
+        self.keys = keys
+        self.unique = unique
+        self.sparse = sparse
+        self.name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        self.options = options
+
+    def key_signature(self) -> tuple:
+        return tuple((field, direction) for field, direction in self.keys)
+
+    def to_index_model(self) -> IndexModel:
+        kwargs = dict(self.options)
+        if self.unique:
+            kwargs["unique"] = True
+        if self.sparse:
+            kwargs["sparse"] = True
+        return IndexModel(self.keys, name=self.name, **kwargs)
+
+    def describe(self) -> str:
+        flags = [flag for flag, enabled in (("unique", self.unique), ("sparse", self.sparse)) if enabled]
+        return f"{self.name}" + (f" ({', '.join(flags)})" if flags else "")
+
+
+# ============================================================================
+# INDEX REGISTRY - سجل الفهارس لكل مجموعة
+# ============================================================================
+
+INDEX_REGISTRY: Dict[str, List[IndexSpec]] = {
+    "users": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("username", ASCENDING)]),
+        IndexSpec([("role", ASCENDING), ("is_active", ASCENDING)]),
+        IndexSpec([("manager_id", ASCENDING)]),
+    ],
+    "clinics": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("assigned_rep_id", ASCENDING)]),
+        IndexSpec([("is_active", ASCENDING)]),
+        IndexSpec([("name", ASCENDING), ("phone", ASCENDING)]),
+        IndexSpec([("geo_location", GEOSPHERE)]),
+    ],
+    "enhanced_clinics": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("line_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexSpec([("status", ASCENDING), ("is_active", ASCENDING), ("created_at", DESCENDING)]),
+        IndexSpec([("assigned_rep_id", ASCENDING)]),
+        IndexSpec([("geo_location", GEOSPHERE)]),
+    ],
+    "visits": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("sales_rep_id", ASCENDING), ("date", DESCENDING)]),
+        IndexSpec([("date", DESCENDING)]),
+        IndexSpec([("created_at", DESCENDING)]),
+    ],
+    "rep_visits": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("clinic_id", ASCENDING), ("medical_rep_id", ASCENDING), ("status", ASCENDING)]),
+        IndexSpec([("medical_rep_id", ASCENDING), ("scheduled_date", ASCENDING)]),
+        # ترقيم بالمؤشر - keyset pagination sorts end with _id
+        IndexSpec([("visit_date", DESCENDING), ("_id", DESCENDING)]),
+        IndexSpec([("representative_id", ASCENDING), ("visit_date", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "notifications": [
+        IndexSpec([("recipient_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)]),
+        IndexSpec([("recipient_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexSpec([("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "notification_counters": [
+        IndexSpec([("user_id", ASCENDING)], unique=True),
+    ],
+    "activities": [
+        IndexSpec([("timestamp", DESCENDING)]),
+        IndexSpec([("user_id", ASCENDING), ("timestamp", DESCENDING)]),
+    ],
+    "login_logs": [
+        IndexSpec([("username", ASCENDING)]),
+        IndexSpec([("login_time", DESCENDING)]),
+    ],
+    "admin_registration_logs": [
+        IndexSpec([("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexSpec([("clinic_id", ASCENDING)]),
+    ],
+    "orders": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("medical_rep_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexSpec([("status", ASCENDING)]),
+        IndexSpec([("created_at", DESCENDING)]),
+        IndexSpec([("order_number", ASCENDING)], sparse=True),
+    ],
+    "products": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("is_active", ASCENDING)]),
+    ],
+    "invoices": [
+        IndexSpec([("invoice_number", ASCENDING)], unique=True, sparse=True),
+        IndexSpec([("clinic_id", ASCENDING)]),
+        IndexSpec([("sales_rep_id", ASCENDING)]),
+        IndexSpec([("status", ASCENDING)]),
+        IndexSpec([("issue_date", DESCENDING)]),
+        IndexSpec([("due_date", ASCENDING)]),
+        IndexSpec([("invoice_date", DESCENDING), ("_id", DESCENDING)]),
+        IndexSpec([("sales_rep_id", ASCENDING), ("invoice_date", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "debts": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("debt_number", ASCENDING)], unique=True, sparse=True),
+        IndexSpec([("clinic_id", ASCENDING)]),
+        IndexSpec([("sales_rep_id", ASCENDING)]),
+        IndexSpec([("status", ASCENDING), ("due_date", ASCENDING)]),
+        IndexSpec([("invoice_id", ASCENDING)]),
+        IndexSpec([("original_due_date", ASCENDING)]),
+        IndexSpec([("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    # ديون المناديب - routes/debt_routes.py (services/debt_repository.py)
+    "rep_debts": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("medical_rep_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexSpec([("clinic_id", ASCENDING)]),
+        IndexSpec([("status", ASCENDING)]),
+        IndexSpec([("priority", ASCENDING)]),
+        IndexSpec([("created_at", DESCENDING)]),
+    ],
+    "rep_debt_collections": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("debt_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexSpec([("medical_rep_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexSpec([("collection_status", ASCENDING)]),
+        IndexSpec([("created_at", DESCENDING)]),
+    ],
+    "payments": [
+        IndexSpec([("payment_number", ASCENDING)], unique=True, sparse=True),
+        IndexSpec([("debt_id", ASCENDING)]),
+        IndexSpec([("idempotency_key", ASCENDING)], unique=True, sparse=True),
+        IndexSpec([("payment_date", DESCENDING)]),
+        IndexSpec([("status", ASCENDING)]),
+    ],
+    "financial_transactions": [
+        IndexSpec([("transaction_number", ASCENDING)], unique=True, sparse=True),
+        IndexSpec([("transaction_type", ASCENDING)]),
+        IndexSpec([("transaction_date", DESCENDING)]),
+        IndexSpec([("invoice_id", ASCENDING)]),
+        IndexSpec([("debt_id", ASCENDING)]),
+    ],
+    "unified_financial_records": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("record_type", ASCENDING), ("status", ASCENDING)]),
+        IndexSpec([("clinic_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexSpec([("created_at", DESCENDING)]),
+        IndexSpec([("issue_date", ASCENDING)]),
+    ],
+    "rep_clinic_roster": [
+        IndexSpec([("rep_id", ASCENDING), ("source", ASCENDING), ("clinic_id", ASCENDING)], unique=True),
+        IndexSpec([("rep_id", ASCENDING), ("version", ASCENDING)]),
+        IndexSpec([("clinic_id", ASCENDING), ("source", ASCENDING)]),
+    ],
+    "rep_clinic_roster_state": [
+        IndexSpec([("rep_id", ASCENDING)], unique=True),
+    ],
+    "gps_daily_trails": [
+        IndexSpec([("user_id", ASCENDING), ("day", ASCENDING)], unique=True),
+        IndexSpec([("day", ASCENDING)]),
+    ],
+    "client_profiles": [
+        IndexSpec([("updated_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexSpec([("assigned_rep_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "import_jobs": [
+        IndexSpec([("id", ASCENDING)]),
+        IndexSpec([("created_at", DESCENDING)]),
+    ],
+    "document_sequences": [
+        IndexSpec([("document_type", ASCENDING)], unique=True),
+    ],
+    "job_runs": [
+        IndexSpec([("job", ASCENDING)], unique=True),
+    ],
+    "integrity_runs": [
+        IndexSpec([("id", ASCENDING)], unique=True),
+        IndexSpec([("status", ASCENDING), ("started_at", DESCENDING)]),
+        IndexSpec([("started_at", DESCENDING)]),
+        # تشغيل واحد فقط قيد العمل
+        IndexSpec([("status", ASCENDING)], unique=True, name="one_running_run",
+                  partialFilterExpression={"status": "running"}),
+    ],
+    "integrity_reports": [
+        IndexSpec([("run_id", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "financial_daily_rollups": [
+        IndexSpec([("day", ASCENDING), ("clinic_id", ASCENDING), ("sales_rep_id", ASCENDING),
+                   ("record_type", ASCENDING), ("status", ASCENDING)], unique=True),
+        IndexSpec([("clinic_id", ASCENDING), ("day", ASCENDING)]),
+        IndexSpec([("sales_rep_id", ASCENDING), ("day", ASCENDING)]),
+    ],
+}
+
+
+def register_indexes(collection: str, specs: List[IndexSpec]):
+    """إضافة فهارس للسجل من وحدات أخرى - Register indexes owned by another module"""
+    existing = {spec.key_signature() for spec in INDEX_REGISTRY.setdefault(collection, [])}
+    for spec in specs:
+        if spec.key_signature() not in existing:
+            INDEX_REGISTRY[collection].append(spec)
+
+
+async def _existing_indexes(db: AsyncIOMotorDatabase, collection: str) -> Dict[tuple, str]:
+    """الفهارس الموجودة حسب المفاتيح - Existing indexes keyed by their key pattern"""
+    info = await db[collection].index_information()
+    return {tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                  for field, direction in details["key"]): name
+            for name, details in info.items()}
+
+
+async def _index_usage(db: AsyncIOMotorDatabase, collection: str) -> Dict[str, int]:
+    """عدد مرات استخدام كل فهرس منذ آخر تشغيل للخادم - $indexStats access counts"""
+    usage = {}
+    async for stat in db[collection].aggregate([{"$indexStats": {}}]):
+        usage[stat["name"]] = stat.get("accesses", {}).get("ops", 0)
+    return usage
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase, dry_run: bool = False,
+                         report_unused: bool = False) -> Dict[str, dict]:
+    """تطبيق سجل الفهارس - Create missing indexes and report on the rest
+
+    Indexes are matched by key pattern, so an existing index with the same keys
+    (even under a different name or options) counts as present and is left alone.
+    """
+    collection_names = set(await db.list_collection_names())
+    report: Dict[str, dict] = {}
+
+    for collection, specs in INDEX_REGISTRY.items():
+        existing = await _existing_indexes(db, collection) if collection in collection_names else {}
+        missing = [spec for spec in specs if spec.key_signature() not in existing]
+        registered = {spec.key_signature() for spec in specs}
+        unmanaged = [name for keys, name in existing.items()
+                     if keys not in registered and name != "_id_"]
+
+        entry = {
+            "present": len(specs) - len(missing),
+            "missing": [spec.describe() for spec in missing],
+            "created": [],
+            "failed": {},
+            "unmanaged": unmanaged,
+        }
+
+        if missing and not dry_run:
+            for spec in missing:
+                try:
+                    await db[collection].create_indexes([spec.to_index_model()])
+                    entry["created"].append(spec.name)
+                except Exception as e:
+                    # بيانات مكررة أو تعارض في الخيارات - لا نوقف التشغيل
+                    entry["failed"][spec.name] = str(e)
+
+        if report_unused and collection in collection_names:
+            try:
+                usage = await _index_usage(db, collection)
+                entry["unused"] = [name for name, ops in usage.items() if ops == 0 and name != "_id_"]
+            except Exception as e:
+                entry["unused_error"] = str(e)
+
+        report[collection] = entry
+
+    return report
+
+
+def print_index_report(report: Dict[str, dict], dry_run: bool = False):
+    total_missing = sum(len(entry["missing"]) for entry in report.values())
+    total_created = sum(len(entry["created"]) for entry in report.values())
+    total_failed = sum(len(entry["failed"]) for entry in report.values())
+
+    for collection, entry in sorted(report.items()):
+        if not (entry["missing"] or entry["unmanaged"] or entry.get("unused") or entry["failed"]):
+            continue
+        print(f"📦 {collection}")
+        for name in entry["missing"]:
+            action = "would create" if dry_run else ("created" if name.split(" ")[0] in entry["created"] else "missing")
+            print(f"   ➕ {action}: {name}")
+        for name, error in entry["failed"].items():
+            print(f"   ❌ failed: {name} - {error}")
+        for name in entry["unmanaged"]:
+            print(f"   ❔ not in registry: {name}")
+        for name in entry.get("unused", []):
+            print(f"   💤 unused since restart: {name}")
+
+    if dry_run:
+        print(f"🔍 Dry run: {total_missing} missing index(es), nothing changed")
+    else:
+        print(f"✅ Indexes ensured: {total_created} created, {total_failed} failed")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Apply the MongoDB index registry")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without creating indexes")
+    parser.add_argument("--report-unused", action="store_true", help="list indexes with no accesses ($indexStats)")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    from database import get_database, close_mongo_connection
+
+    try:
+        report = await ensure_indexes(get_database(), dry_run=args.dry_run, report_unused=args.report_unused)
+        print_index_report(report, dry_run=args.dry_run)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
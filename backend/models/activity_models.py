@@ -115,4 +115,21 @@ class GPSTrackingLog(BaseModel):
     duration_at_location: Optional[int] = Field(None, description="مدة البقاء بالموقع بالدقائق")
     nearby_clinics: Optional[List[Dict[str, Any]]] = Field(None, description="العيادات القريبة")
     weather_data: Optional[Dict[str, Any]] = Field(None, description="بيانات الطقس")
-    created_at: datetime = Field(default_factory=datetime.utcnow, description="وقت الإنشاء")
\ No newline at end of file
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="وقت الإنشاء")
+
+
+class GPSPoint(BaseModel):
+    """نقطة GPS واحدة من الجهاز"""
+    latitude: float = Field(..., ge=-90, le=90, description="خط العرض")
+    longitude: float = Field(..., ge=-180, le=180, description="خط الطول")
+    accuracy: Optional[float] = Field(None, ge=0, description="دقة الموقع بالمتر")
+    altitude: Optional[float] = Field(None, description="الارتفاع")
+    speed: Optional[float] = Field(None, ge=0, description="السرعة م/ث")
+    heading: Optional[float] = Field(None, ge=0, le=360, description="الاتجاه")
+    timestamp: Optional[datetime] = Field(None, description="وقت القراءة على الجهاز (UTC)")
+    activity_id: Optional[str] = Field(None, description="معرف النشاط المرتبط")
+
+
+class GPSBatchRequest(BaseModel):
+    """دفعة نقاط GPS - يرسلها التطبيق كل عدة دقائق أو عند عودة الاتصال"""
+    points: List[GPSPoint] = Field(..., min_length=1, max_length=1000, description="النقاط بأي ترتيب")
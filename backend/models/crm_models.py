@@ -278,4 +278,6 @@ class ClientSearchFilter(BaseModel):
     search_text: Optional[str] = None
     tags: List[str] = []
     limit: int = Field(default=50, le=200)
-    offset: int = Field(default=0, ge=0)
\ No newline at end of file
+    offset: int = Field(default=0, ge=0)
+    cursor: Optional[str] = None
+    total: str = "estimate"
\ No newline at end of file
@@ -0,0 +1,213 @@
+# نماذج ديون المناديب والتحصيل - Field debt & collection models
+# Medical Management System - models for routes/debt_routes.py
+#
+# Field debts are the rep-level records migrated from the old debt_data.json
+# and collection_data.json files: scalar paid/outstanding amounts, priorities
+# and collector details. They live in their own collections (see
+# services/debt_repository.py) and are separate from the integrated
+# financial debts in models/financial_models.py.
+
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+from enum import Enum
+import uuid
+
+
+class DebtStatus(str, Enum):
+    """حالة الدين - Field debt status"""
+    PENDING = "pending"
+    PARTIAL = "partial"
+    PAID = "paid"
+    OVERDUE = "overdue"
+    WRITTEN_OFF = "written_off"
+
+
+class CollectionStatus(str, Enum):
+    """حالة التحصيل - Collection status"""
+    PENDING = "pending"
+    SUCCESSFUL = "successful"
+    FAILED = "failed"
+
+
+class PaymentMethod(str, Enum):
+    """طريقة الدفع - Payment method"""
+    CASH = "cash"
+    BANK_TRANSFER = "bank_transfer"
+    CHECK = "check"
+    CARD = "card"
+
+
+class DebtRecord(BaseModel):
+    """سجل الدين - Field debt record"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    debt_number: str
+
+    # العيادة والمندوب
+    clinic_id: str
+    clinic_name: str
+    doctor_name: Optional[str] = None
+    medical_rep_id: str
+    medical_rep_name: str
+    direct_manager_id: Optional[str] = None
+    direct_manager_name: Optional[str] = None
+
+    # الموقع - hidden from reps
+    area: Optional[str] = None
+    region: Optional[str] = None
+    address: Optional[str] = None
+    gps_latitude: Optional[float] = None
+    gps_longitude: Optional[float] = None
+
+    # المبالغ
+    original_amount: float
+    paid_amount: float = 0.0
+    outstanding_amount: float
+    interest_amount: float = 0.0
+    penalty_amount: float = 0.0
+
+    status: DebtStatus = DebtStatus.PENDING
+    priority: str = "medium"  # high, medium, low
+
+    # التواريخ
+    debt_date: datetime
+    due_date: datetime
+    last_contact_date: Optional[datetime] = None
+    expected_payment_date: Optional[datetime] = None
+    payment_completion_date: Optional[datetime] = None
+
+    # المراجع
+    invoice_id: Optional[str] = None
+    order_ids: List[str] = []
+    contract_id: Optional[str] = None
+
+    # التحصيل
+    notes: Optional[str] = None
+    collection_notes: List[Any] = []
+    payment_plan: Optional[Dict[str, Any]] = None
+    assigned_collector_id: Optional[str] = None
+    assigned_collector_name: Optional[str] = None
+    collection_attempts: int = 0
+
+    is_printable: bool = True
+    pdf_generated: bool = False
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_by: str = ""
+    updated_by: str = ""
+
+
+class DebtRecordCreate(BaseModel):
+    """إنشاء دين - Create field debt"""
+    clinic_id: str
+    clinic_name: str
+    doctor_name: Optional[str] = None
+    medical_rep_id: str
+    medical_rep_name: str
+    original_amount: float = Field(..., gt=0)
+    debt_date: datetime
+    due_date: datetime
+    priority: str = "medium"
+    notes: Optional[str] = None
+    invoice_id: Optional[str] = None
+    order_ids: List[str] = []
+
+
+class CollectionRecord(BaseModel):
+    """سجل التحصيل - Collection record"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    debt_id: str
+    debt_number: str
+    collection_amount: float
+    collection_method: PaymentMethod
+    collection_status: CollectionStatus = CollectionStatus.PENDING
+
+    collector_id: str
+    collector_name: str
+    collection_date: datetime
+    actual_collection_date: Optional[datetime] = None
+
+    # تفاصيل الدفع
+    reference_number: Optional[str] = None
+    bank_name: Optional[str] = None
+    check_number: Optional[str] = None
+    transaction_id: Optional[str] = None
+
+    # الموقع - hidden from reps
+    collection_location: Optional[str] = None
+    gps_latitude: Optional[float] = None
+    gps_longitude: Optional[float] = None
+    collection_time: Optional[datetime] = None
+
+    collection_notes: Optional[str] = None
+    receipt_number: Optional[str] = None
+    receipt_issued: bool = False
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_by: str = ""
+    approved_by: Optional[str] = None
+    approved_at: Optional[datetime] = None
+
+
+class CollectionRecordCreate(BaseModel):
+    """إنشاء تحصيل - Create collection"""
+    debt_id: str
+    collection_amount: float = Field(..., gt=0)
+    collection_method: PaymentMethod
+    collection_date: datetime
+    reference_number: Optional[str] = None
+    collection_notes: Optional[str] = None
+    bank_name: Optional[str] = None
+    check_number: Optional[str] = None
+
+
+class PaymentPlan(BaseModel):
+    """خطة السداد - Payment plan"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    debt_id: str
+    installments_count: int
+    installment_amount: float
+    start_date: datetime
+    frequency: str = "monthly"  # weekly, monthly
+    status: str = "active"
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_by: str = ""
+
+
+class PaymentPlanCreate(BaseModel):
+    """إنشاء خطة سداد - Create payment plan"""
+    debt_id: str
+    installments_count: int = Field(..., gt=0)
+    installment_amount: float = Field(..., gt=0)
+    start_date: datetime
+    frequency: str = "monthly"
+
+
+class DebtSummary(BaseModel):
+    """ملخص الديون - Debt summary"""
+    total_debts: int = 0
+    total_amount: float = 0.0
+    paid_amount: float = 0.0
+    outstanding_amount: float = 0.0
+    overdue_amount: float = 0.0
+    pending_count: int = 0
+    partial_count: int = 0
+    paid_count: int = 0
+    overdue_count: int = 0
+    high_priority_count: int = 0
+    medium_priority_count: int = 0
+    low_priority_count: int = 0
+
+
+class CollectionSummary(BaseModel):
+    """ملخص التحصيل - Collection summary"""
+    total_collections: int = 0
+    total_collected_amount: float = 0.0
+    successful_collections: int = 0
+    failed_collections: int = 0
+    pending_collections: int = 0
+    cash_collections: float = 0.0
+    bank_collections: float = 0.0
+    check_collections: float = 0.0
+    card_collections: float = 0.0
@@ -1,12 +1,13 @@
 # نظام الإدارة الطبية المتكامل - النماذج المالية المتكاملة
 # Medical Management System - Integrated Financial Models
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Dict, Optional, Any, Union, Literal
 from datetime import datetime, date
 from enum import Enum
 from decimal import Decimal, ROUND_HALF_UP
 import uuid
+from bson import Decimal128
 
 # ============================================================================
 # BASE FINANCIAL CONFIGURATION - الإعدادات المالية الأساسية
@@ -116,6 +117,12 @@ class MoneyAmount(BaseModel):
             Decimal: lambda v: float(v)
         }
     
+    @field_validator("amount", mode="before")
+    @classmethod
+    def _from_decimal128(cls, value):
+        # المبالغ المرحلة بـ $inc مخزنة كـ Decimal128
+        return value.to_decimal() if isinstance(value, Decimal128) else value
+    
     def round(self, precision: int = 2) -> Decimal:
         """تقريب المبلغ"""
         return self.amount.quantize(Decimal(10) ** -precision, rounding=ROUND_HALF_UP)
@@ -0,0 +1,163 @@
+from pydantic import BaseModel, Field, create_model, field_validator
+from pydantic.fields import FieldInfo
+from typing import Optional, Any, Dict, Tuple, Type
+from datetime import date, datetime
+
+from models.user_models import User, UserRole
+from models.clinic_models import Clinic
+
+# Excel Import Row Models - نماذج صفوف الاستيراد
+# Field aliases are the Arabic template headers (see routers/excel_routes.create_excel_template);
+# files exported from the system use the field names directly, so both are accepted.
+# Blank cells are dropped before validation so field defaults apply.
+
+TRUE_VALUES = {"نعم", "yes", "true", "1", "y", "active", "نشط"}
+FALSE_VALUES = {"لا", "no", "false", "0", "n", "inactive", "غير نشط"}
+
+
+class ImportRow(BaseModel):
+    """صف مستورد - base for all import rows"""
+
+    class Config:
+        populate_by_name = True
+        str_strip_whitespace = True
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def normalize_cell(cls, value: Any, info):
+        # أرقام الهواتف والأكواد تُقرأ من Excel كأرقام
+        annotation = cls.model_fields[info.field_name].annotation
+        if annotation in (str, Optional[str]) and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+        if annotation in (date, Optional[date]) and isinstance(value, datetime):
+            return value.date()
+        return value
+
+
+def parse_bool(value: Any) -> Any:
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in TRUE_VALUES:
+            return True
+        if lowered in FALSE_VALUES:
+            return False
+    return value
+
+
+def import_row_model(name: str, domain: Type[BaseModel], columns: Dict[str, str], required: Tuple[str, ...] = (),
+                     validators: Optional[Dict[str, Any]] = None, **import_fields: Any) -> Type[ImportRow]:
+    """نموذج صف مشتق من نموذج المجال - derive an import row from a domain model
+
+    Each column takes its type, constraints and default from the domain field
+    and the template header as its alias. Only the ``required`` columns must be
+    present: a re-import may update a subset of columns, so every other domain
+    field is optional with its domain default. ``import_fields`` declares the
+    template columns the domain model has no field for, as optional types.
+    """
+    fields: Dict[str, Any] = {}
+    for field, header in columns.items():
+        if field in import_fields:
+            fields[field] = (import_fields[field], Field(None, alias=header))
+            continue
+        info = domain.model_fields[field]
+        if field in required:
+            fields[field] = (info.annotation, FieldInfo.merge_field_infos(info, Field(alias=header)))
+        else:
+            default = None if info.is_required() else info.default
+            fields[field] = (Optional[info.annotation],
+                             FieldInfo.merge_field_infos(info, Field(alias=header), default=default))
+    return create_model(name, __base__=ImportRow, __validators__=validators, **fields)
+
+
+@field_validator("role", mode="after")
+@classmethod
+def _validate_role(cls, value):
+    role = UserRole.normalize_role(value)
+    if role not in UserRole.ROLE_HIERARCHY:
+        raise ValueError(f"Unknown role: {value}")
+    return role
+
+
+@field_validator("is_active", mode="before")
+@classmethod
+def _validate_is_active(cls, value):
+    return parse_bool(value)
+
+
+ClinicImportRow = import_row_model(
+    "ClinicImportRow", Clinic,
+    {
+        "name": "اسم العيادة",
+        "phone": "هاتف العيادة",
+        "email": "بريد العيادة",
+        "doctor_name": "اسم الطبيب",
+        "doctor_phone": "هاتف الطبيب",
+        "address": "عنوان العيادة",
+        "line": "رمز الخط",
+        "area_id": "رمز المنطقة",
+        "classification": "تصنيف العيادة",
+        "credit_classification": "التصنيف الائتماني",
+        "notes": "ملاحظات",
+    },
+    required=("name",),
+    doctor_name=Optional[str],
+    doctor_phone=Optional[str],
+    credit_classification=Optional[str],
+    notes=Optional[str],
+)
+
+UserImportRow = import_row_model(
+    "UserImportRow", User,
+    {
+        "username": "اسم المستخدم",
+        "full_name": "الاسم الكامل",
+        "password": "كلمة المرور",
+        "role": "الدور",
+        "email": "البريد الإلكتروني",
+        "line": "رمز الخط",
+        "area_id": "رمز المنطقة",
+        "managed_by": "رمز المدير",
+        "is_active": "نشط",
+    },
+    required=("username", "full_name", "role"),
+    validators={"validate_role": _validate_role, "validate_is_active": _validate_is_active},
+    # يُحوَّل إلى password_hash في خدمة الاستيراد
+    password=Optional[str],
+)
+
+
+class OrderImportRow(ImportRow):
+    order_number: str = Field(alias="رقم الطلب")
+    clinic_id: str = Field(alias="رمز العيادة")
+    sales_rep_id: str = Field(alias="رمز المندوب")
+    product_id: Optional[str] = Field(None, alias="رمز المنتج")
+    quantity: Optional[int] = Field(None, ge=0, alias="الكمية")
+    unit_price: Optional[float] = Field(None, ge=0, alias="السعر")
+    total_amount: float = Field(0.0, ge=0, alias="إجمالي المبلغ")
+    status: str = Field("pending", alias="حالة الطلب")
+    order_date: Optional[date] = Field(None, alias="تاريخ الطلب")
+    notes: Optional[str] = Field(None, alias="ملاحظات")
+
+
+class DebtImportRow(ImportRow):
+    debt_number: str = Field(alias="رقم المديونية")
+    clinic_id: str = Field(alias="رمز العيادة")
+    sales_rep_id: Optional[str] = Field(None, alias="رمز المندوب")
+    original_amount: float = Field(ge=0, alias="المبلغ الأصلي")
+    remaining_amount: float = Field(ge=0, alias="المبلغ المتبقي")
+    due_date: Optional[date] = Field(None, alias="تاريخ الاستحقاق")
+    status: str = Field("outstanding", alias="حالة المديونية")
+    debt_type: Optional[str] = Field(None, alias="نوع المديونية")
+    notes: Optional[str] = Field(None, alias="ملاحظات")
+
+
+class PaymentImportRow(ImportRow):
+    payment_number: str = Field(alias="رقم المدفوعة")
+    debt_number: Optional[str] = Field(None, alias="رقم المديونية")
+    clinic_id: Optional[str] = Field(None, alias="رمز العيادة")
+    sales_rep_id: Optional[str] = Field(None, alias="رمز المندوب")
+    payment_amount: float = Field(gt=0, alias="المبلغ المدفوع")
+    payment_method: str = Field("cash", alias="طريقة الدفع")
+    payment_date: Optional[date] = Field(None, alias="تاريخ الدفع")
+    receipt_number: Optional[str] = Field(None, alias="رقم الإيصال")
+    notes: Optional[str] = Field(None, alias="ملاحظات")
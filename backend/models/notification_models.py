@@ -131,4 +131,6 @@ class NotificationFilter(BaseModel):
     date_to: Optional[datetime] = None
     search: Optional[str] = None
     limit: int = Field(default=50, le=200)
-    offset: int = Field(default=0, ge=0)
\ No newline at end of file
+    offset: int = Field(default=0, ge=0)
+    cursor: Optional[str] = Field(None, description="مؤشر الصفحة التالية")
+    total: str = Field(default="estimate", description="estimate | exact | none")
\ No newline at end of file
@@ -353,6 +353,7 @@ class VisitCheckInRequest(BaseModel):
     visit_id: str
     gps_latitude: float
     gps_longitude: float
+    gps_accuracy: Optional[float] = None  # بالمتر كما يبلغ عنها الجهاز
     notes: Optional[str] = None
 
 class VisitCompletionRequest(BaseModel):
@@ -1,19 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
 from typing import Optional, Dict, List
 from datetime import datetime, timedelta
 import uuid
-import os
 import jwt
 
 router = APIRouter(prefix="/api", tags=["activities"])
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # JWT Configuration
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -37,7 +32,8 @@ async def get_activities(
     activity_type: Optional[str] = Query(None, description="Activity type filter"),
     user_role: Optional[str] = Query(None, description="User role filter"),
     search: Optional[str] = Query(None, description="Search in descriptions"),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Get all activities with filtering options
@@ -147,7 +143,8 @@ async def get_activities(
 @router.post("/activities")
 async def create_activity(
     activity_data: Dict,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Create a new activity record
@@ -185,7 +182,8 @@ async def create_activity(
 
 @router.get("/activities/stats")
 async def get_activity_stats(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Get activity statistics
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Clinic proximity routes for Medical Management System
+واجهات البحث الجغرافي عن العيادات
+"""
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Optional
+
+from database import get_database
+from auth import get_current_user_claims
+from services.geo_service import GeoService
+from services.clinic_roster_service import rep_clinics_filter, rep_enhanced_clinics_filter
+
+router = APIRouter(prefix="/api/clinics", tags=["clinics-geo"])
+
+
+@router.get("/nearby")
+async def get_nearby_clinics(
+    latitude: float = Query(..., ge=-90, le=90, description="خط العرض"),
+    longitude: float = Query(..., ge=-180, le=180, description="خط الطول"),
+    radius_km: Optional[float] = Query(None, gt=0, le=500, description="نصف قطر البحث بالكيلومتر (بدونه: الأقرب فقط)"),
+    limit: int = Query(20, ge=1, le=100),
+    mine_only: bool = Query(False, description="العيادات المتاحة للمندوب فقط"),
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """العيادات القريبة من موقع معين - radius or k-nearest search on the 2dsphere index"""
+    try:
+        queries = {
+            "clinics": {"is_active": {"$ne": False}},
+            "enhanced_clinics": {"is_active": {"$ne": False}, "status": {"$ne": "rejected"}}
+        }
+        if mine_only:
+            rep_id = current_user.get("id")
+            queries = {
+                "clinics": {**queries["clinics"], **rep_clinics_filter(rep_id)},
+                "enhanced_clinics": rep_enhanced_clinics_filter(rep_id)
+            }
+
+        clinics = await GeoService(db).nearby_clinics(
+            latitude, longitude, limit=limit,
+            max_distance_m=radius_km * 1000 if radius_km else None,
+            queries=queries
+        )
+
+        return {
+            "success": True,
+            "clinics": clinics,
+            "total_count": len(clinics),
+            "center": {"latitude": latitude, "longitude": longitude},
+            "radius_km": radius_km
+        }
+
+    except HTTPException:
+        raise
+    except ValueError:
+        raise HTTPException(status_code=400, detail="إحداثيات غير صالحة")
+    except Exception as e:
+        print(f"❌ خطأ في البحث عن العيادات القريبة: {str(e)}")
+        raise HTTPException(status_code=500, detail="خطأ في البحث عن العيادات القريبة")
@@ -7,22 +7,23 @@ Comprehensive debt collection system with assignment and tracking
 
 from fastapi import APIRouter, HTTPException, Depends, status, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from services.dashboard_service import invalidate_dashboard
+from services.pagination import paginate
+from services.debt_aging import (
+    aging_for, with_aging, aging_stages, aging_category_filter, overdue_filter,
+    debt_status_filter, overdue_status_expr, day_start
+)
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import uuid
 import jwt
-import os
 from models.financial_system_models import (
     Debt, DebtStatus, PaymentRecord, PaymentMethod,
     CreateDebtRequest, RecordPaymentRequest, DebtAssignmentRequest, DebtStatistics
 )
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # JWT Configuration
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -51,26 +52,10 @@ def generate_debt_number() -> str:
     return f"DEBT-{timestamp}-{random_part}"
 
 def calculate_aging_category(due_date: datetime) -> tuple[int, str]:
-    """Calculate aging days and category"""
-    if not due_date:
-        return 0, "current"
-    
-    days_overdue = max(0, (datetime.utcnow() - due_date).days)
-    
-    if days_overdue <= 0:
-        category = "current"
-    elif days_overdue <= 30:
-        category = "1-30"
-    elif days_overdue <= 60:
-        category = "31-60"
-    elif days_overdue <= 90:
-        category = "61-90"
-    else:
-        category = "90+"
-    
-    return days_overdue, category
+    """Calculate aging days and category (calendar days, see services/debt_aging.py)"""
+    return aging_for(due_date)
 
-async def create_debt_from_invoice(invoice_id: str, current_user: dict) -> str:
+async def create_debt_from_invoice(db: AsyncIOMotorDatabase, invoice_id: str, current_user: dict) -> str:
     """Create debt record from approved invoice"""
     try:
         # Get invoice details
@@ -125,6 +110,7 @@ async def create_debt_from_invoice(invoice_id: str, current_user: dict) -> str:
         
         # Save debt to database
         await db.debts.insert_one(debt.dict())
+        invalidate_dashboard("debts")
         
         # Log activity
         await db.activities.insert_one({
@@ -154,7 +140,8 @@ async def create_debt_from_invoice(invoice_id: str, current_user: dict) -> str:
 @router.post("/debts", response_model=Dict[str, Any])
 async def create_debt(
     debt_data: CreateDebtRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Create a new debt record manually"""
     try:
@@ -181,11 +168,11 @@ async def create_debt(
             raise HTTPException(status_code=404, detail="Assigned user not found")
         
         # Create debt using the helper function
-        debt_id = await create_debt_from_invoice(debt_data.invoice_id, current_user)
+        debt_id = await create_debt_from_invoice(db, debt_data.invoice_id, current_user)
         
         # Update assignment if different from default
         if debt_data.assigned_to_id != invoice["sales_rep_id"]:
-            await assign_debt(debt_id, DebtAssignmentRequest(
+            await assign_debt(db, debt_id, DebtAssignmentRequest(
                 debt_id=debt_id,
                 assigned_to_id=debt_data.assigned_to_id,
                 assigned_to_name=debt_data.assigned_to_name,
@@ -218,12 +205,21 @@ async def get_debts(
     end_date: Optional[str] = Query(None, description="End date filter"),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    current_user: dict = Depends(get_current_user)
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get debts with comprehensive filtering"""
+    """Get debts with comprehensive filtering
+
+    The summary aggregation also yields the exact total, so no separate
+    count runs; with a cursor the summary is skipped (kept from page one).
+    Aging is computed from the due date at query time, not read from the
+    stored fields.
+    """
     try:
         # Build filter query
         filter_query = {}
+        today = day_start()
         
         # Role-based access control
         if current_user.get("role") in ["sales_rep", "medical_rep"]:
@@ -232,16 +228,20 @@ async def get_debts(
             filter_query["line_id"] = current_user.get("line_id")
         
         # Apply filters
+        aging_filters = []
         if status:
-            filter_query["status"] = status
+            aging_filters.append(debt_status_filter(status, as_of=today))
         if assigned_to and current_user.get("role") in ["admin", "gm", "line_manager"]:
             filter_query["assigned_to_id"] = assigned_to
         if clinic_id:
             filter_query["clinic_id"] = clinic_id
+        # التقادم كمدى على تاريخ الاستحقاق
         if aging_category:
-            filter_query["aging_category"] = aging_category
+            aging_filters.append(aging_category_filter(aging_category, as_of=today))
         if overdue_only:
-            filter_query["days_overdue"] = {"$gt": 0}
+            aging_filters.append(overdue_filter(as_of=today))
+        if aging_filters:
+            filter_query["$and"] = aging_filters
         
         # Date range filter
         date_filter = {}
@@ -252,21 +252,32 @@ async def get_debts(
         if date_filter:
             filter_query["created_at"] = date_filter
         
-        # Update aging information before querying
-        await update_debt_aging()
-        
-        # Get debts
-        cursor = db.debts.find(filter_query, {"_id": 0}).sort("created_at", -1)
-        debts = await cursor.skip(skip).limit(limit).to_list(length=limit)
+        # Get debts (keyset when a cursor is given, skip for older clients)
+        page = await paginate(
+            db.debts, filter_query, [("created_at", -1)], limit,
+            cursor=cursor, offset=skip, projection={"_id": 0}, total="none"
+        )
+        for debt in page["items"]:
+            with_aging(debt, today)
         
-        # Get total count
-        total_count = await db.debts.count_documents(filter_query)
+        if cursor:
+            return {
+                "success": True,
+                "debts": page["items"],
+                "total_count": None,
+                "limit": limit,
+                "has_more": page["has_more"],
+                "next_cursor": page["next_cursor"],
+                "summary": None
+            }
         
-        # Calculate summary statistics
+        # Calculate summary statistics (count included)
         pipeline = [
             {"$match": filter_query},
+            *aging_stages(as_of=today),
             {"$group": {
                 "_id": None,
+                "count": {"$sum": 1},
                 "total_outstanding": {"$sum": "$remaining_amount"},
                 "total_original": {"$sum": "$original_amount"},
                 "total_paid": {"$sum": "$paid_amount"},
@@ -274,9 +285,9 @@ async def get_debts(
             }}
         ]
         
-        cursor = db.debts.aggregate(pipeline)
-        summary = await cursor.to_list(length=1)
+        summary = await db.debts.aggregate(pipeline).to_list(length=1)
         summary = summary[0] if summary else {
+            "count": 0,
             "total_outstanding": 0,
             "total_original": 0,
             "total_paid": 0,
@@ -285,10 +296,12 @@ async def get_debts(
         
         return {
             "success": True,
-            "debts": debts,
-            "total_count": total_count,
+            "debts": page["items"],
+            "total_count": summary["count"],
             "skip": skip,
             "limit": limit,
+            "has_more": page["has_more"],
+            "next_cursor": page["next_cursor"],
             "summary": {
                 "total_outstanding": summary["total_outstanding"],
                 "total_original": summary["total_original"],
@@ -298,13 +311,16 @@ async def get_debts(
             }
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching debts: {str(e)}")
 
 @router.get("/debts/{debt_id}", response_model=Dict[str, Any])
 async def get_debt(
     debt_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get detailed debt information"""
     try:
@@ -318,25 +334,8 @@ async def get_debt(
             debt["assigned_to_id"] != current_user.get("user_id")):
             raise HTTPException(status_code=403, detail="Access denied")
         
-        # Update aging information
-        due_date = debt.get("original_due_date")
-        if due_date:
-            if isinstance(due_date, str):
-                due_date = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-            
-            days_overdue, aging_category = calculate_aging_category(due_date)
-            
-            if debt["days_overdue"] != days_overdue or debt["aging_category"] != aging_category:
-                await db.debts.update_one(
-                    {"id": debt_id},
-                    {"$set": {
-                        "days_overdue": days_overdue,
-                        "aging_category": aging_category,
-                        "updated_at": datetime.utcnow()
-                    }}
-                )
-                debt["days_overdue"] = days_overdue
-                debt["aging_category"] = aging_category
+        # Aging from the due date (stored fields are refreshed by the aging job)
+        with_aging(debt)
         
         # Get related invoice
         invoice = await db.invoices.find_one({"id": debt["invoice_id"]}, {"_id": 0})
@@ -363,7 +362,8 @@ async def get_debt(
 async def record_payment(
     debt_id: str,
     payment_data: RecordPaymentRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Record a payment against a debt"""
     try:
@@ -419,6 +419,7 @@ async def record_payment(
         }
         
         await db.debts.update_one({"id": debt_id}, update_query)
+        invalidate_dashboard("debts")
         
         # Log activity
         await db.activities.insert_one({
@@ -454,7 +455,7 @@ async def record_payment(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error recording payment: {str(e)}")
 
-async def assign_debt(debt_id: str, assignment_data: DebtAssignmentRequest, current_user: dict):
+async def assign_debt(db: AsyncIOMotorDatabase, debt_id: str, assignment_data: DebtAssignmentRequest, current_user: dict):
     """Assign debt to a sales representative"""
     try:
         # Find debt
@@ -483,6 +484,7 @@ async def assign_debt(debt_id: str, assignment_data: DebtAssignmentRequest, curr
             update_query["collection_notes"] = assignment_data.notes
         
         await db.debts.update_one({"id": debt_id}, {"$set": update_query})
+        invalidate_dashboard("debts")
         
         # Log activity
         await db.activities.insert_one({
@@ -510,7 +512,8 @@ async def assign_debt(debt_id: str, assignment_data: DebtAssignmentRequest, curr
 async def assign_debt_endpoint(
     debt_id: str,
     assignment_data: DebtAssignmentRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Assign debt to a sales representative (API endpoint)"""
     try:
@@ -521,7 +524,7 @@ async def assign_debt_endpoint(
                 detail="Insufficient permissions to assign debts"
             )
         
-        await assign_debt(debt_id, assignment_data, current_user)
+        await assign_debt(db, debt_id, assignment_data, current_user)
         
         # Get updated debt
         updated_debt = await db.debts.find_one({"id": debt_id}, {"_id": 0})
@@ -537,54 +540,15 @@ async def assign_debt_endpoint(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error assigning debt: {str(e)}")
 
-async def update_debt_aging():
-    """Update aging information for all debts"""
-    try:
-        # Get all active debts
-        cursor = db.debts.find({"status": {"$nin": ["fully_collected", "written_off"]}})
-        
-        async for debt in cursor:
-            due_date = debt.get("original_due_date")
-            if due_date:
-                if isinstance(due_date, str):
-                    due_date = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                
-                days_overdue, aging_category = calculate_aging_category(due_date)
-                
-                # Update status if now overdue
-                new_status = debt["status"]
-                if days_overdue > 0 and debt["status"] in ["pending", "assigned"]:
-                    new_status = "overdue"
-                
-                # Update if changed
-                if (debt["days_overdue"] != days_overdue or 
-                    debt["aging_category"] != aging_category or 
-                    debt["status"] != new_status):
-                    
-                    await db.debts.update_one(
-                        {"id": debt["id"]},
-                        {"$set": {
-                            "days_overdue": days_overdue,
-                            "aging_category": aging_category,
-                            "status": new_status,
-                            "updated_at": datetime.utcnow()
-                        }}
-                    )
-        
-    except Exception as e:
-        print(f"Error updating debt aging: {e}")
-
 @router.get("/debts/statistics/overview", response_model=Dict[str, Any])
 async def get_debt_statistics(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get comprehensive debt statistics"""
     try:
-        # Update aging before generating statistics
-        await update_debt_aging()
-        
         # Build date filter
         date_filter = {}
         if start_date:
@@ -603,6 +567,8 @@ async def get_debt_statistics(
         # Aggregate comprehensive statistics
         pipeline = [
             {"$match": filter_query},
+            *aging_stages(),
+            {"$addFields": {"status": overdue_status_expr()}},
             {"$group": {
                 "_id": None,
                 "total_debts": {"$sum": 1},
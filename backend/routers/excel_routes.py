@@ -4,18 +4,23 @@ Excel Import/Export routes for Medical Management System
 Supports exporting and importing data for all major sections
 """
 
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import StreamingResponse
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from services.import_service import ExcelImportService, IMPORT_TARGETS
 import os
 import jwt
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
-import uuid
 import io
+import csv
 import json
-from openpyxl import Workbook, load_workbook
+import asyncio
+import tempfile
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.utils import get_column_letter
 
@@ -23,11 +28,6 @@ from openpyxl.utils import get_column_letter
 from dotenv import load_dotenv
 load_dotenv()
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # JWT Configuration  
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -197,9 +197,142 @@ async def download_template(data_type: str, current_user: dict = Depends(get_cur
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating template: {str(e)}")
 
+# ============================================================================
+# STREAMING EXPORT - تصدير متدفق بذاكرة ثابتة
+# ============================================================================
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXCEL_EXPORT_BATCH_SIZE', '1000'))
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Arabic sheet names
+EXPORT_SHEET_NAMES = {
+    "clinics": "بيانات العيادات",
+    "users": "بيانات المستخدمين",
+    "orders": "بيانات الطلبات",
+    "debts": "بيانات المديونية",
+    "payments": "بيانات التحصيل"
+}
+
+# URL-safe filenames without Arabic characters
+EXPORT_FILENAMES = {
+    "clinics": "clinics_export",
+    "users": "users_export",
+    "orders": "orders_export",
+    "debts": "debts_export",
+    "payments": "payments_export"
+}
+
+EXPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson"
+}
+
+def format_export_value(value) -> str:
+    """Convert a document value to the text written in a cell"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+async def iter_export_batches(cursor, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield the cursor in lists of batch_size documents (one server round trip each)"""
+    cursor.batch_size(batch_size)
+    while True:
+        batch = await cursor.to_list(batch_size)
+        if not batch:
+            break
+        yield batch
+
+def _append_xlsx_rows(ws, headers: List[str], batch: List[dict]):
+    for item in batch:
+        ws.append([format_export_value(item.get(key, "")) for key in headers])
+
+async def build_xlsx_export(cursor, data_type: str):
+    """Write the export with a write-only workbook into a temporary file
+
+    Rows go straight to openpyxl's temporary sheet XML, so memory stays flat;
+    row writing and the final zip run in a worker thread to keep the event
+    loop free. Columns come from the first document, as before.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=EXPORT_SHEET_NAMES.get(data_type, data_type))
+    
+    # Header styling
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="1F4E79", end_color="1F4E79", fill_type="solid")
+    
+    headers = None
+    async for batch in iter_export_batches(cursor):
+        if headers is None:
+            headers = list(batch[0].keys())
+            for col in range(1, len(headers) + 1):
+                ws.column_dimensions[get_column_letter(col)].width = 15
+            header_cells = []
+            for header in headers:
+                cell = WriteOnlyCell(ws, value=header)
+                cell.font = header_font
+                cell.fill = header_fill
+                header_cells.append(cell)
+            ws.append(header_cells)
+        await asyncio.to_thread(_append_xlsx_rows, ws, headers, batch)
+    
+    if headers is None:
+        # Add a message indicating no data
+        ws.append([f"لا توجد بيانات {data_type} متاحة للتصدير"])
+    
+    output = tempfile.TemporaryFile()
+    await asyncio.to_thread(wb.save, output)
+    output.seek(0)
+    return output
+
+def iter_file_chunks(output):
+    """Stream a temporary file and close (delete) it when done"""
+    try:
+        while True:
+            chunk = output.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        output.close()
+
+async def stream_csv_export(cursor):
+    """CSV chunks flushed after every batch (UTF-8 with BOM so Excel shows Arabic)"""
+    headers = None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    async for batch in iter_export_batches(cursor):
+        if headers is None:
+            headers = list(batch[0].keys())
+            writer.writerow(headers)
+        for item in batch:
+            writer.writerow([format_export_value(item.get(key, "")) for key in headers])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+
+async def stream_ndjson_export(cursor):
+    """One JSON document per line, flushed after every batch"""
+    async for batch in iter_export_batches(cursor):
+        yield "".join(
+            json.dumps(item, ensure_ascii=False, default=str) + "\n" for item in batch
+        ).encode("utf-8")
+
 @router.get("/export/{data_type}")
-async def export_data(data_type: str, current_user: dict = Depends(get_current_user)):
-    """Export data to Excel"""
+async def export_data(
+    data_type: str,
+    format: str = Query("xlsx", regex="^(xlsx|csv|ndjson)$"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Export data to Excel (or CSV / NDJSON) without loading the collection in memory"""
     try:
         # Check permissions
         if current_user.get("role") not in ["admin", "gm", "manager", "accounting"]:
@@ -217,137 +350,40 @@ async def export_data(data_type: str, current_user: dict = Depends(get_current_u
         if data_type not in collections:
             raise HTTPException(status_code=400, detail=f"Unsupported data type: {data_type}")
         
-        # Get data from database
-        data = []
-        async for item in collections[data_type].find({}, {"_id": 0}):
-            data.append(item)
-        
-        if not data:
-            # Return empty Excel file with headers only
-            wb = Workbook()
-            ws = wb.active
-            
-            # Arabic sheet names
-            sheet_names = {
-                "clinics": "بيانات العيادات",
-                "users": "بيانات المستخدمين", 
-                "orders": "بيانات الطلبات",
-                "debts": "بيانات المديونية",
-                "payments": "بيانات التحصيل"
-            }
-            
-            ws.title = sheet_names.get(data_type, data_type)
-            
-            # Add a message indicating no data
-            ws.cell(row=1, column=1, value=f"لا توجد بيانات {data_type} متاحة للتصدير")
-            
-            # Save to memory
-            output = io.BytesIO()
-            wb.save(output)
-            output.seek(0)
-            
-            # URL-safe filenames without Arabic characters
-            filename_mapping = {
-                "clinics": "clinics_export",
-                "users": "users_export",
-                "orders": "orders_export", 
-                "debts": "debts_export",
-                "payments": "payments_export"
-            }
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{filename_mapping.get(data_type, data_type)}_{timestamp}.xlsx"
-            
-            # Get the content as bytes
-            content = output.getvalue()
-            
-            return StreamingResponse(
-                io.BytesIO(content),
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename={filename}"}
-            )
-        
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        
-        # Arabic sheet names
-        sheet_names = {
-            "clinics": "بيانات العيادات",
-            "users": "بيانات المستخدمين", 
-            "orders": "بيانات الطلبات",
-            "debts": "بيانات المديونية",
-            "payments": "بيانات التحصيل"
-        }
-        
-        ws.title = sheet_names.get(data_type, data_type)
-        
-        # Header styling
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="1F4E79", end_color="1F4E79", fill_type="solid")
-        
-        if data:
-            # Add headers from first item keys
-            headers = list(data[0].keys())
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col, value=header)
-                cell.font = header_font
-                cell.fill = header_fill
-                ws.column_dimensions[get_column_letter(col)].width = 15
-            
-            # Add data
-            for row, item in enumerate(data, 2):
-                for col, key in enumerate(headers, 1):
-                    value = item.get(key, "")
-                    # Convert datetime objects to strings
-                    if isinstance(value, datetime):
-                        value = value.strftime("%Y-%m-%d %H:%M:%S")
-                    elif isinstance(value, list):
-                        value = ", ".join(str(v) for v in value)
-                    elif isinstance(value, dict):
-                        value = json.dumps(value, ensure_ascii=False)
-                    ws.cell(row=row, column=col, value=str(value))
-        
-        # Save to memory
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        # URL-safe filenames without Arabic characters
-        filename_mapping = {
-            "clinics": "clinics_export",
-            "users": "users_export",
-            "orders": "orders_export", 
-            "debts": "debts_export",
-            "payments": "payments_export"
-        }
+        cursor = collections[data_type].find({}, {"_id": 0})
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{filename_mapping.get(data_type, data_type)}_{timestamp}.xlsx"
+        filename = f"{EXPORT_FILENAMES.get(data_type, data_type)}_{timestamp}.{format}"
+        headers = {"Content-Disposition": f"attachment; filename={filename}"}
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{filename_mapping.get(data_type, data_type)}_{timestamp}.xlsx"
+        if format == "csv":
+            body = stream_csv_export(cursor)
+        elif format == "ndjson":
+            body = stream_ndjson_export(cursor)
+        else:
+            body = iter_file_chunks(await build_xlsx_export(cursor, data_type))
         
-        # Get the content as bytes
-        content = output.getvalue()
-        
-        return StreamingResponse(
-            io.BytesIO(content),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error exporting data: {str(e)}")
 
+# Background import tasks (kept referenced until they finish)
+_import_tasks = set()
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 @router.post("/import/{data_type}")
 async def import_data(
     data_type: str,
     file: UploadFile = File(...),
     import_mode: str = Form("append"),  # "append" or "overwrite"
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Import data from Excel file"""
+    """Start a background import job for an Excel file; poll /import/jobs/{job_id} for progress"""
     try:
         # Check permissions
         if current_user.get("role") not in ["admin", "gm"]:
@@ -357,71 +393,39 @@ async def import_data(
         if not file.filename.endswith(('.xlsx', '.xls')):
             raise HTTPException(status_code=400, detail="File must be Excel format (.xlsx or .xls)")
         
-        # Collection mapping
-        collections = {
-            "clinics": db.clinics,
-            "users": db.users,
-            "orders": db.orders,
-            "debts": db.debts,
-            "payments": db.payments
-        }
-        
-        if data_type not in collections:
+        if data_type not in IMPORT_TARGETS:
             raise HTTPException(status_code=400, detail=f"Unsupported data type: {data_type}")
         
-        # Read Excel file
-        contents = await file.read()
-        wb = load_workbook(io.BytesIO(contents))
-        ws = wb.active
-        
-        # Get headers from first row
-        headers = []
-        for cell in ws[1]:
-            if cell.value:
-                headers.append(str(cell.value).strip())
-        
-        if not headers:
-            raise HTTPException(status_code=400, detail="No headers found in Excel file")
-        
-        # Read data rows
-        imported_data = []
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if any(cell is not None and str(cell).strip() for cell in row):  # Skip empty rows
-                row_data = {}
-                for i, header in enumerate(headers):
-                    value = row[i] if i < len(row) and row[i] is not None else ""
-                    row_data[header] = str(value).strip() if value else ""
-                
-                # Add metadata
-                row_data["id"] = str(uuid.uuid4())
-                row_data["imported_at"] = datetime.utcnow().isoformat()
-                row_data["imported_by"] = current_user.get("user_id")
-                
-                imported_data.append(row_data)
+        if import_mode not in ("append", "overwrite"):
+            raise HTTPException(status_code=400, detail=f"Unsupported import mode: {import_mode}")
         
-        if not imported_data:
-            raise HTTPException(status_code=400, detail="No data rows found in Excel file")
+        # Spool the upload to disk so the job outlives the request
+        spool = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
+        try:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                spool.write(chunk)
+        finally:
+            spool.close()
         
-        # Handle import mode
-        collection = collections[data_type]
+        service = ExcelImportService(db)
+        job = await service.create_job(data_type, import_mode, file.filename, current_user)
         
-        if import_mode == "overwrite":
-            # Clear existing data first
-            await collection.delete_many({})
-            result = await collection.insert_many(imported_data)
-            message = f"Overwritten {len(result.inserted_ids)} {data_type} records"
-        else:  # append mode
-            result = await collection.insert_many(imported_data)
-            message = f"Imported {len(result.inserted_ids)} new {data_type} records"
+        task = asyncio.create_task(service.run_job(job, spool.name))
+        _import_tasks.add(task)
+        task.add_done_callback(_import_tasks.discard)
         
         return {
             "success": True,
-            "message": message,
-            "imported_count": len(imported_data),
+            "message": f"Import job queued for {data_type}",
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": f"/api/excel/import/jobs/{job['id']}",
             "import_mode": import_mode,
             "data_type": data_type,
-            "imported_at": datetime.utcnow().isoformat(),
-            "imported_by": current_user.get("full_name", "Unknown")
+            "created_by": job["created_by_name"]
         }
         
     except HTTPException:
@@ -429,6 +433,24 @@ async def import_data(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error importing data: {str(e)}")
 
+@router.get("/import/jobs/{job_id}")
+async def get_import_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get import job progress and row errors"""
+    if current_user.get("role") not in ["admin", "gm"]:
+        raise HTTPException(status_code=403, detail="Only admin and GM can view import jobs")
+    
+    job = await ExcelImportService(db).get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    
+    # Frontend compatibility: rows written by the job so far
+    job["imported_count"] = job.get("inserted", 0) + job.get("updated", 0)
+    return job
+
 @router.get("/import-options")
 async def get_import_options(current_user: dict = Depends(get_current_user)):
     """Get available import options and data types"""
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+GPS ingestion routes for Medical Management System
+واجهات استقبال مواقع GPS من تطبيق المناديب
+"""
+
+from datetime import date, datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from fastapi.responses import JSONResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from auth import get_current_user, get_current_user_claims
+from database import get_database
+from models.activity_models import GPSBatchRequest, GPSPoint
+from services.gps_ingest_service import gps_buffer, ingest_points
+from services.gps_trail_service import GPSTrailService
+
+router = APIRouter(prefix="/api/gps", tags=["gps"])
+
+# مهلة إعادة المحاولة المقترحة للجهاز عند امتلاء الذاكرة
+RETRY_AFTER_SECONDS = 5
+
+# الأدوار التي ترى مسارات كل المناديب
+TRAIL_VIEWER_ROLES = ["admin", "gm", "line_manager", "area_manager"]
+
+
+def _busy_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "الخادم مشغول، أعد إرسال النقاط لاحقاً"},
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
+
+
+@router.post("/batch", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_gps_batch(
+    batch: GPSBatchRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """استقبال دفعة نقاط GPS - accepted points are written in the background"""
+    points = [point.dict() for point in batch.points]
+    if not await ingest_points(current_user["id"], points):
+        return _busy_response()
+    return {"success": True, "accepted": len(points)}
+
+
+@router.post("/location", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_gps_location(
+    point: GPSPoint,
+    current_user: dict = Depends(get_current_user)
+):
+    """استقبال نقطة واحدة - same path as /batch"""
+    if not await ingest_points(current_user["id"], [point.dict()]):
+        return _busy_response()
+    return {"success": True, "accepted": 1}
+
+
+@router.get("/ingest/stats")
+async def get_gps_ingest_stats(current_user: dict = Depends(get_current_user_claims)):
+    """حالة ذاكرة الكتابة المؤجلة - للأدمن فقط"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {"success": True, "buffer": gps_buffer.snapshot()}
+
+
+@router.get("/trails")
+async def get_daily_trails(
+    day: Optional[date] = Query(None, alias="date", description="اليوم (UTC)، الافتراضي اليوم"),
+    zoom: int = Query(12, ge=0, le=22, description="مستوى تكبير الخريطة"),
+    user_ids: Optional[str] = Query(None, description="معرفات المناديب مفصولة بفواصل"),
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """مسارات اليوم المبسطة لخريطة الإدارة - encoded polylines at the zoom level's resolution plus stay points"""
+    day = day or datetime.utcnow().date()
+    service = GPSTrailService(db)
+    if current_user.get("role") not in TRAIL_VIEWER_ROLES:
+        ids = [current_user["id"]]
+    elif user_ids:
+        ids = [user_id.strip() for user_id in user_ids.split(",") if user_id.strip()]
+    else:
+        ids = await service.users_with_points(day)
+
+    trails = await service.daily_trails(ids, day, zoom)
+    return {"success": True, "date": day.isoformat(), "zoom": zoom, "trails": trails, "total": len(trails)}
@@ -1,12 +1,15 @@
 # نظام الإدارة الطبية المتكامل - موجه النظام المالي المتكامل
 # Medical Management System - Integrated Financial Router
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Header
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Dict, Any, Optional
 from datetime import date, datetime
 from decimal import Decimal
+import asyncio
 import traceback
 
+from database import get_database
 from models.financial_models import (
     IntegratedInvoice, IntegratedDebtRecord, DebtPaymentRecord,
     CreateInvoiceRequest, ProcessPaymentRequest, FinancialReportRequest,
@@ -14,19 +17,24 @@ from models.financial_models import (
     FinancialSummary, AgingAnalysis
 )
 from services.financial_service import IntegratedFinancialService
+from services.payment_engine import IdempotencyConflict
+from services.integrity_checker import IntegrityChecker, INTEGRITY_REPORTS_COLLECTION
+from services.pagination import paginate
 from models.all_models import User, UserRole
 from routes.auth_routes import get_current_user
 
 # إنشاء الموجه
 router = APIRouter(prefix="/api/financial", tags=["Integrated Financial System"])
 
+# مهام فحص السلامة الجارية (مرجع يمنع جمعها قبل انتهائها)
+_integrity_tasks = set()
+
 # ============================================================================
 # DEPENDENCY INJECTION - حقن التبعيات
 # ============================================================================
 
-async def get_financial_service() -> IntegratedFinancialService:
+async def get_financial_service(db: AsyncIOMotorDatabase = Depends(get_database)) -> IntegratedFinancialService:
     """الحصول على خدمة النظام المالي"""
-    from server import db  # تجنب circular import
     return IntegratedFinancialService(db)
 
 def check_financial_permissions(required_roles: List[str]):
@@ -357,10 +365,11 @@ async def get_debt_details(
 async def process_debt_payment(
     debt_id: str,
     request: ProcessPaymentRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=128),
     current_user: User = Depends(check_financial_permissions(["admin", "accounting", "gm", "collection_agent"])),
     financial_service: IntegratedFinancialService = Depends(get_financial_service)
 ):
-    """معالجة دفعة دين - Process debt payment"""
+    """معالجة دفعة دين - Process debt payment (retries with the same Idempotency-Key post once)"""
     try:
         result = await financial_service.process_debt_payment(
             debt_id=debt_id,
@@ -369,11 +378,14 @@ async def process_debt_payment(
             processed_by=current_user.id,
             payment_date=request.payment_date,
             reference_number=request.reference_number,
-            notes=request.notes
+            notes=request.notes,
+            idempotency_key=idempotency_key
         )
         
         return result
         
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -455,16 +467,57 @@ async def get_clinic_financial_status(
 # SYSTEM INTEGRITY APIs - واجهات سلامة النظام
 # ============================================================================
 
+@router.post("/system/integrity-check", status_code=202)
+async def start_financial_integrity_check(
+    current_user: User = Depends(check_financial_permissions(["admin"])),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """بدء فحص سلامة البيانات المالية في الخلفية - resumes a stopped run instead of starting over"""
+    try:
+        checker = IntegrityChecker(db)
+        run = await checker.start_or_resume(started_by=current_user.id)
+        if run is None:
+            active = await checker.active_run()
+            return {"success": True, "run_id": active["id"], "status": "running", "message": "الفحص قيد التشغيل بالفعل"}
+        
+        task = asyncio.create_task(checker.run(run))
+        _integrity_tasks.add(task)
+        task.add_done_callback(_integrity_tasks.discard)
+        
+        return {"success": True, "run_id": run["id"], "status": "running", "message": "تم بدء فحص السلامة"}
+        
+    except Exception as e:
+        print(f"Error starting financial integrity check: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="خطأ في بدء فحص سلامة البيانات المالية")
+
 @router.get("/system/integrity-check")
 async def validate_financial_integrity(
+    run_id: Optional[str] = Query(None, description="معرف التشغيل، الافتراضي آخر تشغيل"),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     current_user: User = Depends(check_financial_permissions(["admin"])),
-    financial_service: IntegratedFinancialService = Depends(get_financial_service)
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """فحص سلامة البيانات المالية - Financial data integrity check"""
+    """تقرير فحص سلامة البيانات المالية - progress and findings of a run (latest by default)"""
     try:
-        integrity_report = await financial_service.validate_financial_integrity()
-        return integrity_report
+        checker = IntegrityChecker(db)
+        report = await checker.summary(run_id, issue_limit=0)
+        if not report:
+            raise HTTPException(status_code=404, detail="لا يوجد فحص سلامة")
+        
+        page = await paginate(
+            db[INTEGRITY_REPORTS_COLLECTION], {"run_id": report["run_id"]}, [("_id", 1)], limit,
+            cursor=cursor, projection={"run_id": 0}, total="none"
+        )
+        for issue in page["items"]:
+            issue.pop("_id", None)
+        report.update(issues=page["items"], has_more=page["has_more"], next_cursor=page["next_cursor"])
+        return report
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error validating financial integrity: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="خطأ في فحص سلامة البيانات المالية")
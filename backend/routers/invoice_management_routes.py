@@ -7,22 +7,18 @@ Comprehensive invoice system with full workflow support
 
 from fastapi import APIRouter, HTTPException, Depends, status, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from services.pagination import paginate
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import uuid
 import jwt
-import os
 from models.financial_system_models import (
     Invoice, InvoiceStatus, CreateInvoiceRequest, UpdateInvoiceRequest, 
     ApproveInvoiceRequest, InvoiceItem, InvoiceStatistics
 )
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # JWT Configuration
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -74,7 +70,8 @@ def calculate_invoice_totals(items: List[Dict]) -> Dict[str, float]:
 @router.post("/invoices", response_model=Dict[str, Any])
 async def create_invoice(
     invoice_data: CreateInvoiceRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Create a new invoice"""
     try:
@@ -190,7 +187,10 @@ async def get_invoices(
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    current_user: dict = Depends(get_current_user)
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    total: str = Query("estimate", regex="^(estimate|exact|none)$"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get invoices with filtering options"""
     try:
@@ -220,28 +220,33 @@ async def get_invoices(
         if date_filter:
             filter_query["invoice_date"] = date_filter
         
-        # Get invoices
-        cursor = db.invoices.find(filter_query, {"_id": 0}).sort("invoice_date", -1)
-        invoices = await cursor.skip(skip).limit(limit).to_list(length=limit)
-        
-        # Get total count
-        total_count = await db.invoices.count_documents(filter_query)
+        # Get invoices (keyset when a cursor is given, skip for older clients)
+        page = await paginate(
+            db.invoices, filter_query, [("invoice_date", -1)], limit,
+            cursor=cursor, offset=skip, projection={"_id": 0}, total=total
+        )
         
         return {
             "success": True,
-            "invoices": invoices,
-            "total_count": total_count,
+            "invoices": page["items"],
+            "total_count": page["total_count"],
+            "total_is_estimate": page["total_is_estimate"],
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            "has_more": page["has_more"],
+            "next_cursor": page["next_cursor"]
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching invoices: {str(e)}")
 
 @router.get("/invoices/{invoice_id}", response_model=Dict[str, Any])
 async def get_invoice(
     invoice_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get invoice by ID"""
     try:
@@ -269,7 +274,8 @@ async def get_invoice(
 async def update_invoice(
     invoice_id: str,
     update_data: UpdateInvoiceRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Update invoice (only if in draft status)"""
     try:
@@ -350,7 +356,8 @@ async def update_invoice(
 async def approve_invoice(
     invoice_id: str,
     approval_data: ApproveInvoiceRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Approve invoice and optionally convert to debt"""
     try:
@@ -394,7 +401,7 @@ async def approve_invoice(
         if approval_data.convert_to_debt:
             # Import debt creation function
             from routers.debt_management_routes import create_debt_from_invoice
-            debt_id = await create_debt_from_invoice(invoice_id, current_user)
+            debt_id = await create_debt_from_invoice(db, invoice_id, current_user)
             
             # Update invoice status to converted
             await db.invoices.update_one(
@@ -437,7 +444,8 @@ async def approve_invoice(
 @router.delete("/invoices/{invoice_id}")
 async def delete_invoice(
     invoice_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Delete invoice (only if in draft status)"""
     try:
@@ -489,7 +497,8 @@ async def delete_invoice(
 async def get_invoice_statistics(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get invoice statistics and analytics"""
     try:
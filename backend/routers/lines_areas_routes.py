@@ -5,8 +5,8 @@ Lines and Areas management routes for Medical Management System
 
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
 import jwt
 from datetime import datetime
 from typing import List, Dict, Any, Optional
@@ -17,11 +17,6 @@ import uuid
 from dotenv import load_dotenv
 load_dotenv()
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # JWT Configuration  
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -71,7 +66,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
 # Sample data creation function
-async def ensure_sample_data():
+async def ensure_sample_data(db: AsyncIOMotorDatabase):
     """Create sample lines and areas if they don't exist"""
     
     # Check if we have lines data
@@ -177,11 +172,11 @@ async def ensure_sample_data():
 # Routes
 
 @router.get("/lines", response_model=List[Dict[str, Any]])
-async def get_lines(current_user: dict = Depends(get_current_user)):
+async def get_lines(current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get all active lines"""
     try:
         # Ensure sample data exists
-        await ensure_sample_data()
+        await ensure_sample_data(db)
         
         lines = []
         async for line in db.lines.find({"is_active": True}, {"_id": 0}):
@@ -193,11 +188,11 @@ async def get_lines(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=f"Error retrieving lines: {str(e)}")
 
 @router.get("/areas", response_model=List[Dict[str, Any]])
-async def get_areas(current_user: dict = Depends(get_current_user)):
+async def get_areas(current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get all active areas"""
     try:
         # Ensure sample data exists
-        await ensure_sample_data()
+        await ensure_sample_data(db)
         
         areas = []
         async for area in db.areas.find({"is_active": True}, {"_id": 0}):
@@ -209,7 +204,7 @@ async def get_areas(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=f"Error retrieving areas: {str(e)}")
 
 @router.get("/lines/{line_id}/areas", response_model=List[Dict[str, Any]])
-async def get_areas_by_line(line_id: str, current_user: dict = Depends(get_current_user)):
+async def get_areas_by_line(line_id: str, current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get all areas for a specific line"""
     try:
         areas = []
@@ -225,7 +220,7 @@ async def get_areas_by_line(line_id: str, current_user: dict = Depends(get_curre
         raise HTTPException(status_code=500, detail=f"Error retrieving areas for line: {str(e)}")
 
 @router.post("/lines", response_model=Dict[str, Any])
-async def create_line(line_data: Dict[str, Any], current_user: dict = Depends(get_current_user)):
+async def create_line(line_data: Dict[str, Any], current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Create a new line (Admin only)"""
     try:
         # Only admin can create lines
@@ -259,7 +254,7 @@ async def create_line(line_data: Dict[str, Any], current_user: dict = Depends(ge
         raise HTTPException(status_code=500, detail=f"Error creating line: {str(e)}")
 
 @router.post("/areas", response_model=Dict[str, Any])
-async def create_area(area_data: Dict[str, Any], current_user: dict = Depends(get_current_user)):
+async def create_area(area_data: Dict[str, Any], current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Create a new area (Admin only)"""
     try:
         # Only admin can create areas
@@ -293,7 +288,7 @@ async def create_area(area_data: Dict[str, Any], current_user: dict = Depends(ge
         raise HTTPException(status_code=500, detail=f"Error creating area: {str(e)}")
 
 @router.put("/lines/{line_id}", response_model=Dict[str, Any])
-async def update_line(line_id: str, line_data: Dict[str, Any], current_user: dict = Depends(get_current_user)):
+async def update_line(line_id: str, line_data: Dict[str, Any], current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Update a line (Admin only)"""
     try:
         # Only admin can update lines
@@ -331,7 +326,7 @@ async def update_line(line_id: str, line_data: Dict[str, Any], current_user: dic
         raise HTTPException(status_code=500, detail=f"Error updating line: {str(e)}")
 
 @router.put("/areas/{area_id}", response_model=Dict[str, Any])
-async def update_area(area_id: str, area_data: Dict[str, Any], current_user: dict = Depends(get_current_user)):
+async def update_area(area_id: str, area_data: Dict[str, Any], current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Update an area (Admin only)"""
     try:
         # Only admin can update areas
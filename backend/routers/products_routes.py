@@ -6,8 +6,8 @@ Products management routes for Medical Management System
 
 from fastapi import APIRouter, HTTPException, Depends, status, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
 import jwt
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
@@ -19,11 +19,6 @@ import json
 from dotenv import load_dotenv
 load_dotenv()
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # JWT Configuration  
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -131,7 +126,7 @@ def get_stock_status(stock_quantity: int, minimum_stock: int) -> str:
         return "good"
 
 # Sample data creation function
-async def ensure_sample_products():
+async def ensure_sample_products(db: AsyncIOMotorDatabase):
     """Create sample products if none exist"""
     products_count = await db.products.count_documents({})
     if products_count == 0:
@@ -228,12 +223,13 @@ async def get_products(
     stock_status: Optional[str] = Query(None, description="تصفية حسب حالة المخزون"),
     is_active: Optional[bool] = Query(None, description="تصفية حسب حالة النشاط"),
     skip: int = Query(0, ge=0, description="عدد العناصر المتجاهلة"),
-    limit: int = Query(100, ge=1, le=1000, description="الحد الأقصى للعناصر المسترجعة")
+    limit: int = Query(100, ge=1, le=1000, description="الحد الأقصى للعناصر المسترجعة"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get all products with filtering and pagination"""
     try:
         # Ensure sample data exists
-        await ensure_sample_products()
+        await ensure_sample_products(db)
         
         # Build query filter
         query = {}
@@ -306,7 +302,8 @@ async def get_products(
 @router.post("/products", response_model=Dict[str, Any])
 async def create_product(
     product_data: ProductCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Create a new product (Admin and GM only)"""
     try:
@@ -373,7 +370,8 @@ async def create_product(
 @router.get("/products/{product_id}", response_model=Dict[str, Any])
 async def get_product_by_id(
     product_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get product by ID"""
     try:
@@ -398,7 +396,8 @@ async def get_product_by_id(
 async def update_product(
     product_id: str,
     product_data: ProductUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Update product (Admin, GM, and line_manager only)"""
     try:
@@ -468,7 +467,8 @@ async def update_product(
 @router.delete("/products/{product_id}")
 async def delete_product(
     product_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Delete product (Admin only)"""
     try:
@@ -502,11 +502,11 @@ async def delete_product(
         raise HTTPException(status_code=500, detail=f"Error deleting product: {str(e)}")
 
 @router.get("/products/stats/overview")
-async def get_products_stats(current_user: dict = Depends(get_current_user)):
+async def get_products_stats(current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get products overview statistics"""
     try:
         # Ensure sample data exists
-        await ensure_sample_products()
+        await ensure_sample_products(db)
         
         # Get total products count
         total_products = await db.products.count_documents({"is_active": True})
@@ -551,7 +551,7 @@ async def get_products_stats(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=f"Error getting products stats: {str(e)}")
 
 @router.get("/products/brands/list")
-async def get_product_brands(current_user: dict = Depends(get_current_user)):
+async def get_product_brands(current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get unique list of product brands"""
     try:
         # Get distinct brands (check both 'brand' and 'category' fields for compatibility)
@@ -572,7 +572,7 @@ async def get_product_brands(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=f"Error getting product brands: {str(e)}")
 
 @router.get("/products/categories/list")
-async def get_medical_categories(current_user: dict = Depends(get_current_user)):
+async def get_medical_categories(current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get unique list of medical categories"""
     try:
         # Get distinct medical categories
@@ -593,7 +593,8 @@ async def get_medical_categories(current_user: dict = Depends(get_current_user))
 async def adjust_product_stock(
     product_id: str,
     adjustment_data: Dict[str, Any],
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Adjust product stock quantity"""
     try:
@@ -4,9 +4,10 @@ User management routes for Medical Management System
 """
 
 from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from fastapi.security import HTTPBearer
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from auth import get_current_user as get_authenticated_user, invalidate_user
 import jwt
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
@@ -18,11 +19,6 @@ import hashlib
 from dotenv import load_dotenv
 load_dotenv()
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # JWT Configuration  
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -73,23 +69,10 @@ def verify_jwt_token(token: str) -> dict:
             detail="Invalid token"
         )
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """Get current user from JWT token"""
+async def get_current_user(user_data: dict = Depends(get_authenticated_user)) -> User:
+    """Get current user from JWT token (cached principal, see auth.py)"""
     try:
-        # Extract token from Bearer
-        token = credentials.credentials
-        payload = verify_jwt_token(token)
-        
-        # Get user from database
-        user_data = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0, "password_hash": 0, "password": 0})
-        if not user_data:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
-        
         return User(**user_data)
-        
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -98,7 +81,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
 # User routes
 @router.get("/users", response_model=List[Dict[str, Any]])
-async def get_users(current_user: User = Depends(get_current_user)):
+async def get_users(current_user: User = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Get all users (Admin and GM only)
     Other roles have limited access
@@ -140,7 +123,8 @@ async def get_users(current_user: User = Depends(get_current_user)):
 @router.post("/users", response_model=Dict[str, Any])
 async def create_user(
     user_request: CreateUserRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Create a new user (Admin only)"""
     try:
@@ -196,7 +180,8 @@ async def create_user(
 @router.get("/users/{user_id}", response_model=Dict[str, Any])
 async def get_user_by_id(
     user_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get user by ID"""
     try:
@@ -229,7 +214,8 @@ async def get_user_by_id(
 async def update_user(
     user_id: str,
     user_request: Dict[str, Any],
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Update user (Admin only or own profile)"""
     try:
@@ -287,6 +273,17 @@ async def update_user(
                 detail="No changes made to user"
             )
         
+        # Drop cached principals so role / activation changes apply immediately
+        await invalidate_user(
+            db,
+            user_id,
+            revoke=update_data.get("is_active") is False,
+            expire_tokens=any(
+                field in update_data and update_data[field] != existing_user.get(field)
+                for field in ("role", "is_active")
+            )
+        )
+        
         # Return updated user data
         updated_user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0, "password": 0})
         updated_user["message"] = "User updated successfully"
@@ -304,7 +301,8 @@ async def update_user(
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Delete user (Admin only)"""
     try:
@@ -339,6 +337,8 @@ async def delete_user(
                 detail="Failed to delete user"
             )
         
+        await invalidate_user(db, user_id, revoke=True)
+        
         return {"message": "User deleted successfully", "deleted_user_id": user_id}
         
     except HTTPException:
@@ -352,7 +352,8 @@ async def delete_user(
 @router.get("/users/{user_id}/comprehensive-profile")
 async def get_user_comprehensive_profile(
     user_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get comprehensive user profile with extended data"""
     try:
@@ -6,8 +6,9 @@ Visits management routes for Medical Management System
 
 from fastapi import APIRouter, HTTPException, Depends, status, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from services.pagination import paginate
 import jwt
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
@@ -18,11 +19,6 @@ import uuid
 from dotenv import load_dotenv
 load_dotenv()
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # JWT Configuration  
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -91,7 +87,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
 # Helper functions
-async def get_clinic_info(clinic_id: str) -> Dict[str, Any]:
+async def get_clinic_info(db: AsyncIOMotorDatabase, clinic_id: str) -> Dict[str, Any]:
     """Get clinic information"""
     try:
         clinic = await db.clinics.find_one({"id": clinic_id}, {"_id": 0})
@@ -106,7 +102,7 @@ async def get_clinic_info(clinic_id: str) -> Dict[str, Any]:
     except:
         return {"id": clinic_id, "name": "Unknown Clinic", "address": "", "phone": ""}
 
-async def get_user_info(user_id: str) -> Dict[str, Any]:
+async def get_user_info(db: AsyncIOMotorDatabase, user_id: str) -> Dict[str, Any]:
     """Get user information"""
     try:
         user = await db.users.find_one({"id": user_id}, {"_id": 0})
@@ -121,7 +117,7 @@ async def get_user_info(user_id: str) -> Dict[str, Any]:
         return {"id": user_id, "full_name": "Unknown User", "role": "unknown"}
 
 # Sample data creation function
-async def ensure_sample_visits():
+async def ensure_sample_visits(db: AsyncIOMotorDatabase):
     """Create sample visits if none exist"""
     visits_count = await db.rep_visits.count_documents({})
     if visits_count == 0:
@@ -172,12 +168,13 @@ async def ensure_sample_visits():
 async def get_visits_overview(
     current_user: dict = Depends(get_current_user),
     time_filter: str = Query("today", description="فلتر الوقت: today, week, month"),
-    representative_id: Optional[str] = Query(None, description="معرف المندوب")
+    representative_id: Optional[str] = Query(None, description="معرف المندوب"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get visits overview statistics"""
     try:
         # Ensure sample data exists
-        await ensure_sample_visits()
+        await ensure_sample_visits(db)
         
         # Build time filter
         now = datetime.utcnow()
@@ -239,12 +236,15 @@ async def get_visits_list(
     status: Optional[str] = Query(None, description="فلتر حسب الحالة"),
     representative_id: Optional[str] = Query(None, description="فلتر حسب المندوب"),
     date_from: Optional[str] = Query(None, description="من تاريخ"),
-    date_to: Optional[str] = Query(None, description="إلى تاريخ")
+    date_to: Optional[str] = Query(None, description="إلى تاريخ"),
+    cursor: Optional[str] = Query(None, description="next_cursor من الصفحة السابقة"),
+    total: str = Query("estimate", regex="^(estimate|exact|none)$"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get paginated visits list with filtering"""
     try:
         # Ensure sample data exists
-        await ensure_sample_visits()
+        await ensure_sample_visits(db)
         
         # Build query
         query = {}
@@ -267,33 +267,37 @@ async def get_visits_list(
             else:
                 query["visit_date"] = {"$lte": date_to}
         
-        # Get total count
-        total_count = await db.rep_visits.count_documents(query)
-        
-        # Get paginated results
-        skip = (page - 1) * limit
-        visits = []
-        async for visit in db.rep_visits.find(query, {"_id": 0}).skip(skip).limit(limit).sort("visit_date", -1):
-            visits.append(visit)
+        # Get paginated results (cursor first, page number for older clients)
+        result = await paginate(
+            db.rep_visits, query, [("visit_date", -1)], limit,
+            cursor=cursor, offset=(page - 1) * limit, projection={"_id": 0}, total=total
+        )
+        total_count = result["total_count"]
         
         return {
             "success": True,
-            "visits": visits,
+            "visits": result["items"],
             "pagination": {
                 "page": page,
                 "limit": limit,
                 "total_count": total_count,
-                "total_pages": (total_count + limit - 1) // limit
+                "total_is_estimate": result["total_is_estimate"],
+                "total_pages": (total_count + limit - 1) // limit if total_count is not None else None,
+                "has_more": result["has_more"],
+                "next_cursor": result["next_cursor"]
             }
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving visits list: {str(e)}")
 
 @router.post("/create")
 async def create_visit(
     visit_data: VisitCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Create a new visit"""
     try:
@@ -305,8 +309,8 @@ async def create_visit(
             )
         
         # Get clinic and representative info
-        clinic_info = await get_clinic_info(visit_data.clinic_id)
-        user_info = await get_user_info(current_user.get("user_id"))
+        clinic_info = await get_clinic_info(db, visit_data.clinic_id)
+        user_info = await get_user_info(db, current_user.get("user_id"))
         
         # Create new visit
         visit_id = str(uuid.uuid4())
@@ -349,7 +353,8 @@ async def create_visit(
 async def update_visit(
     visit_id: str,
     visit_data: VisitUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Update visit details"""
     try:
@@ -408,7 +413,8 @@ async def get_login_logs(
     limit: int = Query(20, ge=1, le=100, description="عدد النتائج في الصفحة"),
     user_id: Optional[str] = Query(None, description="فلتر حسب المستخدم"),
     date_from: Optional[str] = Query(None, description="من تاريخ"),
-    date_to: Optional[str] = Query(None, description="إلى تاريخ")
+    date_to: Optional[str] = Query(None, description="إلى تاريخ"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get login logs - Admins see all, others see their own"""
     try:
@@ -461,7 +467,8 @@ async def get_login_logs(
 @router.get("/stats/representatives")
 async def get_representatives_stats(
     current_user: dict = Depends(get_current_user),
-    time_filter: str = Query("month", description="فلتر الوقت: week, month, quarter")
+    time_filter: str = Query("month", description="فلتر الوقت: week, month, quarter"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get representatives performance statistics"""
     try:
@@ -473,7 +480,7 @@ async def get_representatives_stats(
             )
         
         # Ensure sample data exists
-        await ensure_sample_visits()
+        await ensure_sample_visits(db)
         
         # Build time filter
         now = datetime.utcnow()
@@ -10,11 +10,16 @@ from datetime import datetime, timedelta
 import json
 import math
 import random
+from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from models.activity_models import (
     ActivityCreate, ActivityResponse, ActivityFilter, 
     ActivityStats, GPSTrackingLog, LocationData, DeviceInfo, ActivityType
 )
+from database import get_database
+from services.geo_distance import segment_lengths_km
+from services.gps_ingest_service import GPS_COLLECTION, ingest_points
+from services.gps_trail_service import classify_points
 
 router = APIRouter()
 security = HTTPBearer()
@@ -72,7 +77,6 @@ def admin_required(current_user: dict = Depends(get_current_user)):
 
 # Mock Database - في التطبيق الحقيقي يجب استخدام قاعدة بيانات حقيقية
 ACTIVITIES_DB = []
-GPS_LOGS_DB = []
 
 def generate_mock_activities():
     """توليد بيانات تجريبية شاملة للأنشطة"""
@@ -222,12 +226,10 @@ async def log_activity(
         
         # If location provided, also store in GPS logs
         if activity.location:
-            gps_log = GPSTrackingLog(
-                user_id=current_user["id"],
-                activity_id=activity_response.id,
-                location=activity.location
-            )
-            GPS_LOGS_DB.append(gps_log)
+            point = {**activity.location.dict(), "activity_id": activity_response.id}
+            if not await ingest_points(current_user["id"], [point]):
+                # النشاط مسجل - نقطة الموقع فقط تسقط (counted in gps_buffer.stats["rejected"])
+                print(f"⚠️ GPS buffer full, location of activity {activity_response.id} dropped")
         
         return activity_response
         
@@ -364,41 +366,58 @@ async def get_gps_tracking_logs(
     to_date: Optional[datetime] = None,
     limit: int = 100,
     offset: int = 0,
-    current_user: dict = Depends(admin_required)
+    current_user: dict = Depends(admin_required),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على سجلات تتبع GPS - للأدمن فقط"""
     try:
-        # Generate mock GPS data if empty
-        if not GPS_LOGS_DB:
-            for activity in ACTIVITIES_DB[:20]:  # Generate GPS logs for first 20 activities
-                if activity.location:
-                    gps_log = GPSTrackingLog(
-                        user_id=activity.user_id,
-                        activity_id=activity.id,
-                        location=activity.location,
-                        movement_type=random.choice(["walking", "driving", "stationary"]),
-                        distance_from_last=random.uniform(0, 1000),
-                        duration_at_location=random.randint(5, 180)
-                    )
-                    GPS_LOGS_DB.append(gps_log)
-        
-        # Apply filters
-        filtered_logs = GPS_LOGS_DB.copy()
-        
+        # قراءة النقاط من مجموعة السلاسل الزمنية
+        query = {}
         if user_id:
-            filtered_logs = [log for log in filtered_logs if log.user_id == user_id]
-        
-        if from_date:
-            filtered_logs = [log for log in filtered_logs if log.created_at >= from_date]
-        
-        if to_date:
-            filtered_logs = [log for log in filtered_logs if log.created_at <= to_date]
-        
-        # Sort by timestamp (newest first)
-        filtered_logs.sort(key=lambda x: x.created_at, reverse=True)
+            query["meta.user_id"] = user_id
+        if from_date or to_date:
+            query["ts"] = {}
+            if from_date:
+                query["ts"]["$gte"] = from_date
+            if to_date:
+                query["ts"]["$lte"] = to_date
+        
+        cursor = db[GPS_COLLECTION].find(query).sort("ts", -1).skip(offset).limit(limit)
+        filtered_logs = [
+            GPSTrackingLog(
+                id=str(point["_id"]),
+                user_id=point["meta"]["user_id"],
+                activity_id=point.get("activity_id"),
+                location=LocationData(
+                    latitude=point["lat"],
+                    longitude=point["lng"],
+                    accuracy=point.get("accuracy"),
+                    altitude=point.get("altitude"),
+                    speed=point.get("speed"),
+                    heading=point.get("heading"),
+                    timestamp=point["ts"]
+                ),
+                created_at=point.get("received_at", point["ts"])
+            )
+            async for point in cursor
+        ]
         
-        # Apply pagination
-        return filtered_logs[offset:offset + limit]
+        # المسافة من الموقع السابق ونوع الحركة ومدة البقاء لكل مستخدم (حساب واحد لكل مسار)
+        trails = {}
+        for log in sorted(filtered_logs, key=lambda x: x.location.timestamp):
+            trails.setdefault(log.user_id, []).append(log)
+        for trail in trails.values():
+            lats = [log.location.latitude for log in trail]
+            lons = [log.location.longitude for log in trail]
+            steps_km = segment_lengths_km(lats, lons)
+            for log, step_km in zip(trail[1:], steps_km):
+                log.distance_from_last = round(float(step_km) * 1000, 1)
+            classified = classify_points([log.location.timestamp for log in trail], lats, lons)
+            for log, (movement_type, duration) in zip(trail, classified):
+                log.movement_type = movement_type
+                log.duration_at_location = duration
+        
+        return filtered_logs
         
     except Exception as e:
         raise HTTPException(
@@ -451,15 +470,17 @@ async def log_gps_location(
 ):
     """تسجيل موقع GPS للمستخدم الحالي"""
     try:
-        gps_log = GPSTrackingLog(
-            user_id=current_user["id"],
-            location=location_data
-        )
-        
-        GPS_LOGS_DB.append(gps_log)
+        if not await ingest_points(current_user["id"], [location_data.dict()]):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="الخادم مشغول، أعد إرسال الموقع لاحقاً",
+                headers={"Retry-After": "5"}
+            )
         
-        return {"message": "تم تسجيل الموقع بنجاح", "log_id": gps_log.id}
+        return {"message": "تم تسجيل الموقع بنجاح"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
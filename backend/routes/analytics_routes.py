@@ -1,11 +1,11 @@
 # Analytics API Routes - مسارات API للتحليلات المتقدمة
 from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer
 from typing import List, Optional
 from datetime import datetime, date
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
-import jwt
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from auth import get_current_user, get_current_user_claims
 
 from models.analytics_models import *
 from services.analytics_service import AnalyticsService
@@ -13,32 +13,13 @@ from services.analytics_service import AnalyticsService
 router = APIRouter()
 security = HTTPBearer()
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # Initialize analytics service
-analytics_service = AnalyticsService(db)
+analytics_service = AnalyticsService(get_database())
 
 # JWT Configuration
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """الحصول على المستخدم الحالي"""
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
 # Sales Analytics
 @router.get("/analytics/sales")
 async def get_sales_analytics(
@@ -46,7 +27,7 @@ async def get_sales_analytics(
     rep_id: Optional[str] = None,
     area_id: Optional[str] = None,
     clinic_id: Optional[str] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على تحليلات المبيعات"""
     try:
@@ -78,7 +59,7 @@ async def get_visit_analytics(
     time_range: TimeRange = TimeRange.THIS_MONTH,
     rep_id: Optional[str] = None,
     clinic_id: Optional[str] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على تحليلات الزيارات"""
     try:
@@ -106,7 +87,7 @@ async def get_visit_analytics(
 @router.get("/analytics/performance")
 async def get_performance_dashboard(
     time_range: TimeRange = TimeRange.THIS_MONTH,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على لوحة الأداء الشخصية"""
     try:
@@ -266,7 +247,8 @@ async def generate_analytics_report(
 @router.get("/analytics/reports/{report_id}")
 async def get_report_details(
     report_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على تفاصيل التقرير"""
     try:
@@ -292,7 +274,8 @@ async def get_report_details(
 async def list_my_reports(
     limit: int = Query(20, le=100),
     offset: int = Query(0, ge=0),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """قائمة تقاريري"""
     try:
@@ -330,7 +313,7 @@ async def list_my_reports(
 # Real-time Analytics
 @router.get("/analytics/real-time")
 async def get_real_time_analytics(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على التحليلات الفورية"""
     try:
@@ -348,7 +331,8 @@ async def get_real_time_analytics(
 @router.post("/analytics/custom-query")
 async def execute_custom_analytics_query(
     query_data: dict,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """تنفيذ استعلام تحليلات مخصص"""
     try:
@@ -379,7 +363,7 @@ async def execute_custom_analytics_query(
 # Dashboard Templates
 @router.get("/analytics/dashboard-templates")
 async def get_dashboard_templates(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على قوالب لوحات المعلومات"""
     try:
@@ -423,7 +407,7 @@ async def export_analytics_data(
     export_type: str,
     time_range: TimeRange = TimeRange.THIS_MONTH,
     format: str = Query("json", regex="^(json|csv|excel)$"),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """تصدير بيانات التحليلات"""
     try:
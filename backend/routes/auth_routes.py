@@ -1,11 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer
 from models.all_models import User, UserLogin, UserRole
 import hashlib
 import jwt
 from datetime import datetime, timedelta
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from auth import get_current_user
 from typing import Optional
 
 router = APIRouter()
@@ -40,77 +41,48 @@ def verify_jwt_token(token: str):
     except Exception as e:
         raise HTTPException(status_code=401, detail="Token verification failed")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """الحصول على المستخدم الحالي من JWT token"""
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing authorization header")
+@router.post("/auth/login")
+async def login(user_data: UserLogin, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """تسجيل الدخول - User Login"""
+    user = await db.users.find_one({"username": user_data.username})
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
     
-    token = credentials.credentials
-    payload = verify_jwt_token(token)
+    # Verify password
+    if not hash_password(user_data.password) == user["password_hash"]:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
     
-    # Get user from database
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
+    # Check if user is active
+    if not user.get("is_active", True):
+        raise HTTPException(status_code=401, detail="Account is deactivated")
     
-    try:
-        user = await db.users.find_one({"id": payload["user_id"]})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    finally:
-        client.close()
-
-@router.post("/auth/login")
-async def login(user_data: UserLogin):
-    """تسجيل الدخول - User Login"""
-    # Database connection (should be shared from main server)
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
+    # Normalize role
+    user["role"] = UserRole.normalize_role(user["role"])
     
-    try:
-        user = await db.users.find_one({"username": user_data.username})
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid username or password")
-        
-        # Verify password
-        if not hash_password(user_data.password) == user["password_hash"]:
-            raise HTTPException(status_code=401, detail="Invalid username or password")
-        
-        # Check if user is active
-        if not user.get("is_active", True):
-            raise HTTPException(status_code=401, detail="Account is deactivated")
-        
-        # Normalize role
-        user["role"] = UserRole.normalize_role(user["role"])
-        
-        # Update last login
-        await db.users.update_one(
-            {"id": user["id"]},
-            {
-                "$set": {"last_login": datetime.utcnow()},
-                "$inc": {"login_count": 1}
-            }
-        )
-        
-        # Create JWT token
-        token = create_jwt_token(user)
-        
-        return {
-            "access_token": token,
-            "token_type": "bearer",
-            "user": {
-                "id": user["id"],
-                "username": user["username"],
-                "full_name": user["full_name"],
-                "role": user["role"],
-                "email": user.get("email"),
-                "phone": user.get("phone")
-            }
+    # Update last login
+    await db.users.update_one(
+        {"id": user["id"]},
+        {
+            "$set": {"last_login": datetime.utcnow()},
+            "$inc": {"login_count": 1}
         }
-    finally:
-        client.close()
+    )
+    
+    # Create JWT token
+    token = create_jwt_token(user)
+    
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "user": {
+            "id": user["id"],
+            "username": user["username"],
+            "full_name": user["full_name"],
+            "role": user["role"],
+            "email": user.get("email"),
+            "phone": user.get("phone")
+        }
+    }
 
 @router.get("/auth/me")
 async def get_me(current_user: dict = Depends(get_current_user)):
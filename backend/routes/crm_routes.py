@@ -1,11 +1,11 @@
 # CRM API Routes - مسارات API لنظام إدارة العلاقات
 from fastapi import APIRouter, HTTPException, Depends, Query
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer
 from typing import List, Optional
 from datetime import datetime
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
-import jwt
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from auth import get_current_user, get_current_user_claims
 
 from models.crm_models import *
 from services.crm_service import CRMService
@@ -13,32 +13,13 @@ from services.crm_service import CRMService
 router = APIRouter()
 security = HTTPBearer()
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # Initialize CRM service
-crm_service = CRMService(db)
+crm_service = CRMService(get_database())
 
 # JWT Configuration
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """الحصول على المستخدم الحالي"""
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
 # Client Interaction Management
 @router.post("/crm/interactions")
 async def create_interaction(
@@ -92,7 +73,7 @@ async def complete_interaction(
 async def get_client_interactions(
     client_id: str,
     limit: int = Query(50, le=200),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على تفاعلات العميل"""
     try:
@@ -129,7 +110,7 @@ async def create_client_profile(
 @router.get("/crm/profiles/{clinic_id}")
 async def get_client_profile(
     clinic_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على ملف العميل"""
     try:
@@ -202,7 +183,7 @@ async def create_follow_up_task(
 @router.get("/crm/tasks/pending")
 async def get_pending_tasks(
     limit: int = Query(50, le=200),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على المهام المعلقة"""
     try:
@@ -250,7 +231,9 @@ async def search_clients(
     search_text: Optional[str] = None,
     limit: int = Query(50, le=200),
     offset: int = Query(0, ge=0),
-    current_user: dict = Depends(get_current_user)
+    cursor: Optional[str] = Query(None, description="next_cursor من الصفحة السابقة"),
+    total: str = Query("estimate", regex="^(estimate|exact|none)$"),
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """البحث في العملاء"""
     try:
@@ -261,7 +244,9 @@ async def search_clients(
             last_interaction_days=last_interaction_days,
             search_text=search_text,
             limit=limit,
-            offset=offset
+            offset=offset,
+            cursor=cursor,
+            total=total
         )
         
         # للمندوبين: البحث في عملائهم فقط
@@ -273,13 +258,15 @@ async def search_clients(
             "success": True,
             "data": results
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في البحث: {str(e)}")
 
 @router.get("/crm/analytics/{client_id}")
 async def get_client_analytics(
     client_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على تحليلات العميل"""
     try:
@@ -294,7 +281,7 @@ async def get_client_analytics(
 
 @router.get("/crm/dashboard")
 async def get_crm_dashboard(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على لوحة معلومات CRM"""
     try:
@@ -313,7 +300,8 @@ async def get_crm_dashboard(
 # Quick Actions for Testing
 @router.post("/crm/test/create-sample-data")
 async def create_sample_crm_data(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """إنشاء بيانات تجريبية للـ CRM - للاختبار فقط"""
     try:
@@ -389,7 +377,8 @@ async def log_communication(
     content: str,
     subject: Optional[str] = None,
     duration: Optional[int] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """تسجيل اتصال مع العميل"""
     try:
@@ -419,7 +408,8 @@ async def log_communication(
 async def get_communication_history(
     client_id: str,
     limit: int = Query(50, le=200),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على تاريخ الاتصالات"""
     try:
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends, Header
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer
 from models.all_models import User, UserRole
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from auth import get_current_user_claims
 from datetime import datetime, timedelta
 import jwt
 from typing import Optional
@@ -26,36 +27,11 @@ def verify_jwt_token(token: str):
     except Exception as e:
         raise HTTPException(status_code=401, detail="Token verification failed")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """الحصول على المستخدم الحالي من JWT token"""
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Missing authorization header")
-    
-    token = credentials.credentials
-    payload = verify_jwt_token(token)
-    
-    # Get user from database
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
-    
-    try:
-        user = await db.users.find_one({"id": payload["user_id"]})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    finally:
-        client.close()
-
 @router.get("/dashboard/stats")
-async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
+async def get_dashboard_stats(current_user: dict = Depends(get_current_user_claims), db: AsyncIOMotorDatabase = Depends(get_database)):
     """احصائيات لوحة التحكم - Dashboard Statistics"""
     user = current_user
     
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
-    
     try:
         # Basic statistics - Enhanced with all system entities
         total_users = await db.users.count_documents({})
@@ -180,7 +156,4 @@ async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
                 "pending_approvals": 0,
                 "active_reps": 0
             }
-        }
-    finally:
-        if 'client' in locals():
-            client.close()
\ No newline at end of file
+        }
\ No newline at end of file
@@ -1,21 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer
 from typing import List, Optional
-from datetime import datetime, date
-import os
-import json
+from datetime import datetime
 import uuid
 import jwt
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from auth import get_current_user, get_current_user_claims
+from services.debt_repository import (
+    DebtRepository, DEBT_LOCATION_FIELDS, COLLECTION_LOCATION_FIELDS
+)
 
 # Import models
-from models.financial_models import (
+from models.debt_collection_models import (
     DebtRecord, DebtRecordCreate, CollectionRecord, CollectionRecordCreate,
-    PaymentPlan, PaymentPlanCreate, DebtSummary, CollectionSummary,
+    DebtSummary, CollectionSummary,
     DebtStatus, CollectionStatus, PaymentMethod
 )
 
-router = APIRouter(prefix="/debts", tags=["Debt Management"])
+router = APIRouter(prefix="/rep-debts", tags=["Debt Management"])
 security = HTTPBearer()
 
 # JWT Configuration
@@ -31,142 +34,51 @@ def decode_jwt_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current user from JWT token"""
-    token = credentials.credentials
-    payload = decode_jwt_token(token)
-    
-    # Connect to MongoDB
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
-    
-    try:
-        user = await db.users.find_one({"id": payload["user_id"]})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    finally:
-        client.close()
-
-# MongoDB-like file storage (can be replaced with actual MongoDB)
-DEBT_DATA_FILE = "/app/debt_data.json"
-COLLECTION_DATA_FILE = "/app/collection_data.json"
-PAYMENT_PLAN_DATA_FILE = "/app/payment_plan_data.json"
-
-def load_debt_data():
-    """تحميل بيانات الديون"""
-    if os.path.exists(DEBT_DATA_FILE):
-        try:
-            with open(DEBT_DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return [DebtRecord(**debt) for debt in data]
-        except:
-            return []
-    return []
-
-def save_debt_data(debts: List[DebtRecord]):
-    """حفظ بيانات الديون"""
-    try:
-        data = [debt.dict() for debt in debts]
-        # Convert datetime objects to strings for JSON serialization
-        for debt in data:
-            for key, value in debt.items():
-                if isinstance(value, datetime):
-                    debt[key] = value.isoformat()
-                elif isinstance(value, date):
-                    debt[key] = value.isoformat()
-        
-        with open(DEBT_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error saving debt data: {e}")
-        return False
-
-def load_collection_data():
-    """تحميل بيانات التحصيل"""
-    if os.path.exists(COLLECTION_DATA_FILE):
-        try:
-            with open(COLLECTION_DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return [CollectionRecord(**collection) for collection in data]
-        except:
-            return []
-    return []
-
-def save_collection_data(collections: List[CollectionRecord]):
-    """حفظ بيانات التحصيل"""
-    try:
-        data = [collection.dict() for collection in collections]
-        # Convert datetime objects to strings
-        for collection in data:
-            for key, value in collection.items():
-                if isinstance(value, datetime):
-                    collection[key] = value.isoformat()
-                elif isinstance(value, date):
-                    collection[key] = value.isoformat()
-        
-        with open(COLLECTION_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error saving collection data: {e}")
-        return False
-
 # ===============================
 # DEBT MANAGEMENT ENDPOINTS
 # ===============================
 
 @router.get("/", response_model=List[DebtRecord])
 async def get_debts(
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user_claims),
     status: Optional[str] = Query(None, description="فلترة حسب الحالة"),
     clinic_id: Optional[str] = Query(None, description="فلترة حسب العيادة"),
     medical_rep_id: Optional[str] = Query(None, description="فلترة حسب المندوب"),
     priority: Optional[str] = Query(None, description="فلترة حسب الأولوية"),
-    limit: int = Query(50, description="عدد النتائج")
+    limit: int = Query(50, description="عدد النتائج"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     الحصول على قائمة الديون مع فلترة حسب الدور
     Get debts list with role-based filtering
     """
     try:
-        debts = load_debt_data()
+        filters = {
+            "status": status,
+            "clinic_id": clinic_id,
+            "priority": priority
+        }
         
         # Role-based filtering
         if current_user.get("role") == "medical_rep":
             # Medical reps see only their own debts
-            debts = [debt for debt in debts if debt.medical_rep_id == current_user.get("id")]
-            
-            # Hide location data for reps
-            for debt in debts:
-                debt.gps_latitude = None
-                debt.gps_longitude = None
-                debt.address = None
-                debt.area = None
-                debt.region = None
+            filters["medical_rep_id"] = current_user.get("id")
         
         elif current_user.get("role") == "manager":
             # Managers see debts of their team
             # TODO: Implement team hierarchy logic
             pass
         
-        # Apply filters
-        if status:
-            debts = [debt for debt in debts if debt.status == status]
-        
-        if clinic_id:
-            debts = [debt for debt in debts if debt.clinic_id == clinic_id]
-            
         if medical_rep_id and current_user.get("role") in ["admin", "manager"]:
-            debts = [debt for debt in debts if debt.medical_rep_id == medical_rep_id]
-            
-        if priority:
-            debts = [debt for debt in debts if debt.priority == priority]
+            filters["medical_rep_id"] = medical_rep_id
         
-        # Sort by creation date (newest first) and limit
-        debts = sorted(debts, key=lambda x: x.created_at, reverse=True)[:limit]
+        # Sorted by creation date (newest first) and limited in the database
+        debts = await DebtRepository(db).list_debts(filters, limit)
+        
+        if current_user.get("role") == "medical_rep":
+            # Hide location data for reps
+            for debt in debts:
+                debt.update({field: None for field in DEBT_LOCATION_FIELDS})
         
         return debts
     
@@ -176,7 +88,8 @@ async def get_debts(
 @router.post("/", response_model=DebtRecord)
 async def create_debt(
     debt_data: DebtRecordCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     إنشاء سجل دين جديد
@@ -210,15 +123,9 @@ async def create_debt(
             updated_by=current_user.get("id", "")
         )
         
-        # Load existing debts and add new one
-        debts = load_debt_data()
-        debts.append(new_debt)
+        await DebtRepository(db).create_debt(new_debt.dict())
         
-        # Save to file
-        if save_debt_data(debts):
-            return new_debt
-        else:
-            raise HTTPException(status_code=500, detail="Error saving debt record")
+        return new_debt
     
     except HTTPException:
         raise
@@ -228,30 +135,26 @@ async def create_debt(
 @router.get("/{debt_id}", response_model=DebtRecord)
 async def get_debt_by_id(
     debt_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     الحصول على دين محدد بالمعرف
     Get specific debt by ID
     """
     try:
-        debts = load_debt_data()
-        debt = next((d for d in debts if d.id == debt_id), None)
+        debt = await DebtRepository(db).get_debt(debt_id)
         
         if not debt:
             raise HTTPException(status_code=404, detail="الدين غير موجود")
         
         # Role-based access control
         if current_user.get("role") == "medical_rep":
-            if debt.medical_rep_id != current_user.get("id"):
+            if debt.get("medical_rep_id") != current_user.get("id"):
                 raise HTTPException(status_code=403, detail="غير مسموح لك بالوصول لهذا الدين")
             
             # Hide location data for reps
-            debt.gps_latitude = None
-            debt.gps_longitude = None
-            debt.address = None
-            debt.area = None
-            debt.region = None
+            debt.update({field: None for field in DEBT_LOCATION_FIELDS})
         
         return debt
     
@@ -264,7 +167,8 @@ async def get_debt_by_id(
 async def update_debt(
     debt_id: str,
     updates: dict,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     تحديث سجل الدين
@@ -275,26 +179,18 @@ async def update_debt(
         if current_user.get("role") not in ["admin", "manager", "accountant"]:
             raise HTTPException(status_code=403, detail="غير مسموح لك بتحديث الديون")
         
-        debts = load_debt_data()
-        debt_index = next((i for i, d in enumerate(debts) if d.id == debt_id), None)
+        # Amounts are only changed by collections ($inc), never overwritten here
+        updates = {
+            **updates,
+            "updated_at": datetime.utcnow(),
+            "updated_by": current_user.get("id", "")
+        }
+        debt = await DebtRepository(db).update_debt(debt_id, updates)
         
-        if debt_index is None:
+        if debt is None:
             raise HTTPException(status_code=404, detail="الدين غير موجود")
         
-        # Update debt record
-        debt = debts[debt_index]
-        for key, value in updates.items():
-            if hasattr(debt, key) and key not in ['id', 'created_at', 'created_by']:
-                setattr(debt, key, value)
-        
-        debt.updated_at = datetime.utcnow()
-        debt.updated_by = current_user.get("id", "")
-        
-        # Save changes
-        if save_debt_data(debts):
-            return debt
-        else:
-            raise HTTPException(status_code=500, detail="Error updating debt record")
+        return debt
     
     except HTTPException:
         raise
@@ -303,37 +199,41 @@ async def update_debt(
 
 @router.get("/summary/statistics")
 async def get_debt_summary(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     الحصول على ملخص إحصائيات الديون
     Get debt summary statistics
     """
     try:
-        debts = load_debt_data()
-        
         # Role-based filtering
+        match = {}
         if current_user.get("role") == "medical_rep":
-            debts = [debt for debt in debts if debt.medical_rep_id == current_user.get("id")]
+            match["medical_rep_id"] = current_user.get("id")
+        
+        # Calculate summary in a single aggregation
+        stats = await DebtRepository(db).debt_summary(match)
+        totals = stats["totals"]
+        by_status = stats["by_status"]
+        by_priority = stats["by_priority"]
         
-        # Calculate summary
-        total_debts = len(debts)
-        total_amount = sum(debt.original_amount for debt in debts)
-        paid_amount = sum(debt.paid_amount for debt in debts)
-        outstanding_amount = sum(debt.outstanding_amount for debt in debts)
-        overdue_amount = sum(debt.outstanding_amount for debt in debts 
-                           if debt.status == DebtStatus.OVERDUE)
+        total_debts = totals.get("total_debts", 0)
+        total_amount = totals.get("total_amount") or 0
+        paid_amount = totals.get("paid_amount") or 0
+        outstanding_amount = totals.get("outstanding_amount") or 0
+        overdue_amount = by_status.get(DebtStatus.OVERDUE.value, {}).get("outstanding_amount") or 0
         
         # Status breakdown
-        pending_count = len([d for d in debts if d.status == DebtStatus.PENDING])
-        partial_count = len([d for d in debts if d.status == DebtStatus.PARTIAL])
-        paid_count = len([d for d in debts if d.status == DebtStatus.PAID])
-        overdue_count = len([d for d in debts if d.status == DebtStatus.OVERDUE])
+        pending_count = by_status.get(DebtStatus.PENDING.value, {}).get("count", 0)
+        partial_count = by_status.get(DebtStatus.PARTIAL.value, {}).get("count", 0)
+        paid_count = by_status.get(DebtStatus.PAID.value, {}).get("count", 0)
+        overdue_count = by_status.get(DebtStatus.OVERDUE.value, {}).get("count", 0)
         
         # Priority breakdown
-        high_priority_count = len([d for d in debts if d.priority == "high"])
-        medium_priority_count = len([d for d in debts if d.priority == "medium"])
-        low_priority_count = len([d for d in debts if d.priority == "low"])
+        high_priority_count = by_priority.get("high", 0)
+        medium_priority_count = by_priority.get("medium", 0)
+        low_priority_count = by_priority.get("low", 0)
         
         summary = DebtSummary(
             total_debts=total_debts,
@@ -361,41 +261,33 @@ async def get_debt_summary(
 
 @router.get("/collections/", response_model=List[CollectionRecord])
 async def get_collections(
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user_claims),
     debt_id: Optional[str] = Query(None, description="فلترة حسب الدين"),
     status: Optional[str] = Query(None, description="فلترة حسب الحالة"),
-    limit: int = Query(50, description="عدد النتائج")
+    limit: int = Query(50, description="عدد النتائج"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     الحصول على قائمة التحصيلات
     Get collections list
     """
     try:
-        collections = load_collection_data()
-        debts = load_debt_data()
+        filters = {
+            "debt_id": debt_id,
+            "collection_status": status
+        }
         
-        # Role-based filtering
+        # Role-based filtering (medical_rep_id is copied from the debt on every collection)
         if current_user.get("role") == "medical_rep":
-            # Get user's debts first
-            user_debts = [debt.id for debt in debts if debt.medical_rep_id == current_user.get("id")]
-            collections = [c for c in collections if c.debt_id in user_debts]
-            
-            # Hide location data for reps
-            for collection in collections:
-                collection.collection_location = None
-                collection.gps_latitude = None
-                collection.gps_longitude = None
-                collection.collection_time = None
-        
-        # Apply filters
-        if debt_id:
-            collections = [c for c in collections if c.debt_id == debt_id]
+            filters["medical_rep_id"] = current_user.get("id")
         
-        if status:
-            collections = [c for c in collections if c.collection_status == status]
+        # Sorted and limited in the database
+        collections = await DebtRepository(db).list_collections(filters, limit)
         
-        # Sort and limit
-        collections = sorted(collections, key=lambda x: x.created_at, reverse=True)[:limit]
+        if current_user.get("role") == "medical_rep":
+            # Hide location data for reps
+            for collection in collections:
+                collection.update({field: None for field in COLLECTION_LOCATION_FIELDS})
         
         return collections
     
@@ -405,7 +297,8 @@ async def get_collections(
 @router.post("/collections/", response_model=CollectionRecord)
 async def create_collection(
     collection_data: CollectionRecordCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     إنشاء سجل تحصيل جديد
@@ -413,21 +306,21 @@ async def create_collection(
     """
     try:
         # Find the debt record
-        debts = load_debt_data()
-        debt = next((d for d in debts if d.id == collection_data.debt_id), None)
+        repository = DebtRepository(db)
+        debt = await repository.get_debt(collection_data.debt_id)
         
         if not debt:
             raise HTTPException(status_code=404, detail="الدين غير موجود")
         
         # Check permissions
         if current_user.get("role") == "medical_rep":
-            if debt.medical_rep_id != current_user.get("id"):
+            if debt.get("medical_rep_id") != current_user.get("id"):
                 raise HTTPException(status_code=403, detail="غير مسموح لك بتسجيل تحصيل لهذا الدين")
         
         # Create collection record
         new_collection = CollectionRecord(
             debt_id=collection_data.debt_id,
-            debt_number=debt.debt_number,
+            debt_number=debt.get("debt_number"),
             collection_amount=collection_data.collection_amount,
             collection_method=collection_data.collection_method,
             collector_id=current_user.get("id", ""),
@@ -440,29 +333,18 @@ async def create_collection(
             created_by=current_user.get("id", "")
         )
         
-        # Load existing collections and add new one
-        collections = load_collection_data()
-        collections.append(new_collection)
-        
-        # Update debt record
-        debt.paid_amount += collection_data.collection_amount
-        debt.outstanding_amount = debt.original_amount - debt.paid_amount
-        
-        # Update debt status
-        if debt.outstanding_amount <= 0:
-            debt.status = DebtStatus.PAID
-            debt.payment_completion_date = collection_data.collection_date
-        elif debt.paid_amount > 0:
-            debt.status = DebtStatus.PARTIAL
-        
-        debt.updated_at = datetime.utcnow()
-        debt.updated_by = current_user.get("id", "")
-        
-        # Save both collections and updated debts
-        if save_collection_data(collections) and save_debt_data(debts):
-            return new_collection
-        else:
-            raise HTTPException(status_code=500, detail="Error saving collection record")
+        # Save the collection with the debt's rep so rep filters stay indexed,
+        # then update debt amounts and status atomically (rolled back on failure)
+        updated_debt = await repository.record_collection(
+            {**new_collection.dict(), "medical_rep_id": debt.get("medical_rep_id")},
+            paid_status=DebtStatus.PAID.value,
+            partial_status=DebtStatus.PARTIAL.value
+        )
+        
+        if updated_debt is None:
+            raise HTTPException(status_code=400, detail="مبلغ التحصيل أكبر من المبلغ المتبقي")
+        
+        return new_collection
     
     except HTTPException:
         raise
@@ -471,33 +353,35 @@ async def create_collection(
 
 @router.get("/collections/summary/statistics")
 async def get_collection_summary(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     الحصول على ملخص إحصائيات التحصيل
     Get collection summary statistics
     """
     try:
-        collections = load_collection_data()
-        debts = load_debt_data()
-        
         # Role-based filtering
+        match = {}
         if current_user.get("role") == "medical_rep":
-            user_debts = [debt.id for debt in debts if debt.medical_rep_id == current_user.get("id")]
-            collections = [c for c in collections if c.debt_id in user_debts]
+            match["medical_rep_id"] = current_user.get("id")
+        
+        # Calculate summary in a single aggregation
+        stats = await DebtRepository(db).collection_summary(match)
+        by_status = stats["by_status"]
+        by_method = stats["by_method"]
         
-        # Calculate summary
-        total_collections = len(collections)
-        total_collected_amount = sum(c.collection_amount for c in collections)
-        successful_collections = len([c for c in collections if c.collection_status == CollectionStatus.SUCCESSFUL])
-        failed_collections = len([c for c in collections if c.collection_status == CollectionStatus.FAILED])
-        pending_collections = len([c for c in collections if c.collection_status == CollectionStatus.PENDING])
+        total_collections = stats["total_collections"]
+        total_collected_amount = stats["total_collected_amount"]
+        successful_collections = by_status.get(CollectionStatus.SUCCESSFUL.value, 0)
+        failed_collections = by_status.get(CollectionStatus.FAILED.value, 0)
+        pending_collections = by_status.get(CollectionStatus.PENDING.value, 0)
         
         # By method
-        cash_collections = sum(c.collection_amount for c in collections if c.collection_method == PaymentMethod.CASH)
-        bank_collections = sum(c.collection_amount for c in collections if c.collection_method == PaymentMethod.BANK_TRANSFER)
-        check_collections = sum(c.collection_amount for c in collections if c.collection_method == PaymentMethod.CHECK)
-        card_collections = sum(c.collection_amount for c in collections if c.collection_method == PaymentMethod.CARD)
+        cash_collections = by_method.get(PaymentMethod.CASH.value, 0)
+        bank_collections = by_method.get(PaymentMethod.BANK_TRANSFER.value, 0)
+        check_collections = by_method.get(PaymentMethod.CHECK.value, 0)
+        card_collections = by_method.get(PaymentMethod.CARD.value, 0)
         
         summary = CollectionSummary(
             total_collections=total_collections,
@@ -523,28 +407,28 @@ async def get_collection_summary(
 @router.get("/{debt_id}/export/pdf")
 async def export_debt_pdf(
     debt_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     تصدير الدين كملف PDF
     Export debt as PDF
     """
     try:
-        debts = load_debt_data()
-        debt = next((d for d in debts if d.id == debt_id), None)
+        debt = await DebtRepository(db).get_debt(debt_id)
         
         if not debt:
             raise HTTPException(status_code=404, detail="الدين غير موجود")
         
         # Role-based access control
         if current_user.get("role") == "medical_rep":
-            if debt.medical_rep_id != current_user.get("id"):
+            if debt.get("medical_rep_id") != current_user.get("id"):
                 raise HTTPException(status_code=403, detail="غير مسموح لك بالوصول لهذا الدين")
         
         # TODO: Implement actual PDF generation
         # For now, return structured data that can be used for PDF generation
         pdf_data = {
-            "debt_record": debt.dict(),
+            "debt_record": debt,
             "generated_by": current_user.get("full_name", ""),
             "generated_at": datetime.utcnow().isoformat(),
             "company_info": {
@@ -558,7 +442,7 @@ async def export_debt_pdf(
         return {
             "message": "PDF data prepared successfully",
             "pdf_data": pdf_data,
-            "download_url": f"/api/debts/{debt_id}/download/pdf"
+            "download_url": f"/api/rep-debts/{debt_id}/download/pdf"
         }
     
     except HTTPException:
@@ -569,26 +453,26 @@ async def export_debt_pdf(
 @router.get("/{debt_id}/print")
 async def print_debt(
     debt_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     طباعة الدين
     Print debt
     """
     try:
-        debts = load_debt_data()
-        debt = next((d for d in debts if d.id == debt_id), None)
+        debt = await DebtRepository(db).get_debt(debt_id)
         
         if not debt:
             raise HTTPException(status_code=404, detail="الدين غير موجود")
         
         # Role-based access control
         if current_user.get("role") == "medical_rep":
-            if debt.medical_rep_id != current_user.get("id"):
+            if debt.get("medical_rep_id") != current_user.get("id"):
                 raise HTTPException(status_code=403, detail="غير مسموح لك بطباعة هذا الدين")
         
         # Prepare print data (without sensitive location info for reps)
-        print_data = debt.dict()
+        print_data = dict(debt)
         
         if current_user.get("role") == "medical_rep":
             # Remove sensitive data for medical reps
@@ -601,7 +485,7 @@ async def print_debt(
         return {
             "message": "Print data prepared successfully",
             "print_data": print_data,
-            "printable": debt.is_printable
+            "printable": debt.get("is_printable", True)
         }
     
     except HTTPException:
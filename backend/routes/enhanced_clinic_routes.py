@@ -2,12 +2,14 @@
 # Enhanced Clinic Management APIs with Professional Registration System
 
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date
 import traceback
 import uuid
 import json
 
+from database import get_database
 from models.all_models import User
 from models.enhanced_clinic_models import (
     EnhancedClinic, ClinicRegistrationRequest, ClinicModificationLog,
@@ -17,6 +19,10 @@ from models.enhanced_clinic_models import (
     LocationData, RegistrationLocationData
 )
 from routes.auth_routes import get_current_user
+from services.clinic_roster_service import ClinicRosterService, sync_clinic_roster
+from services.geo_service import geo_point, clinic_geo_point
+from services.geo_distance import score_registrations
+from services.pagination import paginate
 
 # إنشاء الموجه
 router = APIRouter(prefix="/enhanced-clinics", tags=["Enhanced Clinic Management"])
@@ -27,12 +33,11 @@ router = APIRouter(prefix="/enhanced-clinics", tags=["Enhanced Clinic Management
 
 @router.get("/registration/form-data")
 async def get_registration_form_data(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على بيانات النموذج (الخطوط والمناطق المتاحة)"""
     try:
-        from server import db
-        
         # جلب الخطوط النشطة
         lines = []
         lines_cursor = db.lines.find({"is_active": True}).sort("priority", 1)
@@ -164,12 +169,11 @@ async def get_registration_form_data(
 @router.post("/register")
 async def register_clinic(
     request: ClinicRegistrationRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """تسجيل عيادة جديدة"""
     try:
-        from server import db
-        
         # التحقق من الصلاحيات
         if current_user.get("role") not in ["medical_rep", "admin", "manager", "line_manager"]:
             raise HTTPException(status_code=403, detail="غير مسموح لك بتسجيل العيادات")
@@ -224,6 +228,7 @@ async def register_clinic(
             # بيانات الموقع
             "location_data": location_data.dict(),
             "admin_approved_location": None,
+            "geo_location": geo_point(request.clinic_latitude, request.clinic_longitude),
             
             # الربط الجغرافي
             "line_id": request.line_id,
@@ -334,11 +339,33 @@ async def get_available_clinics_for_user(
     area_id: Optional[str] = Query(None, description="تصفية حسب المنطقة"),
     status_filter: Optional[str] = Query("approved", description="تصفية حسب الحالة"),
     limit: int = Query(50, le=100),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على العيادات المتاحة للمستخدم حسب الخط والمنطقة"""
     try:
-        from server import db
+        # المندوب يقرأ العيادات المعتمدة من قائمته المخزنة (استعلام مفهرس واحد)
+        if current_user.get("role") == "medical_rep" and (status_filter or "approved") == "approved":
+            roster_filter = {}
+            if line_id:
+                roster_filter["line_id"] = line_id
+            if area_id:
+                roster_filter["area_id"] = area_id
+            clinics, total_count = await ClinicRosterService(db).list_entries(
+                current_user.get("id"), "enhanced_clinics", roster_filter,
+                sort=[("clinic_created_at", -1)], limit=limit
+            )
+            return {
+                "success": True,
+                "clinics": clinics,
+                "statistics": {
+                    "total_available": total_count,
+                    "returned_count": len(clinics),
+                    "user_role": current_user.get("role", ""),
+                    "filtered_by_line": line_id is not None,
+                    "filtered_by_area": area_id is not None
+                }
+            }
         
         # بناء فلتر البحث حسب دور المستخدم
         query_filter = {"status": status_filter or "approved", "is_active": True}
@@ -366,21 +393,13 @@ async def get_available_clinics_for_user(
         
         # جلب العيادات
         clinics = []
-        clinics_cursor = db.enhanced_clinics.find(query_filter).limit(limit).sort("created_at", -1)
+        page = await db.enhanced_clinics.find(query_filter).limit(limit).sort("created_at", -1).to_list(limit)
         
-        async for clinic in clinics_cursor:
-            # حساب آخر زيارة للعيادة
-            last_visit = await db.rep_visits.find_one(
-                {"clinic_id": clinic.get("id", ""), "status": "completed"},
-                sort=[("actual_end_time", -1)]
-            )
-            
-            last_visit_date = None
-            if last_visit and last_visit.get("actual_end_time"):
-                try:
-                    last_visit_date = last_visit["actual_end_time"]
-                except:
-                    pass
+        # آخر زيارة مكتملة لكل عيادات الصفحة في تجميع واحد
+        last_visits = await ClinicRosterService(db).last_completed_visits([clinic.get("id", "") for clinic in page])
+        
+        for clinic in page:
+            last_visit_date = last_visits.get(clinic.get("id", ""))
             
             # تنسيق بيانات العيادة
             clinic_summary = {
@@ -443,12 +462,16 @@ async def get_admin_registration_logs(
     to_date: Optional[date] = Query(None, description="إلى تاريخ"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = Query(None, description="next_cursor من الصفحة السابقة"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """الحصول على سجلات تسجيل العيادات للأدمن"""
+    """الحصول على سجلات تسجيل العيادات للأدمن
+
+    With a cursor the page is fetched by keyset and the statistics (which
+    also give the total) are skipped; clients keep them from the first page.
+    """
     try:
-        from server import db
-        
         # التحقق من الصلاحيات
         if current_user.get("role") not in ["admin", "manager"]:
             raise HTTPException(status_code=403, detail="غير مسموح لك بالوصول لهذه البيانات")
@@ -483,69 +506,48 @@ async def get_admin_registration_logs(
         skip = (page - 1) * page_size
         
         # جلب السجلات
-        logs = []
-        logs_cursor = db.admin_registration_logs.find(query_filter).skip(skip).limit(page_size).sort("created_at", -1)
+        page_result = await paginate(
+            db.admin_registration_logs, query_filter, [("created_at", -1)], page_size,
+            cursor=cursor, offset=skip, projection={"_id": 0}, total="none"
+        )
+        logs = page_result["items"]
         
-        async for log in logs_cursor:
-            # إضافة معلومات إضافية للسجل
-            log_enhanced = dict(log)
-            
-            # حساب المسافة بين موقع العيادة وموقع المسجل
-            clinic_loc = log.get("clinic_location", {})
-            registrar_loc = log.get("registrar_location", {})
-            
-            distance_km = None
-            if (clinic_loc.get("latitude") and clinic_loc.get("longitude") and 
-                registrar_loc and registrar_loc.get("rep_latitude") and registrar_loc.get("rep_longitude")):
-                # يمكن حساب المسافة باستخدام formula Haversine
-                import math
-                
-                def calculate_distance(lat1, lon1, lat2, lon2):
-                    R = 6371  # نصف قطر الأرض بالكيلومتر
-                    dLat = math.radians(lat2 - lat1)
-                    dLon = math.radians(lon2 - lon1)
-                    a = (math.sin(dLat / 2) * math.sin(dLat / 2) +
-                         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-                         math.sin(dLon / 2) * math.sin(dLon / 2))
-                    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-                    return R * c
-                
-                try:
-                    distance_km = round(calculate_distance(
-                        clinic_loc["latitude"], clinic_loc["longitude"],
-                        registrar_loc["rep_latitude"], registrar_loc["rep_longitude"]
-                    ), 2)
-                except:
-                    pass
-            
-            log_enhanced["distance_between_locations_km"] = distance_km
-            log_enhanced["registration_accuracy"] = "high" if distance_km and distance_km < 0.1 else "medium" if distance_km and distance_km < 1 else "low"
+        # حساب المسافة بين موقع العيادة وموقع المسجل لكل السجلات دفعة واحدة
+        # (page_size <= 100, so this stays cheap; the formula and thresholds live only in geo_distance)
+        for log, (distance_km, accuracy) in zip(logs, score_registrations(logs)):
+            log["distance_between_locations_km"] = distance_km
+            log["registration_accuracy"] = accuracy
             
             # تنسيق التواريخ
-            if "created_at" in log_enhanced and isinstance(log_enhanced["created_at"], str):
+            if "created_at" in log and isinstance(log["created_at"], str):
                 try:
-                    log_enhanced["created_at_formatted"] = datetime.fromisoformat(log_enhanced["created_at"].replace('Z', '+00:00')).strftime("%Y-%m-%d %H:%M")
+                    log["created_at_formatted"] = datetime.fromisoformat(log["created_at"].replace('Z', '+00:00')).strftime("%Y-%m-%d %H:%M")
                 except:
                     pass
-            
-            logs.append(log_enhanced)
         
-        # إحصائيات
-        total_count = await db.admin_registration_logs.count_documents(query_filter)
-        
-        # إحصائيات سريعة
-        stats_pipeline = [
-            {"$match": query_filter if query_filter else {}},
-            {
-                "$group": {
-                    "_id": "$review_decision",
-                    "count": {"$sum": 1}
+        # إحصائيات سريعة - العدد الإجمالي مجموعها، فلا حاجة لعد منفصل
+        statistics = None
+        total_count = None
+        if not cursor:
+            stats_pipeline = [
+                {"$match": query_filter if query_filter else {}},
+                {
+                    "$group": {
+                        "_id": "$review_decision",
+                        "count": {"$sum": 1}
+                    }
                 }
+            ]
+            
+            stats_result = await db.admin_registration_logs.aggregate(stats_pipeline).to_list(10)
+            status_stats = {stat["_id"]: stat["count"] for stat in stats_result}
+            total_count = sum(status_stats.values())
+            statistics = {
+                "total_registrations": total_count,
+                "pending": status_stats.get("pending", 0),
+                "approved": status_stats.get("approved", 0),
+                "rejected": status_stats.get("rejected", 0)
             }
-        ]
-        
-        stats_result = await db.admin_registration_logs.aggregate(stats_pipeline).to_list(10)
-        status_stats = {stat["_id"]: stat["count"] for stat in stats_result}
         
         return {
             "success": True,
@@ -554,20 +556,18 @@ async def get_admin_registration_logs(
                 "current_page": page,
                 "page_size": page_size,
                 "total_count": total_count,
-                "total_pages": (total_count + page_size - 1) // page_size,
-                "has_next": skip + page_size < total_count,
-                "has_previous": page > 1
+                "total_pages": (total_count + page_size - 1) // page_size if total_count is not None else None,
+                "has_next": page_result["has_more"],
+                "has_previous": page > 1 or bool(cursor),
+                "next_cursor": page_result["next_cursor"]
             },
-            "statistics": {
-                "total_registrations": total_count,
-                "pending": status_stats.get("pending", 0),
-                "approved": status_stats.get("approved", 0),
-                "rejected": status_stats.get("rejected", 0)
-            }
+            "statistics": statistics
         }
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error getting admin registration logs: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="خطأ في جلب سجلات التسجيل")
@@ -579,12 +579,11 @@ async def approve_clinic_registration(
     approved_location: Optional[Dict[str, Any]] = None,
     classification: Optional[ClinicClassification] = None,
     credit_classification: Optional[CreditClassification] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """اعتماد تسجيل العيادة"""
     try:
-        from server import db
-        
         # التحقق من الصلاحيات
         if current_user.get("role") not in ["admin", "manager"]:
             raise HTTPException(status_code=403, detail="غير مسموح لك باعتماد التسجيلات")
@@ -620,6 +619,7 @@ async def approve_clinic_registration(
         # إضافة الموقع المعتمد إذا تم تحديده
         if approved_location:
             update_data["admin_approved_location"] = approved_location
+            update_data["geo_location"] = clinic_geo_point({**clinic, **update_data})
         
         # إضافة سجل تدقيق
         audit_entry = {
@@ -649,6 +649,9 @@ async def approve_clinic_registration(
         if result.modified_count == 0:
             raise HTTPException(status_code=500, detail="فشل في تحديث العيادة")
         
+        # تحديث قوائم عيادات المناديب
+        await sync_clinic_roster(db, clinic_id, "enhanced_clinics")
+        
         # تحديث سجل الأدمن
         await db.admin_registration_logs.update_one(
             {"clinic_id": clinic_id},
@@ -706,12 +709,11 @@ async def modify_clinic(
     clinic_id: str,
     modification_data: Dict[str, Any],
     modification_reason: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """تعديل بيانات العيادة"""
     try:
-        from server import db
-        
         # البحث عن العيادة
         clinic = await db.enhanced_clinics.find_one({"id": clinic_id})
         if not clinic:
@@ -752,6 +754,9 @@ async def modify_clinic(
         new_data = modification_data.copy()
         new_data["updated_at"] = datetime.utcnow().isoformat()
         new_data["updated_by"] = user_id
+        new_location = clinic_geo_point({**clinic, **modification_data})
+        if new_location != clinic.get("geo_location"):
+            new_data["geo_location"] = new_location
         
         # إضافة سجل تدقيق
         audit_entry = {
@@ -780,6 +785,9 @@ async def modify_clinic(
         if result.modified_count == 0:
             raise HTTPException(status_code=500, detail="فشل في تحديث العيادة")
         
+        # تحديث قوائم عيادات المناديب
+        await sync_clinic_roster(db, clinic_id, "enhanced_clinics")
+        
         # إنشاء سجل التعديل
         modification_log = {
             "id": str(uuid.uuid4()),
@@ -823,12 +831,11 @@ async def get_modification_logs(
     to_date: Optional[date] = Query(None, description="إلى تاريخ"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على سجلات تعديل العيادات"""
     try:
-        from server import db
-        
         # التحقق من الصلاحيات
         if current_user.get("role") not in ["admin", "manager"]:
             raise HTTPException(status_code=403, detail="غير مسموح لك بالوصول لهذه البيانات")
@@ -2,10 +2,12 @@
 # Medical Management System - Simple Financial APIs
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Dict, Any, Optional
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import traceback
+from database import get_database
 from models.all_models import User
 from routes.auth_routes import get_current_user
 
@@ -18,12 +20,11 @@ router = APIRouter(prefix="/financial", tags=["Financial Management"])
 
 @router.get("/dashboard/financial-overview")
 async def get_financial_overview(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """نظرة عامة على النظام المالي - Financial overview"""
     try:
-        from server import db
-        
         # جلب إحصائيات الديون
         total_debts = await db.debts.count_documents({})
         outstanding_debts = await db.debts.count_documents({"status": "outstanding"})
@@ -81,18 +82,16 @@ async def get_financial_overview(
                 "total_clients_with_debts": await db.debts.count_documents({"remaining_amount": {"$gt": 0}}),
                 "high_risk_clients_count": await db.debts.count_documents({"amount": {"$gte": 5000}})
             },
-            "top_risk_clients": await get_top_risk_clients()
+            "top_risk_clients": await get_top_risk_clients(db)
         }
         
     except Exception as e:
         print(f"Error getting financial overview: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="خطأ في جلب النظرة العامة المالية")
 
-async def get_top_risk_clients():
+async def get_top_risk_clients(db: AsyncIOMotorDatabase):
     """الحصول على العملاء عالي المخاطر"""
     try:
-        from server import db
-        
         # جلب أعلى الديون
         top_debts = await db.debts.find(
             {"remaining_amount": {"$gt": 0}},
@@ -145,12 +144,11 @@ async def get_invoices(
     clinic_id: Optional[str] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على قائمة الفواتير (من الطلبات) - Get invoices list"""
     try:
-        from server import db
-        
         # بناء فلتر البحث
         query_filter = {}
         
@@ -219,12 +217,11 @@ async def get_debts(
     clinic_id: Optional[str] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على قائمة الديون - Get debts list"""
     try:
-        from server import db
-        
         # بناء فلتر البحث
         query_filter = {}
         
@@ -301,12 +298,11 @@ async def get_debts(
 @router.get("/reports/aging-analysis")
 async def get_aging_analysis(
     clinic_ids: Optional[str] = Query(None),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """تحليل تقادم الديون - Aging analysis"""
     try:
-        from server import db
-        
         # تحديد العيادات المطلوبة
         clinic_filter = {}
         if clinic_ids:
@@ -394,12 +390,11 @@ async def get_financial_summary(
     start_date: date,
     end_date: date,
     clinic_ids: Optional[str] = Query(None),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الملخص المالي الشامل - Financial summary"""
     try:
-        from server import db
-        
         # تحديد فلاتر البحث
         date_filter = {
             "created_at": {
@@ -492,12 +487,11 @@ async def get_financial_summary(
 
 @router.get("/system/integrity-check")
 async def validate_financial_integrity(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """فحص سلامة البيانات المالية - Financial integrity check"""
     try:
-        from server import db
-        
         issues = []
         
         # فحص الديون المتناقضة
@@ -1,6 +1,6 @@
 # Notification API Routes - مسارات API للإشعارات المتقدمة
 from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, Query
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer
 from typing import List, Optional
 from datetime import datetime
 import json
@@ -8,40 +8,23 @@ import logging
 
 from models.notification_models import *
 from services.notification_service import NotificationService
+from services.notification_counters import unread_count_message
+from services.pagination import paginate
 from models.all_models import User
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
-import jwt
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from auth import get_current_user, get_current_user_claims
 
 router = APIRouter(prefix="/api/notifications", tags=["Notifications"])
 security = HTTPBearer()
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # Initialize notification service
-notification_service = NotificationService(db)
+notification_service = NotificationService(get_database())
 
 # JWT Configuration
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """الحصول على المستخدم الحالي"""
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
 @router.post("/", response_model=dict)
 async def create_notification(
     notification_data: NotificationCreate,
@@ -94,7 +77,9 @@ async def get_my_notifications(
     search: Optional[str] = None,
     limit: int = Query(50, le=200),
     offset: int = Query(0, ge=0),
-    current_user: dict = Depends(get_current_user)
+    cursor: Optional[str] = Query(None, description="next_cursor من الصفحة السابقة"),
+    total: str = Query("estimate", regex="^(estimate|exact|none)$"),
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على إشعاراتي مع الفلترة"""
     try:
@@ -106,7 +91,9 @@ async def get_my_notifications(
             date_to=date_to,
             search=search,
             limit=limit,
-            offset=offset
+            offset=offset,
+            cursor=cursor,
+            total=total
         )
         
         result = await notification_service.get_user_notifications(
@@ -118,6 +105,8 @@ async def get_my_notifications(
             "success": True,
             "data": result
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في جلب الإشعارات: {str(e)}")
 
@@ -181,7 +170,7 @@ async def dismiss_notification(
 
 @router.get("/stats", response_model=NotificationStats)
 async def get_notification_stats(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """الحصول على إحصائيات الإشعارات"""
     try:
@@ -192,14 +181,12 @@ async def get_notification_stats(
 
 @router.get("/unread-count", response_model=dict)
 async def get_unread_count(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """الحصول على عدد الإشعارات غير المقروءة"""
+    """الحصول على عدد الإشعارات غير المقروءة - من العداد، والتحديثات تصل عبر WebSocket"""
     try:
-        count = await db.notifications.count_documents({
-            "recipient_id": current_user["id"],
-            "status": "unread"
-        })
+        count = await notification_service.unread.get(current_user["id"])
         
         return {
             "success": True,
@@ -216,6 +203,11 @@ async def websocket_notifications(websocket: WebSocket, user_id: str):
     notification_service.add_connection(user_id, websocket)
     
     try:
+        # العدد الحالي عند الاتصال، ثم كل تغيير يصل كرسالة unread_count
+        await notification_service.connections.deliver(
+            [(user_id, unread_count_message(await notification_service.unread.get(user_id)))]
+        )
+        
         while True:
             # استقبال ping للحفاظ على الاتصال
             data = await websocket.receive_text()
@@ -225,41 +217,46 @@ async def websocket_notifications(websocket: WebSocket, user_id: str):
                 await websocket.send_text("pong")
                 
     except WebSocketDisconnect:
-        notification_service.remove_connection(user_id)
+        notification_service.remove_connection(user_id, websocket)
         logging.info(f"WebSocket disconnected for user {user_id}")
     except Exception as e:
         logging.error(f"WebSocket error for user {user_id}: {e}")
-        notification_service.remove_connection(user_id)
+        notification_service.remove_connection(user_id, websocket)
 
 # مسارات إدارية للإشعارات
 @router.get("/admin/all", response_model=dict)
 async def get_all_notifications_admin(
     limit: int = Query(100, le=500),
     offset: int = Query(0, ge=0),
-    current_user: dict = Depends(get_current_user)
+    cursor: Optional[str] = Query(None, description="next_cursor من الصفحة السابقة"),
+    total: str = Query("estimate", regex="^(estimate|exact|none)$"),
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على جميع الإشعارات - للإدارة فقط"""
     try:
         if current_user["role"] not in ["admin", "gm"]:
             raise HTTPException(status_code=403, detail="غير مصرح لك")
         
-        total_count = await db.notifications.count_documents({})
-        notifications = await db.notifications.find({}, {"_id": 0}) \
-            .sort("created_at", -1) \
-            .skip(offset) \
-            .limit(limit) \
-            .to_list(limit)
+        page = await paginate(
+            db.notifications, {}, [("created_at", -1)], limit,
+            cursor=cursor, offset=offset, projection={"_id": 0}, total=total
+        )
         
         return {
             "success": True,
             "data": {
-                "notifications": notifications,
-                "total_count": total_count,
-                "has_more": (offset + len(notifications)) < total_count
+                "notifications": page["items"],
+                "total_count": page["total_count"],
+                "total_is_estimate": page["total_is_estimate"],
+                "has_more": page["has_more"],
+                "next_cursor": page["next_cursor"]
             }
         }
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في جلب الإشعارات: {str(e)}")
 
@@ -285,6 +282,13 @@ async def cleanup_old_notifications(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في التنظيف: {str(e)}")
 
+@router.get("/admin/realtime-stats", response_model=dict)
+async def get_realtime_stats(current_user: dict = Depends(get_current_user_claims)):
+    """حالة ناقل الإشعارات واتصالات هذا العامل - للإدارة فقط"""
+    if current_user["role"] not in ["admin"]:
+        raise HTTPException(status_code=403, detail="غير مصرح لك")
+    return {"success": True, "data": notification_service.bus.snapshot()}
+
 # Trigger routes for testing (development only)
 @router.post("/test/order-notification", response_model=dict)
 async def test_order_notification(
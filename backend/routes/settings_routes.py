@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer
 from models.all_models import SystemSettings
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from auth import get_current_user, get_current_user_claims
 from datetime import datetime
 import jwt
 
@@ -23,28 +24,10 @@ def verify_jwt_token(token: str):
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """الحصول على المستخدم الحالي من JWT token"""
-    token = credentials.credentials
-    payload = verify_jwt_token(token)
-    
-    # Get user from database
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
-    
-    user = await db.users.find_one({"id": payload["user_id"]})
-    client.close()
-    return user
-
 @router.get("/admin/settings")
-async def get_system_settings(current_user: dict = Depends(get_current_user)):
+async def get_system_settings(current_user: dict = Depends(get_current_user_claims), db: AsyncIOMotorDatabase = Depends(get_database)):
     """إعدادات النظام - System Settings"""
     
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
-    
     try:
         # Try to get existing settings
         settings = await db.system_settings.find_one({})
@@ -98,22 +81,15 @@ async def get_system_settings(current_user: dict = Depends(get_current_user)):
                 "default_language": "ar"
             }
         }
-    finally:
-        if 'client' in locals():
-            client.close()
 
 @router.put("/admin/settings")
-async def update_system_settings(settings_data: dict, current_user: dict = Depends(get_current_user)):
+async def update_system_settings(settings_data: dict, current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     """تحديث إعدادات النظام - Update System Settings"""
     
     # Verify admin user
     if not current_user or current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
-    
     try:
         # Update or create settings
         settings_data["updated_at"] = datetime.utcnow()
@@ -125,8 +101,6 @@ async def update_system_settings(settings_data: dict, current_user: dict = Depen
             upsert=True
         )
         
-        client.close()
-        
         return {
             "success": True,
             "message": "تم تحديث الإعدادات بنجاح",
@@ -134,5 +108,4 @@ async def update_system_settings(settings_data: dict, current_user: dict = Depen
         }
         
     except Exception as e:
-        client.close()
         raise HTTPException(status_code=500, detail=f"خطأ في تحديث الإعدادات: {str(e)}")
\ No newline at end of file
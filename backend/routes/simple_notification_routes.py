@@ -1,46 +1,25 @@
 # Simple Notification Routes - مسارات الإشعارات البسيطة
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
-import jwt
+from fastapi.security import HTTPBearer
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from database import get_database
+from services.notification_counters import UnreadCounters
+from auth import get_current_user, get_current_user_claims
 from datetime import datetime
 import uuid
 
 router = APIRouter()
 security = HTTPBearer()
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
-
 # JWT Configuration
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """الحصول على المستخدم الحالي"""
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
 @router.get("/notifications/unread-count")
-async def get_unread_count(current_user: dict = Depends(get_current_user)):
+async def get_unread_count(current_user: dict = Depends(get_current_user_claims), db: AsyncIOMotorDatabase = Depends(get_database)):
     """الحصول على عدد الإشعارات غير المقروءة"""
     try:
-        count = await db.notifications.count_documents({
-            "recipient_id": current_user["id"],
-            "status": "unread"
-        })
+        count = await UnreadCounters(db).get(current_user["id"])
         
         return {
             "success": True,
@@ -56,7 +35,8 @@ async def get_unread_count(current_user: dict = Depends(get_current_user)):
 @router.get("/notifications/")
 async def get_my_notifications(
     limit: int = 50,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على إشعاراتي"""
     try:
@@ -67,10 +47,7 @@ async def get_my_notifications(
         ).sort("created_at", -1).limit(limit).to_list(limit)
         
         # Get unread count
-        unread_count = await db.notifications.count_documents({
-            "recipient_id": current_user["id"],
-            "status": "unread"
-        })
+        unread_count = await UnreadCounters(db).get(current_user["id"])
         
         return {
             "success": True,
@@ -94,7 +71,8 @@ async def get_my_notifications(
 @router.post("/notifications/")
 async def create_notification(
     notification_data: dict,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """إنشاء إشعار جديد"""
     try:
@@ -117,6 +95,7 @@ async def create_notification(
         }
         
         await db.notifications.insert_one(notification)
+        await UnreadCounters(db).add(notification["recipient_id"], 1)
         
         return {
             "success": True,
@@ -129,22 +108,26 @@ async def create_notification(
 @router.patch("/notifications/{notification_id}/read")
 async def mark_notification_as_read(
     notification_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """تحديد الإشعار كمقروء"""
     try:
-        result = await db.notifications.update_one(
+        previous = await db.notifications.find_one_and_update(
             {"id": notification_id, "recipient_id": current_user["id"]},
             {
                 "$set": {
                     "status": "read",
                     "read_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"_id": 0, "status": 1}
         )
         
-        if result.modified_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="الإشعار غير موجود")
+        if previous.get("status") == "unread":
+            await UnreadCounters(db).add(current_user["id"], -1)
         
         return {
             "success": True,
@@ -157,7 +140,8 @@ async def mark_notification_as_read(
 
 @router.post("/notifications/test")
 async def create_test_notification(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """إنشاء إشعار اختبار"""
     try:
@@ -178,6 +162,7 @@ async def create_test_notification(
         }
         
         await db.notifications.insert_one(notification)
+        await UnreadCounters(db).add(current_user["id"], 1)
         
         return {
             "success": True,
@@ -2,12 +2,14 @@
 # Medical Management System - Unified Financial APIs
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Dict, Any, Optional
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import traceback
 import uuid
 
+from database import get_database
 from models.all_models import User
 from models.unified_financial_models import (
     UnifiedFinancialRecord, TransactionType, UnifiedTransactionStatus,
@@ -15,6 +17,10 @@ from models.unified_financial_models import (
     UnifiedFinancialSummary
 )
 from routes.auth_routes import get_current_user
+from services.financial_rollups import (
+    record_changed, rollup_match, totals_by_type_and_status, top_clinics as rollup_top_clinics,
+    high_risk_clinics as rollup_high_risk_clinics, sum_rows
+)
 
 # إنشاء الموجه المالي الموحد
 router = APIRouter(prefix="/unified-financial", tags=["Unified Financial Management"])
@@ -25,67 +31,33 @@ router = APIRouter(prefix="/unified-financial", tags=["Unified Financial Managem
 
 @router.get("/dashboard/overview")
 async def get_unified_financial_overview(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """نظرة عامة موحدة على النظام المالي"""
+    """نظرة عامة موحدة على النظام المالي - من الملخصات اليومية بدل مسح السجل"""
     try:
-        from server import db
+        # مجاميع لكل (نوع، حالة) من financial_daily_rollups
+        totals = await totals_by_type_and_status(db, {})
         
         # إحصائيات موحدة من جميع السجلات المالية
-        total_records = await db.unified_financial_records.count_documents({})
+        total_records = sum_rows(totals, "count")
         
         # إحصائيات حسب النوع
-        invoice_count = await db.unified_financial_records.count_documents({"record_type": "invoice"})
-        debt_count = await db.unified_financial_records.count_documents({"record_type": "debt"})
-        payment_count = await db.unified_financial_records.count_documents({"record_type": "payment"})
-        collection_count = await db.unified_financial_records.count_documents({"record_type": "collection"})
+        invoice_count = sum_rows(totals, "count", record_types=["invoice"])
+        debt_count = sum_rows(totals, "count", record_types=["debt"])
+        payment_count = sum_rows(totals, "count", record_types=["payment"])
+        collection_count = sum_rows(totals, "count", record_types=["collection"])
         
         # إحصائيات حسب الحالة
-        pending_count = await db.unified_financial_records.count_documents({"status": "pending"})
-        paid_count = await db.unified_financial_records.count_documents({"status": "paid"})
-        overdue_count = await db.unified_financial_records.count_documents({"status": "overdue"})
+        pending_count = sum_rows(totals, "count", statuses=["pending"])
+        paid_count = sum_rows(totals, "count", statuses=["paid"])
+        overdue_count = sum_rows(totals, "count", statuses=["overdue"])
         
         # حساب المبالغ الإجمالية
-        pipeline_amounts = [
-            {
-                "$group": {
-                    "_id": None,
-                    "total_invoiced": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": ["$record_type", "invoice"]},
-                                {"$toDouble": "$net_amount"}, 
-                                0
-                            ]
-                        }
-                    },
-                    "total_collected": {
-                        "$sum": {
-                            "$cond": [
-                                {"$in": ["$record_type", ["payment", "collection"]]},
-                                {"$toDouble": "$net_amount"},
-                                0
-                            ]
-                        }
-                    },
-                    "total_outstanding": {
-                        "$sum": {
-                            "$cond": [
-                                {"$ne": ["$status", "paid"]},
-                                {"$toDouble": "$outstanding_amount"},
-                                0
-                            ]
-                        }
-                    }
-                }
-            }
-        ]
-        
-        amounts_result = await db.unified_financial_records.aggregate(pipeline_amounts).to_list(1)
-        amounts = amounts_result[0] if amounts_result else {
-            "total_invoiced": 0,
-            "total_collected": 0, 
-            "total_outstanding": 0
+        amounts = {
+            "total_invoiced": sum_rows(totals, "net_amount", record_types=["invoice"]),
+            "total_collected": sum_rows(totals, "net_amount", record_types=["payment", "collection"]),
+            "total_outstanding": sum_rows(totals, "outstanding_amount", exclude_statuses=["paid"])
         }
         
         # حساب معدل التحصيل
@@ -94,42 +66,10 @@ async def get_unified_financial_overview(
             collection_rate = (amounts["total_collected"] / amounts["total_invoiced"]) * 100
         
         # أفضل 5 عيادات من ناحية القيمة
-        top_clinics_pipeline = [
-            {
-                "$group": {
-                    "_id": "$clinic_id",
-                    "clinic_name": {"$first": "$clinic_name"},
-                    "total_value": {"$sum": {"$toDouble": "$net_amount"}},
-                    "records_count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"total_value": -1}},
-            {"$limit": 5}
-        ]
+        top_clinics = await rollup_top_clinics(db, {}, limit=5)
         
-        top_clinics = await db.unified_financial_records.aggregate(top_clinics_pipeline).to_list(5)
-        
-        # العيادات عالية المخاطر (مديونيات عالية)
-        high_risk_pipeline = [
-            {
-                "$match": {
-                    "status": {"$in": ["overdue", "pending"]},
-                    "outstanding_amount": {"$gt": 1000}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$clinic_id",
-                    "clinic_name": {"$first": "$clinic_name"},
-                    "total_outstanding": {"$sum": {"$toDouble": "$outstanding_amount"}},
-                    "overdue_count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"total_outstanding": -1}},
-            {"$limit": 10}
-        ]
-        
-        high_risk_clinics = await db.unified_financial_records.aggregate(high_risk_pipeline).to_list(10)
+        # العيادات عالية المخاطر (سجلات بمديونية أكبر من HIGH_RISK_OUTSTANDING)
+        high_risk_clinics = await rollup_high_risk_clinics(db, {}, limit=10)
         
         return {
             "success": True,
@@ -171,12 +111,11 @@ async def get_financial_records(
     end_date: Optional[date] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على السجلات المالية الموحدة مع فلترة"""
     try:
-        from server import db
-        
         # بناء فلتر البحث
         query_filter = {}
         
@@ -267,12 +206,11 @@ async def get_financial_records(
 @router.post("/records")
 async def create_financial_record(
     request: CreateFinancialRecordRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """إنشاء سجل مالي جديد موحد"""
     try:
-        from server import db
-        
         # التحقق من الصلاحيات
         if current_user.get("role") not in ["admin", "manager", "accountant"]:
             raise HTTPException(status_code=403, detail="غير مسموح لك بإنشاء سجلات مالية")
@@ -346,6 +284,7 @@ async def create_financial_record(
         result = await db.unified_financial_records.insert_one(financial_record)
         
         if result.inserted_id:
+            await record_changed(db, None, financial_record)
             financial_record["_id"] = str(result.inserted_id)
             return {
                 "success": True,
@@ -364,12 +303,11 @@ async def create_financial_record(
 @router.post("/process-payment")
 async def process_payment(
     request: ProcessPaymentRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """معالجة دفعة مالية موحدة"""
     try:
-        from server import db
-        
         # جلب السجل المالي
         financial_record = await db.unified_financial_records.find_one({"id": request.financial_record_id})
         if not financial_record:
@@ -421,6 +359,7 @@ async def process_payment(
         
         # حفظ سجل الدفعة
         await db.unified_financial_records.insert_one(payment_record)
+        await record_changed(db, None, payment_record)
         
         # تحديث السجل الأصلي
         update_data = {
@@ -459,6 +398,8 @@ async def process_payment(
         )
         
         if result.modified_count > 0:
+            # نقل مساهمة السجل من خلية الحالة القديمة إلى الجديدة
+            await record_changed(db, financial_record, {**financial_record, **update_data})
             return {
                 "success": True,
                 "message": "تم تسجيل الدفعة بنجاح",
@@ -481,47 +422,33 @@ async def get_comprehensive_financial_report(
     end_date: date = Query(..., description="تاريخ النهاية (مطلوب)"),
     clinic_ids: Optional[str] = Query(None, description="معرفات العيادات مفصولة بفواصل"),
     sales_rep_ids: Optional[str] = Query(None, description="معرفات المناديب مفصولة بفواصل"),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """تقرير مالي شامل موحد"""
     try:
-        from server import db
-        
-        # بناء فلاتر البحث
-        base_filter = {
-            "issue_date": {
-                "$gte": start_date.isoformat(),
-                "$lte": end_date.isoformat()
-            }
-        }
-        
-        if clinic_ids:
-            clinic_ids_list = [cid.strip() for cid in clinic_ids.split(",") if cid.strip()]
-            base_filter["clinic_id"] = {"$in": clinic_ids_list}
-        
-        if sales_rep_ids:
-            rep_ids_list = [rid.strip() for rid in sales_rep_ids.split(",") if rid.strip()]
-            base_filter["sales_rep_id"] = {"$in": rep_ids_list}
+        # بناء فلاتر البحث على الملخصات اليومية
+        clinic_ids_list = [cid.strip() for cid in clinic_ids.split(",") if cid.strip()] if clinic_ids else None
+        rep_ids_list = [rid.strip() for rid in sales_rep_ids.split(",") if rid.strip()] if sales_rep_ids else None
         
         # فلترة حسب دور المستخدم
         if current_user.get("role") == "medical_rep":
-            base_filter["sales_rep_id"] = current_user.get("id")
+            rep_ids_list = [current_user.get("id")]
+        
+        base_filter = rollup_match(start_date, end_date, clinic_ids_list, rep_ids_list)
         
-        # إحصائيات شاملة
-        summary_pipeline = [
-            {"$match": base_filter},
+        # إحصائيات شاملة - صف لكل (نوع، حالة)
+        totals = await totals_by_type_and_status(db, base_filter)
+        summary_results = [
             {
-                "$group": {
-                    "_id": "$record_type",
-                    "count": {"$sum": 1},
-                    "total_amount": {"$sum": {"$toDouble": "$net_amount"}},
-                    "total_outstanding": {"$sum": {"$toDouble": "$outstanding_amount"}}
-                }
+                "_id": record_type,
+                "count": sum_rows(totals, "count", record_types=[record_type]),
+                "total_amount": sum_rows(totals, "net_amount", record_types=[record_type]),
+                "total_outstanding": sum_rows(totals, "outstanding_amount", record_types=[record_type])
             }
+            for record_type in sorted({row["record_type"] for row in totals})
         ]
         
-        summary_results = await db.unified_financial_records.aggregate(summary_pipeline).to_list(100)
-        
         # تنظيم النتائج
         report = {
             "period": {
@@ -572,12 +499,7 @@ async def get_comprehensive_financial_report(
         overdue_percentage = 0.0
         if total_invoiced > 0:
             # حساب المتأخرات
-            overdue_filter = {**base_filter, "status": "overdue"}
-            overdue_amount = 0.0
-            
-            overdue_cursor = db.unified_financial_records.find(overdue_filter)
-            async for record in overdue_cursor:
-                overdue_amount += float(record.get("outstanding_amount", 0))
+            overdue_amount = sum_rows(totals, "outstanding_amount", statuses=["overdue"])
             
             overdue_percentage = (overdue_amount / total_invoiced) * 100
         
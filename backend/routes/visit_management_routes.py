@@ -1,18 +1,24 @@
 # نظام الإدارة الطبية المتكامل - واجهات برمجة التطبيقات لإدارة الزيارات
 # Medical Management System - Visit Management APIs
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Dict, Any, Optional
 from datetime import datetime, date, timedelta
 import traceback
 import uuid
 
+from database import get_database
 from models.all_models import User
 from models.unified_financial_models import (
     RepVisit, VisitStatus, VisitType, VisitPlan,
     CreateVisitRequest, VisitCheckInRequest, VisitCompletionRequest, VisitSummary
 )
 from routes.auth_routes import get_current_user
+from services.geo_service import check_geofence, find_clinic_location, VISIT_GEOFENCE_ENFORCE
+from services.clinic_roster_service import (
+    ClinicRosterService, sync_clinic_roster, sort_roster, format_roster_etag, parse_roster_etag
+)
 
 # إنشاء الموجه لإدارة الزيارات
 router = APIRouter(prefix="/visits", tags=["Visit Management"])
@@ -23,12 +29,11 @@ router = APIRouter(prefix="/visits", tags=["Visit Management"])
 
 @router.get("/dashboard/overview")
 async def get_visits_dashboard_overview(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """نظرة عامة على زيارات المندوب"""
     try:
-        from server import db
-        
         # تحديد المندوب المطلوب
         rep_id = current_user.get("id")
         if current_user.get("role") == "admin" or current_user.get("role") == "manager":
@@ -175,12 +180,12 @@ async def get_visits_dashboard_overview(
 
 @router.get("/available-clinics")
 async def get_available_clinics(
-    current_user: User = Depends(get_current_user)
+    cached: bool = Query(False, description="استخدام قائمة العيادات المخزنة مؤقتاً للمندوب"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على العيادات المتاحة للمستخدم المسجل"""
     try:
-        from server import db
-        
         # السماح للمناديب والمديرين والأدمن بالوصول
         allowed_roles = ["medical_rep", "admin", "manager"]
         if current_user.get("role") not in allowed_roles:
@@ -191,80 +196,14 @@ async def get_available_clinics(
         
         rep_id = current_user.get("id")
         
-        # البحث عن العيادات المتاحة للمندوب
-        # 1. العيادات المخصصة مباشرة للمندوب
-        # 2. العيادات المتاحة عبر قائمة المناديب المسموحين
-        # 3. العيادات في نفس المنطقة إذا كان مسموحاً له
-        
-        clinics_filter = {
-            "$or": [
-                {"assigned_rep_id": rep_id},                    # مخصص مباشرة
-                {"available_reps": {"$in": [rep_id]}},          # في قائمة المتاحين
-                {"area_reps": {"$in": [rep_id]}}                # مندوب منطقة
-            ]
-        }
-        
-        available_clinics = []
-        clinics_cursor = db.clinics.find(clinics_filter)
-        
-        async for clinic in clinics_cursor:
-            # جلب آخر زيارة لهذه العيادة
-            last_visit = await db.rep_visits.find_one(
-                {
-                    "clinic_id": clinic.get("id", ""),
-                    "medical_rep_id": rep_id,
-                    "status": "completed"
-                },
-                sort=[("actual_end_time", -1)]
-            )
-            
-            last_visit_date = None
-            if last_visit and last_visit.get("actual_end_time"):
-                try:
-                    last_visit_date = datetime.fromisoformat(last_visit["actual_end_time"].replace('Z', '+00:00')).date().isoformat()
-                except:
-                    pass
-            
-            # عدد الزيارات المكتملة لهذه العيادة
-            visits_count = await db.rep_visits.count_documents({
-                "clinic_id": clinic.get("id", ""),
-                "medical_rep_id": rep_id,
-                "status": "completed"
-            })
-            
-            # حالة العيادة (هل لها زيارة مجدولة اليوم؟)
-            today = date.today()
-            has_visit_today = await db.rep_visits.count_documents({
-                "clinic_id": clinic.get("id", ""),
-                "medical_rep_id": rep_id,
-                "scheduled_date": {
-                    "$gte": datetime.combine(today, datetime.min.time()).isoformat(),
-                    "$lte": datetime.combine(today, datetime.max.time()).isoformat()
-                },
-                "status": {"$in": ["planned", "in_progress", "completed"]}
-            }) > 0
-            
-            available_clinics.append({
-                "id": clinic.get("id", ""),
-                "name": clinic.get("name", ""),
-                "address": clinic.get("address", ""),
-                "area_name": clinic.get("area_name", ""),
-                "phone": clinic.get("phone", ""),
-                "email": clinic.get("email", ""),
-                "specialization": clinic.get("specialization", ""),
-                "doctor_name": clinic.get("primary_doctor_name", ""),
-                "assignment_type": "assigned" if clinic.get("assigned_rep_id") == rep_id else "available",
-                "last_visit_date": last_visit_date,
-                "total_visits": visits_count,
-                "has_visit_today": has_visit_today,
-                "coordinates": {
-                    "latitude": clinic.get("latitude"),
-                    "longitude": clinic.get("longitude")
-                } if clinic.get("latitude") and clinic.get("longitude") else None
-            })
-        
-        # ترتيب حسب آخر زيارة (الأقدم أولاً)
-        available_clinics.sort(key=lambda x: x["last_visit_date"] if x["last_visit_date"] else "1900-01-01")
+        # البحث عن العيادات المتاحة للمندوب (مخصصة، متاحة، أو مندوب منطقة)
+        # مع إحصائيات الزيارات لكل العيادات في تجميع واحد
+        roster_service = ClinicRosterService(db)
+        if cached:
+            available_clinics, _ = await roster_service.list_entries(rep_id, "clinics")
+            sort_roster(available_clinics)
+        else:
+            available_clinics = await roster_service.build_roster(rep_id)
         
         return {
             "success": True,
@@ -278,15 +217,53 @@ async def get_available_clinics(
         print(f"Error getting available clinics: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="خطأ في جلب العيادات المتاحة")
 
+@router.get("/clinic-roster")
+async def get_clinic_roster(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """قائمة عيادات المندوب مع التحديث التفاضلي
+    
+    أرسل ETag الأخير في If-None-Match: يعود 304 إذا لم يتغير شيء،
+    وإلا تعود العيادات التي تغيرت فقط مع المعرفات المحذوفة (delta=true).
+    """
+    try:
+        if current_user.get("role") != "medical_rep":
+            raise HTTPException(status_code=403, detail="قائمة العيادات متاحة للمناديب فقط")
+        
+        rep_id = current_user.get("id")
+        since = parse_roster_etag(if_none_match, rep_id)
+        roster = await ClinicRosterService(db).fetch(rep_id, since)
+        etag = format_roster_etag(rep_id, roster["version"])
+        
+        if roster["not_modified"]:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        response.headers["ETag"] = etag
+        return {
+            "success": True,
+            "delta": roster["delta"],
+            "clinics": roster["clinics"],
+            "removed": roster["removed"],
+            "etag": etag
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting clinic roster: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="خطأ في جلب قائمة العيادات")
+
 @router.post("/")
 async def create_visit(
     request: CreateVisitRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """إنشاء زيارة جديدة"""
     try:
-        from server import db
-        
         if current_user.get("role") != "medical_rep":
             raise HTTPException(status_code=403, detail="إنشاء الزيارات متاح للمناديب فقط")
         
@@ -372,6 +349,8 @@ async def create_visit(
         
         if result.inserted_id:
             visit_data["_id"] = str(result.inserted_id)
+            # زيارة اليوم تظهر في قائمة العيادات المخزنة
+            await sync_clinic_roster(db, request.clinic_id)
             return {
                 "success": True,
                 "message": "تم إنشاء الزيارة بنجاح",
@@ -389,12 +368,11 @@ async def create_visit(
 @router.post("/check-in")
 async def check_in_visit(
     request: VisitCheckInRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """تسجيل دخول للزيارة"""
     try:
-        from server import db
-        
         if current_user.get("role") != "medical_rep":
             raise HTTPException(status_code=403, detail="تسجيل الدخول للزيارات متاح للمناديب فقط")
         
@@ -416,6 +394,16 @@ async def check_in_visit(
                 detail=f"لا يمكن تسجيل الدخول للزيارة في الحالة الحالية: {visit.get('status')}"
             )
         
+        # التحقق من أن المندوب عند العيادة
+        clinic = await find_clinic_location(db, visit.get("clinic_id"))
+        geofence = check_geofence(clinic, request.gps_latitude, request.gps_longitude, request.gps_accuracy)
+        if geofence["within_geofence"] is False and VISIT_GEOFENCE_ENFORCE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"أنت بعيد عن العيادة ({int(geofence['distance_from_clinic_m'])} متر). "
+                       f"يجب أن تكون ضمن {int(geofence['allowed_radius_m'])} متر لتسجيل الدخول"
+            )
+        
         # تحديث الزيارة
         check_in_data = {
             "status": VisitStatus.IN_PROGRESS,
@@ -423,8 +411,10 @@ async def check_in_visit(
             "check_in_location": {
                 "latitude": request.gps_latitude,
                 "longitude": request.gps_longitude,
+                "accuracy": request.gps_accuracy,
                 "timestamp": datetime.utcnow().isoformat(),
-                "notes": request.notes
+                "notes": request.notes,
+                **geofence
             },
             "updated_at": datetime.utcnow().isoformat()
         }
@@ -438,7 +428,8 @@ async def check_in_visit(
             return {
                 "success": True,
                 "message": "تم تسجيل الدخول للزيارة بنجاح",
-                "check_in_time": check_in_data["actual_start_time"]
+                "check_in_time": check_in_data["actual_start_time"],
+                "geofence": geofence
             }
         else:
             raise HTTPException(status_code=500, detail="خطأ في تسجيل الدخول للزيارة")
@@ -452,12 +443,11 @@ async def check_in_visit(
 @router.post("/complete")
 async def complete_visit(
     request: VisitCompletionRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """إنهاء الزيارة"""
     try:
-        from server import db
-        
         if current_user.get("role") != "medical_rep":
             raise HTTPException(status_code=403, detail="إنهاء الزيارات متاح للمناديب فقط")
         
@@ -516,6 +506,9 @@ async def complete_visit(
         )
         
         if result.modified_count > 0:
+            # تحديث آخر زيارة وعدد الزيارات في قائمة العيادات المخزنة
+            await sync_clinic_roster(db, visit.get("clinic_id", ""))
+            
             # حساب درجة الفعالية
             effectiveness_score = calculate_visit_effectiveness(
                 duration_minutes, 
@@ -554,12 +547,11 @@ async def get_visits(
     end_date: Optional[date] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على قائمة الزيارات مع فلترة"""
     try:
-        from server import db
-        
         # بناء فلتر البحث
         query_filter = {}
         
@@ -643,12 +635,11 @@ async def get_visits(
 @router.get("/{visit_id}")
 async def get_visit_details(
     visit_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """الحصول على تفاصيل زيارة محددة"""
     try:
-        from server import db
-        
         # جلب الزيارة
         visit = await db.rep_visits.find_one({"id": visit_id})
         if not visit:
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+📍 تعبئة مواقع العيادات بصيغة GeoJSON - One-shot clinic geo_location backfill
+Builds the geo_location point used by /api/clinics/nearby from the legacy
+latitude/longitude fields on clinics and enhanced_clinics. Safe to re-run.
+
+    python scripts/backfill_clinic_locations.py --dry-run
+    python scripts/backfill_clinic_locations.py
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+from database import get_database, close_mongo_connection
+from services.geo_service import GeoService
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Backfill GeoJSON clinic locations")
+    parser.add_argument("--dry-run", action="store_true", help="count clinics without writing")
+    args = parser.parse_args()
+
+    try:
+        report = await GeoService(get_database()).backfill_locations(dry_run=args.dry_run)
+        for collection, counts in report.items():
+            action = "would update" if args.dry_run else "updated"
+            print(f"📦 {collection}: {counts['scanned']} without location, "
+                  f"{counts['located']} with coordinates, {counts['updated']} {action}")
+        if args.dry_run:
+            print("🔍 Dry run: nothing changed")
+        else:
+            print("✅ Clinic locations backfilled")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس أداء حساب المسافات - Micro-benchmarks for services/geo_distance.py
+Compares the per-row Python Haversine loop the routes used to run against the
+vectorized Haversine/equirectangular functions. No database needed.
+
+    python scripts/benchmark_geo_distance.py
+    python scripts/benchmark_geo_distance.py --sizes 1000 100000 --repeat 7
+"""
+
+import argparse
+import math
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.geo_distance import (
+    EARTH_RADIUS_KM, haversine_km, equirectangular_km, segment_lengths_km, score_registrations
+)
+
+
+def python_haversine_km(lat1, lon1, lat2, lon2):
+    """المعادلة القديمة لكل صف - the inline closure from get_admin_registration_logs"""
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (math.sin(d_lat / 2) * math.sin(d_lat / 2) +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(d_lon / 2) * math.sin(d_lon / 2))
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def sample_points(size: int, seed: int = 7):
+    # نقاط حول القاهرة ضمن ~20 كم، مثل بيانات المناديب الفعلية
+    rng = np.random.default_rng(seed)
+    lat1 = 30.04 + rng.uniform(-0.2, 0.2, size)
+    lon1 = 31.23 + rng.uniform(-0.2, 0.2, size)
+    lat2 = lat1 + rng.normal(0, 0.002, size)
+    lon2 = lon1 + rng.normal(0, 0.002, size)
+    return lat1, lon1, lat2, lon2
+
+
+def best_time(statement, repeat: int) -> float:
+    timer = timeit.Timer(statement)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorized geo distance functions")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'points':>8} {'python loop':>14} {'haversine':>12} {'equirect':>12} {'trail':>12} {'speedup':>9}")
+    for size in args.sizes:
+        lat1, lon1, lat2, lon2 = sample_points(size)
+        rows = list(zip(lat1.tolist(), lon1.tolist(), lat2.tolist(), lon2.tolist()))
+
+        loop = best_time(lambda: [python_haversine_km(*row) for row in rows], args.repeat)
+        vectorized = best_time(lambda: haversine_km(lat1, lon1, lat2, lon2), args.repeat)
+        approximate = best_time(lambda: equirectangular_km(lat1, lon1, lat2, lon2), args.repeat)
+        trail = best_time(lambda: segment_lengths_km(lat1, lon1), args.repeat)
+
+        print(f"{size:>8} {loop * 1e3:>11.3f} ms {vectorized * 1e3:>9.3f} ms {approximate * 1e3:>9.3f} ms "
+              f"{trail * 1e3:>9.3f} ms {loop / vectorized:>8.1f}x")
+
+    # صفحة تقييم تسجيلات كاملة من قواميس السجلات
+    lat1, lon1, lat2, lon2 = sample_points(5000)
+    logs = [{"clinic_location": {"latitude": a, "longitude": b},
+             "registrar_location": {"rep_latitude": c, "rep_longitude": d}}
+            for a, b, c, d in zip(lat1.tolist(), lon1.tolist(), lat2.tolist(), lon2.tolist())]
+    scored = best_time(lambda: score_registrations(logs), args.repeat)
+    print(f"📋 score_registrations: 5000 logs in {scored * 1e3:.2f} ms")
+
+    # الدقة مقارنة بالحلقة القديمة
+    error = np.max(np.abs(haversine_km(lat1, lon1, lat2, lon2) -
+                          np.array([python_haversine_km(*row) for row in zip(lat1, lon1, lat2, lon2)])))
+    approx_error = np.max(np.abs(equirectangular_km(lat1, lon1, lat2, lon2) - haversine_km(lat1, lon1, lat2, lon2)))
+    print(f"✅ max |vectorized - loop| = {error:.2e} km, max |equirect - haversine| = {approx_error:.2e} km")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+🧾 فحص سلامة البيانات المالية - Nightly financial integrity job
+Recomputes invoice totals and debt balances in _id-range shards and writes
+findings to integrity_reports. A run that was interrupted is resumed from
+its last saved batch; a run still alive in another process is left alone.
+
+    python scripts/check_financial_integrity.py
+    python scripts/check_financial_integrity.py --shards 8 --batch-size 1000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+from database import get_database, close_mongo_connection
+from services.integrity_checker import IntegrityChecker, INTEGRITY_SHARDS, INTEGRITY_BATCH_SIZE
+
+
+async def main(shards: int, batch_size: int):
+    try:
+        checker = IntegrityChecker(get_database(), shards=shards, batch_size=batch_size)
+        run = await checker.start_or_resume(started_by="nightly_job")
+        if run is None:
+            print("⏳ An integrity run is already in progress, nothing to do")
+            return
+        print(f"🔎 Integrity run {run['id']} ({len([s for s in run['shards'] if not s['done']])} shards)")
+        report = await checker.run(run)
+        print(f"📦 {report['scanned']} documents checked")
+        print(f"✅ Status: {report['status']} ({report['issues_found']} issues)")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check financial data integrity")
+    parser.add_argument("--shards", type=int, default=INTEGRITY_SHARDS, help="concurrent _id ranges per collection")
+    parser.add_argument("--batch-size", type=int, default=INTEGRITY_BATCH_SIZE, help="documents per read")
+    args = parser.parse_args()
+    asyncio.run(main(args.shards, args.batch_size))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+📦 نقل بيانات الديون من ملفات JSON إلى MongoDB - One-shot debt JSON migration
+Moves /app/debt_data.json and /app/collection_data.json into the rep_debts and
+rep_debt_collections collections used by routes/debt_routes.py. Safe to re-run;
+the files are renamed to *.migrated only when every record had an id.
+
+    python scripts/migrate_debt_json.py --dry-run
+    python scripts/migrate_debt_json.py
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+from database import get_database, close_mongo_connection
+from services.debt_repository import migrate_json_files, LEGACY_DEBT_FILE, LEGACY_COLLECTION_FILE
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Migrate legacy debt JSON files into MongoDB")
+    parser.add_argument("--debt-file", default=LEGACY_DEBT_FILE)
+    parser.add_argument("--collection-file", default=LEGACY_COLLECTION_FILE)
+    parser.add_argument("--dry-run", action="store_true", help="count records without writing")
+    args = parser.parse_args()
+
+    try:
+        report = await migrate_json_files(
+            get_database(), args.debt_file, args.collection_file, dry_run=args.dry_run
+        )
+        if args.dry_run:
+            print(f"🔍 Dry run: {report['debts']} debt(s), {report['collections']} collection(s) found")
+        else:
+            print(f"✅ Migrated {report['debts_inserted']}/{report['debts']} debt(s), "
+                  f"{report['collections_inserted']}/{report['collections']} collection(s)")
+
+        for label, skipped in (("debt", report["skipped_debts"]), ("collection", report["skipped_collections"])):
+            if skipped:
+                print(f"⚠️ {len(skipped)} {label} record(s) without an id skipped (positions: {skipped[:20]})")
+        if not args.dry_run:
+            if report["files_renamed"]:
+                print("📁 Legacy files renamed to *.migrated")
+            else:
+                print("📁 Legacy files left in place - fix the skipped records and re-run")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
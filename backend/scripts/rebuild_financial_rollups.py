@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+📊 إعادة بناء الملخصات المالية اليومية - Rebuild financial_daily_rollups
+Recomputes the daily rollups of unified_financial_records from the ledger.
+Run once to backfill after deploying, then nightly (or after manual data
+fixes) for recent days to correct any drift from failed rollup writes.
+Run off-peak: a ledger write during the rebuild of its day can count twice.
+
+    python scripts/rebuild_financial_rollups.py                # whole ledger
+    python scripts/rebuild_financial_rollups.py --days 7       # last 7 days
+    python scripts/rebuild_financial_rollups.py --start 2024-01-01 --end 2024-03-31
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+from database import get_database, close_mongo_connection
+from services.financial_rollups import rebuild_rollups
+
+
+async def main(start_day, end_day):
+    try:
+        print(f"📅 Range: {start_day or 'beginning'} → {end_day or 'today'}")
+        report = await rebuild_rollups(get_database(), start_day, end_day)
+        print(f"✅ {report['rows']} rollup rows written")
+        print(f"🧹 {report['removed']} empty rows removed")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild daily financial rollups")
+    parser.add_argument("--days", type=int, help="rebuild only the last N days")
+    parser.add_argument("--start", type=date.fromisoformat, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day (YYYY-MM-DD)")
+    args = parser.parse_args()
+    start = args.start
+    if args.days:
+        start = date.today() - timedelta(days=args.days - 1)
+    asyncio.run(main(start, args.end))
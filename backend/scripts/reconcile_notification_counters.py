@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+🔔 مطابقة عدادات الإشعارات غير المقروءة - Recompute notification_counters from notifications
+Run once after deploying the counters, then nightly (cron) to correct drift.
+Safe to re-run; only counters that differ are written.
+
+    python scripts/reconcile_notification_counters.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+from database import get_database, close_mongo_connection
+from services.notification_counters import UnreadCounters
+
+
+async def main():
+    try:
+        report = await UnreadCounters(get_database()).reconcile()
+        print(f"📦 {report['counters']} counters, {report['users_with_unread']} users with unread notifications")
+        print(f"✅ {report['corrected']} counters corrected")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
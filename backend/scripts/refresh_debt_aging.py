@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+⏳ تحديث تقادم الديون المخزن - Refresh stored aging_category / overdue status
+Run daily (cron, shortly after midnight UTC). Only debts that crossed an
+aging bucket boundary since the last run are read and written; missed days
+are caught up automatically. Queries compute aging themselves, so skipping a
+run only delays the stored fields.
+
+    python scripts/refresh_debt_aging.py          # boundary crossings only
+    python scripts/refresh_debt_aging.py --full   # re-check every active debt
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+from database import get_database, close_mongo_connection
+from services.debt_aging import refresh_debt_aging
+
+
+async def main(full: bool):
+    try:
+        report = await refresh_debt_aging(get_database(), full=full)
+        print(f"📦 Mode: {report['mode']}")
+        print(f"✅ {report['updated']} debts updated")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh stored debt aging")
+    parser.add_argument("--full", action="store_true", help="re-check every active debt")
+    asyncio.run(main(parser.parse_args().full))
@@ -6,7 +6,7 @@ Simple FastAPI server for testing dashboard APIs - Fixed with missing routers
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
 import os
 import jwt
 import hashlib
@@ -19,6 +19,14 @@ import uvicorn
 from dotenv import load_dotenv
 load_dotenv()
 
+from database import get_database, connect_to_mongo, close_mongo_connection
+from indexes import ensure_indexes, print_index_report
+from services.dashboard_service import DashboardQueryPlanner, dashboard_snapshots, invalidate_dashboard
+from services.clinic_roster_service import sync_clinic_roster
+from services.geo_service import geo_point
+from services.gps_ingest_service import ensure_gps_collection, gps_buffer
+from services.notification_bus import notification_bus
+
 # Import routers
 from routers.user_routes import router as user_router
 from routers.lines_areas_routes import router as lines_areas_router
@@ -28,6 +36,9 @@ from routers.visits_routes import router as visits_router
 from routers.activities_routes import router as activities_router
 from routers.invoice_management_routes import router as invoice_router
 from routers.debt_management_routes import router as debt_router
+from routes.debt_routes import router as rep_debt_router
+from routers.clinic_geo_routes import router as clinic_geo_router
+from routers.gps_routes import router as gps_router
 
 # Import clinic routes from routes directory
 try:
@@ -39,10 +50,8 @@ except ImportError as e:
     print(f"⚠️ Enhanced routes not available: {e}")
     ENHANCED_ROUTES_AVAILABLE = False
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
+# MongoDB connection - shared pool, see database.py
+db = get_database()
 
 # JWT Configuration
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
@@ -52,8 +61,30 @@ JWT_EXPIRATION_HOURS = 24
 # Security
 security = HTTPBearer()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await connect_to_mongo()
+    try:
+        await ensure_gps_collection(get_database())
+    except Exception as e:
+        print(f"⚠️ GPS collection setup failed: {str(e)}")
+    if os.environ.get('MONGO_ENSURE_INDEXES', 'true').lower() == 'true':
+        try:
+            print_index_report(await ensure_indexes(get_database()))
+        except Exception as e:
+            print(f"⚠️ Index provisioning failed: {str(e)}")
+    gps_buffer.start(get_database())
+    try:
+        await notification_bus.start(get_database())
+    except Exception as e:
+        print(f"⚠️ Notification bus failed to start, delivering locally only: {str(e)}")
+    yield
+    await notification_bus.stop()
+    await gps_buffer.stop()
+    await close_mongo_connection()
+
 # Create FastAPI app
-app = FastAPI(title="Medical Management System API", version="2.0.0")
+app = FastAPI(title="Medical Management System API", version="2.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -73,6 +104,9 @@ app.include_router(visits_router)
 app.include_router(activities_router)
 app.include_router(invoice_router)
 app.include_router(debt_router)
+app.include_router(rep_debt_router, prefix="/api")
+app.include_router(clinic_geo_router)
+app.include_router(gps_router)
 
 # Include enhanced routes if available
 if ENHANCED_ROUTES_AVAILABLE:
@@ -319,140 +353,146 @@ async def log_user_login(user_info: dict, geolocation: dict = None, device_info:
 @app.get("/api/dashboard/stats/{role_type}")
 async def get_dashboard_stats(role_type: str, time_filter: str = "today", current_user: dict = Depends(get_current_user)):
     try:
-        # Get basic statistics from database
-        users_count = await db.users.count_documents({"is_active": {"$ne": False}})
-        clinics_count = await db.clinics.count_documents({"is_active": {"$ne": False}})
-        products_count = await db.products.count_documents({"is_active": {"$ne": False}})
-        orders_count = await db.orders.count_documents({})
-        visits_count = await db.visits.count_documents({})
-        debts_count = await db.debts.count_documents({})
-        
-        # Base statistics
-        base_stats = {
-            "total_users": users_count,
-            "total_clinics": clinics_count,
-            "total_products": products_count,
-            "orders_in_period": orders_count,
-            "visits_in_period": visits_count,
-            "time_filter": time_filter,
-            "user_role": current_user.get("role"),
-            "dashboard_type": role_type
-        }
-        
-        # Role-specific statistics
-        if role_type == "admin":
-            # Admin gets comprehensive system overview
-            user_roles_stats = await db.users.aggregate([
-                {"$group": {"_id": "$role", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}}
-            ]).to_list(10)
-            
-            financial_stats = await db.debts.aggregate([
-                {"$group": {
-                    "_id": None,
-                    "total_debts": {"$sum": 1},
-                    "total_outstanding": {"$sum": "$remaining_amount"},
-                    "total_settled": {"$sum": {"$subtract": ["$original_amount", "$remaining_amount"]}}
-                }}
-            ]).to_list(1)
-            
-            financial_data = financial_stats[0] if financial_stats else {
-                "total_debts": 0, "total_outstanding": 0, "total_settled": 0
-            }
-            
-            base_stats.update({
-                "user_roles_distribution": user_roles_stats,
-                "financial_overview": financial_data,
-                "dashboard_widgets": [
-                    "system_overview", "user_management", "financial_summary", 
-                    "performance_metrics", "activity_log", "system_health"
-                ]
-            })
-            
-        elif role_type == "medical_rep":
-            # Medical rep gets personal performance data
-            rep_visits = await db.visits.count_documents({"sales_rep_id": current_user.get("user_id")})
-            successful_visits = await db.visits.count_documents({
-                "sales_rep_id": current_user.get("user_id"),
-                "effective": True
-            })
-            assigned_clinics = await db.clinics.count_documents({
-                "assigned_rep_id": current_user.get("user_id")
-            })
-            
-            success_rate = (successful_visits / rep_visits * 100) if rep_visits > 0 else 0
-            
-            base_stats.update({
-                "personal_visits": rep_visits,
-                "successful_visits": successful_visits,
-                "success_rate": round(success_rate, 2),
-                "assigned_clinics_count": assigned_clinics,
-                "dashboard_widgets": [
-                    "personal_stats", "visit_tracker", "orders_summary", 
-                    "clinic_assignments", "performance_comparison", "targets_progress"
-                ]
-            })
-            
-        elif role_type == "accounting":
-            # Accounting gets financial overview
-            financial_summary = await db.debts.aggregate([
-                {"$group": {
-                    "_id": None,
-                    "total_invoices": {"$sum": 1},
-                    "total_amount": {"$sum": "$original_amount"},
-                    "outstanding_amount": {"$sum": "$remaining_amount"},
-                    "settled_amount": {"$sum": {"$subtract": ["$original_amount", "$remaining_amount"]}}
-                }}
-            ]).to_list(1)
-            
-            payments_count = await db.payments.count_documents({})
-            overdue_debts = await db.debts.count_documents({
-                "status": "outstanding",
-                "due_date": {"$lt": datetime.utcnow()}
-            })
-            
-            financial_data = financial_summary[0] if financial_summary else {
-                "total_invoices": 0, "total_amount": 0, "outstanding_amount": 0, "settled_amount": 0
-            }
-            
-            base_stats.update({
-                "financial_summary": financial_data,
-                "payments_count": payments_count,
-                "overdue_debts_count": overdue_debts,
-                "dashboard_widgets": [
-                    "financial_overview", "payments_tracker", "debt_management", 
-                    "payment_methods", "overdue_alerts", "financial_reports"
-                ]
-            })
-            
-        elif role_type == "gm":
-            # General manager gets strategic overview
-            lines_count = await db.lines.count_documents({})
-            areas_count = await db.areas.count_documents({})
-            
-            base_stats.update({
-                "lines_count": lines_count,
-                "areas_count": areas_count,
-                "dashboard_widgets": [
-                    "performance_overview", "lines_comparison", "reps_ranking", 
-                    "growth_trends", "financial_kpis", "strategic_metrics"
-                ]
-            })
-            
-        elif role_type == "manager":
-            # Manager gets team overview
-            base_stats.update({
-                "team_performance": {},
-                "dashboard_widgets": [
-                    "team_overview", "performance_metrics", "targets_tracking"
-                ]
-            })
-        
-        return base_stats
+        # One snapshot per dashboard, time filter and viewer role (personal dashboards per rep)
+        snapshot_key = (
+            "api", role_type, time_filter, current_user.get("role"),
+            current_user.get("user_id") if role_type == "medical_rep" else None
+        )
+        return await dashboard_snapshots.get_or_compute(
+            snapshot_key, lambda: compute_dashboard_stats(role_type, time_filter, current_user)
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Dashboard stats error: {str(e)}")
 
+async def compute_dashboard_stats(role_type: str, time_filter: str, current_user: dict):
+    """Build the dashboard stats; returns (stats, collections read) for the snapshot cache"""
+    # All counts are registered first and executed as one $facet per collection
+    planner = DashboardQueryPlanner(db)
+    
+    # Get basic statistics from database
+    users_count = planner.count("users", {"is_active": {"$ne": False}})
+    clinics_count = planner.count("clinics", {"is_active": {"$ne": False}})
+    products_count = planner.count("products", {"is_active": {"$ne": False}})
+    orders_count = planner.count("orders")
+    visits_count = planner.count("visits")
+    
+    # Role-specific statistics
+    if role_type == "admin":
+        # Admin gets comprehensive system overview
+        user_roles_stats = planner.aggregate("users", [
+            {"$group": {"_id": "$role", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": 10}
+        ])
+        
+        financial_stats = planner.group_one("debts", {
+            "total_debts": {"$sum": 1},
+            "total_outstanding": {"$sum": "$remaining_amount"},
+            "total_settled": {"$sum": {"$subtract": ["$original_amount", "$remaining_amount"]}}
+        }, default={"total_debts": 0, "total_outstanding": 0, "total_settled": 0})
+        
+    elif role_type == "medical_rep":
+        # Medical rep gets personal performance data
+        rep_visits = planner.count("visits", {"sales_rep_id": current_user.get("user_id")})
+        successful_visits = planner.count("visits", {
+            "sales_rep_id": current_user.get("user_id"),
+            "effective": True
+        })
+        assigned_clinics = planner.count("clinics", {
+            "assigned_rep_id": current_user.get("user_id")
+        })
+        
+    elif role_type == "accounting":
+        # Accounting gets financial overview
+        financial_summary = planner.group_one("debts", {
+            "total_invoices": {"$sum": 1},
+            "total_amount": {"$sum": "$original_amount"},
+            "outstanding_amount": {"$sum": "$remaining_amount"},
+            "settled_amount": {"$sum": {"$subtract": ["$original_amount", "$remaining_amount"]}}
+        }, default={"total_invoices": 0, "total_amount": 0, "outstanding_amount": 0, "settled_amount": 0})
+        
+        payments_count = planner.count("payments")
+        overdue_debts = planner.count("debts", {
+            "status": "outstanding",
+            "due_date": {"$lt": datetime.utcnow()}
+        })
+        
+    elif role_type == "gm":
+        # General manager gets strategic overview
+        lines_count = planner.count("lines")
+        areas_count = planner.count("areas")
+    
+    await planner.execute()
+    
+    # Base statistics
+    base_stats = {
+        "total_users": users_count.value,
+        "total_clinics": clinics_count.value,
+        "total_products": products_count.value,
+        "orders_in_period": orders_count.value,
+        "visits_in_period": visits_count.value,
+        "time_filter": time_filter,
+        "user_role": current_user.get("role"),
+        "dashboard_type": role_type
+    }
+    
+    if role_type == "admin":
+        base_stats.update({
+            "user_roles_distribution": user_roles_stats.value,
+            "financial_overview": financial_stats.value,
+            "dashboard_widgets": [
+                "system_overview", "user_management", "financial_summary", 
+                "performance_metrics", "activity_log", "system_health"
+            ]
+        })
+        
+    elif role_type == "medical_rep":
+        success_rate = (successful_visits.value / rep_visits.value * 100) if rep_visits.value > 0 else 0
+        
+        base_stats.update({
+            "personal_visits": rep_visits.value,
+            "successful_visits": successful_visits.value,
+            "success_rate": round(success_rate, 2),
+            "assigned_clinics_count": assigned_clinics.value,
+            "dashboard_widgets": [
+                "personal_stats", "visit_tracker", "orders_summary", 
+                "clinic_assignments", "performance_comparison", "targets_progress"
+            ]
+        })
+        
+    elif role_type == "accounting":
+        base_stats.update({
+            "financial_summary": financial_summary.value,
+            "payments_count": payments_count.value,
+            "overdue_debts_count": overdue_debts.value,
+            "dashboard_widgets": [
+                "financial_overview", "payments_tracker", "debt_management", 
+                "payment_methods", "overdue_alerts", "financial_reports"
+            ]
+        })
+        
+    elif role_type == "gm":
+        base_stats.update({
+            "lines_count": lines_count.value,
+            "areas_count": areas_count.value,
+            "dashboard_widgets": [
+                "performance_overview", "lines_comparison", "reps_ranking", 
+                "growth_trends", "financial_kpis", "strategic_metrics"
+            ]
+        })
+        
+    elif role_type == "manager":
+        # Manager gets team overview
+        base_stats.update({
+            "team_performance": {},
+            "dashboard_widgets": [
+                "team_overview", "performance_metrics", "targets_tracking"
+            ]
+        })
+    
+    return base_stats, planner.collections
+
 @app.get("/api/dashboard/widgets/{role_type}")
 async def get_dashboard_widgets(role_type: str, current_user: dict = Depends(get_current_user)):
     widgets_config = {
@@ -569,6 +609,7 @@ async def create_clinic(clinic_data: dict, current_user: dict = Depends(get_curr
             "location_accuracy": clinic_data.get("location_accuracy"),
             "formatted_address": clinic_data.get("formatted_address", ""),
             "place_id": clinic_data.get("place_id"),
+            "geo_location": geo_point(clinic_data.get("clinic_latitude"), clinic_data.get("clinic_longitude")),
             
             # System fields
             "registered_by": current_user.get("username", ""),
@@ -590,6 +631,7 @@ async def create_clinic(clinic_data: dict, current_user: dict = Depends(get_curr
         
         if result.inserted_id:
             print(f"✅ تم تسجيل العيادة بنجاح: {clinic_data.get('clinic_name', 'Unknown')} - ID: {clinic_id}")
+            await sync_clinic_roster(db, clinic_id, "clinics")
             
             # Create activity log
             activity_record = {
@@ -703,6 +745,7 @@ async def process_payment(payment_data: dict, current_user: dict = Depends(get_c
                 }
             }
         )
+        invalidate_dashboard("payments", "debts")
         
         # Create activity log
         activity_record = {
@@ -880,6 +923,7 @@ async def create_visit(visit_data: dict, current_user: dict = Depends(get_curren
         
         # Insert into database
         result = await db.visits.insert_one(visit_document)
+        invalidate_dashboard("visits")
         
         if result.inserted_id:
             print(f"✅ تم إنشاء الزيارة بنجاح: {visit_data.get('clinic_name', 'Unknown')} - ID: {visit_id}")
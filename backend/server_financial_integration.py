@@ -201,14 +201,16 @@ async def initialize_document_sequences(db):
     document_types = ["invoices", "debts", "payments", "receipts", "credit_notes", "debit_notes"]
     
     for doc_type in document_types:
-        existing = await db.document_sequences.find_one({"document_type": doc_type})
-        if not existing:
-            await db.document_sequences.insert_one({
-                "document_type": doc_type,
+        # upsert لا يلمس تسلسلاً موجوداً ولا يتعارض مع الترقيم المتزامن
+        await db.document_sequences.update_one(
+            {"document_type": doc_type},
+            {"$setOnInsert": {
                 "last_number": 0,
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
-            })
+            }},
+            upsert=True
+        )
 
 # معلومات للمطور حول التكامل
 INTEGRATION_NOTES = """
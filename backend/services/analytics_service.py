@@ -9,6 +9,8 @@ from models.analytics_models import *
 import json
 import math
 
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
 class AnalyticsService:
     def __init__(self, db):
         self.db = db
@@ -34,114 +36,51 @@ class AnalyticsService:
             if filters.get("clinic_id"):
                 query["clinic_id"] = filters["clinic_id"]
             
-            # الحصول على الطلبات
-            orders = await self.db.orders.find(query).to_list(10000)
-            
-            # حساب الإحصائيات الأساسية
-            total_sales = sum(order.get("total_amount", 0) for order in orders)
-            total_orders = len(orders)
-            average_order_value = total_sales / total_orders if total_orders > 0 else 0
-            
             # مقارنة بالفترة السابقة
             prev_start, prev_end = self._get_previous_period(start_date, end_date)
-            prev_orders = await self.db.orders.find({
+            prev_query = {
                 "created_at": {"$gte": prev_start, "$lte": prev_end},
                 "status": {"$ne": "cancelled"}
-            }).to_list(10000)
+            }
+            
+            # كل الإحصائيات تحسب في قاعدة البيانات - only grouped rows are returned
+            current_result, prev_result, visits_count = await asyncio.gather(
+                self.db.orders.aggregate(self._sales_analytics_pipeline(query)).to_list(1),
+                self.db.orders.aggregate([
+                    {"$match": prev_query},
+                    {"$group": {
+                        "_id": None,
+                        "total_sales": {"$sum": {"$ifNull": ["$total_amount", 0]}},
+                        "total_orders": {"$sum": 1}
+                    }}
+                ]).to_list(1),
+                # حساب معدل التحويل (نسبة الزيارات التي أدت لطلبات)
+                self.db.visits.count_documents({
+                    "date": {"$gte": start_date, "$lte": end_date}
+                })
+            )
             
-            prev_total_sales = sum(order.get("total_amount", 0) for order in prev_orders)
-            prev_total_orders = len(prev_orders)
+            current = current_result[0] if current_result else {}
+            totals = (current.get("totals") or [{}])[0]
+            prev_totals = prev_result[0] if prev_result else {}
+            
+            # حساب الإحصائيات الأساسية
+            total_sales = totals.get("total_sales", 0)
+            total_orders = totals.get("total_orders", 0)
+            average_order_value = total_sales / total_orders if total_orders > 0 else 0
+            
+            prev_total_sales = prev_totals.get("total_sales", 0)
+            prev_total_orders = prev_totals.get("total_orders", 0)
             
             sales_growth = ((total_sales - prev_total_sales) / prev_total_sales * 100) if prev_total_sales > 0 else 0
             order_growth = ((total_orders - prev_total_orders) / prev_total_orders * 100) if prev_total_orders > 0 else 0
             
-            # أفضل المنتجات
-            product_sales = {}
-            for order in orders:
-                for item in order.get("items", []):
-                    product_id = item.get("product_id")
-                    quantity = item.get("quantity", 0)
-                    total_price = item.get("total_price", 0)
-                    
-                    if product_id not in product_sales:
-                        product_sales[product_id] = {
-                            "product_name": item.get("product_name", "غير محدد"),
-                            "quantity": 0,
-                            "total_sales": 0
-                        }
-                    
-                    product_sales[product_id]["quantity"] += quantity
-                    product_sales[product_id]["total_sales"] += total_price
-            
-            top_products = sorted(
-                [{"product_id": k, **v} for k, v in product_sales.items()],
-                key=lambda x: x["total_sales"],
-                reverse=True
-            )[:10]
-            
-            # أفضل العملاء
-            clinic_sales = {}
-            for order in orders:
-                clinic_id = order.get("clinic_id")
-                amount = order.get("total_amount", 0)
-                
-                if clinic_id not in clinic_sales:
-                    clinic_sales[clinic_id] = {
-                        "clinic_name": order.get("clinic_name", "غير محدد"),
-                        "total_sales": 0,
-                        "order_count": 0
-                    }
-                
-                clinic_sales[clinic_id]["total_sales"] += amount
-                clinic_sales[clinic_id]["order_count"] += 1
-            
-            top_clients = sorted(
-                [{"clinic_id": k, **v} for k, v in clinic_sales.items()],
-                key=lambda x: x["total_sales"],
-                reverse=True
-            )[:10]
-            
-            # أفضل المندوبين
-            rep_sales = {}
-            for order in orders:
-                rep_id = order.get("medical_rep_id")
-                amount = order.get("total_amount", 0)
-                
-                if rep_id and rep_id not in rep_sales:
-                    rep_sales[rep_id] = {
-                        "rep_name": order.get("rep_name", "غير محدد"),
-                        "total_sales": 0,
-                        "order_count": 0
-                    }
-                
-                if rep_id:
-                    rep_sales[rep_id]["total_sales"] += amount
-                    rep_sales[rep_id]["order_count"] += 1
-            
-            top_reps = sorted(
-                [{"rep_id": k, **v} for k, v in rep_sales.items()],
-                key=lambda x: x["total_sales"],
-                reverse=True
-            )[:10]
-            
-            # المبيعات حسب المنطقة
-            area_sales = {}
-            for order in orders:
-                area = order.get("line", "غير محدد")
-                amount = order.get("total_amount", 0)
-                
-                if area not in area_sales:
-                    area_sales[area] = {"area_name": area, "total_sales": 0, "order_count": 0}
-                
-                area_sales[area]["total_sales"] += amount
-                area_sales[area]["order_count"] += 1
-            
-            sales_by_area = list(area_sales.values())
+            # أفضل المنتجات والعملاء والمندوبين والمبيعات حسب المنطقة
+            top_products = current.get("top_products", [])
+            top_clients = current.get("top_clients", [])
+            top_reps = current.get("top_reps", [])
+            sales_by_area = current.get("sales_by_area", [])
             
-            # حساب معدل التحويل (نسبة الزيارات التي أدت لطلبات)
-            visits_count = await self.db.visits.count_documents({
-                "date": {"$gte": start_date, "$lte": end_date}
-            })
             conversion_rate = (total_orders / visits_count * 100) if visits_count > 0 else 0
             
             return SalesAnalytics(
@@ -162,6 +101,78 @@ class AnalyticsService:
             self.logger.error(f"Error generating sales analytics: {e}")
             return SalesAnalytics()
 
+    def _sales_analytics_pipeline(self, query: Dict[str, Any], top_n: int = 10) -> List[Dict[str, Any]]:
+        """خط تجميع تحليل المبيعات - totals and top lists in a single $facet"""
+        amount = {"$ifNull": ["$total_amount", 0]}
+        return [
+            {"$match": query},
+            {"$project": {
+                "_id": 0, "total_amount": 1, "items": 1, "clinic_id": 1, "clinic_name": 1,
+                "medical_rep_id": 1, "rep_name": 1, "line": 1
+            }},
+            {"$facet": {
+                "totals": [
+                    {"$group": {"_id": None, "total_sales": {"$sum": amount}, "total_orders": {"$sum": 1}}}
+                ],
+                "top_products": [
+                    {"$unwind": "$items"},
+                    {"$group": {
+                        "_id": "$items.product_id",
+                        "product_name": {"$first": "$items.product_name"},
+                        "quantity": {"$sum": {"$ifNull": ["$items.quantity", 0]}},
+                        "total_sales": {"$sum": {"$ifNull": ["$items.total_price", 0]}}
+                    }},
+                    {"$sort": {"total_sales": -1}},
+                    {"$limit": top_n},
+                    {"$project": {
+                        "_id": 0, "product_id": "$_id",
+                        "product_name": {"$ifNull": ["$product_name", "غير محدد"]},
+                        "quantity": 1, "total_sales": 1
+                    }}
+                ],
+                "top_clients": [
+                    {"$group": {
+                        "_id": "$clinic_id",
+                        "clinic_name": {"$first": "$clinic_name"},
+                        "total_sales": {"$sum": amount},
+                        "order_count": {"$sum": 1}
+                    }},
+                    {"$sort": {"total_sales": -1}},
+                    {"$limit": top_n},
+                    {"$project": {
+                        "_id": 0, "clinic_id": "$_id",
+                        "clinic_name": {"$ifNull": ["$clinic_name", "غير محدد"]},
+                        "total_sales": 1, "order_count": 1
+                    }}
+                ],
+                "top_reps": [
+                    {"$match": {"medical_rep_id": {"$nin": [None, ""]}}},
+                    {"$group": {
+                        "_id": "$medical_rep_id",
+                        "rep_name": {"$first": "$rep_name"},
+                        "total_sales": {"$sum": amount},
+                        "order_count": {"$sum": 1}
+                    }},
+                    {"$sort": {"total_sales": -1}},
+                    {"$limit": top_n},
+                    {"$project": {
+                        "_id": 0, "rep_id": "$_id",
+                        "rep_name": {"$ifNull": ["$rep_name", "غير محدد"]},
+                        "total_sales": 1, "order_count": 1
+                    }}
+                ],
+                "sales_by_area": [
+                    {"$group": {
+                        "_id": {"$ifNull": ["$line", "غير محدد"]},
+                        "total_sales": {"$sum": amount},
+                        "order_count": {"$sum": 1}
+                    }},
+                    {"$sort": {"total_sales": -1}},
+                    {"$project": {"_id": 0, "area_name": "$_id", "total_sales": 1, "order_count": 1}}
+                ]
+            }}
+        ]
+
     async def generate_visit_analytics(self, time_range: TimeRange, filters: Dict[str, Any] = {}) -> VisitAnalytics:
         """تحليل الزيارات المتقدم"""
         try:
@@ -176,100 +187,43 @@ class AnalyticsService:
             if filters.get("clinic_id"):
                 query["clinic_id"] = filters["clinic_id"]
             
-            visits = await self.db.visits.find(query).to_list(10000)
+            # كل التجميعات تتم في قاعدة البيانات
+            result = await self.db.visits.aggregate(self._visit_analytics_pipeline(query)).to_list(1)
+            current = result[0] if result else {}
+            totals = (current.get("totals") or [{}])[0]
             
             # حساب الإحصائيات الأساسية
-            total_visits = len(visits)
-            successful_visits = len([v for v in visits if v.get("effective", False)])
+            total_visits = totals.get("total_visits", 0)
+            successful_visits = totals.get("successful_visits", 0)
             success_rate = (successful_visits / total_visits * 100) if total_visits > 0 else 0
             
             # حساب متوسط الزيارات لكل مندوب
-            unique_reps = set(v.get("sales_rep_id") for v in visits if v.get("sales_rep_id"))
-            average_visits_per_rep = total_visits / len(unique_reps) if unique_reps else 0
+            unique_reps = (current.get("unique_reps") or [{}])[0].get("count", 0)
+            average_visits_per_rep = total_visits / unique_reps if unique_reps else 0
             
             # تحليل الزيارات حسب الساعة
-            visits_by_hour = {}
-            for visit in visits:
-                visit_date = visit.get("date")
-                if isinstance(visit_date, datetime):
-                    hour = visit_date.hour
-                    if hour not in visits_by_hour:
-                        visits_by_hour[hour] = 0
-                    visits_by_hour[hour] += 1
-            
             visits_by_hour_list = [
-                {"hour": f"{hour:02d}:00", "count": count}
-                for hour, count in sorted(visits_by_hour.items())
+                {"hour": f"{row['_id']:02d}:00", "count": row["count"]}
+                for row in current.get("visits_by_hour", [])
             ]
             
             # تحليل الزيارات حسب اليوم
-            visits_by_day = {}
-            for visit in visits:
-                visit_date = visit.get("date")
-                if isinstance(visit_date, datetime):
-                    day_name = visit_date.strftime("%A")
-                    if day_name not in visits_by_day:
-                        visits_by_day[day_name] = 0
-                    visits_by_day[day_name] += 1
-            
             visits_by_day_list = [
-                {"day": day, "count": count}
-                for day, count in visits_by_day.items()
+                {"day": WEEKDAY_NAMES[row["_id"] - 1], "count": row["count"]}
+                for row in current.get("visits_by_day", [])
             ]
             
-            # أداء المندوبين
-            rep_performance = {}
-            for visit in visits:
-                rep_id = visit.get("sales_rep_id")
-                if rep_id:
-                    if rep_id not in rep_performance:
-                        rep_performance[rep_id] = {
-                            "rep_name": "غير محدد",  # سيتم تحديثه من قاعدة البيانات
-                            "total_visits": 0,
-                            "successful_visits": 0,
-                            "success_rate": 0
-                        }
-                    
-                    rep_performance[rep_id]["total_visits"] += 1
-                    if visit.get("effective", False):
-                        rep_performance[rep_id]["successful_visits"] += 1
-            
-            # حساب معدل النجاح لكل مندوب
-            for rep_id, data in rep_performance.items():
-                if data["total_visits"] > 0:
-                    data["success_rate"] = (data["successful_visits"] / data["total_visits"]) * 100
-                
-                # الحصول على اسم المندوب
-                rep = await self.db.users.find_one({"id": rep_id}, {"full_name": 1, "username": 1})
-                if rep:
-                    data["rep_name"] = rep.get("full_name", rep.get("username", "غير محدد"))
-            
-            rep_performance_list = [
-                {"rep_id": k, **v} for k, v in rep_performance.items()
-            ]
-            rep_performance_list.sort(key=lambda x: x["success_rate"], reverse=True)
+            # أداء المندوبين - أسماء المندوبين في استعلام واحد
+            rep_performance_list = current.get("rep_performance", [])
+            rep_ids = [row["rep_id"] for row in rep_performance_list]
+            rep_names = {}
+            async for rep in self.db.users.find({"id": {"$in": rep_ids}}, {"_id": 0, "id": 1, "full_name": 1, "username": 1}):
+                rep_names[rep["id"]] = rep.get("full_name", rep.get("username", "غير محدد"))
+            for row in rep_performance_list:
+                row["rep_name"] = rep_names.get(row["rep_id"], "غير محدد")
             
             # تغطية العيادات
-            clinic_coverage = {}
-            for visit in visits:
-                clinic_id = visit.get("clinic_id")
-                if clinic_id:
-                    if clinic_id not in clinic_coverage:
-                        clinic_coverage[clinic_id] = {
-                            "clinic_name": visit.get("clinic_name", "غير محدد"),
-                            "visit_count": 0,
-                            "last_visit": None
-                        }
-                    
-                    clinic_coverage[clinic_id]["visit_count"] += 1
-                    visit_date = visit.get("date")
-                    if visit_date and (not clinic_coverage[clinic_id]["last_visit"] or visit_date > clinic_coverage[clinic_id]["last_visit"]):
-                        clinic_coverage[clinic_id]["last_visit"] = visit_date
-            
-            clinic_coverage_list = [
-                {"clinic_id": k, **v} for k, v in clinic_coverage.items()
-            ]
-            clinic_coverage_list.sort(key=lambda x: x["visit_count"], reverse=True)
+            clinic_coverage_list = current.get("clinic_coverage", [])
             
             return VisitAnalytics(
                 total_visits=total_visits,
@@ -279,14 +233,80 @@ class AnalyticsService:
                 visits_by_hour=visits_by_hour_list,
                 visits_by_day=visits_by_day_list,
                 visits_by_month=[],  # يمكن تطويرها
-                rep_performance=rep_performance_list[:10],
-                clinic_coverage=clinic_coverage_list[:20]
+                rep_performance=rep_performance_list,
+                clinic_coverage=clinic_coverage_list
             )
             
         except Exception as e:
             self.logger.error(f"Error generating visit analytics: {e}")
             return VisitAnalytics()
 
+    def _visit_analytics_pipeline(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """خط تجميع تحليل الزيارات - totals, hour/day buckets, top reps and clinics in one $facet"""
+        effective = {"$cond": [{"$eq": ["$effective", True]}, 1, 0]}
+        date_parts = [
+            {"$match": {"date": {"$type": "date"}}},
+            {"$project": {"parts": {"$dateToParts": {"date": "$date", "iso8601": True}}}}
+        ]
+        return [
+            {"$match": query},
+            {"$project": {
+                "_id": 0, "date": 1, "effective": 1, "sales_rep_id": 1, "clinic_id": 1, "clinic_name": 1
+            }},
+            {"$facet": {
+                "totals": [
+                    {"$group": {
+                        "_id": None,
+                        "total_visits": {"$sum": 1},
+                        "successful_visits": {"$sum": effective}
+                    }}
+                ],
+                "unique_reps": [
+                    {"$match": {"sales_rep_id": {"$nin": [None, ""]}}},
+                    {"$group": {"_id": "$sales_rep_id"}},
+                    {"$count": "count"}
+                ],
+                "visits_by_hour": date_parts + [
+                    {"$group": {"_id": "$parts.hour", "count": {"$sum": 1}}},
+                    {"$sort": {"_id": 1}}
+                ],
+                "visits_by_day": date_parts + [
+                    {"$group": {"_id": "$parts.isoDayOfWeek", "count": {"$sum": 1}}},
+                    {"$sort": {"_id": 1}}
+                ],
+                "rep_performance": [
+                    {"$match": {"sales_rep_id": {"$nin": [None, ""]}}},
+                    {"$group": {
+                        "_id": "$sales_rep_id",
+                        "total_visits": {"$sum": 1},
+                        "successful_visits": {"$sum": effective}
+                    }},
+                    {"$project": {
+                        "_id": 0, "rep_id": "$_id", "total_visits": 1, "successful_visits": 1,
+                        "success_rate": {"$multiply": [{"$divide": ["$successful_visits", "$total_visits"]}, 100]}
+                    }},
+                    {"$sort": {"success_rate": -1}},
+                    {"$limit": 10}
+                ],
+                "clinic_coverage": [
+                    {"$match": {"clinic_id": {"$nin": [None, ""]}}},
+                    {"$group": {
+                        "_id": "$clinic_id",
+                        "clinic_name": {"$first": "$clinic_name"},
+                        "visit_count": {"$sum": 1},
+                        "last_visit": {"$max": "$date"}
+                    }},
+                    {"$sort": {"visit_count": -1}},
+                    {"$limit": 20},
+                    {"$project": {
+                        "_id": 0, "clinic_id": "$_id",
+                        "clinic_name": {"$ifNull": ["$clinic_name", "غير محدد"]},
+                        "visit_count": 1, "last_visit": 1
+                    }}
+                ]
+            }}
+        ]
+
     async def generate_performance_dashboard(self, user_id: str, time_range: TimeRange) -> PerformanceDashboard:
         """إنشاء لوحة أداء شخصية"""
         try:
@@ -0,0 +1,480 @@
+# Clinic Roster - قائمة عيادات المندوب
+# Medical Management System - Per-rep clinic roster materialized in MongoDB
+#
+# Visit stats for all of a rep's clinics come from one rep_visits aggregation
+# grouped by clinic_id instead of three queries per clinic.
+#
+# rep_clinic_roster holds one document per (rep, source, clinic) with the list
+# entry already built, so a rep's clinic lists are a single indexed lookup.
+# Clinic and visit writes call sync_clinic(), which rebuilds that clinic's
+# entries for every rep it concerns. Every write stamps a per-rep version;
+# clients send the last ETag back and receive only entries with a newer
+# version (removals are kept as tombstones).
+#
+# "Visit today" depends on the calendar day, not only on writes, so entries
+# store the days of the rep's upcoming visits (visit_days) and has_visit_today
+# is derived when the entry is read. ETags carry the day as well: an ETag from
+# an earlier day gets a full fetch instead of a delta.
+
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+ROSTER_SOURCES = ("clinics", "enhanced_clinics")
+TODAY_VISIT_STATUSES = ["planned", "in_progress", "completed"]
+# إصدار محجوز لم يُكتب خلال هذه المدة يعتبر متروكاً (عملية توقفت)
+PENDING_VERSION_TIMEOUT = timedelta(seconds=60)
+# شكل المدخلات المخزنة - a state with an older schema is rebuilt on its next read
+ROSTER_SCHEMA = 2
+
+CLINIC_ROSTER_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "address": 1, "area_name": 1, "phone": 1, "email": 1,
+    "specialization": 1, "primary_doctor_name": 1, "assigned_rep_id": 1, "available_reps": 1,
+    "area_reps": 1, "latitude": 1, "longitude": 1
+}
+ENHANCED_CLINIC_ROSTER_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "registration_number": 1, "primary_doctor_name": 1,
+    "primary_doctor_specialty": 1, "phone": 1, "location_data": 1, "classification": 1,
+    "credit_classification": 1, "status": 1, "is_active": 1, "line_id": 1, "line_name": 1, "area_id": 1,
+    "area_name": 1, "assigned_rep_id": 1, "assigned_rep_name": 1, "available_reps": 1, "backup_rep_ids": 1,
+    "total_visits": 1, "total_revenue": 1, "outstanding_debt": 1, "created_at": 1
+}
+
+
+def rep_clinics_filter(rep_id: str) -> dict:
+    """العيادات المتاحة للمندوب - assigned, in available_reps, or an area rep"""
+    return {
+        "$or": [
+            {"assigned_rep_id": rep_id},                    # مخصص مباشرة
+            {"available_reps": {"$in": [rep_id]}},          # في قائمة المتاحين
+            {"area_reps": {"$in": [rep_id]}}                # مندوب منطقة
+        ]
+    }
+
+
+def rep_enhanced_clinics_filter(rep_id: str) -> dict:
+    """العيادات المعتمدة المتاحة للمندوب - approved, active, assigned/available/backup"""
+    return {
+        "status": "approved",
+        "is_active": True,
+        "$or": [
+            {"assigned_rep_id": rep_id},
+            {"available_reps": {"$in": [rep_id]}},
+            {"backup_rep_ids": {"$in": [rep_id]}}
+        ]
+    }
+
+
+def _clinic_reps(clinic: dict, source: str) -> Set[str]:
+    """المناديب الذين تظهر لهم العيادة - inverse of the filters above"""
+    if source == "enhanced_clinics":
+        if clinic.get("status") != "approved" or clinic.get("is_active") is not True:
+            return set()
+        fields = ("available_reps", "backup_rep_ids")
+    else:
+        fields = ("available_reps", "area_reps")
+    reps = {clinic.get("assigned_rep_id")}
+    for field in fields:
+        reps.update(clinic.get(field) or [])
+    reps.discard(None)
+    reps.discard("")
+    return reps
+
+
+def _last_visit_date(actual_end_time: Optional[str]) -> Optional[str]:
+    if not actual_end_time:
+        return None
+    try:
+        return datetime.fromisoformat(actual_end_time.replace('Z', '+00:00')).date().isoformat()
+    except (AttributeError, ValueError):
+        return None
+
+
+def _roster_entry(clinic: dict, rep_id: str, stats: Optional[dict]) -> dict:
+    stats = stats or {}
+    return {
+        "id": clinic.get("id", ""),
+        "name": clinic.get("name", ""),
+        "address": clinic.get("address", ""),
+        "area_name": clinic.get("area_name", ""),
+        "phone": clinic.get("phone", ""),
+        "email": clinic.get("email", ""),
+        "specialization": clinic.get("specialization", ""),
+        "doctor_name": clinic.get("primary_doctor_name", ""),
+        "assignment_type": "assigned" if clinic.get("assigned_rep_id") == rep_id else "available",
+        "last_visit_date": _last_visit_date(stats.get("last_completed_end")),
+        "total_visits": stats.get("completed_visits", 0),
+        "visit_days": stats.get("visit_days", []),
+        "coordinates": {
+            "latitude": clinic.get("latitude"),
+            "longitude": clinic.get("longitude")
+        } if clinic.get("latitude") and clinic.get("longitude") else None
+    }
+
+
+def _enhanced_roster_entry(clinic: dict, last_visit_end: Optional[str]) -> dict:
+    location = clinic.get("location_data") or {}
+    return {
+        "id": clinic.get("id", ""),
+        "name": clinic.get("name", ""),
+        "registration_number": clinic.get("registration_number", ""),
+        "primary_doctor_name": clinic.get("primary_doctor_name", ""),
+        "primary_doctor_specialty": clinic.get("primary_doctor_specialty", ""),
+        "phone": clinic.get("phone", ""),
+        "address": location.get("address", ""),
+        "classification": clinic.get("classification", "average"),
+        "credit_classification": clinic.get("credit_classification", "b"),
+        "status": clinic.get("status", "pending"),
+        "line_name": clinic.get("line_name", ""),
+        "area_name": clinic.get("area_name", ""),
+        "assigned_rep_name": clinic.get("assigned_rep_name", ""),
+        "total_visits": clinic.get("total_visits", 0),
+        "total_revenue": clinic.get("total_revenue", 0.0),
+        "outstanding_debt": clinic.get("outstanding_debt", 0.0),
+        "last_visit_date": last_visit_end,
+        "location": {
+            "latitude": location.get("latitude"),
+            "longitude": location.get("longitude")
+        },
+        "is_available_for_visit": True,  # يمكن تطوير هذا بناء على قواعد العمل
+        "distance_from_user": None  # يمكن حسابها إذا توفر موقع المستخدم
+    }
+
+
+def with_visit_today(entry: dict, today: Optional[date] = None) -> dict:
+    """has_visit_today من أيام الزيارات المخزنة - evaluated at read time, never goes stale"""
+    visit_days = entry.pop("visit_days", None)
+    if visit_days is not None:
+        entry["has_visit_today"] = (today or date.today()).isoformat() in visit_days
+    return entry
+
+
+def sort_roster(roster: List[dict]):
+    # ترتيب حسب آخر زيارة (الأقدم أولاً)
+    roster.sort(key=lambda x: x["last_visit_date"] if x["last_visit_date"] else "1900-01-01")
+
+
+def format_roster_etag(rep_id: str, version: int, today: Optional[date] = None) -> str:
+    return f'"{rep_id}.{version}.{(today or date.today()).strftime("%Y%m%d")}"'
+
+
+def parse_roster_etag(etag: Optional[str], rep_id: str, today: Optional[date] = None) -> Optional[int]:
+    """قراءة If-None-Match - returns the version, or None when it is not this rep's ETag for today"""
+    if not etag:
+        return None
+    value = etag.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    rest, _, day = value.strip('"').rpartition(".")
+    owner, _, version = rest.rpartition(".")
+    # يوم جديد - has_visit_today تغير دون كتابة، فالقائمة تعاد كاملة
+    if owner != rep_id or not version.isdigit() or day != (today or date.today()).strftime("%Y%m%d"):
+        return None
+    return int(version)
+
+
+class ClinicRosterService:
+    """خدمة قائمة عيادات المندوب - builds roster entries and maintains rep_clinic_roster"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.roster = db.rep_clinic_roster
+        self.state = db.rep_clinic_roster_state
+
+    # ----------------------------------------------------------------
+    # Building entries from the source collections
+    # ----------------------------------------------------------------
+
+    async def visit_stats(self, match: dict, group_by: str = "$clinic_id") -> Dict[str, dict]:
+        """إحصائيات الزيارات في تجميع واحد - last completion, completed count, upcoming visit days
+
+        scheduled_date and actual_end_time are stored as ISO strings, so the
+        day range and the latest completion compare as strings. visit_days
+        lists the days (from today on) that have a planned, running or
+        completed visit.
+        """
+        today = date.today()
+        day_start = datetime.combine(today, datetime.min.time()).isoformat()
+        completed = {"$eq": ["$status", "completed"]}
+
+        rows = await self.db.rep_visits.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": group_by,
+                "last_completed_end": {"$max": {"$cond": [completed, "$actual_end_time", None]}},
+                "completed_visits": {"$sum": {"$cond": [completed, 1, 0]}},
+                "scheduled": {"$addToSet": {"$cond": [{"$and": [
+                    {"$gte": ["$scheduled_date", day_start]},
+                    {"$in": ["$status", TODAY_VISIT_STATUSES]}
+                ]}, "$scheduled_date", None]}}
+            }}
+        ]).to_list(None)
+        for row in rows:
+            row["visit_days"] = sorted({str(value)[:10] for value in row.pop("scheduled") if value})
+        return {row["_id"]: row for row in rows}
+
+    async def last_completed_visits(self, clinic_ids: List[str]) -> Dict[str, str]:
+        """آخر زيارة مكتملة لكل عيادة (من أي مندوب)"""
+        if not clinic_ids:
+            return {}
+        rows = await self.db.rep_visits.aggregate([
+            {"$match": {"clinic_id": {"$in": clinic_ids}, "status": "completed"}},
+            {"$group": {"_id": "$clinic_id", "last_end": {"$max": "$actual_end_time"}}}
+        ]).to_list(None)
+        return {row["_id"]: row["last_end"] for row in rows if row.get("last_end")}
+
+    async def build_roster(self, rep_id: str) -> List[dict]:
+        """قائمة العيادات مباشرة من المجموعات - two queries, no roster involved"""
+        entries = await self._build_rep_entries(rep_id, "clinics")
+        roster = [with_visit_today(entry) for _, entry, _ in entries]
+        sort_roster(roster)
+        return roster
+
+    async def _build_rep_entries(self, rep_id: str, source: str) -> List[Tuple[str, dict, dict]]:
+        """(clinic_id, entry, extra fields) for every clinic of the rep in one source"""
+        if source == "enhanced_clinics":
+            clinics = await self.db.enhanced_clinics.find(
+                rep_enhanced_clinics_filter(rep_id), ENHANCED_CLINIC_ROSTER_PROJECTION
+            ).to_list(None)
+            last_visits = await self.last_completed_visits([clinic.get("id", "") for clinic in clinics])
+            return [(clinic.get("id", ""), _enhanced_roster_entry(clinic, last_visits.get(clinic.get("id", ""))),
+                     self._extra_fields(clinic)) for clinic in clinics]
+
+        clinics = await self.db.clinics.find(rep_clinics_filter(rep_id), CLINIC_ROSTER_PROJECTION).to_list(None)
+        clinic_ids = [clinic.get("id", "") for clinic in clinics]
+        stats = await self.visit_stats({"medical_rep_id": rep_id, "clinic_id": {"$in": clinic_ids}}) if clinic_ids else {}
+        return [(clinic.get("id", ""), _roster_entry(clinic, rep_id, stats.get(clinic.get("id", ""))),
+                 self._extra_fields(clinic)) for clinic in clinics]
+
+    @staticmethod
+    def _extra_fields(clinic: dict) -> dict:
+        # حقول التصفية والترتيب خارج الاستجابة
+        return {"line_id": clinic.get("line_id"), "area_id": clinic.get("area_id"),
+                "clinic_created_at": clinic.get("created_at")}
+
+    # ----------------------------------------------------------------
+    # Versions
+    # ----------------------------------------------------------------
+
+    async def _reserve_version(self, rep_id: str) -> Optional[int]:
+        """حجز إصدار جديد للمندوب - None when the rep has no materialized roster yet
+
+        The version stays in `pending` until its writes land, so readers never
+        hand out an ETag past a version that is still being written. The new
+        version and its pending entry are set in one update guarded on the
+        version just read (retried when another writer got there first), so
+        no reader sees the version without its pending entry.
+        """
+        while True:
+            state = await self.state.find_one({"rep_id": rep_id}, {"_id": 0, "version": 1})
+            if state is None:
+                return None
+            current = state.get("version", 0)
+            result = await self.state.update_one(
+                {"rep_id": rep_id, "version": current},
+                {
+                    "$set": {"version": current + 1},
+                    "$push": {"pending": {"version": current + 1, "at": datetime.utcnow()}}
+                }
+            )
+            if result.modified_count:
+                return current + 1
+
+    async def _release_version(self, rep_id: str, version: int, **fields):
+        update = {"$pull": {"pending": {"version": version}}}
+        if fields:
+            update["$set"] = fields
+        await self.state.update_one({"rep_id": rep_id}, update)
+
+    @staticmethod
+    def _watermark(state: dict) -> int:
+        """أعلى إصدار مكتمل - versions below an in-flight write are not yet safe to acknowledge"""
+        cutoff = datetime.utcnow() - PENDING_VERSION_TIMEOUT
+        pending = [item["version"] for item in state.get("pending", []) if item.get("at", cutoff) > cutoff]
+        return min(pending) - 1 if pending else state.get("version", 0)
+
+    # ----------------------------------------------------------------
+    # Materialization
+    # ----------------------------------------------------------------
+
+    async def rebuild_rep(self, rep_id: str):
+        """إعادة بناء قائمة المندوب بالكامل - all sources, one new version, removals tombstoned
+
+        The stale flag is cleared only if no mark_stale() arrived while the
+        rebuild was reading (stale_marks unchanged), and only on success.
+        """
+        state = await self.state.find_one_and_update(
+            {"rep_id": rep_id},
+            {"$setOnInsert": {"rep_id": rep_id, "version": 0, "pending": [], "stale": True, "stale_marks": 0}},
+            projection={"_id": 0, "stale_marks": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        stale_marks = (state or {}).get("stale_marks")
+        version = await self._reserve_version(rep_id)
+        try:
+            now = datetime.utcnow()
+            operations = []
+            for source in ROSTER_SOURCES:
+                built = await self._build_rep_entries(rep_id, source)
+                current = {clinic_id for clinic_id, _, _ in built}
+                existing = await self.roster.distinct(
+                    "clinic_id", {"rep_id": rep_id, "source": source, "removed": False}
+                )
+                operations.extend(
+                    self._upsert(rep_id, source, clinic_id, entry, extra, version, now)
+                    for clinic_id, entry, extra in built
+                )
+                operations.extend(
+                    self._tombstone(rep_id, source, clinic_id, version, now)
+                    for clinic_id in existing if clinic_id not in current
+                )
+            await self._write(operations)
+        finally:
+            await self._release_version(rep_id, version)
+        await self.state.update_one(
+            {"rep_id": rep_id, "stale_marks": stale_marks},
+            {"$set": {"stale": False, "schema": ROSTER_SCHEMA, "rebuilt_at": datetime.utcnow()}}
+        )
+
+    async def sync_clinic(self, clinic_id: str, sources: Iterable[str] = ROSTER_SOURCES):
+        """تحديث العيادة في قوائم كل المناديب المعنيين - call after any clinic or visit write
+
+        Never raises: if the update fails the affected reps are marked stale and
+        rebuilt on their next read.
+        """
+        for source in sources:
+            affected: Set[str] = set()
+            try:
+                clinic = await self.db[source].find_one(
+                    {"id": clinic_id},
+                    ENHANCED_CLINIC_ROSTER_PROJECTION if source == "enhanced_clinics" else CLINIC_ROSTER_PROJECTION
+                )
+                target = _clinic_reps(clinic, source) if clinic else set()
+                listed = await self.roster.distinct(
+                    "rep_id", {"clinic_id": clinic_id, "source": source, "removed": False}
+                )
+                affected = target | set(listed)
+                if not affected:
+                    continue
+                # المناديب الذين لم تُبنَ قوائمهم بعد تُبنى كاملة عند أول قراءة
+                materialized = await self.state.distinct("rep_id", {"rep_id": {"$in": list(affected)}})
+                if not materialized:
+                    continue
+                entries = await self._clinic_entries(clinic, source, [rep for rep in materialized if rep in target])
+                now = datetime.utcnow()
+                for rep_id in materialized:
+                    version = await self._reserve_version(rep_id)
+                    if version is None:
+                        continue
+                    try:
+                        if rep_id in entries:
+                            entry, extra = entries[rep_id]
+                            await self._write([self._upsert(rep_id, source, clinic_id, entry, extra, version, now)])
+                        else:
+                            await self._write([self._tombstone(rep_id, source, clinic_id, version, now)])
+                    finally:
+                        await self._release_version(rep_id, version)
+            except Exception as e:
+                print(f"⚠️ Clinic roster sync failed for {source}/{clinic_id}: {str(e)}")
+                await self.mark_stale(affected or None)
+
+    async def _clinic_entries(self, clinic: Optional[dict], source: str, reps: List[str]) -> Dict[str, tuple]:
+        if clinic is None or not reps:
+            return {}
+        clinic_id = clinic.get("id", "")
+        extra = self._extra_fields(clinic)
+        if source == "enhanced_clinics":
+            last_visits = await self.last_completed_visits([clinic_id])
+            entry = _enhanced_roster_entry(clinic, last_visits.get(clinic_id))
+            return {rep_id: (entry, extra) for rep_id in reps}
+        # إحصائيات هذه العيادة لكل مندوب في تجميع واحد
+        stats = await self.visit_stats({"clinic_id": clinic_id, "medical_rep_id": {"$in": reps}}, "$medical_rep_id")
+        return {rep_id: (_roster_entry(clinic, rep_id, stats.get(rep_id)), extra) for rep_id in reps}
+
+    async def mark_stale(self, rep_ids: Optional[Iterable[str]] = None):
+        """تعليم القوائم للإعادة البناء - all reps when rep_ids is None (bulk imports)"""
+        query = {} if rep_ids is None else {"rep_id": {"$in": list(rep_ids)}}
+        await self.state.update_many(query, {"$set": {"stale": True}, "$inc": {"stale_marks": 1}})
+
+    async def _write(self, operations: List[UpdateOne]):
+        """كتابة مشروطة بالإصدار - a write carrying an older version than the stored one is dropped
+
+        The version guard turns an upsert against a newer document into a
+        duplicate key error on the unique (rep_id, source, clinic_id) index,
+        which is exactly the outcome we want, so those errors are ignored.
+        """
+        if not operations:
+            return
+        try:
+            await self.roster.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if errors:
+                raise
+
+    @staticmethod
+    def _upsert(rep_id, source, clinic_id, entry, extra, version, now) -> UpdateOne:
+        return UpdateOne(
+            {"rep_id": rep_id, "source": source, "clinic_id": clinic_id, "version": {"$lt": version}},
+            {"$set": {"entry": entry, **extra, "version": version, "removed": False, "updated_at": now}},
+            upsert=True
+        )
+
+    @staticmethod
+    def _tombstone(rep_id, source, clinic_id, version, now) -> UpdateOne:
+        return UpdateOne(
+            {"rep_id": rep_id, "source": source, "clinic_id": clinic_id, "version": {"$lt": version}},
+            {"$set": {"version": version, "removed": True, "updated_at": now}, "$unset": {"entry": ""}}
+        )
+
+    # ----------------------------------------------------------------
+    # Reads
+    # ----------------------------------------------------------------
+
+    async def _ready_state(self, rep_id: str) -> dict:
+        state = await self.state.find_one({"rep_id": rep_id}, {"_id": 0})
+        if state is None or state.get("stale", True) or state.get("schema") != ROSTER_SCHEMA:
+            await self.rebuild_rep(rep_id)
+            state = await self.state.find_one({"rep_id": rep_id}, {"_id": 0})
+        return state
+
+    async def list_entries(self, rep_id: str, source: str, query: Optional[dict] = None,
+                           sort: Optional[List[tuple]] = None, limit: int = 0) -> Tuple[List[dict], int]:
+        """قراءة القائمة المخزنة - (entries, total matching) from rep_clinic_roster"""
+        await self._ready_state(rep_id)
+        match = {"rep_id": rep_id, "source": source, "removed": False, **(query or {})}
+        cursor = self.roster.find(match, {"_id": 0, "entry": 1})
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        docs = await cursor.to_list(None)
+        total = await self.roster.count_documents(match) if limit else len(docs)
+        return [with_visit_today(doc["entry"]) for doc in docs], total
+
+    async def fetch(self, rep_id: str, since: Optional[int] = None) -> dict:
+        """قائمة المندوب كاملة أو التغييرات منذ إصدار - backs the ETag / If-None-Match endpoint
+
+        Returns {"version", "not_modified", "delta", "clinics", "removed"}.
+        An unknown or future version falls back to a full fetch.
+        """
+        state = await self._ready_state(rep_id)
+        watermark = self._watermark(state)
+        delta = since is not None and since <= state.get("version", 0)
+        if delta and since == watermark:
+            return {"version": watermark, "not_modified": True, "delta": True, "clinics": [], "removed": []}
+
+        query = {"rep_id": rep_id, "version": {"$gt": since}} if delta else {"rep_id": rep_id, "removed": False}
+        docs = await self.roster.find(query, {"_id": 0, "source": 1, "clinic_id": 1, "entry": 1, "removed": 1}) \
+            .sort("version", 1).to_list(None)
+        clinics = [with_visit_today({"source": doc["source"], **doc["entry"]}) for doc in docs if not doc.get("removed")]
+        removed = [{"source": doc["source"], "id": doc["clinic_id"]} for doc in docs if doc.get("removed")]
+        return {"version": watermark, "not_modified": False, "delta": delta, "clinics": clinics, "removed": removed}
+
+
+async def sync_clinic_roster(db: AsyncIOMotorDatabase, clinic_id: str, *sources: str):
+    """يُستدعى بعد تعديل عيادة أو تخصيصها أو اعتمادها، وبعد إنشاء زيارة أو إنهائها"""
+    await ClinicRosterService(db).sync_clinic(clinic_id, sources or ROSTER_SOURCES)
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient
 import uuid
 from models.crm_models import *
+from services.pagination import paginate
 
 class CRMService:
     def __init__(self, db):
@@ -297,17 +298,21 @@ class CRMService:
                 clinic_ids = [clinic["id"] for clinic in matching_clinics]
                 query["clinic_id"] = {"$in": clinic_ids}
             
-            # العدد الإجمالي
-            total_count = await self.db.client_profiles.count_documents(query)
-            
-            # الحصول على النتائج
-            profiles = await self.db.client_profiles.find(
-                query, {"_id": 0}
-            ).sort("updated_at", -1).skip(search_filter.offset).limit(search_filter.limit).to_list(search_filter.limit)
+            # الحصول على النتائج بالمؤشر - العدد الإجمالي في الصفحة الأولى فقط
+            page = await paginate(
+                self.db.client_profiles, query, [("updated_at", -1)], search_filter.limit,
+                cursor=search_filter.cursor, offset=search_filter.offset,
+                projection={"_id": 0}, total=search_filter.total
+            )
+            profiles = page["items"]
             
-            # إضافة معلومات العيادة
+            # إضافة معلومات العيادة - استعلام واحد لكل الصفحة
+            clinics = {clinic["id"]: clinic async for clinic in self.db.clinics.find(
+                {"id": {"$in": [profile.get("clinic_id") for profile in profiles]}},
+                {"_id": 0, "id": 1, "name": 1, "address": 1, "phone": 1}
+            )}
             for profile in profiles:
-                clinic = await self.db.clinics.find_one({"id": profile["clinic_id"]})
+                clinic = clinics.get(profile.get("clinic_id"))
                 if clinic:
                     profile["clinic_info"] = {
                         "name": clinic.get("name", "غير محدد"),
@@ -322,11 +327,15 @@ class CRMService:
             
             return {
                 "profiles": profiles,
-                "total_count": total_count,
-                "has_more": (search_filter.offset + len(profiles)) < total_count,
+                "total_count": page["total_count"],
+                "total_is_estimate": page["total_is_estimate"],
+                "has_more": page["has_more"],
+                "next_cursor": page["next_cursor"],
                 "filter_applied": search_filter.dict()
             }
             
+        except ValueError:
+            raise
         except Exception as e:
             self.logger.error(f"Error searching clients: {e}")
             return {"profiles": [], "total_count": 0, "has_more": False}
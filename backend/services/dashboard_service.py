@@ -0,0 +1,271 @@
+# Dashboard Query Planner - مخطط استعلامات لوحة التحكم
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from indexes import INDEX_REGISTRY
+
+# شروط يستطيع الفهرس تحديدها - predicates that pin an index's leading key
+INDEX_PINNING_OPERATORS = {"$eq", "$in"}
+
+
+def _leading_match(stages: List[dict]) -> dict:
+    return stages[0]["$match"] if stages and "$match" in stages[0] else {}
+
+
+def _without_match(stages: List[dict], shared: Optional[dict]) -> List[dict]:
+    """إزالة الشرط المشترك - the shared $match already ran before the $facet"""
+    if not shared:
+        return stages
+    rest = {field: value for field, value in stages[0]["$match"].items() if field not in shared}
+    return ([{"$match": rest}] if rest else []) + stages[1:]
+
+
+def _pins_index(match: dict, indexed_fields: set) -> bool:
+    for field in indexed_fields & set(match):
+        value = match[field]
+        if not isinstance(value, dict) or (value and set(value) <= INDEX_PINNING_OPERATORS):
+            return True
+    return False
+
+
+class DashboardMetric:
+    """مقياس واحد في لوحة التحكم - a single facet whose value is filled in by execute()"""
+
+    def __init__(self, collection: str, stages: List[dict], kind: str, default: Any = None):
+        self.collection = collection
+        self.stages = stages
+        self.kind = kind
+        self.default = default
+        self.value: Any = default
+
+    def resolve(self, rows: List[dict]):
+        if self.kind == "count":
+            self.value = rows[0]["n"] if rows else 0
+        elif self.kind == "group_one":
+            if rows:
+                row = dict(rows[0])
+                row.pop("_id", None)
+                self.value = row
+            else:
+                self.value = dict(self.default or {})
+        else:
+            self.value = rows
+
+
+class DashboardQueryPlanner:
+    """مخطط استعلامات لوحة التحكم - merges dashboard metrics into one $facet per collection
+
+    Metrics are registered first and executed together: every collection gets a
+    single aggregate round trip and the collections run concurrently. Identical
+    metrics registered by different widgets share one facet.
+
+    $facet sub-pipelines cannot use indexes. A filter shared by all metrics on
+    a collection runs as a $match in front of the $facet; otherwise metrics
+    filtered on an indexed field (e.g. a rep's visits by sales_rep_id) keep
+    their own indexed query and only the rest share the collection scan.
+    A failed query raises, so a broken computation is never cached.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self._metrics: Dict[str, Dict[str, DashboardMetric]] = {}
+        self.executed = False
+
+    def _register(self, collection: str, stages: List[dict], kind: str, default: Any = None) -> DashboardMetric:
+        signature = json.dumps([kind, stages], sort_keys=True, default=str)
+        metrics = self._metrics.setdefault(collection, {})
+        if signature not in metrics:
+            metrics[signature] = DashboardMetric(collection, stages, kind, default)
+        return metrics[signature]
+
+    def count(self, collection: str, match: Optional[dict] = None) -> DashboardMetric:
+        """عدد المستندات - count_documents equivalent"""
+        stages = [{"$match": match}] if match else []
+        return self._register(collection, stages + [{"$count": "n"}], "count", 0)
+
+    def group_one(self, collection: str, accumulators: dict, match: Optional[dict] = None,
+                  default: Optional[dict] = None) -> DashboardMetric:
+        """تجميع في مستند واحد - $group with _id: None"""
+        stages = [{"$match": match}] if match else []
+        stages.append({"$group": {"_id": None, **accumulators}})
+        return self._register(collection, stages, "group_one", default or {})
+
+    def aggregate(self, collection: str, stages: List[dict]) -> DashboardMetric:
+        """خط تجميع عام - arbitrary sub-pipeline returning a list"""
+        return self._register(collection, stages, "list", [])
+
+    def find(self, collection: str, match: Optional[dict] = None, sort: Optional[dict] = None,
+             limit: Optional[int] = None) -> DashboardMetric:
+        """أحدث المستندات - find().sort().limit() equivalent (without _id)"""
+        stages = [{"$match": match}] if match else []
+        if sort:
+            stages.append({"$sort": sort})
+        if limit:
+            stages.append({"$limit": limit})
+        stages.append({"$project": {"_id": 0}})
+        return self._register(collection, stages, "list", [])
+
+    def _plan_collection(self, collection: str, metrics: List[DashboardMetric]):
+        """خطة المجموعة - returns (shared $match, metrics for the $facet, metrics run on their own)
+
+        A filter shared by every metric goes in front of the $facet, where it
+        can use an index. Without one, metrics whose filter pins the leading
+        key of a registered index run as their own indexed query instead of
+        scanning the collection inside the $facet.
+        """
+        shared = _leading_match(metrics[0].stages)
+        for metric in metrics[1:]:
+            match = _leading_match(metric.stages)
+            shared = {field: value for field, value in shared.items() if field in match and match[field] == value}
+        if shared:
+            return shared, metrics, []
+
+        indexed_fields = {spec.keys[0][0] for spec in INDEX_REGISTRY.get(collection, [])}
+        separate = [metric for metric in metrics if _pins_index(_leading_match(metric.stages), indexed_fields)]
+        return None, [metric for metric in metrics if metric not in separate], separate
+
+    async def _run_facet(self, collection: str, metrics: List[DashboardMetric], shared: Optional[dict]):
+        facet = {f"m{i}": _without_match(metric.stages, shared) for i, metric in enumerate(metrics)}
+        pipeline = ([{"$match": shared}] if shared else []) + [{"$facet": facet}]
+        result = await self.db[collection].aggregate(pipeline).to_list(1)
+        row = result[0] if result else {}
+        for i, metric in enumerate(metrics):
+            metric.resolve(row.get(f"m{i}", []))
+
+    async def _run_alone(self, collection: str, metric: DashboardMetric):
+        if metric.kind == "count":
+            metric.value = await self.db[collection].count_documents(_leading_match(metric.stages))
+        else:
+            metric.resolve(await self.db[collection].aggregate(metric.stages).to_list(None))
+
+    async def _run_collection(self, collection: str, metrics: List[DashboardMetric]):
+        # الأخطاء تُرفع ولا تُخزن كلقطة - a failed aggregate fails the whole computation
+        shared, faceted, separate = self._plan_collection(collection, metrics)
+        runs = [self._run_alone(collection, metric) for metric in separate]
+        if faceted:
+            runs.append(self._run_facet(collection, faceted, shared))
+        await asyncio.gather(*runs)
+
+    async def execute(self):
+        """تنفيذ كل المقاييس - one $facet per collection, collections in parallel"""
+        await asyncio.gather(*[
+            self._run_collection(collection, list(metrics.values()))
+            for collection, metrics in self._metrics.items()
+        ])
+        self.executed = True
+
+    @property
+    def round_trips(self) -> int:
+        trips = 0
+        for collection, metrics in self._metrics.items():
+            _, faceted, separate = self._plan_collection(collection, list(metrics.values()))
+            trips += len(separate) + (1 if faceted else 0)
+        return trips
+
+    @property
+    def collections(self) -> List[str]:
+        """المجموعات المستخدمة - collections read by the registered metrics"""
+        return list(self._metrics)
+
+
+class DashboardSnapshotCache:
+    """ذاكرة مؤقتة للقطات لوحة التحكم - Per-key dashboard snapshots with TTL and stale-while-revalidate
+
+    A snapshot is fresh for ttl_seconds. After that, and until stale_seconds
+    have passed, the stale snapshot is returned while a single background task
+    recomputes it. Concurrent misses on the same key share one computation.
+
+    Writes call invalidate() with the collections they touched; every snapshot
+    that read one of them is dropped, so the next read waits for a fresh
+    computation instead of returning the pre-write value. A computation that
+    was already running when the write happened is not joined by later reads
+    and its result is not stored.
+    The cache is per process, like the principal cache in auth.py.
+    """
+
+    def __init__(self, ttl_seconds: int = 30, stale_seconds: int = 300, max_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self._versions: Dict[str, int] = {}
+
+    async def get_or_compute(self, key: tuple, compute: Callable[[], Awaitable[Tuple[Any, Iterable[str]]]]):
+        """إرجاع اللقطة أو حسابها - compute() returns (value, collections it read)"""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            if now < entry["fresh_until"]:
+                return entry["value"]
+            if now < entry["stale_until"]:
+                self._refresh(key, compute)
+                return entry["value"]
+        return await asyncio.shield(self._refresh(key, compute))
+
+    def invalidate(self, *collections: str):
+        """حذف اللقطات المتأثرة - drop snapshots that read these collections"""
+        touched = set(collections)
+        for collection in touched:
+            self._versions[collection] = self._versions.get(collection, 0) + 1
+        for key in [key for key, entry in self._entries.items() if touched & entry["collections"]]:
+            del self._entries[key]
+        # حسابات جارية بدأت قبل الكتابة - unknown or affected keys start a new computation on the next read
+        for key in [key for key in self._inflight if key not in self._entries]:
+            del self._inflight[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def _refresh(self, key: tuple, compute) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, compute))
+            task.add_done_callback(self._log_failure)
+            self._inflight[key] = task
+        return task
+
+    async def _compute(self, key: tuple, compute):
+        versions = dict(self._versions)
+        try:
+            value, collections = await compute()
+            collections = set(collections)
+            # كتابة حدثت أثناء الحساب - the value goes to the callers already waiting, not to the cache
+            if any(self._versions.get(c, 0) != versions.get(c, 0) for c in collections):
+                return value
+            now = time.monotonic()
+            self._entries[key] = {
+                "value": value,
+                "collections": collections,
+                "fresh_until": now + self.ttl_seconds,
+                "stale_until": now + self.stale_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Dashboard snapshot refresh failed: {str(task.exception())}")
+
+
+dashboard_snapshots = DashboardSnapshotCache(
+    ttl_seconds=int(os.environ.get('DASHBOARD_CACHE_TTL_SECONDS', '30')),
+    stale_seconds=int(os.environ.get('DASHBOARD_CACHE_STALE_SECONDS', '300')),
+    max_entries=int(os.environ.get('DASHBOARD_CACHE_MAX_ENTRIES', '1000'))
+)
+
+
+def invalidate_dashboard(*collections: str):
+    """يُستدعى بعد الكتابة في الطلبات أو الزيارات أو الديون أو المدفوعات"""
+    dashboard_snapshots.invalidate(*collections)
@@ -0,0 +1,218 @@
+# Debt Aging - تقادم الديون
+# Medical Management System - Aging computed at query time
+#
+# Due dates never change, so a debt's age is a function of today's date and
+# is computed where it is read: an aggregation stage ($dateDiff + $switch)
+# for reports, a due-date range for filters, and aging_for() for the rows of
+# a page. Nothing has to rewrite every debt before a query.
+#
+# The stored aging_category / overdue status (kept for dashboards and older
+# clients) change only on the days a debt crosses a bucket boundary.
+# refresh_debt_aging() touches just those debts with one bulk_write; it runs
+# from scripts/refresh_debt_aging.py (daily cron) and catches up on missed
+# days, or re-checks every active debt with --full.
+#
+# Only active debts (ACTIVE_DEBT_FILTER) age: settled and written-off debts
+# keep the days_overdue / aging_category stored while they were active, and
+# the aging filters never match them.
+#
+# Days are counted in calendar days (UTC): a debt due yesterday is 1 day overdue.
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from services.dashboard_service import invalidate_dashboard
+
+# (آخر يوم في الشريحة، اسمها) - None is open-ended
+AGING_BUCKETS: List[Tuple[Optional[int], str]] = [
+    (0, "current"), (30, "1-30"), (60, "31-60"), (90, "61-90"), (None, "90+")
+]
+# قيم days_overdue التي يدخل عندها الدين شريحة جديدة
+AGING_BOUNDARIES = [upper + 1 for upper, _ in AGING_BUCKETS if upper is not None]
+
+DEBT_DUE_FIELD = "original_due_date"
+# الديون المسددة أو المعدومة تحتفظ بالتقادم المخزن ولا تتقادم بعد ذلك
+INACTIVE_DEBT_STATUSES = ["fully_collected", "written_off"]
+ACTIVE_DEBT_FILTER = {"status": {"$nin": INACTIVE_DEBT_STATUSES}}
+# حالات تصبح "overdue" عند تجاوز تاريخ الاستحقاق
+OVERDUE_FROM_STATUSES = ["pending", "assigned"]
+
+AGING_JOB = "debt_aging"
+JOB_RUNS_COLLECTION = "job_runs"
+# أقصى عدد أيام تعويض قبل التحول إلى فحص كامل
+MAX_CATCH_UP_DAYS = 31
+
+
+def day_start(as_of: Union[date, datetime, None] = None) -> datetime:
+    """بداية اليوم (UTC، بدون منطقة زمنية)"""
+    if as_of is None:
+        as_of = datetime.utcnow()
+    if isinstance(as_of, datetime) and as_of.tzinfo is not None:
+        as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime(as_of.year, as_of.month, as_of.day)
+
+
+def aging_category_for(days_overdue: int) -> str:
+    for upper, label in AGING_BUCKETS:
+        if upper is None or days_overdue <= upper:
+            return label
+    return AGING_BUCKETS[-1][1]
+
+
+def aging_for(due_date: Union[date, datetime, str, None], as_of: Union[date, datetime, None] = None) -> Tuple[int, str]:
+    """(days_overdue, aging_category) لتاريخ استحقاق - no due date is current"""
+    if not due_date:
+        return 0, AGING_BUCKETS[0][1]
+    if isinstance(due_date, str):
+        due_date = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
+    days_overdue = max(0, (day_start(as_of) - day_start(due_date)).days)
+    return days_overdue, aging_category_for(days_overdue)
+
+
+def with_aging(debt: dict, as_of: Optional[datetime] = None) -> dict:
+    """تقادم صف واحد عند القراءة - for the rows of a page"""
+    if debt.get("status") in INACTIVE_DEBT_STATUSES:
+        debt.setdefault("days_overdue", 0)
+        debt.setdefault("aging_category", AGING_BUCKETS[0][1])
+        return debt
+    debt["days_overdue"], debt["aging_category"] = aging_for(debt.get(DEBT_DUE_FIELD), as_of)
+    if debt["days_overdue"] > 0 and debt.get("status") in OVERDUE_FROM_STATUSES:
+        debt["status"] = "overdue"
+    return debt
+
+
+def days_overdue_expr(due_field: str, as_of: Optional[datetime] = None) -> dict:
+    """تعبير الأيام المتأخرة - 0 when not due or without a due date"""
+    return {"$max": [0, {"$ifNull": [
+        {"$dateDiff": {"startDate": f"${due_field}", "endDate": day_start(as_of), "unit": "day"}}, 0
+    ]}]}
+
+
+def aging_bucket_expr(days: Union[str, dict], labels: Optional[List[str]] = None) -> dict:
+    """شريحة التقادم بـ $switch - labels rename the buckets in AGING_BUCKETS order"""
+    labels = labels or [label for _, label in AGING_BUCKETS]
+    return {"$switch": {
+        "branches": [
+            {"case": {"$lte": [days, upper]}, "then": labels[i]}
+            for i, (upper, _) in enumerate(AGING_BUCKETS) if upper is not None
+        ],
+        "default": labels[-1]
+    }}
+
+
+def aging_stages(due_field: str = DEBT_DUE_FIELD, as_of: Optional[datetime] = None) -> List[dict]:
+    """مراحل تضيف days_overdue و aging_category المحسوبة - stored values for inactive debts"""
+    active = {"$not": [{"$in": ["$status", INACTIVE_DEBT_STATUSES]}]}
+    return [
+        {"$addFields": {"days_overdue": {"$cond": [
+            active, days_overdue_expr(due_field, as_of), {"$ifNull": ["$days_overdue", 0]}
+        ]}}},
+        {"$addFields": {"aging_category": {"$cond": [
+            active, aging_bucket_expr("$days_overdue"), {"$ifNull": ["$aging_category", AGING_BUCKETS[0][1]]}
+        ]}}}
+    ]
+
+
+def overdue_status_expr() -> dict:
+    """الحالة بعد تجاوز الاستحقاق - needs days_overdue from aging_stages()"""
+    return {"$cond": [
+        {"$and": [{"$gt": ["$days_overdue", 0]}, {"$in": ["$status", OVERDUE_FROM_STATUSES]}]},
+        "overdue", "$status"
+    ]}
+
+
+def aging_category_filter(category: str, due_field: str = DEBT_DUE_FIELD, as_of: Optional[datetime] = None) -> dict:
+    """فلتر شريحة كمدى على تاريخ الاستحقاق - active debts only, nothing to keep fresh"""
+    today = day_start(as_of)
+    lower = None
+    for upper, label in AGING_BUCKETS:
+        if label == category:
+            if lower is None:
+                return {**ACTIVE_DEBT_FILTER, "$or": [{due_field: {"$gte": today}}, {due_field: None}]}
+            due_range = {"$lt": today - timedelta(days=lower - 1)}
+            if upper is not None:
+                due_range["$gte"] = today - timedelta(days=upper)
+            return {**ACTIVE_DEBT_FILTER, due_field: due_range}
+        lower = (upper or 0) + 1
+    raise ValueError(f"Unknown aging category: {category}")
+
+
+def debt_status_filter(status: str, due_field: str = DEBT_DUE_FIELD, as_of: Optional[datetime] = None) -> dict:
+    """فلتر الحالة مع تطبيق "overdue" قبل أن يخزنها الجدول اليومي"""
+    if status == "overdue":
+        return {"$or": [
+            {"status": "overdue"},
+            {"status": {"$in": OVERDUE_FROM_STATUSES}, due_field: {"$lt": day_start(as_of)}}
+        ]}
+    if status in OVERDUE_FROM_STATUSES:
+        return {"status": status, due_field: {"$not": {"$lt": day_start(as_of)}}}
+    return {"status": status}
+
+
+def overdue_filter(due_field: str = DEBT_DUE_FIELD, as_of: Optional[datetime] = None) -> dict:
+    """الديون النشطة المتجاوزة لتاريخ الاستحقاق"""
+    return {**ACTIVE_DEBT_FILTER, due_field: {"$lt": day_start(as_of)}}
+
+
+def _boundary_filter(today: datetime, days: int) -> dict:
+    """الديون التي عبرت حد شريحة خلال آخر `days` يوم"""
+    return {"$or": [
+        {DEBT_DUE_FIELD: {
+            "$gte": today - timedelta(days=boundary + days - 1),
+            "$lt": today - timedelta(days=boundary - 1)
+        }}
+        for boundary in AGING_BOUNDARIES
+    ]}
+
+
+async def refresh_debt_aging(db: AsyncIOMotorDatabase, as_of: Optional[datetime] = None,
+                             full: bool = False) -> Dict[str, Any]:
+    """تحديث التقادم المخزن للديون التي عبرت حد شريحة فقط - one bulk_write
+
+    Without full, only debts whose due date puts them on a boundary day
+    since the last run are read (today alone when run daily). The first run,
+    or one after more than MAX_CATCH_UP_DAYS, checks every active debt.
+    """
+    today = day_start(as_of)
+    last_run = await db[JOB_RUNS_COLLECTION].find_one({"job": AGING_JOB})
+    days = (today - last_run["as_of"]).days if last_run else None
+    if days is not None and days <= 0 and not full:
+        return {"mode": "skipped", "updated": 0}
+    if full or days is None or days > MAX_CATCH_UP_DAYS:
+        mode, match = "full", dict(ACTIVE_DEBT_FILTER)
+    else:
+        mode, match = "boundaries", {**ACTIVE_DEBT_FILTER, **_boundary_filter(today, days)}
+
+    pipeline = [
+        {"$match": match},
+        {"$project": {"_id": 0, "id": 1, "status": 1, "stored_category": "$aging_category",
+                      DEBT_DUE_FIELD: 1}},
+        *aging_stages(DEBT_DUE_FIELD, today),
+        {"$addFields": {"new_status": overdue_status_expr()}},
+        {"$match": {"$expr": {"$or": [
+            {"$ne": ["$aging_category", "$stored_category"]},
+            {"$ne": ["$new_status", "$status"]}
+        ]}}}
+    ]
+    now = datetime.utcnow()
+    updates = []
+    async for debt in db.debts.aggregate(pipeline, allowDiskUse=True):
+        updates.append(UpdateOne({"id": debt["id"]}, {"$set": {
+            "days_overdue": debt["days_overdue"],
+            "aging_category": debt["aging_category"],
+            "status": debt["new_status"],
+            "updated_at": now
+        }}))
+    for i in range(0, len(updates), 1000):
+        await db.debts.bulk_write(updates[i:i + 1000], ordered=False)
+
+    await db[JOB_RUNS_COLLECTION].update_one(
+        {"job": AGING_JOB},
+        {"$set": {"as_of": today, "finished_at": now, "mode": mode, "updated": len(updates)}},
+        upsert=True
+    )
+    if updates:
+        invalidate_dashboard("debts")
+    return {"mode": mode, "updated": len(updates)}
@@ -0,0 +1,274 @@
+# Debt Repository - مستودع الديون والتحصيل
+# Medical Management System - MongoDB storage for routes/debt_routes.py
+#
+# Replaces the /app/*_data.json files: every list/summary call is an indexed
+# query or a single aggregation, and payments are applied with atomic $inc.
+#
+# Field debts keep scalar paid_amount/outstanding_amount, so they are stored in
+# their own collections and never mixed with the integrated financial debts
+# (outstanding_amount.amount) in the debts collection.
+
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+
+REP_DEBTS_COLLECTION = "rep_debts"
+REP_COLLECTIONS_COLLECTION = "rep_debt_collections"
+
+# حقول الموقع المخفية عن المندوبين
+DEBT_LOCATION_FIELDS = ["gps_latitude", "gps_longitude", "address", "area", "region"]
+COLLECTION_LOCATION_FIELDS = ["collection_location", "gps_latitude", "gps_longitude", "collection_time"]
+
+# حقول لا يمكن تعديلها عبر update_debt
+PROTECTED_DEBT_FIELDS = {"id", "created_at", "created_by", "paid_amount", "outstanding_amount"}
+
+
+class DebtRepository:
+    """مستودع الديون والتحصيلات - debts and collections stored in MongoDB"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.debts = db[REP_DEBTS_COLLECTION]
+        self.collections = db[REP_COLLECTIONS_COLLECTION]
+
+    # ----------------------------------------------------------------
+    # Debts
+    # ----------------------------------------------------------------
+
+    async def list_debts(self, filters: Dict[str, Any], limit: int = 50) -> List[dict]:
+        """قائمة الديون - newest first, filtered in the database"""
+        query = {key: value for key, value in filters.items() if value is not None}
+        cursor = self.debts.find(query, {"_id": 0}).sort("created_at", -1).limit(limit)
+        return await cursor.to_list(limit)
+
+    async def get_debt(self, debt_id: str) -> Optional[dict]:
+        return await self.debts.find_one({"id": debt_id}, {"_id": 0})
+
+    async def create_debt(self, debt: dict) -> dict:
+        await self.debts.insert_one(dict(debt))
+        return debt
+
+    async def update_debt(self, debt_id: str, updates: dict) -> Optional[dict]:
+        """تحديث حقول الدين - amounts only change through apply_collection()"""
+        changes = {key: value for key, value in updates.items() if key not in PROTECTED_DEBT_FIELDS}
+        return await self.debts.find_one_and_update(
+            {"id": debt_id},
+            {"$set": changes},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def apply_collection(self, debt_id: str, amount: float, paid_status: str, partial_status: str,
+                               collection_date: Any, updated_by: str) -> Optional[dict]:
+        """تسجيل مبلغ محصل على الدين بشكل ذري - atomic $inc of paid/outstanding amounts
+
+        The filter requires outstanding_amount >= amount, so a collection larger
+        than what is left (or racing another collection for the same balance)
+        matches nothing and returns None. The status is derived from the
+        post-update amounts and written with a guard on outstanding_amount, so a
+        slower concurrent writer can never put a fully paid debt back to partial.
+        """
+        now = datetime.utcnow()
+        debt = await self.debts.find_one_and_update(
+            {"id": debt_id, "outstanding_amount": {"$gte": amount}},
+            {
+                "$inc": {"paid_amount": amount, "outstanding_amount": -amount},
+                "$set": {"updated_at": now, "updated_by": updated_by}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if debt is None:
+            return None
+        debt.pop("_id", None)
+
+        if debt.get("outstanding_amount", 0) <= 0:
+            await self.debts.update_one(
+                {"id": debt_id, "outstanding_amount": {"$lte": 0}},
+                {"$set": {"status": paid_status, "payment_completion_date": collection_date}}
+            )
+            debt["status"] = paid_status
+            debt["payment_completion_date"] = collection_date
+        elif debt.get("paid_amount", 0) > 0:
+            await self.debts.update_one(
+                {"id": debt_id, "outstanding_amount": {"$gt": 0}},
+                {"$set": {"status": partial_status}}
+            )
+            debt["status"] = partial_status
+        return debt
+
+    async def debt_summary(self, match: Optional[dict] = None) -> dict:
+        """ملخص الديون في استعلام واحد - totals plus per-status and per-priority breakdowns"""
+        result = await self.debts.aggregate([
+            {"$match": match or {}},
+            {"$facet": {
+                "totals": [{"$group": {
+                    "_id": None,
+                    "total_debts": {"$sum": 1},
+                    "total_amount": {"$sum": "$original_amount"},
+                    "paid_amount": {"$sum": "$paid_amount"},
+                    "outstanding_amount": {"$sum": "$outstanding_amount"}
+                }}],
+                "by_status": [{"$group": {
+                    "_id": "$status",
+                    "count": {"$sum": 1},
+                    "outstanding_amount": {"$sum": "$outstanding_amount"}
+                }}],
+                "by_priority": [{"$group": {"_id": "$priority", "count": {"$sum": 1}}}]
+            }}
+        ]).to_list(1)
+        row = result[0] if result else {}
+        totals = (row.get("totals") or [{}])[0]
+        totals.pop("_id", None)
+        return {
+            "totals": totals,
+            "by_status": {item["_id"]: item for item in row.get("by_status", [])},
+            "by_priority": {item["_id"]: item["count"] for item in row.get("by_priority", [])}
+        }
+
+    # ----------------------------------------------------------------
+    # Collections
+    # ----------------------------------------------------------------
+
+    async def list_collections(self, filters: Dict[str, Any], limit: int = 50) -> List[dict]:
+        query = {key: value for key, value in filters.items() if value is not None}
+        cursor = self.collections.find(query, {"_id": 0}).sort("created_at", -1).limit(limit)
+        return await cursor.to_list(limit)
+
+    async def create_collection(self, collection: dict) -> dict:
+        await self.collections.insert_one(dict(collection))
+        return collection
+
+    async def record_collection(self, collection: dict, paid_status: str, partial_status: str) -> Optional[dict]:
+        """حفظ التحصيل وتطبيقه على الدين - insert the collection row, then apply it
+
+        The debt update is the commit point: when apply_collection rejects the
+        amount or fails, the collection row is deleted again so no collection
+        exists without its effect on the debt. Returns the updated debt, or None
+        when the amount exceeds the outstanding balance.
+        """
+        await self.create_collection(collection)
+        try:
+            debt = await self.apply_collection(
+                collection["debt_id"],
+                collection["collection_amount"],
+                paid_status=paid_status,
+                partial_status=partial_status,
+                collection_date=collection["collection_date"],
+                updated_by=collection.get("created_by", "")
+            )
+        except Exception:
+            await self.collections.delete_one({"id": collection["id"]})
+            raise
+        if debt is None:
+            await self.collections.delete_one({"id": collection["id"]})
+        return debt
+
+    async def collection_summary(self, match: Optional[dict] = None) -> dict:
+        """ملخص التحصيل - totals by status and by payment method"""
+        result = await self.collections.aggregate([
+            {"$match": match or {}},
+            {"$facet": {
+                "by_status": [{"$group": {"_id": "$collection_status", "count": {"$sum": 1}}}],
+                "by_method": [{"$group": {
+                    "_id": "$collection_method",
+                    "count": {"$sum": 1},
+                    "amount": {"$sum": "$collection_amount"}
+                }}]
+            }}
+        ]).to_list(1)
+        row = result[0] if result else {}
+        by_method = {item["_id"]: item for item in row.get("by_method", [])}
+        return {
+            "total_collections": sum(item["count"] for item in by_method.values()),
+            "total_collected_amount": sum(item["amount"] or 0 for item in by_method.values()),
+            "by_status": {item["_id"]: item["count"] for item in row.get("by_status", [])},
+            "by_method": {method: item["amount"] or 0 for method, item in by_method.items()}
+        }
+
+
+# ============================================================================
+# One-shot migration from the legacy JSON files
+# ============================================================================
+
+LEGACY_DEBT_FILE = "/app/debt_data.json"
+LEGACY_COLLECTION_FILE = "/app/collection_data.json"
+
+
+def _read_legacy_file(path: str) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _parse_dates(record: dict) -> dict:
+    """ISO strings written by the old save_*_data() back to datetimes"""
+    for key, value in record.items():
+        if isinstance(value, str) and key.endswith(("_at", "_date", "_time")):
+            try:
+                record[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            except ValueError:
+                pass
+    return record
+
+
+async def _insert_missing(db: AsyncIOMotorDatabase, collection_name: str, records: List[dict]) -> int:
+    """upsert by id with $setOnInsert - existing documents are left as they are"""
+    operations = [UpdateOne({"id": record["id"]}, {"$setOnInsert": record}, upsert=True) for record in records]
+    if not operations:
+        return 0
+    result = await db[collection_name].bulk_write(operations, ordered=False)
+    return result.upserted_count
+
+
+async def migrate_json_files(db: AsyncIOMotorDatabase, debt_file: str = LEGACY_DEBT_FILE,
+                             collection_file: str = LEGACY_COLLECTION_FILE,
+                             dry_run: bool = False) -> Dict[str, Any]:
+    """نقل بيانات الديون من ملفات JSON - idempotent upsert by id
+
+    Existing documents are never overwritten ($setOnInsert), so re-running after
+    a partial failure is safe. Collections get medical_rep_id copied from their
+    debt so rep filtering no longer needs to load the debts.
+
+    Records without an id cannot be upserted idempotently; they are reported in
+    skipped_debts / skipped_collections (by position in the file) and the files
+    are only renamed to *.migrated when every record was migrated.
+    """
+    debts = [_parse_dates(debt) for debt in _read_legacy_file(debt_file)]
+    collections = [_parse_dates(collection) for collection in _read_legacy_file(collection_file)]
+    rep_by_debt = {debt.get("id"): debt.get("medical_rep_id") for debt in debts}
+
+    for collection in collections:
+        collection.setdefault("medical_rep_id", rep_by_debt.get(collection.get("debt_id")))
+
+    report = {
+        "debts": len(debts),
+        "collections": len(collections),
+        "debts_inserted": 0,
+        "collections_inserted": 0,
+        "skipped_debts": [index for index, debt in enumerate(debts) if not debt.get("id")],
+        "skipped_collections": [index for index, c in enumerate(collections) if not c.get("id")],
+        "files_renamed": False
+    }
+    if dry_run:
+        return report
+
+    report["debts_inserted"] = await _insert_missing(
+        db, REP_DEBTS_COLLECTION, [debt for debt in debts if debt.get("id")]
+    )
+    report["collections_inserted"] = await _insert_missing(
+        db, REP_COLLECTIONS_COLLECTION, [c for c in collections if c.get("id")]
+    )
+
+    # سجلات بدون معرف - الملفات تبقى في مكانها لمراجعتها
+    if report["skipped_debts"] or report["skipped_collections"]:
+        return report
+
+    for path in (debt_file, collection_file):
+        if os.path.exists(path):
+            os.replace(path, path + ".migrated")
+    report["files_renamed"] = True
+    return report
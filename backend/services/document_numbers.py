@@ -0,0 +1,117 @@
+# Document Numbers - ترقيم المستندات المالية
+# Medical Management System - Atomic document number allocation
+#
+# Every number comes from one find_one_and_update with $inc on the type's
+# document_sequences row (upserted on first use), so concurrent requests can
+# never receive the same number and each allocation is one round trip.
+#
+# Block leasing (DOCUMENT_NUMBER_BLOCK_SIZE > 1) lets a worker reserve a
+# range with a single $inc and hand numbers out from memory. The trade-off:
+# numbers are unique but no longer strictly in creation order across
+# workers, and the unused part of a lease is lost when the worker stops.
+# The default of 1 keeps the sequence gap-free. Batch callers use
+# allocate(count=n), which reserves a contiguous range in one write either way.
+
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models.financial_models import FinancialConfig
+
+DOCUMENT_SEQUENCES_COLLECTION = "document_sequences"
+DOCUMENT_NUMBER_BLOCK_SIZE = int(os.environ.get('DOCUMENT_NUMBER_BLOCK_SIZE', '1'))
+
+
+def format_document_number(document_type: str, number: int) -> str:
+    """تنسيق رقم المستند - INV-000001"""
+    config = FinancialConfig.AUTO_NUMBERING.get(document_type)
+    if not config:
+        raise ValueError(f"نوع المستند غير مدعوم: {document_type}")
+    return f"{config['prefix']}-{number:0{config['digits']}d}"
+
+
+class DocumentNumberAllocator:
+    """موزع أرقام المستندات - one atomic $inc per number, or per leased block"""
+
+    def __init__(self, block_size: int = DOCUMENT_NUMBER_BLOCK_SIZE):
+        self.block_size = max(1, block_size)
+        # (database, document_type) -> [next, last] للمدى المحجوز في هذه العملية
+        self._leases: Dict[Tuple[str, str], List[int]] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.stats = {"allocated": 0, "reservations": 0}
+
+    async def reserve(self, db: AsyncIOMotorDatabase, document_type: str, count: int = 1) -> int:
+        """حجز مدى متصل بكتابة ذرية واحدة - returns the first number of the range"""
+        now = datetime.utcnow()
+        for attempt in range(2):
+            try:
+                sequence = await db[DOCUMENT_SEQUENCES_COLLECTION].find_one_and_update(
+                    {"document_type": document_type},
+                    {
+                        "$inc": {"last_number": count},
+                        "$set": {"updated_at": now},
+                        "$setOnInsert": {"created_at": now}
+                    },
+                    projection={"_id": 0, "last_number": 1},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                self.stats["reservations"] += 1
+                return sequence["last_number"] - count + 1
+            except DuplicateKeyError:
+                # طلب آخر أنشأ التسلسل في نفس اللحظة - المحاولة الثانية تحدّثه
+                if attempt:
+                    raise
+
+    def _take(self, key: Tuple[str, str], count: int) -> List[int]:
+        lease = self._leases.get(key)
+        if not lease:
+            return []
+        take = min(count, lease[1] - lease[0] + 1)
+        numbers = list(range(lease[0], lease[0] + take))
+        lease[0] += take
+        return numbers
+
+    async def allocate(self, db: AsyncIOMotorDatabase, document_type: str, count: int = 1) -> List[int]:
+        """أرقام جديدة لنوع مستند - unique across workers"""
+        format_document_number(document_type, 0)
+        if count < 1:
+            return []
+        self.stats["allocated"] += count
+        if self.block_size == 1 or count >= self.block_size:
+            first = await self.reserve(db, document_type, count)
+            return list(range(first, first + count))
+
+        key = (db.name, document_type)
+        # المسار السريع بدون انتظار - no other coroutine can run in between
+        numbers = self._take(key, count)
+        if len(numbers) < count:
+            async with self._locks[key]:
+                numbers += self._take(key, count - len(numbers))
+                while len(numbers) < count:
+                    first = await self.reserve(db, document_type, self.block_size)
+                    self._leases[key] = [first, first + self.block_size - 1]
+                    numbers += self._take(key, count - len(numbers))
+        return numbers
+
+    async def next_number(self, db: AsyncIOMotorDatabase, document_type: str) -> str:
+        return format_document_number(document_type, (await self.allocate(db, document_type))[0])
+
+    async def next_numbers(self, db: AsyncIOMotorDatabase, document_type: str, count: int) -> List[str]:
+        return [format_document_number(document_type, n) for n in await self.allocate(db, document_type, count)]
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            **self.stats,
+            "block_size": self.block_size,
+            "leased": {f"{db}.{doc_type}": max(0, lease[1] - lease[0] + 1)
+                       for (db, doc_type), lease in self._leases.items()}
+        }
+
+
+document_number_allocator = DocumentNumberAllocator()
@@ -0,0 +1,217 @@
+# Financial Rollups - ملخصات يومية للسجل المالي الموحد
+# Medical Management System - Daily rollups of unified_financial_records
+#
+# One row per (day, clinic, rep, record_type, status) holds the record count
+# and the net / outstanding sums of the ledger records in that cell. Every
+# ledger write moves its record's contribution with $inc (out of the old
+# cell, into the new one), so the overview and period reports aggregate a
+# few hundred rollup rows instead of the ledger.
+#
+# "day" is the record's issue_date, the same field the reports filter on.
+# Per-record thresholds cannot be recovered from sums, so records with more
+# than HIGH_RISK_OUTSTANDING outstanding are also counted and summed apart.
+#
+# A failed rollup write is logged, not raised (the ledger write already
+# happened); scripts/rebuild_financial_rollups.py recomputes rollups from the
+# ledger, for the backfill and to correct drift. Run it off-peak: a ledger
+# write that lands during the rebuild of its day can be counted twice.
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne, UpdateOne
+
+FINANCIAL_ROLLUPS_COLLECTION = "financial_daily_rollups"
+ROLLUP_KEY_FIELDS = ("day", "clinic_id", "sales_rep_id", "record_type", "status")
+# حد المديونية العالية للسجل الواحد - matches the overview's high risk rule
+HIGH_RISK_OUTSTANDING = 1000
+HIGH_RISK_STATUSES = ["overdue", "pending"]
+
+RollupKey = Tuple[str, str, str, str, str]
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, Enum):
+        return str(value.value)
+    return "" if value is None else str(value)
+
+
+def _amount(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def rollup_key(record: dict) -> RollupKey:
+    day = record.get("issue_date")
+    if isinstance(day, (date, datetime)):
+        day = day.isoformat()
+    return (
+        _text(day)[:10], _text(record.get("clinic_id")), _text(record.get("sales_rep_id")),
+        _text(record.get("record_type")), _text(record.get("status"))
+    )
+
+
+def rollup_contribution(record: dict) -> Dict[str, float]:
+    """ما يضيفه سجل واحد إلى خلية الملخص"""
+    outstanding = _amount(record.get("outstanding_amount"))
+    large = outstanding > HIGH_RISK_OUTSTANDING
+    return {
+        "count": 1,
+        "net_amount": _amount(record.get("net_amount")),
+        "outstanding_amount": outstanding,
+        "large_outstanding_count": 1 if large else 0,
+        "large_outstanding_amount": outstanding if large else 0.0
+    }
+
+
+def _key_filter(key: RollupKey) -> dict:
+    return dict(zip(ROLLUP_KEY_FIELDS, key))
+
+
+async def record_changed(db: AsyncIOMotorDatabase, before: Optional[dict], after: Optional[dict]):
+    """نقل مساهمة سجل بعد كتابته - before None for inserts, after None for deletes"""
+    deltas: Dict[RollupKey, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+    names: Dict[RollupKey, dict] = {}
+    for record, sign in ((before, -1), (after, 1)):
+        if record is None:
+            continue
+        key = rollup_key(record)
+        for field, value in rollup_contribution(record).items():
+            deltas[key][field] += sign * value
+        names[key] = {"clinic_name": record.get("clinic_name", ""), "sales_rep_name": record.get("sales_rep_name", "")}
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            _key_filter(key),
+            {"$inc": dict(delta), "$set": {**names[key], "updated_at": now}},
+            upsert=True
+        )
+        for key, delta in deltas.items() if any(delta.values())
+    ]
+    if not operations:
+        return
+    try:
+        await db[FINANCIAL_ROLLUPS_COLLECTION].bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"⚠️ Financial rollup update failed (rebuild will correct it): {str(e)}")
+
+
+async def rebuild_rollups(db: AsyncIOMotorDatabase, start_day: Optional[date] = None,
+                          end_day: Optional[date] = None) -> Dict[str, int]:
+    """إعادة بناء الملخصات من السجل لمدى أيام (أو كلها) - backfill and drift correction"""
+    ledger_range, day_range = {}, {}
+    if start_day:
+        ledger_range["$gte"] = day_range["$gte"] = start_day.isoformat()
+    if end_day:
+        # issue_date قد يحمل وقتاً بعد التاريخ
+        ledger_range["$lt"] = (end_day + timedelta(days=1)).isoformat()
+        day_range["$lte"] = end_day.isoformat()
+    ledger_match = {"issue_date": ledger_range} if ledger_range else {}
+    stale_match = {"day": day_range} if day_range else {}
+
+    cells: Dict[RollupKey, dict] = {}
+    projection = {"_id": 0, "issue_date": 1, "clinic_id": 1, "clinic_name": 1, "sales_rep_id": 1,
+                  "sales_rep_name": 1, "record_type": 1, "status": 1, "net_amount": 1, "outstanding_amount": 1}
+    async for record in db.unified_financial_records.find(ledger_match, projection).batch_size(2000):
+        key = rollup_key(record)
+        cell = cells.setdefault(key, {
+            **_key_filter(key), "clinic_name": record.get("clinic_name", ""),
+            "sales_rep_name": record.get("sales_rep_name", ""),
+            "count": 0, "net_amount": 0.0, "outstanding_amount": 0.0,
+            "large_outstanding_count": 0, "large_outstanding_amount": 0.0
+        })
+        for field, value in rollup_contribution(record).items():
+            cell[field] += value
+
+    rollups = db[FINANCIAL_ROLLUPS_COLLECTION]
+    now = datetime.utcnow()
+    operations = [ReplaceOne(_key_filter(key), {**cell, "updated_at": now}, upsert=True) for key, cell in cells.items()]
+    for i in range(0, len(operations), 1000):
+        await rollups.bulk_write(operations[i:i + 1000], ordered=False)
+    # خلايا لم تعد تحوي سجلات
+    removed = await rollups.delete_many({**stale_match, "updated_at": {"$lt": now}})
+    return {"rows": len(operations), "removed": removed.deleted_count}
+
+
+# ============================================================================
+# QUERIES - الاستعلامات
+# ============================================================================
+
+def rollup_match(start_day: Optional[date] = None, end_day: Optional[date] = None,
+                 clinic_ids: Optional[List[str]] = None, sales_rep_ids: Optional[List[str]] = None) -> dict:
+    match: Dict[str, Any] = {}
+    if start_day or end_day:
+        match["day"] = {}
+        if start_day:
+            match["day"]["$gte"] = start_day.isoformat()
+        if end_day:
+            match["day"]["$lte"] = end_day.isoformat()
+    if clinic_ids:
+        match["clinic_id"] = {"$in": clinic_ids}
+    if sales_rep_ids:
+        match["sales_rep_id"] = {"$in": sales_rep_ids}
+    return match
+
+
+async def totals_by_type_and_status(db: AsyncIOMotorDatabase, match: dict) -> List[dict]:
+    """مجاميع لكل (نوع، حالة) - a handful of rows"""
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"record_type": "$record_type", "status": "$status"},
+            "count": {"$sum": "$count"},
+            "net_amount": {"$sum": "$net_amount"},
+            "outstanding_amount": {"$sum": "$outstanding_amount"}
+        }}
+    ]
+    return [
+        {**row["_id"], "count": row["count"], "net_amount": row["net_amount"],
+         "outstanding_amount": row["outstanding_amount"]}
+        async for row in db[FINANCIAL_ROLLUPS_COLLECTION].aggregate(pipeline)
+    ]
+
+
+async def top_clinics(db: AsyncIOMotorDatabase, match: dict, limit: int = 5) -> List[dict]:
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$clinic_id",
+            "clinic_name": {"$first": "$clinic_name"},
+            "total_value": {"$sum": "$net_amount"},
+            "records_count": {"$sum": "$count"}
+        }},
+        {"$sort": {"total_value": -1}},
+        {"$limit": limit}
+    ]
+    return await db[FINANCIAL_ROLLUPS_COLLECTION].aggregate(pipeline).to_list(limit)
+
+
+async def high_risk_clinics(db: AsyncIOMotorDatabase, match: dict, limit: int = 10) -> List[dict]:
+    """عيادات بسجلات متأخرة/معلقة فوق HIGH_RISK_OUTSTANDING"""
+    pipeline = [
+        {"$match": {**match, "status": {"$in": HIGH_RISK_STATUSES}, "large_outstanding_count": {"$gt": 0}}},
+        {"$group": {
+            "_id": "$clinic_id",
+            "clinic_name": {"$first": "$clinic_name"},
+            "total_outstanding": {"$sum": "$large_outstanding_amount"},
+            "overdue_count": {"$sum": "$large_outstanding_count"}
+        }},
+        {"$sort": {"total_outstanding": -1}},
+        {"$limit": limit}
+    ]
+    return await db[FINANCIAL_ROLLUPS_COLLECTION].aggregate(pipeline).to_list(limit)
+
+
+def sum_rows(rows: Iterable[dict], field: str, record_types: Optional[List[str]] = None,
+             statuses: Optional[List[str]] = None, exclude_statuses: Optional[List[str]] = None) -> float:
+    return sum(
+        row[field] for row in rows
+        if (record_types is None or row["record_type"] in record_types)
+        and (statuses is None or row["status"] in statuses)
+        and (exclude_statuses is None or row["status"] not in exclude_statuses)
+    )
@@ -5,16 +5,20 @@ from typing import List, Dict, Any, Optional, Union
 from datetime import datetime, date, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 import uuid
-import asyncio
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from models.financial_models import (
-    IntegratedInvoice, IntegratedDebtRecord, DebtPaymentRecord,
-    FinancialTransaction, MoneyAmount, TaxCalculation, AuditTrail,
-    InvoiceStatus, DebtStatus, PaymentStatus, TransactionType,
+    IntegratedInvoice, IntegratedDebtRecord,
+    MoneyAmount, TaxCalculation, AuditTrail,
+    InvoiceStatus, DebtStatus, PaymentStatus,
     FinancialConfig, AgingAnalysis, FinancialSummary,
     InvoiceLineItem
 )
+from services.dashboard_service import invalidate_dashboard
+from services.document_numbers import document_number_allocator
+from services.payment_engine import PaymentEngine
+from services.debt_aging import aging_bucket_expr, days_overdue_expr, day_start
+from services.integrity_checker import IntegrityChecker
 
 class IntegratedFinancialService:
     """خدمة النظام المالي المتكامل - Integrated Financial Service"""
@@ -28,37 +32,12 @@ class IntegratedFinancialService:
     # ============================================================================
     
     async def generate_document_number(self, document_type: str) -> str:
-        """إنشاء رقم مستند تلقائي - Generate automatic document number"""
-        config = self.config.AUTO_NUMBERING.get(document_type)
-        if not config:
-            raise ValueError(f"نوع المستند غير مدعوم: {document_type}")
-        
-        # البحث عن آخر رقم مستند
-        last_doc = await self.db.document_sequences.find_one(
-            {"document_type": document_type}
-        )
-        
-        if last_doc:
-            next_number = last_doc["last_number"] + 1
-            await self.db.document_sequences.update_one(
-                {"document_type": document_type},
-                {"$set": {"last_number": next_number, "updated_at": datetime.utcnow()}}
-            )
-        else:
-            next_number = 1
-            await self.db.document_sequences.insert_one({
-                "document_type": document_type,
-                "last_number": next_number,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            })
-        
-        # تنسيق الرقم
-        prefix = config["prefix"]
-        digits = config["digits"]
-        formatted_number = f"{prefix}-{next_number:0{digits}d}"
-        
-        return formatted_number
+        """إنشاء رقم مستند تلقائي - Generate automatic document number (one atomic $inc)"""
+        return await document_number_allocator.next_number(self.db, document_type)
+    
+    async def generate_document_numbers(self, document_type: str, count: int) -> List[str]:
+        """أرقام متعددة لنوع واحد بكتابة واحدة - for batch creation"""
+        return await document_number_allocator.next_numbers(self.db, document_type, count)
     
     # ============================================================================
     # INVOICE MANAGEMENT - إدارة الفواتير
@@ -243,6 +222,7 @@ class IntegratedFinancialService:
         
         # حفظ سجل الدين
         await self.db.debts.insert_one(debt_record.dict())
+        invalidate_dashboard("debts")
         
         # تحديث حالة الفاتورة
         invoice_audit = AuditTrail(
@@ -331,6 +311,7 @@ class IntegratedFinancialService:
         
         # حفظ سجل الدين
         await self.db.debts.insert_one(debt_record.dict())
+        invalidate_dashboard("debts")
         
         return debt_record
     
@@ -342,141 +323,19 @@ class IntegratedFinancialService:
         processed_by: str,
         payment_date: Optional[date] = None,
         reference_number: Optional[str] = None,
-        notes: Optional[str] = None
+        notes: Optional[str] = None,
+        idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
-        """معالجة دفعة دين - Process debt payment"""
-        
-        # جلب سجل الدين
-        debt_data = await self.db.debts.find_one({"id": debt_id})
-        if not debt_data:
-            raise ValueError("سجل الدين غير موجود")
-        
-        debt_record = IntegratedDebtRecord(**debt_data)
-        
-        # التحقق من صحة المبلغ
-        if amount <= 0:
-            raise ValueError("مبلغ الدفعة يجب أن يكون أكبر من صفر")
-        
-        if amount > debt_record.outstanding_amount.amount:
-            raise ValueError("مبلغ الدفعة أكبر من المبلغ المتبقي")
-        
-        # إنشاء سجل الدفعة
-        payment_record = DebtPaymentRecord(
-            payment_number=await self.generate_document_number("payments"),
+        """معالجة دفعة دين - Process debt payment (see services/payment_engine.py)"""
+        return await PaymentEngine(self.db).post_debt_payment(
             debt_id=debt_id,
-            debt_number=debt_record.debt_number,
-            amount=MoneyAmount(amount=amount, currency="EGP"),
-            payment_date=payment_date or date.today(),
+            amount=amount,
             payment_method=payment_method,
-            reference_number=reference_number,
-            processed_by=processed_by,
-            processed_by_name="",  # سيتم ملؤها
-            notes=notes
-        )
-        
-        # الحصول على معلومات المعالج
-        user = await self.db.users.find_one({"id": processed_by})
-        if user:
-            payment_record.processed_by_name = user.get("full_name", "")
-        
-        # إضافة مسار التدقيق للدفعة
-        audit = AuditTrail(
-            action="payment_processed",
-            user_id=processed_by,
-            user_name=payment_record.processed_by_name,
-            timestamp=datetime.utcnow(),
-            after_values={
-                "amount": str(amount),
-                "method": payment_method
-            }
-        )
-        payment_record.audit_trail.append(audit)
-        
-        # تحديث سجل الدين
-        debt_record.add_payment(payment_record)
-        
-        # إنشاء معاملة مالية
-        transaction = FinancialTransaction(
-            transaction_number=await self.generate_document_number("payments"),
-            transaction_type=TransactionType.DEBT_PAYMENT,
-            debt_id=debt_id,
-            payment_id=payment_record.id,
-            amount=payment_record.amount,
-            description=f"دفعة على الدين {debt_record.debt_number}",
-            reference=reference_number,
             processed_by=processed_by,
-            processed_by_name=payment_record.processed_by_name
-        )
-        
-        # حفظ البيانات
-        await asyncio.gather(
-            self.db.debts.update_one(
-                {"id": debt_id},
-                {"$set": debt_record.dict()}
-            ),
-            self.db.payments.insert_one(payment_record.dict()),
-            self.db.financial_transactions.insert_one(transaction.dict())
-        )
-        
-        # تحديث الفاتورة المرتبطة إذا وجدت
-        if debt_record.invoice_id:
-            await self._update_invoice_from_debt_payment(debt_record, payment_record)
-        
-        return {
-            "success": True,
-            "payment_id": payment_record.id,
-            "remaining_amount": float(debt_record.outstanding_amount.amount),
-            "fully_paid": debt_record.status == DebtStatus.COLLECTED,
-            "message": "تم تسجيل الدفعة بنجاح"
-        }
-    
-    async def _update_invoice_from_debt_payment(
-        self, 
-        debt_record: IntegratedDebtRecord, 
-        payment_record: DebtPaymentRecord
-    ):
-        """تحديث الفاتورة المرتبطة بعد دفعة الدين"""
-        if not debt_record.invoice_id:
-            return
-        
-        # جلب الفاتورة
-        invoice_data = await self.db.invoices.find_one({"id": debt_record.invoice_id})
-        if not invoice_data:
-            return
-        
-        # حساب المبلغ المدفوع الجديد
-        current_paid = invoice_data.get("paid_amount", {})
-        if isinstance(current_paid, dict):
-            current_paid_amount = Decimal(str(current_paid.get("amount", "0.00")))
-        else:
-            current_paid_amount = Decimal("0.00")
-        
-        new_paid_amount = current_paid_amount + payment_record.amount.amount
-        new_outstanding = Decimal(str(invoice_data["total_amount"]["amount"])) - new_paid_amount
-        
-        # تحديد الحالة الجديدة
-        if new_outstanding <= Decimal("0.01"):
-            new_status = InvoiceStatus.PAID
-        else:
-            new_status = InvoiceStatus.PARTIALLY_PAID
-        
-        # تحديث الفاتورة
-        await self.db.invoices.update_one(
-            {"id": debt_record.invoice_id},
-            {
-                "$set": {
-                    "paid_amount": {
-                        "amount": float(new_paid_amount),
-                        "currency": "EGP"
-                    },
-                    "outstanding_amount": {
-                        "amount": float(new_outstanding),
-                        "currency": "EGP"
-                    },
-                    "status": new_status,
-                    "updated_at": datetime.utcnow()
-                }
-            }
+            payment_date=payment_date,
+            reference_number=reference_number,
+            notes=notes,
+            idempotency_key=idempotency_key
         )
     
     # ============================================================================
@@ -499,47 +358,33 @@ class IntegratedFinancialService:
         else:
             clinic_filter = {}
         
-        # جلب الديون النشطة
-        debts_cursor = self.db.debts.find({
-            **clinic_filter,
-            "status": {"$in": [DebtStatus.OUTSTANDING, DebtStatus.PARTIALLY_COLLECTED]}
-        })
+        # التجميع في قاعدة البيانات - no per-debt model construction
+        buckets = ["current", "days_30", "days_60", "days_90", "over_90"]
+        pipeline = [
+            {"$match": {
+                **clinic_filter,
+                "status": {"$in": [DebtStatus.OUTSTANDING.value, DebtStatus.PARTIALLY_COLLECTED.value]}
+            }},
+            {"$project": {
+                "clinic_id": 1,
+                "clinic_name": 1,
+                "outstanding": {"$toDecimal": {"$ifNull": ["$outstanding_amount.amount", 0]}},
+                "bucket": aging_bucket_expr(days_overdue_expr("due_date", day_start(as_of_date)), buckets)
+            }},
+            {"$group": {
+                "_id": "$clinic_id",
+                "clinic_name": {"$first": "$clinic_name"},
+                "total_outstanding": {"$sum": "$outstanding"},
+                **{bucket: {"$sum": {"$cond": [{"$eq": ["$bucket", bucket]}, "$outstanding", 0]}} for bucket in buckets}
+            }}
+        ]
         
-        # تجميع البيانات حسب العيادة
         clinic_aging = {}
-        
-        async for debt_data in debts_cursor:
-            debt = IntegratedDebtRecord(**debt_data)
-            clinic_id = debt.clinic_id
-            
-            if clinic_id not in clinic_aging:
-                clinic_aging[clinic_id] = {
-                    "clinic_name": debt.clinic_name,
-                    "total_outstanding": Decimal("0.00"),
-                    "current": Decimal("0.00"),
-                    "days_30": Decimal("0.00"),
-                    "days_60": Decimal("0.00"),
-                    "days_90": Decimal("0.00"),
-                    "over_90": Decimal("0.00")
-                }
-            
-            # حساب تقادم الدين
-            aging = debt.calculate_aging()
-            outstanding = debt.outstanding_amount.amount
-            
-            clinic_aging[clinic_id]["total_outstanding"] += outstanding
-            
-            # تصنيف حسب العمر
-            if aging["days_overdue"] <= 0:
-                clinic_aging[clinic_id]["current"] += outstanding
-            elif aging["days_overdue"] <= 30:
-                clinic_aging[clinic_id]["days_30"] += outstanding
-            elif aging["days_overdue"] <= 60:
-                clinic_aging[clinic_id]["days_60"] += outstanding
-            elif aging["days_overdue"] <= 90:
-                clinic_aging[clinic_id]["days_90"] += outstanding
-            else:
-                clinic_aging[clinic_id]["over_90"] += outstanding
+        async for row in self.db.debts.aggregate(pipeline, allowDiskUse=True):
+            clinic_aging[row["_id"]] = {
+                "clinic_name": row.get("clinic_name") or "",
+                **{key: Decimal(str(row[key])) for key in ["total_outstanding", *buckets]}
+            }
         
         # تحويل إلى قائمة AgingAnalysis
         aging_analysis = []
@@ -778,54 +623,14 @@ class IntegratedFinancialService:
         }
     
     async def validate_financial_integrity(self) -> Dict[str, Any]:
-        """فحص سلامة البيانات المالية - Validate financial data integrity"""
-        
-        issues = []
-        
-        # فحص تطابق مجاميع الفواتير
-        invoices_cursor = self.db.invoices.find({})
-        async for invoice_data in invoices_cursor:
-            invoice = IntegratedInvoice(**invoice_data)
-            calculated_totals = invoice.calculate_totals()
-            
-            # مقارنة المجاميع المحفوظة مع المحسوبة
-            stored_total = invoice.total_amount
-            calculated_total = calculated_totals["total"]
-            
-            if abs(stored_total.amount - calculated_total.amount) > Decimal("0.01"):
-                issues.append({
-                    "type": "invoice_total_mismatch",
-                    "invoice_id": invoice.id,
-                    "invoice_number": invoice.invoice_number,
-                    "stored_total": float(stored_total.amount),
-                    "calculated_total": float(calculated_total.amount)
-                })
-        
-        # فحص تطابق مجاميع الديون
-        debts_cursor = self.db.debts.find({})
-        async for debt_data in debts_cursor:
-            debt = IntegratedDebtRecord(**debt_data)
-            
-            # حساب إجمالي المدفوعات
-            total_payments = sum(
-                payment.amount.amount for payment in debt.payments
-            )
-            
-            expected_outstanding = debt.original_amount.amount - total_payments
-            actual_outstanding = debt.outstanding_amount.amount
-            
-            if abs(expected_outstanding - actual_outstanding) > Decimal("0.01"):
-                issues.append({
-                    "type": "debt_balance_mismatch",
-                    "debt_id": debt.id,
-                    "debt_number": debt.debt_number,
-                    "expected_outstanding": float(expected_outstanding),
-                    "actual_outstanding": float(actual_outstanding)
-                })
-        
-        return {
-            "integrity_check_completed": True,
-            "issues_found": len(issues),
-            "issues": issues,
-            "status": "clean" if len(issues) == 0 else "issues_found"
-        }
\ No newline at end of file
+        """فحص سلامة البيانات المالية - Validate financial data integrity
+        
+        Runs (or resumes) the integrity job and waits for it; see
+        services/integrity_checker.py. If another worker is running it, the
+        latest report is returned instead.
+        """
+        checker = IntegrityChecker(self.db)
+        run = await checker.start_or_resume()
+        if run is None:
+            return await checker.summary()
+        return await checker.run(run)
\ No newline at end of file
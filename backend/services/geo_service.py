@@ -0,0 +1,190 @@
+# Geo Service - خدمة المواقع الجغرافية
+# Medical Management System - GeoJSON clinic locations and proximity queries
+#
+# Clinics carry a GeoJSON point in `geo_location` next to the legacy
+# latitude/longitude fields, indexed 2dsphere on clinics and enhanced_clinics.
+# Legacy clinics documents use `location` for address text, hence the
+# separate field name.
+
+import asyncio
+import math
+import os
+from typing import Any, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from services.geo_distance import distances_from_point
+
+GEO_FIELD = "geo_location"
+GEO_COLLECTIONS = ("clinics", "enhanced_clinics")
+BACKFILL_BATCH_SIZE = 500
+
+# نطاق تسجيل الدخول للزيارة حول العيادة، تضاف إليه دقة GPS المبلغ عنها حتى حد أقصى
+VISIT_GEOFENCE_RADIUS_M = float(os.environ.get('VISIT_GEOFENCE_RADIUS_M', '300'))
+VISIT_GEOFENCE_MAX_ACCURACY_M = float(os.environ.get('VISIT_GEOFENCE_MAX_ACCURACY_M', '200'))
+# افتراضياً للتقرير فقط: النتيجة تُحفظ مع تسجيل الدخول ولا تمنعه حتى تفعّل البيئة الإلزام
+VISIT_GEOFENCE_ENFORCE = os.environ.get('VISIT_GEOFENCE_ENFORCE', 'false').lower() == 'true'
+
+
+def _coordinate(value: Any) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def geo_point(latitude: Any, longitude: Any) -> Optional[dict]:
+    """نقطة GeoJSON - [longitude, latitude]; None for missing or out-of-range values"""
+    lat, lng = _coordinate(latitude), _coordinate(longitude)
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    if lat == 0 and lng == 0:
+        return None  # قيمة افتراضية من النماذج وليست موقعاً حقيقياً
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def clinic_geo_point(clinic: dict) -> Optional[dict]:
+    """موقع العيادة من أي من الصيغ المخزنة - approved location first"""
+    candidates = []
+    for key in ("admin_approved_location", "location_data"):
+        location = clinic.get(key)
+        if isinstance(location, dict):
+            candidates.append((location.get("latitude"), location.get("longitude")))
+    candidates.append((clinic.get("latitude"), clinic.get("longitude")))
+    candidates.append((clinic.get("clinic_latitude"), clinic.get("clinic_longitude")))
+    for latitude, longitude in candidates:
+        point = geo_point(latitude, longitude)
+        if point:
+            return point
+    return None
+
+
+# الحقول اللازمة لتحديد موقع العيادة في أي من المجموعتين
+CLINIC_LOCATION_PROJECTION = {
+    "_id": 0, GEO_FIELD: 1, "admin_approved_location": 1, "location_data": 1,
+    "latitude": 1, "longitude": 1, "clinic_latitude": 1, "clinic_longitude": 1
+}
+
+
+async def find_clinic_location(db: AsyncIOMotorDatabase, clinic_id: str) -> Optional[dict]:
+    """العيادة بحقول الموقع فقط - looked up in clinics and enhanced_clinics, like /api/clinics/nearby"""
+    clinics = await asyncio.gather(*[
+        db[source].find_one({"id": clinic_id}, CLINIC_LOCATION_PROJECTION) for source in GEO_COLLECTIONS
+    ])
+    found = [clinic for clinic in clinics if clinic]
+    # عيادة لها موقع في أي من المجموعتين أولاً
+    located = [clinic for clinic in found if clinic.get(GEO_FIELD) or clinic_geo_point(clinic)]
+    return (located or found or [None])[0]
+
+
+def check_geofence(clinic: Optional[dict], latitude: float, longitude: float,
+                   accuracy_m: Optional[float] = None) -> dict:
+    """التحقق من وجود المندوب عند العيادة - within_geofence is None when the clinic has no location"""
+    point = (clinic.get(GEO_FIELD) or clinic_geo_point(clinic)) if clinic else None
+    if point is None:
+        return {"distance_from_clinic_m": None, "allowed_radius_m": None, "within_geofence": None}
+    clinic_longitude, clinic_latitude = point["coordinates"]
+    distance_m = float(distances_from_point(clinic_latitude, clinic_longitude, latitude, longitude,
+                                            approximate=True)[0]) * 1000
+    allowed_m = VISIT_GEOFENCE_RADIUS_M + min(max(accuracy_m or 0.0, 0.0), VISIT_GEOFENCE_MAX_ACCURACY_M)
+    within = not math.isnan(distance_m) and distance_m <= allowed_m
+    return {
+        "distance_from_clinic_m": None if math.isnan(distance_m) else round(distance_m, 1),
+        "allowed_radius_m": allowed_m,
+        "within_geofence": within
+    }
+
+
+def _nearby_entry(clinic: dict, source: str) -> dict:
+    longitude, latitude = clinic[GEO_FIELD]["coordinates"]
+    location = clinic.get("location_data") or {}
+    return {
+        "id": clinic.get("id", ""),
+        "source": source,
+        "name": clinic.get("name") or clinic.get("clinic_name") or "",
+        "doctor_name": clinic.get("primary_doctor_name") or clinic.get("doctor_name") or "",
+        "phone": clinic.get("phone", ""),
+        "address": clinic.get("address") or location.get("address", ""),
+        "area_name": clinic.get("area_name", ""),
+        "classification": clinic.get("classification"),
+        "status": clinic.get("status"),
+        "coordinates": {"latitude": latitude, "longitude": longitude},
+        "distance_m": round(clinic["distance_m"], 1),
+        "distance_km": round(clinic["distance_m"] / 1000, 3)
+    }
+
+
+class GeoService:
+    """خدمة الاستعلامات الجغرافية للعيادات"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def _near(self, source: str, point: dict, limit: int, max_distance_m: Optional[float],
+                    query: Optional[dict]) -> List[dict]:
+        geo_near = {
+            "near": point,
+            "distanceField": "distance_m",
+            "key": GEO_FIELD,
+            "spherical": True,
+            "query": query or {}
+        }
+        if max_distance_m:
+            geo_near["maxDistance"] = max_distance_m
+        clinics = await self.db[source].aggregate([
+            {"$geoNear": geo_near},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "audit_trail": 0}}
+        ]).to_list(limit)
+        return [_nearby_entry(clinic, source) for clinic in clinics]
+
+    async def nearby_clinics(self, latitude: float, longitude: float, limit: int = 20,
+                             max_distance_m: Optional[float] = None,
+                             queries: Optional[Dict[str, dict]] = None) -> List[dict]:
+        """أقرب العيادات - $geoNear on each clinic collection, merged by distance
+
+        Without max_distance_m this is a plain k-nearest query. queries maps a
+        collection name to an extra filter; collections missing from it are skipped.
+        """
+        point = geo_point(latitude, longitude)
+        if point is None:
+            raise ValueError("Invalid coordinates")
+        queries = queries if queries is not None else {source: {} for source in GEO_COLLECTIONS}
+        results = await asyncio.gather(*[
+            self._near(source, point, limit, max_distance_m, query) for source, query in queries.items()
+        ])
+        nearby = [clinic for clinics in results for clinic in clinics]
+        nearby.sort(key=lambda clinic: clinic["distance_m"])
+        return nearby[:limit]
+
+    async def backfill_locations(self, dry_run: bool = False) -> Dict[str, dict]:
+        """تعبئة geo_location للعيادات القديمة - idempotent, only documents without a point"""
+        report = {}
+        for source in GEO_COLLECTIONS:
+            scanned = located = updated = 0
+            batch: List[UpdateOne] = []
+            cursor = self.db[source].find(
+                {GEO_FIELD: None},
+                {"_id": 1, "latitude": 1, "longitude": 1, "clinic_latitude": 1, "clinic_longitude": 1,
+                 "location_data": 1, "admin_approved_location": 1}
+            )
+            async for clinic in cursor:
+                scanned += 1
+                point = clinic_geo_point(clinic)
+                if point is None:
+                    continue
+                located += 1
+                batch.append(UpdateOne({"_id": clinic["_id"]}, {"$set": {GEO_FIELD: point}}))
+                if len(batch) >= BACKFILL_BATCH_SIZE:
+                    updated += await self._flush(source, batch, dry_run)
+                    batch = []
+            updated += await self._flush(source, batch, dry_run)
+            report[source] = {"scanned": scanned, "located": located, "updated": updated}
+        return report
+
+    async def _flush(self, source: str, batch: List[UpdateOne], dry_run: bool) -> int:
+        if not batch or dry_run:
+            return 0
+        result = await self.db[source].bulk_write(batch, ordered=False)
+        return result.modified_count
@@ -0,0 +1,190 @@
+# GPS Ingestion - استقبال مواقع GPS بكميات كبيرة
+# Medical Management System - Write-behind buffer for the gps_points time-series collection
+#
+# Requests only validate points and append them to an in-process buffer; a
+# single background task drains it with unordered insert_many batches. When
+# MongoDB is slow the buffer fills up and producers wait (bounded), then get
+# a 503 so devices retry later instead of piling up memory. Points accepted
+# but not yet flushed are lost if the process dies; that is the trade-off
+# for not writing per point, and a graceful shutdown flushes everything.
+
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+
+GPS_COLLECTION = "gps_points"
+GPS_RETENTION_DAYS = int(os.environ.get('GPS_RETENTION_DAYS', '180'))
+# نقاط مستقبلية بأكثر من هذا تعتبر ساعة جهاز خاطئة ويستخدم وقت الاستلام
+GPS_MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+async def ensure_gps_collection(db: AsyncIOMotorDatabase):
+    """إنشاء مجموعة السلاسل الزمنية - run before ensure_indexes so it is not created as a plain collection
+
+    Falls back to a regular collection where time-series collections are not
+    supported (MongoDB < 5.0). Its index lives here rather than in the
+    registry because the registry would create the collection first.
+    """
+    if GPS_COLLECTION not in await db.list_collection_names():
+        try:
+            await db.create_collection(
+                GPS_COLLECTION,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "seconds"},
+                expireAfterSeconds=GPS_RETENTION_DAYS * 86400
+            )
+            print(f"✅ Created time-series collection {GPS_COLLECTION}")
+        except Exception as e:
+            print(f"⚠️ Time-series collections unavailable, using a regular collection: {str(e)}")
+    await db[GPS_COLLECTION].create_index([("meta.user_id", ASCENDING), ("ts", DESCENDING)])
+
+
+def gps_document(user_id: str, point: dict, received_at: datetime) -> dict:
+    """مستند نقطة GPS - meta holds the series key, ts the device time"""
+    timestamp = point.get("timestamp")
+    if timestamp is not None and timestamp.tzinfo is not None:
+        timestamp = timestamp.replace(tzinfo=None) - (timestamp.utcoffset() or timedelta(0))
+    if timestamp is None or timestamp > received_at + GPS_MAX_CLOCK_SKEW:
+        timestamp = received_at
+    document = {
+        "ts": timestamp,
+        "meta": {"user_id": user_id},
+        "lat": point["latitude"],
+        "lng": point["longitude"],
+        "received_at": received_at
+    }
+    for field in ("accuracy", "altitude", "speed", "heading", "activity_id"):
+        if point.get(field) is not None:
+            document[field] = point[field]
+    return document
+
+
+class GPSWriteBuffer:
+    """ذاكرة كتابة مؤجلة لنقاط GPS - bounded buffer drained by one background task
+
+    Flushes when batch_size points are waiting or every flush_interval
+    seconds. A failed flush keeps its points at the head of the buffer and
+    retries with exponential backoff; documents MongoDB rejects outright are
+    dropped and counted.
+    """
+
+    def __init__(self, capacity: int = 50000, batch_size: int = 1000, flush_interval: float = 1.0,
+                 enqueue_timeout: float = 2.0, max_backoff: float = 30.0):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_backoff = max_backoff
+        self._points: Deque[dict] = deque()
+        self._space = asyncio.Condition()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._stopping = False
+        self._failures = 0
+        self.stats = {"accepted": 0, "flushed": 0, "rejected": 0, "dropped": 0,
+                      "failed_flushes": 0, "last_flush_ms": None}
+
+    @property
+    def pending(self) -> int:
+        return len(self._points)
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if self._task is None or self._task.done():
+            self._db = db
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف مع تفريغ ما تبقى - final flush on shutdown"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    async def put_many(self, documents: List[dict]) -> bool:
+        """إضافة نقاط للذاكرة - waits up to enqueue_timeout for space, False means back off"""
+        if not documents:
+            return True
+        if len(documents) > self.capacity or self._task is None:
+            self.stats["rejected"] += len(documents)
+            return False
+        async with self._space:
+            try:
+                await asyncio.wait_for(
+                    self._space.wait_for(lambda: len(self._points) + len(documents) <= self.capacity),
+                    self.enqueue_timeout
+                )
+            except asyncio.TimeoutError:
+                self.stats["rejected"] += len(documents)
+                return False
+            self._points.extend(documents)
+        self.stats["accepted"] += len(documents)
+        if len(self._points) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if await self._drain():
+                if self._stopping:
+                    return
+                continue
+            if self._stopping and self._failures >= 3:
+                print(f"❌ GPS buffer stopped with {len(self._points)} unflushed points")
+                return
+            # MongoDB غير متاح - الانتظار قبل إعادة المحاولة
+            await asyncio.sleep(min(self.max_backoff, 0.5 * 2 ** min(self._failures, 10)))
+
+    async def _drain(self) -> bool:
+        while self._points:
+            batch = [self._points.popleft() for _ in range(min(self.batch_size, len(self._points)))]
+            started = time.perf_counter()
+            try:
+                await self._db[GPS_COLLECTION].insert_many(batch, ordered=False)
+                self.stats["flushed"] += len(batch)
+            except BulkWriteError as e:
+                # المستندات المرفوضة لن تنجح عند الإعادة
+                failed = len(e.details.get("writeErrors", []))
+                self.stats["flushed"] += len(batch) - failed
+                self.stats["dropped"] += failed
+            except Exception as e:
+                self._points.extendleft(reversed(batch))
+                self._failures += 1
+                self.stats["failed_flushes"] += 1
+                print(f"⚠️ GPS flush failed ({len(self._points)} points waiting): {str(e)}")
+                return False
+            self._failures = 0
+            self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            async with self._space:
+                self._space.notify_all()
+        return True
+
+    def snapshot(self) -> Dict[str, object]:
+        return {**self.stats, "pending": self.pending, "capacity": self.capacity, "running": self._task is not None}
+
+
+gps_buffer = GPSWriteBuffer(
+    capacity=int(os.environ.get('GPS_BUFFER_CAPACITY', '50000')),
+    batch_size=int(os.environ.get('GPS_FLUSH_BATCH_SIZE', '1000')),
+    flush_interval=float(os.environ.get('GPS_FLUSH_INTERVAL_SECONDS', '1.0')),
+    enqueue_timeout=float(os.environ.get('GPS_ENQUEUE_TIMEOUT_SECONDS', '2.0'))
+)
+
+
+async def ingest_points(user_id: str, points: List[dict]) -> bool:
+    """تحويل النقاط وإضافتها للذاكرة المؤجلة - False when the buffer is full"""
+    received_at = datetime.utcnow()
+    return await gps_buffer.put_many([gps_document(user_id, point, received_at) for point in points])
@@ -0,0 +1,299 @@
+# GPS Trails - تبسيط مسارات GPS ونقاط التوقف
+# Medical Management System - Server-side trail simplification for map views
+#
+# A rep's day of points is read once, simplified with Douglas-Peucker at a
+# few zoom-dependent tolerances, scanned for stay points, and stored in
+# gps_daily_trails as encoded polylines. Map views read the stored trail for
+# their zoom level, so a day for 200 reps is a few kilobytes per rep instead
+# of every raw point. Closed days are computed once; an open day's trail is
+# recomputed at most every TRAIL_REFRESH_SECONDS, and only when new points
+# were received for it.
+
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.geo_distance import EARTH_RADIUS_KM, segment_lengths_km
+from services.gps_ingest_service import GPS_COLLECTION
+
+TRAIL_COLLECTION = "gps_daily_trails"
+TRAIL_REFRESH_SECONDS = int(os.environ.get('GPS_TRAIL_REFRESH_SECONDS', '120'))
+# الأجهزة غير المتصلة ترفع نقاطها متأخرة؛ اليوم يعتبر مغلقاً بعد هذه المهلة
+TRAIL_LATE_UPLOAD_GRACE = timedelta(hours=24)
+# نقاط مستلمة لم تكتب بعد من ذاكرة الكتابة المؤجلة
+TRAIL_INGEST_LAG = timedelta(seconds=10)
+
+# مستويات التبسيط: أقصى تكبير للخريطة -> السماحية بالمتر
+TRAIL_LEVELS = (
+    ("city", 11, 150.0),
+    ("district", 14, 30.0),
+    ("street", 22, 5.0),
+)
+
+# نقطة توقف: البقاء ضمن نصف القطر لمدة لا تقل عن الحد الأدنى
+STAY_RADIUS_M = float(os.environ.get('GPS_STAY_RADIUS_M', '100'))
+STAY_MIN_SECONDS = int(os.environ.get('GPS_STAY_MIN_SECONDS', '300'))
+
+# حدود السرعة م/ث لتصنيف الحركة
+WALKING_MAX_SPEED = 2.5
+STATIONARY_MAX_SPEED = 0.5
+
+
+def level_for_zoom(zoom: int) -> str:
+    for name, max_zoom, _ in TRAIL_LEVELS:
+        if zoom <= max_zoom:
+            return name
+    return TRAIL_LEVELS[-1][0]
+
+
+def _project_m(lats: np.ndarray, lons: np.ndarray):
+    """إسقاط محلي بالمتر حول مركز المسار - accurate enough for one day of one rep"""
+    lat0, lon0 = np.radians(np.mean(lats)), np.radians(np.mean(lons))
+    radius_m = EARTH_RADIUS_KM * 1000
+    x = (np.radians(lons) - lon0) * np.cos(lat0) * radius_m
+    y = (np.radians(lats) - lat0) * radius_m
+    return x, y
+
+
+def simplification_tolerances(lats: np.ndarray, lons: np.ndarray, min_tolerance_m: float) -> np.ndarray:
+    """Douglas-Peucker مرة واحدة لكل المستويات - the largest tolerance (m) at which each point survives
+
+    A point is kept at tolerance t when its value is greater than t, so one
+    run down to the finest level yields every coarser level too. Endpoints
+    are infinite (always kept); points dropped even at min_tolerance_m are 0.
+    """
+    n = len(lats)
+    survives = np.zeros(n)
+    if n == 0:
+        return survives
+    survives[0] = survives[-1] = np.inf
+    if n < 3:
+        return survives
+    x, y = _project_m(lats, lons)
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        start, end, parent = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            distances = np.hypot(px, py)
+        else:
+            t = np.clip((px * dx + py * dy) / length_sq, 0.0, 1.0)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > min_tolerance_m:
+            index = start + 1 + farthest
+            # نقطة داخل مقطع لا تظهر بسماحية أكبر من سماحية المقطع الأب
+            survives[index] = min(parent, distances[farthest])
+            stack.append((start, index, survives[index]))
+            stack.append((index, end, survives[index]))
+    return survives
+
+
+def simplify_indices(lats: np.ndarray, lons: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Douglas-Peucker - indices of the points to keep, first and last always kept"""
+    return np.flatnonzero(simplification_tolerances(lats, lons, tolerance_m) > tolerance_m)
+
+
+def _first_beyond(x: np.ndarray, y: np.ndarray, i: int, radius_m: float) -> int:
+    """أول نقطة بعد i خارج نصف القطر - searched in growing windows, n when none"""
+    window = 32
+    start = i + 1
+    while start < len(x):
+        end = min(len(x), start + window)
+        beyond = np.flatnonzero(np.hypot(x[start:end] - x[i], y[start:end] - y[i]) > radius_m)
+        if beyond.size:
+            return start + int(beyond[0])
+        start, window = end, window * 2
+    return len(x)
+
+
+def detect_stay_points(seconds: np.ndarray, lats: np.ndarray, lons: np.ndarray,
+                       radius_m: float = STAY_RADIUS_M, min_seconds: int = STAY_MIN_SECONDS):
+    """نقاط التوقف - returns (stays, label per point) where label is the stay index or -1"""
+    n = len(lats)
+    labels = np.full(n, -1)
+    stays = []
+    if n == 0:
+        return stays, labels
+    x, y = _project_m(lats, lons)
+    i = 0
+    while i < n:
+        j = _first_beyond(x, y, i, radius_m)
+        if seconds[j - 1] - seconds[i] >= min_seconds:
+            labels[i:j] = len(stays)
+            stays.append({
+                "latitude": round(float(np.mean(lats[i:j])), 6),
+                "longitude": round(float(np.mean(lons[i:j])), 6),
+                "start_index": i,
+                "end_index": j - 1,
+                "duration_minutes": int((seconds[j - 1] - seconds[i]) // 60),
+                "point_count": j - i
+            })
+            i = j
+        else:
+            i += 1
+    return stays, labels
+
+
+def movement_types(seconds: np.ndarray, lats: np.ndarray, lons: np.ndarray, stay_labels: np.ndarray) -> List[str]:
+    """نوع الحركة عند كل نقطة - from the speed of the segment leading to it"""
+    n = len(lats)
+    if n == 0:
+        return []
+    steps_m = np.concatenate([[0.0], segment_lengths_km(lats, lons) * 1000])
+    elapsed = np.concatenate([[np.inf], np.diff(seconds)])
+    speeds = np.divide(steps_m, elapsed, out=np.zeros(n), where=elapsed > 0)
+    kinds = np.select(
+        [stay_labels >= 0, speeds < STATIONARY_MAX_SPEED, speeds < WALKING_MAX_SPEED],
+        ["stationary", "stationary", "walking"],
+        default="driving"
+    )
+    return kinds.tolist()
+
+
+def classify_points(times: List[datetime], lats, lons) -> List[Tuple[str, Optional[int]]]:
+    """نوع الحركة ومدة البقاء لكل نقطة مرتبة زمنياً - duration is set only inside a stay point"""
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    seconds = np.array([(ts - times[0]).total_seconds() for ts in times]) if times else np.zeros(0)
+    stays, labels = detect_stay_points(seconds, lats, lons)
+    kinds = movement_types(seconds, lats, lons, labels)
+    return [(kind, stays[label]["duration_minutes"] if label >= 0 else None)
+            for kind, label in zip(kinds, labels.tolist())]
+
+
+def encode_polyline(lats: np.ndarray, lons: np.ndarray) -> str:
+    """ترميز Google polyline (دقة 1e-5) - what map SDKs decode natively"""
+    if len(lats) == 0:
+        return ""
+    values = np.column_stack([np.round(lats * 1e5), np.round(lons * 1e5)]).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chunks = []
+    for value in zigzag.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def build_trail(points: List[dict]) -> dict:
+    """حساب كل مستويات المسار ونقاط التوقف من نقاط يوم واحد مرتبة زمنياً"""
+    times = [point["ts"] for point in points]
+    lats = np.array([point["lat"] for point in points], dtype=float)
+    lons = np.array([point["lng"] for point in points], dtype=float)
+    seconds = np.array([(ts - times[0]).total_seconds() for ts in times]) if times else np.zeros(0)
+
+    stays, _ = detect_stay_points(seconds, lats, lons)
+    survives = simplification_tolerances(lats, lons, min(level[2] for level in TRAIL_LEVELS))
+    levels = {}
+    for name, _, tolerance_m in TRAIL_LEVELS:
+        kept = np.flatnonzero(survives > tolerance_m)
+        levels[name] = {"polyline": encode_polyline(lats[kept], lons[kept]), "point_count": int(kept.size)}
+
+    return {
+        "raw_point_count": len(points),
+        "distance_km": round(float(np.nansum(segment_lengths_km(lats, lons))), 2),
+        "start": times[0] if times else None,
+        "end": times[-1] if times else None,
+        "levels": levels,
+        "stay_points": [{
+            "latitude": stay["latitude"],
+            "longitude": stay["longitude"],
+            "arrival": times[stay["start_index"]],
+            "departure": times[stay["end_index"]],
+            "duration_minutes": stay["duration_minutes"],
+            "point_count": stay["point_count"]
+        } for stay in stays]
+    }
+
+
+class GPSTrailService:
+    """خدمة مسارات GPS المبسطة"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.points = db[GPS_COLLECTION]
+        self.trails = db[TRAIL_COLLECTION]
+
+    async def _day_points(self, user_ids: List[str], day: date) -> Dict[str, List[dict]]:
+        start = datetime.combine(day, datetime.min.time())
+        points: Dict[str, List[dict]] = {user_id: [] for user_id in user_ids}
+        cursor = self.points.find(
+            {"meta.user_id": {"$in": user_ids}, "ts": {"$gte": start, "$lt": start + timedelta(days=1)}},
+            {"_id": 0, "meta.user_id": 1, "ts": 1, "lat": 1, "lng": 1}
+        ).sort("ts", 1)
+        async for point in cursor:
+            points[point["meta"]["user_id"]].append(point)
+        return points
+
+    async def _last_received(self, user_ids: List[str], day: date) -> Dict[str, datetime]:
+        start = datetime.combine(day, datetime.min.time())
+        pipeline = [
+            {"$match": {"meta.user_id": {"$in": user_ids}, "ts": {"$gte": start, "$lt": start + timedelta(days=1)}}},
+            {"$group": {"_id": "$meta.user_id", "last": {"$max": "$received_at"}}}
+        ]
+        return {row["_id"]: row["last"] async for row in self.points.aggregate(pipeline)}
+
+    async def users_with_points(self, day: date) -> List[str]:
+        start = datetime.combine(day, datetime.min.time())
+        return await self.points.distinct("meta.user_id", {"ts": {"$gte": start, "$lt": start + timedelta(days=1)}})
+
+    async def daily_trails(self, user_ids: List[str], day: date, zoom: int) -> List[dict]:
+        """مسارات اليوم لعدة مناديب - stored trails, computing only missing or outdated ones"""
+        level = level_for_zoom(zoom)
+        now = datetime.utcnow()
+        final = datetime.combine(day + timedelta(days=1), datetime.min.time()) + TRAIL_LATE_UPLOAD_GRACE <= now
+        stored = {trail["user_id"]: trail async for trail in self.trails.find(
+            {"user_id": {"$in": user_ids}, "day": day.isoformat()}, {"_id": 0}
+        )}
+        refresh_before = now - timedelta(seconds=TRAIL_REFRESH_SECONDS)
+        outdated = [user_id for user_id in user_ids if user_id not in stored]
+        stale = [user_id for user_id, trail in stored.items()
+                 if not trail["final"] and trail["computed_at"] < refresh_before]
+        if stale:
+            # إعادة الحساب فقط لمن استلمنا له نقاطاً منذ آخر حساب (بما فيها نقاط متأخرة الرفع)
+            received = await self._last_received(stale, day)
+            changed = [user_id for user_id in stale if user_id in received and received[user_id] >= stored[user_id]["computed_at"] - TRAIL_INGEST_LAG]
+            outdated.extend(changed)
+            unchanged = [user_id for user_id in stale if user_id not in changed]
+            if unchanged:
+                await self.trails.update_many(
+                    {"user_id": {"$in": unchanged}, "day": day.isoformat()},
+                    {"$set": {"computed_at": now, "final": final}}
+                )
+
+        if outdated:
+            day_points = await self._day_points(outdated, day)
+            # الحساب في خيط منفصل حتى لا يعطل حلقة الأحداث
+            computed = await asyncio.to_thread(
+                lambda: {user_id: build_trail(points) for user_id, points in day_points.items()}
+            )
+            for user_id, trail in computed.items():
+                document = {"user_id": user_id, "day": day.isoformat(), "final": final, "computed_at": now, **trail}
+                await self.trails.replace_one({"user_id": user_id, "day": day.isoformat()}, document, upsert=True)
+                stored[user_id] = document
+
+        return [self._view(stored[user_id], level) for user_id in user_ids if stored.get(user_id, {}).get("raw_point_count")]
+
+    @staticmethod
+    def _view(trail: dict, level: str) -> dict:
+        return {
+            "user_id": trail["user_id"],
+            "date": trail["day"],
+            "level": level,
+            "polyline": trail["levels"][level]["polyline"],
+            "point_count": trail["levels"][level]["point_count"],
+            "raw_point_count": trail["raw_point_count"],
+            "distance_km": trail["distance_km"],
+            "start": trail["start"],
+            "end": trail["end"],
+            "stay_points": trail["stay_points"]
+        }
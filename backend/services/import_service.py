@@ -0,0 +1,267 @@
+# Excel Import Jobs - خدمة استيراد ملفات Excel في الخلفية
+# Medical Management System - Batched, validated background imports
+#
+# Uploads are spooled to a temporary file and processed by a background task:
+# the workbook is parsed read-only in a worker thread, every row is validated
+# against its import model, and valid rows are upserted in bounded unordered
+# batches. Progress is stored in the import_jobs collection. Overwrite imports
+# are written to a staging collection that replaces the target with a single
+# renameCollection once every batch has succeeded.
+#
+# Only the cells present in a row are $set on an existing document; model
+# defaults (active flag, classification, status) apply on insert only, so a
+# re-import with blank cells never resets fields that were edited since.
+
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple, Type
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from openpyxl import load_workbook
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from auth import invalidate_user
+from models.import_models import (
+    ImportRow, ClinicImportRow, UserImportRow, OrderImportRow, DebtImportRow, PaymentImportRow
+)
+from indexes import INDEX_REGISTRY
+from services.dashboard_service import invalidate_dashboard
+from services.clinic_roster_service import ClinicRosterService
+
+IMPORT_BATCH_SIZE = int(os.environ.get('EXCEL_IMPORT_BATCH_SIZE', '500'))
+MAX_STORED_ERRORS = 200
+
+# نوع البيانات -> (المجموعة، نموذج الصف، مفتاح التحديث)
+IMPORT_TARGETS: Dict[str, Tuple[str, Type[ImportRow], Tuple[str, ...]]] = {
+    "clinics": ("clinics", ClinicImportRow, ("name", "phone")),
+    "users": ("users", UserImportRow, ("username",)),
+    "orders": ("orders", OrderImportRow, ("order_number",)),
+    "debts": ("debts", DebtImportRow, ("debt_number",)),
+    "payments": ("payments", PaymentImportRow, ("payment_number",)),
+}
+
+
+def _read_batches(path: str, batch_size: int):
+    """مولد متزامن لصفوف الملف - runs inside a worker thread via _next_batch"""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        rows = ws.iter_rows(values_only=True)
+        header_row = next(rows, None) or ()
+        headers = [str(cell).strip() if cell is not None else "" for cell in header_row]
+        yield headers
+
+        batch = []
+        for row_number, row in enumerate(rows, start=2):
+            if not any(cell is not None and str(cell).strip() for cell in row):
+                continue  # Skip empty rows
+            batch.append((row_number, row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        wb.close()
+
+
+def _next_batch(iterator):
+    return next(iterator, None)
+
+
+def _to_bson(value):
+    # BSON has no date type
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+class ExcelImportService:
+    """خدمة مهام الاستيراد - Excel import job engine"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.jobs = db.import_jobs
+
+    async def create_job(self, data_type: str, import_mode: str, filename: str, user: dict) -> dict:
+        job = {
+            "id": str(uuid.uuid4()),
+            "data_type": data_type,
+            "import_mode": import_mode,
+            "filename": filename,
+            "status": "queued",
+            "processed_rows": 0,
+            "inserted": 0,
+            "updated": 0,
+            "failed_rows": 0,
+            "errors": [],
+            "created_by": user.get("user_id"),
+            "created_by_name": user.get("full_name", "Unknown"),
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+            "message": None
+        }
+        await self.jobs.insert_one(dict(job))
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        return await self.jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def run_job(self, job: dict, path: str, batch_size: int = IMPORT_BATCH_SIZE):
+        """تنفيذ مهمة الاستيراد - never raises; the outcome is recorded on the job"""
+        job_id = job["id"]
+        collection_name, row_model, key_fields = IMPORT_TARGETS[job["data_type"]]
+        overwrite = job["import_mode"] == "overwrite"
+        target = f"{collection_name}_import_{job_id.replace('-', '')}" if overwrite else collection_name
+
+        await self.jobs.update_one({"id": job_id}, {"$set": {"status": "running", "started_at": datetime.utcnow()}})
+        rows = _read_batches(path, batch_size)
+        try:
+            headers = await asyncio.to_thread(_next_batch, rows)
+            if not any(headers or []):
+                raise ValueError("No headers found in Excel file")
+
+            while True:
+                batch = await asyncio.to_thread(_next_batch, rows)
+                if batch is None:
+                    break
+                await self._process_batch(job, target, row_model, key_fields, headers, batch)
+
+            if overwrite:
+                replaced_users = await self.db.users.distinct("id") if collection_name == "users" else []
+                await self._swap_staging(target, collection_name)
+                # المستخدمون المستبدلون يحصلون على معرفات جديدة - التوكنات القديمة تلغى
+                for user_id in replaced_users:
+                    await invalidate_user(self.db, user_id, revoke=True)
+
+            invalidate_dashboard(collection_name)
+            if collection_name == "clinics":
+                # تخصيصات العيادات تغيرت دفعة واحدة - إعادة بناء القوائم عند القراءة
+                await ClinicRosterService(self.db).mark_stale()
+            job_state = await self.get_job(job_id)
+            message = (f"{'Overwritten' if overwrite else 'Imported'} {job_state['inserted']} new and "
+                       f"updated {job_state['updated']} {job['data_type']} records, "
+                       f"{job_state['failed_rows']} rows rejected")
+            await self.jobs.update_one({"id": job_id}, {"$set": {
+                "status": "completed", "finished_at": datetime.utcnow(), "message": message
+            }})
+            print(f"✅ Import job {job_id}: {message}")
+        except Exception as e:
+            if overwrite:
+                await self.db.drop_collection(target)
+            await self.jobs.update_one({"id": job_id}, {"$set": {
+                "status": "failed", "finished_at": datetime.utcnow(), "message": str(e)
+            }})
+            print(f"❌ Import job {job_id} failed: {str(e)}")
+        finally:
+            await asyncio.to_thread(rows.close)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _prepare_batch(job: dict, row_model: Type[ImportRow], key_fields: Tuple[str, ...],
+                       headers: List[str], batch: list):
+        """التحقق من الصفوف وبناء عمليات الكتابة - CPU work, runs in a worker thread"""
+        now = datetime.utcnow()
+        operations, row_numbers, documents, errors = [], [], [], []
+
+        for row_number, row in batch:
+            raw = {header: value for header, value in zip(headers, row)
+                   if header and value is not None and not (isinstance(value, str) and not value.strip())}
+            try:
+                row = row_model(**raw)
+            except ValidationError as e:
+                errors.append({"row": row_number, "errors": [
+                    f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+                ]})
+                continue
+
+            # الخلايا الموجودة فقط تحدّث - defaults are written on insert only
+            document = {field: _to_bson(value) for field, value in row.model_dump(exclude_unset=True).items()
+                        if value is not None}
+            defaults = {field: _to_bson(value) for field, value in row.model_dump().items()
+                        if value is not None and field not in document}
+            if job["data_type"] == "users" and "password" in document:
+                document["password_hash"] = hashlib.sha256(document.pop("password").encode()).hexdigest()
+            document.update({
+                "updated_at": now,
+                "imported_at": now,
+                "imported_by": job["created_by"],
+                "import_job_id": job["id"]
+            })
+            operations.append(UpdateOne(
+                {field: document.get(field) for field in key_fields},
+                {"$set": document, "$setOnInsert": {**defaults, "id": str(uuid.uuid4()), "created_at": now}},
+                upsert=True
+            ))
+            row_numbers.append(row_number)
+            documents.append(document)
+
+        return operations, row_numbers, documents, errors
+
+    async def _users_before(self, documents: List[dict]) -> Dict[str, dict]:
+        """الدور والتفعيل الحاليان للمستخدمين في الدفعة - by username"""
+        usernames = [document["username"] for document in documents]
+        cursor = self.db.users.find(
+            {"username": {"$in": usernames}}, {"_id": 0, "id": 1, "username": 1, "role": 1, "is_active": 1}
+        )
+        return {user["username"]: user async for user in cursor}
+
+    async def _process_batch(self, job: dict, target: str, row_model: Type[ImportRow],
+                             key_fields: Tuple[str, ...], headers: List[str], batch: list):
+        operations, row_numbers, documents, errors = await asyncio.to_thread(
+            self._prepare_batch, job, row_model, key_fields, headers, batch
+        )
+
+        users_before = {}
+        if job["data_type"] == "users" and job["import_mode"] != "overwrite" and documents:
+            users_before = await self._users_before(documents)
+
+        inserted = updated = 0
+        if operations:
+            try:
+                result = await self.db[target].bulk_write(operations, ordered=False)
+                inserted, updated = result.upserted_count, result.matched_count
+            except BulkWriteError as e:
+                details = e.details
+                inserted = details.get("nUpserted", 0)
+                updated = details.get("nMatched", 0)
+                for write_error in details.get("writeErrors", []):
+                    errors.append({"row": row_numbers[write_error["index"]], "errors": [write_error.get("errmsg", "")]})
+
+        # دور أو تفعيل تغير - إلغاء المستخدم من الذاكرة المؤقتة كما في user_routes.update_user
+        for document in documents:
+            user = users_before.get(document.get("username"))
+            if not user:
+                continue
+            role_changed = "role" in document and document["role"] != user.get("role")
+            active_changed = "is_active" in document and document["is_active"] != user.get("is_active", True)
+            if role_changed or active_changed:
+                await invalidate_user(self.db, user["id"], revoke=document.get("is_active") is False, expire_tokens=True)
+
+        update = {"$inc": {
+            "processed_rows": len(batch),
+            "inserted": inserted,
+            "updated": updated,
+            "failed_rows": len(errors)
+        }}
+        if errors:
+            update["$push"] = {"errors": {"$each": errors, "$slice": MAX_STORED_ERRORS}}
+        await self.jobs.update_one({"id": job["id"]}, update)
+
+    async def _swap_staging(self, staging: str, collection_name: str):
+        """استبدال المجموعة دفعة واحدة - build indexes on staging, then rename over the target"""
+        specs = INDEX_REGISTRY.get(collection_name, [])
+        if specs:
+            await self.db[staging].create_indexes([spec.to_index_model() for spec in specs])
+        if staging not in await self.db.list_collection_names():
+            # ملف بدون صفوف صالحة - الاستبدال يعني مجموعة فارغة
+            await self.db.create_collection(staging)
+        await self.db[staging].rename(collection_name, dropTarget=True)
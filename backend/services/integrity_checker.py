@@ -0,0 +1,303 @@
+# Integrity Checker - فحص سلامة البيانات المالية
+# Medical Management System - Streaming, sharded, resumable integrity job
+#
+# Each check reads only the fields it needs, in _id order and in batches, and
+# recomputes totals with Decimal arithmetic straight from the documents (no
+# Pydantic models). A collection is split into _id ranges sampled with
+# $sample; one task per range runs concurrently. Findings are written to
+# integrity_reports as they are found, with an _id derived from the run and
+# the document, so re-processing a batch never duplicates them.
+#
+# Progress (last _id per shard) lives on the run in integrity_runs. A run
+# that stopped (crash, deploy) is resumed from there; a run whose heartbeat
+# is recent is considered alive and is not started twice: resuming claims the
+# stale run with one find_one_and_update, and a partial unique index allows a
+# single "running" run. The nightly job is scripts/check_financial_integrity.py;
+# the API only starts runs and reads reports.
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from indexes import INDEX_REGISTRY
+from models.financial_models import FinancialConfig
+
+INTEGRITY_RUNS_COLLECTION = "integrity_runs"
+INTEGRITY_REPORTS_COLLECTION = "integrity_reports"
+INTEGRITY_SHARDS = int(os.environ.get('INTEGRITY_SHARDS', '4'))
+INTEGRITY_BATCH_SIZE = int(os.environ.get('INTEGRITY_BATCH_SIZE', '500'))
+# تشغيل بدون نبض لهذه المدة يعتبر متوقفاً ويستأنف
+INTEGRITY_STALE_AFTER = timedelta(minutes=10)
+# عينات لكل جزء عند تقسيم المجموعة
+SAMPLES_PER_SHARD = 20
+
+TOLERANCE = Decimal("0.01")
+VAT_RATE = Decimal(str(FinancialConfig.TAX_RATES["vat"]))
+
+
+def _decimal(value: Any) -> Decimal:
+    """مبلغ من مستند - MoneyAmount dict, number, string or Decimal128"""
+    if isinstance(value, dict):
+        value = value.get("amount")
+    if value is None:
+        return Decimal("0.00")
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return Decimal("0.00")
+
+
+# ============================================================================
+# CHECKS - الفحوصات
+# ============================================================================
+
+def check_invoice_total(invoice: dict) -> Optional[dict]:
+    """إجمالي الفاتورة = مجموع البنود بعد الخصم + الضريبة (as InvoiceLineItem.calculate_totals)"""
+    total = Decimal("0.00")
+    for item in invoice.get("line_items") or []:
+        subtotal = _decimal(item.get("unit_price")) * _decimal(item.get("quantity"))
+        discount_percentage = _decimal(item.get("discount_percentage"))
+        if discount_percentage > 0:
+            discount = subtotal * (discount_percentage / 100)
+        else:
+            discount = _decimal(item.get("discount_amount"))
+        after_discount = subtotal - discount
+        total += after_discount + after_discount * VAT_RATE
+
+    stored = _decimal(invoice.get("total_amount"))
+    if abs(stored - total) <= TOLERANCE:
+        return None
+    return {
+        "type": "invoice_total_mismatch",
+        "invoice_id": invoice.get("id"),
+        "invoice_number": invoice.get("invoice_number"),
+        "stored_total": float(stored),
+        "calculated_total": float(total)
+    }
+
+
+def check_debt_balance(debt: dict) -> Optional[dict]:
+    """المتبقي = الأصلي - المدفوعات (integrated) أو الأصلي - المدفوع (legacy)"""
+    if isinstance(debt.get("outstanding_amount"), dict):
+        paid = sum((_decimal(payment.get("amount")) for payment in debt.get("payments") or []), Decimal("0.00"))
+        actual = _decimal(debt["outstanding_amount"])
+    else:
+        paid = _decimal(debt.get("paid_amount"))
+        actual = _decimal(debt.get("remaining_amount"))
+    expected = _decimal(debt.get("original_amount")) - paid
+
+    if abs(expected - actual) <= TOLERANCE:
+        return None
+    return {
+        "type": "debt_balance_mismatch",
+        "debt_id": debt.get("id"),
+        "debt_number": debt.get("debt_number"),
+        "expected_outstanding": float(expected),
+        "actual_outstanding": float(actual)
+    }
+
+
+class IntegrityCheck:
+    """فحص واحد - which documents, which fields, and the per-document rule"""
+
+    def __init__(self, name: str, collection: str, query: dict, projection: dict,
+                 check: Callable[[dict], Optional[dict]]):
+        self.name = name
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.check = check
+
+
+INTEGRITY_CHECKS: List[IntegrityCheck] = [
+    IntegrityCheck(
+        "invoice_totals", "invoices",
+        {"line_items": {"$type": "array"}, "total_amount.amount": {"$exists": True}},
+        {"id": 1, "invoice_number": 1, "total_amount.amount": 1,
+         "line_items.quantity": 1, "line_items.unit_price.amount": 1,
+         "line_items.discount_percentage": 1, "line_items.discount_amount.amount": 1},
+        check_invoice_total
+    ),
+    IntegrityCheck(
+        "debt_balances", "debts",
+        {"$or": [{"outstanding_amount.amount": {"$exists": True}}, {"remaining_amount": {"$exists": True}}]},
+        {"id": 1, "debt_number": 1, "original_amount": 1, "outstanding_amount.amount": 1,
+         "payments.amount.amount": 1, "paid_amount": 1, "remaining_amount": 1},
+        check_debt_balance
+    ),
+]
+
+
+# ============================================================================
+# RUNNER - التشغيل
+# ============================================================================
+
+class IntegrityChecker:
+    """تشغيل الفحوصات على أجزاء متوازية مع حفظ التقدم"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, shards: int = INTEGRITY_SHARDS,
+                 batch_size: int = INTEGRITY_BATCH_SIZE, checks: List[IntegrityCheck] = INTEGRITY_CHECKS):
+        self.db = db
+        self.runs = db[INTEGRITY_RUNS_COLLECTION]
+        self.reports = db[INTEGRITY_REPORTS_COLLECTION]
+        self.shards = max(1, shards)
+        self.batch_size = batch_size
+        self.checks = {check.name: check for check in checks}
+
+    async def _split(self, check: IntegrityCheck) -> List[dict]:
+        """حدود _id للأجزاء من عينة عشوائية - one open range when the ids are not comparable"""
+        if self.shards == 1:
+            return [{"lower": None, "upper": None}]
+        sample = [doc["_id"] async for doc in self.db[check.collection].aggregate([
+            {"$sample": {"size": self.shards * SAMPLES_PER_SHARD}},
+            {"$project": {"_id": 1}}
+        ])]
+        # أنواع مختلفة من _id لا تقارن بالمدى - جزء واحد
+        if len(sample) < self.shards or len({type(_id) for _id in sample}) > 1:
+            return [{"lower": None, "upper": None}]
+        sample.sort()
+        step = len(sample) / self.shards
+        cuts = sorted({sample[int(step * i)] for i in range(1, self.shards)})
+        bounds = [None, *cuts, None]
+        return [{"lower": bounds[i], "upper": bounds[i + 1]} for i in range(len(bounds) - 1)]
+
+    async def active_run(self) -> Optional[dict]:
+        """آخر تشغيل غير مكتمل (قيد العمل أو متوقف)"""
+        return await self.runs.find_one({"status": "running"}, {"_id": 0}, sort=[("started_at", -1)])
+
+    async def create_run(self, started_by: Optional[str] = None) -> Optional[dict]:
+        """تشغيل جديد - None when another run was created first (unique running index)"""
+        now = datetime.utcnow()
+        shards = []
+        for check in self.checks.values():
+            for bounds in await self._split(check):
+                shards.append({"check": check.name, **bounds, "last_id": None,
+                               "scanned": 0, "issues": 0, "done": False})
+        run = {
+            "id": str(uuid.uuid4()),
+            "status": "running",
+            "started_by": started_by,
+            "started_at": now,
+            "heartbeat_at": now,
+            "finished_at": None,
+            "checks": list(self.checks),
+            "shards": shards,
+            "scanned": 0,
+            "issues_found": 0
+        }
+        # الفهرس الفريد يمنع تشغيلين - the nightly script may run before server startup created it
+        await self.runs.create_indexes([spec.to_index_model() for spec in INDEX_REGISTRY[INTEGRITY_RUNS_COLLECTION]])
+        try:
+            await self.runs.insert_one(dict(run))
+        except DuplicateKeyError:
+            return None
+        return run
+
+    async def run(self, run: dict) -> dict:
+        """تشغيل أو استئناف كل الأجزاء غير المكتملة - returns the finished run summary"""
+        try:
+            await asyncio.gather(*[
+                self._run_shard(run["id"], index, shard)
+                for index, shard in enumerate(run["shards"]) if not shard["done"]
+            ])
+        except Exception as e:
+            # يبقى "running" ليستأنف لاحقاً من آخر دفعة محفوظة
+            print(f"⚠️ Integrity run {run['id']} stopped: {str(e)}")
+            raise
+        finished = await self.runs.find_one({"id": run["id"]}, {"_id": 0, "issues_found": 1})
+        status = "clean" if not finished["issues_found"] else "issues_found"
+        await self.runs.update_one(
+            {"id": run["id"]},
+            {"$set": {"status": status, "finished_at": datetime.utcnow()}}
+        )
+        return await self.summary(run["id"])
+
+    async def _run_shard(self, run_id: str, index: int, shard: dict):
+        check = self.checks[shard["check"]]
+        collection = self.db[check.collection]
+        last_id = shard["last_id"]
+        while True:
+            id_range = {}
+            if last_id is not None:
+                id_range["$gt"] = last_id
+            elif shard["lower"] is not None:
+                id_range["$gte"] = shard["lower"]
+            if shard["upper"] is not None:
+                id_range["$lt"] = shard["upper"]
+            query = {**check.query, "_id": id_range} if id_range else check.query
+
+            batch = await collection.find(query, check.projection).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+            now = datetime.utcnow()
+            issues = []
+            for document in batch:
+                issue = check.check(document)
+                if issue:
+                    issues.append({
+                        "_id": f"{run_id}:{check.name}:{document['_id']}",
+                        "run_id": run_id,
+                        "check": check.name,
+                        "collection": check.collection,
+                        **issue,
+                        "found_at": now
+                    })
+            if issues:
+                try:
+                    await self.reports.insert_many(issues, ordered=False)
+                except BulkWriteError as e:
+                    # دفعة أعيدت بعد استئناف - النتائج موجودة بالفعل
+                    if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                        raise
+
+            done = len(batch) < self.batch_size
+            if batch:
+                last_id = batch[-1]["_id"]
+            await self.runs.update_one({"id": run_id}, {
+                "$set": {f"shards.{index}.last_id": last_id, f"shards.{index}.done": done, "heartbeat_at": now},
+                "$inc": {f"shards.{index}.scanned": len(batch), f"shards.{index}.issues": len(issues),
+                         "scanned": len(batch), "issues_found": len(issues)}
+            })
+            if done:
+                return
+
+    async def start_or_resume(self, started_by: Optional[str] = None) -> Optional[dict]:
+        """التشغيل المتوقف يستأنف، والتشغيل الحي لا يكرر - returns the run to execute, or None"""
+        now = datetime.utcnow()
+        # استئناف ذري - only one caller can move the stale heartbeat forward
+        run = await self.runs.find_one_and_update(
+            {"status": "running", "heartbeat_at": {"$lt": now - INTEGRITY_STALE_AFTER}},
+            {"$set": {"heartbeat_at": now}},
+            projection={"_id": 0}
+        )
+        if run:
+            run["heartbeat_at"] = now
+            return run
+        if await self.runs.count_documents({"status": "running"}, limit=1):
+            return None
+        return await self.create_run(started_by)
+
+    async def summary(self, run_id: Optional[str] = None, issue_limit: int = 100) -> Optional[dict]:
+        """ملخص تشغيل (الأحدث افتراضياً) مع أول النتائج"""
+        query = {"id": run_id} if run_id else {}
+        run = await self.runs.find_one(query, {"_id": 0, "shards": 0}, sort=[("started_at", -1)])
+        if not run:
+            return None
+        issues = []
+        if issue_limit:
+            issues = await self.reports.find(
+                {"run_id": run["id"]}, {"_id": 0, "run_id": 0}
+            ).sort("_id", 1).limit(issue_limit).to_list(issue_limit)
+        return {
+            "integrity_check_completed": run["status"] != "running",
+            "run_id": run["id"],
+            "status": run["status"],
+            "started_at": run["started_at"],
+            "finished_at": run.get("finished_at"),
+            "scanned": run["scanned"],
+            "issues_found": run["issues_found"],
+            "issues": issues
+        }
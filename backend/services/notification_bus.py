@@ -0,0 +1,276 @@
+# Notification Bus - توزيع الإشعارات الفورية بين العمليات
+# Medical Management System - Pub/sub fan-out for WebSocket notifications
+#
+# Each worker keeps the WebSocket connections it accepted in a
+# ConnectionRegistry (several per user: tabs, phone and desktop). Services
+# never send to sockets directly; they publish (user_id, message) pairs on
+# the bus and every worker delivers them to whatever local connections it
+# holds for those users. Delivery only enqueues: each connection has a
+# bounded send buffer drained by its own task, with a shared cap on
+# concurrent sends, so one slow socket cannot stall a broadcast.
+#
+#   memory - single process, publish delivers locally (development, one worker)
+#   mongo  - a capped collection every worker tails; works on a standalone
+#            server, unlike change streams which need a replica set
+#
+# NOTIFICATION_BUS selects the implementation (default: mongo).
+
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import CursorType
+
+NOTIFICATION_EVENTS_COLLECTION = "notification_events"
+NOTIFICATION_EVENTS_SIZE_MB = int(os.environ.get('NOTIFICATION_EVENTS_SIZE_MB', '64'))
+# عدد التسليمات في مستند حدث واحد - keeps role-wide broadcasts to a few inserts
+EVENT_DELIVERIES_PER_DOCUMENT = 500
+
+# (user_id, message) - the message must already be JSON-ready (no datetimes)
+Delivery = Tuple[str, Dict[str, Any]]
+
+
+class ConnectionSender:
+    """صندوق إرسال لاتصال واحد - a bounded queue drained by the connection's own task
+
+    A slow socket only backs up its own queue. When the queue is full the
+    registry's policy applies: "drop" discards the oldest queued message,
+    "disconnect" closes the socket so the client reconnects and reloads.
+    """
+
+    def __init__(self, registry: "ConnectionRegistry", user_id: str, websocket):
+        self.registry = registry
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(registry.buffer_size)
+        self.task = asyncio.create_task(self._run())
+
+    def offer(self, message: Dict[str, Any]):
+        stats = self.registry.stats
+        if self.queue.full():
+            if self.registry.slow_consumer_policy == "disconnect":
+                self.registry.disconnect(self.user_id, self.websocket)
+                return
+            self.queue.get_nowait()
+            stats["dropped"] += 1
+        self.queue.put_nowait(message)
+        stats["queued"] += 1
+
+    async def _run(self):
+        registry = self.registry
+        while True:
+            message = await self.queue.get()
+            async with registry._send_slots:
+                try:
+                    await asyncio.wait_for(self.websocket.send_json(message), registry.send_timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    registry.stats["failed"] += 1
+                    registry.disconnect(self.user_id, self.websocket)
+                    return
+            registry.stats["sent"] += 1
+
+
+class ConnectionRegistry:
+    """اتصالات WebSocket المحلية لكل مستخدم - several connections per user, each with its own sender"""
+
+    def __init__(self, buffer_size: int = 100, send_concurrency: int = 200, send_timeout: float = 5.0,
+                 slow_consumer_policy: str = "drop"):
+        if slow_consumer_policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
+        self.buffer_size = buffer_size
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self._send_slots = asyncio.Semaphore(send_concurrency)
+        self._connections: Dict[str, Dict[Any, ConnectionSender]] = defaultdict(dict)
+        self.stats = {"queued": 0, "sent": 0, "dropped": 0, "failed": 0, "disconnected": 0}
+
+    def add(self, user_id: str, websocket):
+        self._connections[user_id][websocket] = ConnectionSender(self, user_id, websocket)
+
+    def remove(self, user_id: str, websocket) -> Optional[ConnectionSender]:
+        connections = self._connections.get(user_id)
+        if connections is None:
+            return None
+        sender = connections.pop(websocket, None)
+        if not connections:
+            del self._connections[user_id]
+        if sender is not None and sender.task is not asyncio.current_task():
+            sender.task.cancel()
+        return sender
+
+    def disconnect(self, user_id: str, websocket):
+        """فصل مستهلك بطيء أو معطل - the client is expected to reconnect"""
+        if self.remove(user_id, websocket) is None:
+            return
+        self.stats["disconnected"] += 1
+        asyncio.create_task(self._close(websocket))
+
+    @staticmethod
+    async def _close(websocket):
+        try:
+            # 1013: حاول لاحقاً
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def connections_for(self, user_id: str) -> List[Any]:
+        return list(self._connections.get(user_id, ()))
+
+    async def deliver(self, deliveries: List[Delivery]):
+        """وضع الرسائل في صناديق الاتصالات المحلية - never waits on a socket"""
+        for user_id, message in deliveries:
+            for sender in list(self._connections.get(user_id, {}).values()):
+                sender.offer(message)
+
+    def snapshot(self) -> Dict[str, int]:
+        senders = [sender for connections in self._connections.values() for sender in connections.values()]
+        return {
+            **self.stats,
+            "pending": sum(sender.queue.qsize() for sender in senders),
+            "users": len(self._connections),
+            "connections": len(senders)
+        }
+
+
+class NotificationBus(ABC):
+    """واجهة النشر والاشتراك - publish on any worker, deliver on every worker"""
+
+    def __init__(self, registry: ConnectionRegistry):
+        self.registry = registry
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, deliveries: List[Delivery]):
+        """نشر التسليمات لكل العمليات"""
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"bus": type(self).__name__, "connections": self.registry.snapshot()}
+
+
+class InMemoryNotificationBus(NotificationBus):
+    """عملية واحدة - publishing is local delivery"""
+
+    async def publish(self, deliveries: List[Delivery]):
+        await self.registry.deliver(deliveries)
+
+
+class MongoNotificationBus(NotificationBus):
+    """ناقل عبر مجموعة محدودة الحجم - every worker tails notification_events
+
+    Workers start tailing after the newest event at startup, so a restarted
+    worker does not replay old notifications; clients reload the list on
+    reconnect anyway. Old events fall off the capped collection by size.
+
+    The tail resumes in $natural (insertion) order after the last event it
+    delivered. ObjectIds from different workers are not ordered by insertion,
+    so an _id $gt filter could skip events.
+    """
+
+    def __init__(self, registry: ConnectionRegistry, size_mb: int = NOTIFICATION_EVENTS_SIZE_MB):
+        super().__init__(registry)
+        self.size_mb = size_mb
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"published": 0, "received": 0, "tail_restarts": 0}
+
+    async def _ensure_collection(self, db: AsyncIOMotorDatabase):
+        if NOTIFICATION_EVENTS_COLLECTION not in await db.list_collection_names():
+            try:
+                await db.create_collection(
+                    NOTIFICATION_EVENTS_COLLECTION, capped=True, size=self.size_mb * 1024 * 1024
+                )
+            except Exception as e:
+                # عامل آخر أنشأها في نفس اللحظة
+                print(f"⚠️ Notification events collection not created: {str(e)}")
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        if self._task is not None:
+            return
+        await self._ensure_collection(db)
+        newest = await db[NOTIFICATION_EVENTS_COLLECTION].find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        self._db = db
+        self._task = asyncio.create_task(self._tail(newest["_id"] if newest else None))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def publish(self, deliveries: List[Delivery]):
+        if not deliveries:
+            return
+        if self._db is None:
+            # الناقل لم يبدأ (سكربت أو اختبار) - تسليم محلي
+            await self.registry.deliver(deliveries)
+            return
+        now = datetime.utcnow()
+        events = [
+            {"deliveries": deliveries[i:i + EVENT_DELIVERIES_PER_DOCUMENT], "created_at": now}
+            for i in range(0, len(deliveries), EVENT_DELIVERIES_PER_DOCUMENT)
+        ]
+        await self._db[NOTIFICATION_EVENTS_COLLECTION].insert_many(events)
+        self.stats["published"] += len(deliveries)
+
+    async def _tail(self, last_id):
+        events = self._db[NOTIFICATION_EVENTS_COLLECTION]
+        failing = False
+        while True:
+            try:
+                # آخر حدث مسلم خرج من المجموعة المحدودة - كل ما بقي أحدث منه
+                skipping = last_id is not None and await events.find_one({"_id": last_id}, {"_id": 1}) is not None
+                cursor = events.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        if skipping:
+                            skipping = event["_id"] != last_id
+                            continue
+                        last_id = event["_id"]
+                        self.stats["received"] += len(event["deliveries"])
+                        await self.registry.deliver(event["deliveries"])
+                    # الحدث خرج أثناء المسح - تسليم ما يصل بعد الآن
+                    skipping = False
+                failing = False
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not failing:
+                    print(f"⚠️ Notification bus tail failed: {str(e)}")
+                failing = True
+            # المؤشر ينتهي على مجموعة فارغة أو بعد خطأ - إعادة الفتح بعد مهلة
+            self.stats["tail_restarts"] += 1
+            await asyncio.sleep(1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**super().snapshot(), **self.stats, "running": self._task is not None}
+
+
+def create_notification_bus(kind: str, registry: ConnectionRegistry) -> NotificationBus:
+    if kind == "memory":
+        return InMemoryNotificationBus(registry)
+    if kind == "mongo":
+        return MongoNotificationBus(registry)
+    raise ValueError(f"Unknown NOTIFICATION_BUS: {kind}")
+
+
+connection_registry = ConnectionRegistry(
+    buffer_size=int(os.environ.get('NOTIFICATION_SEND_BUFFER', '100')),
+    send_concurrency=int(os.environ.get('NOTIFICATION_SEND_CONCURRENCY', '200')),
+    send_timeout=float(os.environ.get('NOTIFICATION_SEND_TIMEOUT_SECONDS', '5')),
+    slow_consumer_policy=os.environ.get('NOTIFICATION_SLOW_CONSUMER_POLICY', 'drop').lower()
+)
+notification_bus = create_notification_bus(os.environ.get('NOTIFICATION_BUS', 'mongo').lower(), connection_registry)
@@ -0,0 +1,129 @@
+# Notification Counters - عدادات الإشعارات غير المقروءة
+# Medical Management System - Per-user unread counters kept next to the notifications
+#
+# Every write that changes a notification's unread state adjusts the
+# recipient's counter with $inc after the notification write, and pushes the
+# new value over the notification bus so clients can stop polling. A missing
+# counter is initialised once by counting the user's unread notifications.
+# Counters can drift (a crash between the two writes); reconcile()
+# recomputes them all and runs from scripts/reconcile_notification_counters.py.
+
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from services.notification_bus import NotificationBus, notification_bus
+
+NOTIFICATION_COUNTERS_COLLECTION = "notification_counters"
+
+
+def unread_count_message(unread: int) -> dict:
+    """رسالة WebSocket بعدد غير المقروء"""
+    return {"event": "unread_count", "unread_count": max(0, unread)}
+
+
+class UnreadCounters:
+    """عدادات غير المقروء لكل مستخدم"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, bus: NotificationBus = notification_bus):
+        self.db = db
+        self.counters = db[NOTIFICATION_COUNTERS_COLLECTION]
+        self.bus = bus
+
+    async def _initialize(self, user_ids: List[str]) -> Dict[str, int]:
+        """تهيئة العدادات المفقودة من الإشعارات نفسها"""
+        pipeline = [
+            {"$match": {"recipient_id": {"$in": user_ids}, "status": "unread"}},
+            {"$group": {"_id": "$recipient_id", "unread": {"$sum": 1}}}
+        ]
+        counted = {row["_id"]: row["unread"] async for row in self.db.notifications.aggregate(pipeline)}
+        try:
+            await self.counters.bulk_write([
+                UpdateOne({"user_id": user_id},
+                          {"$setOnInsert": {"unread": counted.get(user_id, 0), "updated_at": datetime.utcnow()}},
+                          upsert=True)
+                for user_id in user_ids
+            ], ordered=False)
+        except BulkWriteError as e:
+            # تهيئة متزامنة من طلب آخر - القيمة الموجودة هي الصحيحة
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        return {counter["user_id"]: counter["unread"] async for counter in self.counters.find(
+            {"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "unread": 1}
+        )}
+
+    async def get(self, user_id: str) -> int:
+        counter = await self.counters.find_one({"user_id": user_id}, {"_id": 0, "unread": 1})
+        if counter is None:
+            return max(0, (await self._initialize([user_id])).get(user_id, 0))
+        return max(0, counter["unread"])
+
+    async def add(self, user_id: str, delta: int) -> int:
+        """تعديل عداد مستخدم واحد بعد كتابة الإشعار - returns and pushes the new value"""
+        if delta == 0:
+            return await self.get(user_id)
+        counter = await self.counters.find_one_and_update(
+            {"user_id": user_id},
+            {"$inc": {"unread": delta}, "$set": {"updated_at": datetime.utcnow()}},
+            projection={"_id": 0, "unread": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        # العداد غير موجود: العد من الإشعارات يتضمن هذه الكتابة بالفعل
+        unread = counter["unread"] if counter else (await self._initialize([user_id])).get(user_id, 0)
+        await self._push({user_id: unread})
+        return max(0, unread)
+
+    async def add_many(self, user_ids: Iterable[str]):
+        """زيادة عدادات عدة مستلمين (إشعار جماعي) بكتابة واحدة"""
+        increments = Counter(user_ids)
+        if not increments:
+            return
+        now = datetime.utcnow()
+        await self.counters.bulk_write([
+            UpdateOne({"user_id": user_id}, {"$inc": {"unread": count}, "$set": {"updated_at": now}})
+            for user_id, count in increments.items()
+        ], ordered=False)
+        values = {counter["user_id"]: counter["unread"] async for counter in self.counters.find(
+            {"user_id": {"$in": list(increments)}}, {"_id": 0, "user_id": 1, "unread": 1}
+        )}
+        missing = [user_id for user_id in increments if user_id not in values]
+        if missing:
+            values.update(await self._initialize(missing))
+        await self._push(values)
+
+    async def _push(self, values: Dict[str, int]):
+        try:
+            await self.bus.publish([(user_id, unread_count_message(unread)) for user_id, unread in values.items()])
+        except Exception as e:
+            print(f"⚠️ Unread count push failed: {str(e)}")
+
+    async def reconcile(self) -> Dict[str, int]:
+        """إعادة حساب كل العدادات من الإشعارات - run off-peak
+
+        Only counters that differ are written. An increment that lands
+        between the aggregation and the correction of the same user's
+        counter is overwritten; the next run corrects it.
+        """
+        now = datetime.utcnow()
+        pipeline = [
+            {"$match": {"status": "unread"}},
+            {"$group": {"_id": "$recipient_id", "unread": {"$sum": 1}}}
+        ]
+        actual = {row["_id"]: row["unread"] async for row in self.db.notifications.aggregate(pipeline, allowDiskUse=True)}
+        stored = {counter["user_id"]: counter["unread"] async for counter in self.counters.find(
+            {}, {"_id": 0, "user_id": 1, "unread": 1}
+        )}
+
+        corrections = [
+            UpdateOne({"user_id": user_id}, {"$set": {"unread": unread, "updated_at": now}}, upsert=True)
+            for user_id, unread in actual.items() if stored.get(user_id) != unread
+        ] + [
+            UpdateOne({"user_id": user_id}, {"$set": {"unread": 0, "updated_at": now}})
+            for user_id, unread in stored.items() if user_id not in actual and unread != 0
+        ]
+        for i in range(0, len(corrections), 1000):
+            await self.counters.bulk_write(corrections[i:i + 1000], ordered=False)
+        return {"counters": len(stored), "users_with_unread": len(actual), "corrected": len(corrections)}
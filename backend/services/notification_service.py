@@ -7,12 +7,19 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from models.notification_models import *
 from models.all_models import User
+from pymongo import ReturnDocument
+from services.notification_bus import connection_registry, notification_bus
+from services.notification_counters import UnreadCounters
+from services.pagination import paginate
 
 class NotificationService:
     def __init__(self, db):
         self.db = db
         self.logger = logging.getLogger(__name__)
-        self.active_connections: Dict[str, Any] = {}  # WebSocket connections
+        # الاتصالات محلية لكل عامل، والتسليم عبر الناقل ليصل لكل العمال
+        self.connections = connection_registry
+        self.bus = notification_bus
+        self.unread = UnreadCounters(db, notification_bus)
         
     async def create_notification(self, notification_data: NotificationCreate) -> Notification:
         """إنشاء إشعار جديد"""
@@ -21,6 +28,7 @@ class NotificationService:
             
             # حفظ في قاعدة البيانات
             await self.db.notifications.insert_one(notification.dict())
+            await self.unread.add(notification.recipient_id, 1)
             
             # إرسال الإشعار الفوري
             await self._send_real_time_notification(notification)
@@ -43,8 +51,8 @@ class NotificationService:
             if bulk_data.recipient_roles:
                 role_users = await self.db.users.find(
                     {"role": {"$in": bulk_data.recipient_roles}},
-                    {"id": 1}
-                ).to_list(1000)
+                    {"_id": 0, "id": 1}
+                ).to_list(None)
                 recipients.update([user["id"] for user in role_users])
             
             # إنشاء إشعار لكل مستلم
@@ -59,17 +67,16 @@ class NotificationService:
                     metadata=bulk_data.metadata or {},
                     action_url=bulk_data.action_url
                 )
-                notifications.append(notification.dict())
+                notifications.append(notification)
                 notification_ids.append(notification.id)
             
             # حفظ جميع الإشعارات
             if notifications:
-                await self.db.notifications.insert_many(notifications)
+                await self.db.notifications.insert_many([n.dict() for n in notifications], ordered=False)
+                await self.unread.add_many(n.recipient_id for n in notifications)
                 
-                # إرسال الإشعارات الفورية
-                for notification_dict in notifications:
-                    notification = Notification(**notification_dict)
-                    await self._send_real_time_notification(notification)
+                # إرسال الإشعارات الفورية - نشر واحد لكل المستلمين، والإرسال الفعلي في الخلفية
+                await self._send_real_time_notifications(notifications)
             
             self.logger.info(f"Created {len(notification_ids)} bulk notifications")
             return notification_ids
@@ -107,27 +114,23 @@ class NotificationService:
                     {"message": {"$regex": filter_params.search, "$options": "i"}}
                 ]
             
-            # الحصول على العدد الإجمالي
-            total_count = await self.db.notifications.count_documents(query)
-            
-            # الحصول على الإشعارات مع الترقيم
-            notifications = await self.db.notifications.find(query, {"_id": 0}) \
-                .sort("created_at", -1) \
-                .skip(filter_params.offset) \
-                .limit(filter_params.limit) \
-                .to_list(filter_params.limit)
+            # الحصول على الإشعارات بالمؤشر - العدد الإجمالي في الصفحة الأولى فقط
+            page = await paginate(
+                self.db.notifications, query, [("created_at", -1)], filter_params.limit,
+                cursor=filter_params.cursor, offset=filter_params.offset,
+                projection={"_id": 0}, total=filter_params.total
+            )
             
-            # إحصائيات سريعة
-            unread_count = await self.db.notifications.count_documents({
-                "recipient_id": user_id,
-                "status": "unread"
-            })
+            # إحصائيات سريعة - من العداد بدل العد
+            unread_count = await self.unread.get(user_id)
             
             return {
-                "notifications": notifications,
-                "total_count": total_count,
+                "notifications": page["items"],
+                "total_count": page["total_count"],
+                "total_is_estimate": page["total_is_estimate"],
                 "unread_count": unread_count,
-                "has_more": (filter_params.offset + len(notifications)) < total_count,
+                "has_more": page["has_more"],
+                "next_cursor": page["next_cursor"],
                 "filter_applied": filter_params.dict()
             }
             
@@ -138,16 +141,10 @@ class NotificationService:
     async def mark_as_read(self, notification_id: str, user_id: str) -> bool:
         """تحديد الإشعار كمقروء"""
         try:
-            result = await self.db.notifications.update_one(
-                {"id": notification_id, "recipient_id": user_id},
-                {
-                    "$set": {
-                        "status": "read",
-                        "read_at": datetime.utcnow()
-                    }
-                }
-            )
-            return result.modified_count > 0
+            return await self._change_status(notification_id, user_id, {
+                "status": "read",
+                "read_at": datetime.utcnow()
+            })
         except Exception as e:
             self.logger.error(f"Error marking notification as read: {e}")
             return False
@@ -164,6 +161,7 @@ class NotificationService:
                     }
                 }
             )
+            await self.unread.add(user_id, -result.modified_count)
             return result.modified_count
         except Exception as e:
             self.logger.error(f"Error marking all notifications as read: {e}")
@@ -172,20 +170,28 @@ class NotificationService:
     async def dismiss_notification(self, notification_id: str, user_id: str) -> bool:
         """إلغاء الإشعار"""
         try:
-            result = await self.db.notifications.update_one(
-                {"id": notification_id, "recipient_id": user_id},
-                {
-                    "$set": {
-                        "status": "dismissed",
-                        "dismissed_at": datetime.utcnow()
-                    }
-                }
-            )
-            return result.modified_count > 0
+            return await self._change_status(notification_id, user_id, {
+                "status": "dismissed",
+                "dismissed_at": datetime.utcnow()
+            })
         except Exception as e:
             self.logger.error(f"Error dismissing notification: {e}")
             return False
 
+    async def _change_status(self, notification_id: str, user_id: str, changes: Dict[str, Any]) -> bool:
+        """تغيير حالة إشعار وتحديث العداد إذا كان غير مقروء قبل التغيير"""
+        previous = await self.db.notifications.find_one_and_update(
+            {"id": notification_id, "recipient_id": user_id},
+            {"$set": changes},
+            projection={"_id": 0, "status": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is None:
+            return False
+        if previous.get("status") == "unread":
+            await self.unread.add(user_id, -1)
+        return True
+
     async def get_notification_stats(self, user_id: str) -> NotificationStats:
         """الحصول على إحصائيات الإشعارات"""
         try:
@@ -329,33 +335,35 @@ class NotificationService:
 
     async def _send_real_time_notification(self, notification: Notification):
         """إرسال الإشعار الفوري عبر WebSocket"""
+        await self._send_real_time_notifications([notification])
+
+    async def _send_real_time_notifications(self, notifications: List[Notification]):
+        """نشر الإشعارات على الناقل - every worker delivers to its own connections"""
         try:
-            real_time_notification = RealTimeNotification(
-                notification_id=notification.id,
-                type=notification.type,
-                title=notification.title,
-                message=notification.message,
-                priority=notification.priority,
-                timestamp=notification.created_at,
-                metadata=notification.metadata
-            )
-            
-            # إرسال للمستخدم المحدد إذا كان متصلاً
-            if notification.recipient_id in self.active_connections:
-                connection = self.active_connections[notification.recipient_id]
-                await connection.send_json(real_time_notification.dict())
+            deliveries = [
+                (notification.recipient_id, RealTimeNotification(
+                    notification_id=notification.id,
+                    type=notification.type,
+                    title=notification.title,
+                    message=notification.message,
+                    priority=notification.priority,
+                    timestamp=notification.created_at,
+                    metadata=notification.metadata
+                ).model_dump(mode="json"))
+                for notification in notifications
+            ]
+            await self.bus.publish(deliveries)
                 
         except Exception as e:
             self.logger.error(f"Error sending real-time notification: {e}")
 
     def add_connection(self, user_id: str, websocket):
-        """إضافة اتصال WebSocket"""
-        self.active_connections[user_id] = websocket
+        """إضافة اتصال WebSocket - a user may hold several"""
+        self.connections.add(user_id, websocket)
 
-    def remove_connection(self, user_id: str):
+    def remove_connection(self, user_id: str, websocket):
         """إزالة اتصال WebSocket"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+        self.connections.remove(user_id, websocket)
 
     async def cleanup_old_notifications(self, days_old: int = 30):
         """تنظيف الإشعارات القديمة"""
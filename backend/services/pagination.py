@@ -0,0 +1,171 @@
+# Pagination - ترقيم الصفحات بالمؤشر
+# Medical Management System - Keyset (cursor) pagination for list endpoints
+#
+# A page is fetched with a range filter on the sort key instead of skip(), so
+# page 500 costs the same as page 1. The sort always ends with _id so the
+# position is unique; the cursor is the last row's sort values, opaque to
+# clients (base64 JSON). Totals are optional: "estimate" (default) counts
+# only on the first page and caps filtered counts, "exact" counts every
+# page, "none" never counts.
+#
+# Legacy offset parameters still work (offset without a cursor), so existing
+# clients keep paging while new ones follow next_cursor.
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+# حد العد التقريبي مع الفلاتر - beyond this the total is reported as a lower bound
+ESTIMATE_COUNT_CAP = 10000
+TOTAL_MODES = ("estimate", "exact", "none")
+
+SortSpec = List[Tuple[str, int]]
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$d": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return {"$o": str(value)}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "$d" in value:
+            return datetime.fromisoformat(value["$d"])
+        if "$o" in value:
+            return ObjectId(value["$o"])
+    return value
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """مؤشر غير شفاف من قيم الترتيب لآخر صف"""
+    raw = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """فك المؤشر - ValueError when it was not produced for this sort"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return [_decode_value(value) for value in values]
+
+
+def _field_value(document: dict, field: str) -> Any:
+    for part in field.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _after(field: str, direction: int, value: Any) -> Optional[dict]:
+    """شرط "بعد القيمة" بترتيب الحقل - None sorts lowest, as in MongoDB"""
+    if value is None:
+        return {field: {"$ne": None}} if direction == 1 else None
+    if direction == 1:
+        return {field: {"$gt": value}}
+    # القيم الفارغة تأتي بعد كل القيم في الترتيب التنازلي
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def keyset_filter(sort: SortSpec, values: List[Any]) -> dict:
+    """فلتر الصفوف التي تلي المؤشر - (a > x) or (a = x and b > y) or ..."""
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        after = _after(field, direction, values[i])
+        if after is None:
+            continue
+        equal = {sort[j][0]: values[j] for j in range(i)}
+        branches.append({"$and": [equal, after]} if equal else after)
+    return {"$or": branches} if branches else {"_id": {"$exists": False}}
+
+
+def _cursor_projection(projection: Optional[dict], sort: SortSpec) -> Tuple[Optional[dict], List[str]]:
+    if projection is None:
+        return None, []
+    fetch = dict(projection)
+    inclusive = any(value for key, value in fetch.items() if key != "_id")
+    hidden = []
+    for field, _ in sort:
+        if field == "_id":
+            if not fetch.pop("_id", 1):
+                hidden.append(field)
+        elif field in fetch and not fetch[field]:
+            del fetch[field]
+            hidden.append(field)
+        elif inclusive and field not in fetch:
+            fetch[field] = 1
+            hidden.append(field)
+    return fetch or None, hidden
+
+
+def with_tiebreaker(sort: SortSpec) -> SortSpec:
+    return sort if sort and sort[-1][0] == "_id" else [*sort, ("_id", sort[-1][1] if sort else -1)]
+
+
+async def count_total(collection: AsyncIOMotorCollection, query: dict, total: str) -> Tuple[Optional[int], bool]:
+    """العدد الإجمالي حسب الوضع - (count, is_estimate)"""
+    if total == "none":
+        return None, False
+    if total == "exact":
+        return await collection.count_documents(query), False
+    if not query:
+        return await collection.estimated_document_count(), True
+    count = await collection.count_documents(query, limit=ESTIMATE_COUNT_CAP)
+    return count, count >= ESTIMATE_COUNT_CAP
+
+
+async def paginate(collection: AsyncIOMotorCollection, query: dict, sort: SortSpec, limit: int,
+                   cursor: Optional[str] = None, offset: int = 0, projection: Optional[dict] = None,
+                   total: str = "estimate") -> Dict[str, Any]:
+    """صفحة واحدة بالمؤشر (أو بالإزاحة للعملاء القدامى)
+
+    Returns items, next_cursor (None on the last page), has_more,
+    total_count (None when not counted) and total_is_estimate. Raises
+    ValueError for an invalid cursor or total mode.
+    """
+    if total not in TOTAL_MODES:
+        raise ValueError(f"total must be one of {', '.join(TOTAL_MODES)}")
+    sort = with_tiebreaker(sort)
+
+    page_query = query
+    if cursor:
+        after = keyset_filter(sort, decode_cursor(cursor, len(sort)))
+        page_query = {"$and": [query, after]} if query else after
+
+    # _id وحقول الترتيب مطلوبة لبناء المؤشر، وتحذف بعده إن لم تكن مطلوبة
+    fetch_projection, hidden = _cursor_projection(projection, sort)
+
+    find = collection.find(page_query, fetch_projection).sort(sort)
+    if offset and not cursor:
+        find = find.skip(offset)
+    items = await find.limit(limit + 1).to_list(limit + 1)
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = encode_cursor([_field_value(items[-1], field) for field, _ in sort]) if has_more else None
+    for item in items:
+        for field in hidden:
+            item.pop(field, None)
+
+    total_count, is_estimate = (None, False)
+    if total == "exact" or not cursor:
+        total_count, is_estimate = await count_total(collection, query, total)
+
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+        "total_count": total_count,
+        "total_is_estimate": is_estimate
+    }
@@ -0,0 +1,276 @@
+# Payment Engine - ترحيل دفعات الديون
+# Medical Management System - Transactional debt payment posting
+#
+# A payment is four writes: the payment row, its financial transaction, and
+# targeted $inc/$push updates on the debt and its invoice. The debt is never
+# rewritten as a whole, so long payment histories cost nothing and two
+# concurrent payments both land. The debt update only matches while the
+# outstanding amount still covers the payment, which makes overpayment
+# impossible even under concurrency.
+#
+# On a replica set or mongos the writes run in one session transaction
+# (with_transaction retries transient write conflicts). On a standalone
+# server, where transactions are unavailable, the debt update is the commit
+# point: the payment and transaction rows written before it are removed if
+# it is rejected. PAYMENT_TRANSACTIONS=auto|on|off overrides the detection.
+#
+# An idempotency key (Idempotency-Key header) is stored on the payment under
+# a unique index; a retried request returns the original payment instead of
+# posting twice.
+
+import os
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+from enum import Enum
+from typing import Any, Dict, Optional
+from bson import Decimal128
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models.financial_models import (
+    DebtPaymentRecord, FinancialTransaction, MoneyAmount, AuditTrail,
+    DebtStatus, InvoiceStatus, TransactionType
+)
+from services.dashboard_service import invalidate_dashboard
+from services.document_numbers import document_number_allocator
+
+PAYMENT_TRANSACTIONS = os.environ.get('PAYMENT_TRANSACTIONS', 'auto').lower()
+# تسامح التسوية - matches IntegratedDebtRecord.add_payment
+SETTLEMENT_TOLERANCE = Decimal128("0.01")
+
+_transactions_supported: Optional[bool] = None
+
+
+class IdempotencyConflict(ValueError):
+    """مفتاح التكرار استخدم لدفعة مختلفة"""
+
+
+def to_mongo(value: Any) -> Any:
+    """تحويل قيم النماذج إلى أنواع BSON - Decimal128 money, datetime for dates"""
+    if isinstance(value, dict):
+        return {key: to_mongo(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_mongo(item) for item in value]
+    if isinstance(value, Decimal):
+        return Decimal128(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+def _decimal(value: Any) -> Decimal:
+    return Decimal(str(value if value is not None else "0.00"))
+
+
+async def transactions_supported(db: AsyncIOMotorDatabase) -> bool:
+    """هل يدعم الخادم المعاملات؟ - replica set member or mongos (checked once)"""
+    global _transactions_supported
+    if PAYMENT_TRANSACTIONS != "auto":
+        return PAYMENT_TRANSACTIONS == "on"
+    if _transactions_supported is None:
+        try:
+            hello = await db.client.admin.command("hello")
+            _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception as e:
+            print(f"⚠️ Transaction support check failed, posting without transactions: {str(e)}")
+            _transactions_supported = False
+    return _transactions_supported
+
+
+class PaymentEngine:
+    """محرك ترحيل الدفعات - Debt payment posting"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def post_debt_payment(
+        self,
+        debt_id: str,
+        amount: Decimal,
+        payment_method: str,
+        processed_by: str,
+        payment_date: Optional[date] = None,
+        reference_number: Optional[str] = None,
+        notes: Optional[str] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """ترحيل دفعة على دين - raises ValueError for invalid payments"""
+        amount = Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        if amount <= 0:
+            raise ValueError("مبلغ الدفعة يجب أن يكون أكبر من صفر")
+
+        if idempotency_key:
+            replay = await self._replay(idempotency_key, debt_id, amount)
+            if replay:
+                return replay
+
+        debt = await self.db.debts.find_one(
+            {"id": debt_id},
+            {"_id": 0, "id": 1, "debt_number": 1, "invoice_id": 1, "outstanding_amount": 1}
+        )
+        if not debt:
+            raise ValueError("سجل الدين غير موجود")
+        if amount > _decimal((debt.get("outstanding_amount") or {}).get("amount")):
+            raise ValueError("مبلغ الدفعة أكبر من المبلغ المتبقي")
+
+        user = await self.db.users.find_one({"id": processed_by}, {"_id": 0, "full_name": 1})
+        processed_by_name = (user or {}).get("full_name", "")
+        payment_number, transaction_number = await document_number_allocator.next_numbers(self.db, "payments", 2)
+
+        payment = DebtPaymentRecord(
+            payment_number=payment_number,
+            debt_id=debt_id,
+            debt_number=debt.get("debt_number", ""),
+            amount=MoneyAmount(amount=amount, currency="EGP"),
+            payment_date=payment_date or date.today(),
+            payment_method=payment_method,
+            reference_number=reference_number,
+            processed_by=processed_by,
+            processed_by_name=processed_by_name,
+            notes=notes
+        )
+        payment.audit_trail.append(AuditTrail(
+            action="payment_processed",
+            user_id=processed_by,
+            user_name=processed_by_name,
+            timestamp=datetime.utcnow(),
+            after_values={"amount": str(amount), "method": payment_method}
+        ))
+        transaction = FinancialTransaction(
+            transaction_number=transaction_number,
+            transaction_type=TransactionType.DEBT_PAYMENT,
+            debt_id=debt_id,
+            payment_id=payment.id,
+            amount=payment.amount,
+            description=f"دفعة على الدين {payment.debt_number}",
+            reference=reference_number,
+            processed_by=processed_by,
+            processed_by_name=processed_by_name
+        )
+
+        payment_doc = to_mongo(payment.model_dump())
+        if idempotency_key:
+            payment_doc["idempotency_key"] = idempotency_key
+
+        try:
+            if await transactions_supported(self.db):
+                async with await self.db.client.start_session() as session:
+                    remaining = await session.with_transaction(
+                        lambda s: self._apply(debt, payment_doc, to_mongo(transaction.model_dump()), s)
+                    )
+            else:
+                remaining = await self._apply(debt, payment_doc, to_mongo(transaction.model_dump()), None)
+        except DuplicateKeyError as e:
+            if not idempotency_key or "idempotency_key" not in ((e.details or {}).get("keyPattern") or {}):
+                raise
+            # طلب متزامن بنفس المفتاح سبقنا - نعيد نتيجته
+            replay = await self._replay(idempotency_key, debt_id, amount)
+            if replay:
+                return replay
+            raise
+        invalidate_dashboard("debts", "payments")
+
+        return {
+            "success": True,
+            "payment_id": payment.id,
+            "payment_number": payment.payment_number,
+            "remaining_amount": float(remaining),
+            "fully_paid": remaining <= _decimal(SETTLEMENT_TOLERANCE),
+            "message": "تم تسجيل الدفعة بنجاح"
+        }
+
+    async def _apply(self, debt: dict, payment_doc: dict, transaction_doc: dict, session) -> Decimal:
+        """كتابات الدفعة - inside a transaction, or with the debt update as the commit point"""
+        amount = payment_doc["amount"]["amount"]
+        negative = Decimal128(-amount.to_decimal())
+        now = datetime.utcnow()
+
+        await self.db.payments.insert_one(payment_doc, session=session)
+        await self.db.financial_transactions.insert_one(transaction_doc, session=session)
+
+        try:
+            updated = await self.db.debts.find_one_and_update(
+                {"id": debt["id"], "outstanding_amount.amount": {"$gte": amount}},
+                {
+                    "$inc": {"paid_amount.amount": amount, "outstanding_amount.amount": negative},
+                    "$push": {"payments": payment_doc, "audit_trail": {"$each": payment_doc["audit_trail"]}},
+                    "$set": {"last_payment_date": payment_doc["payment_date"], "updated_at": now}
+                },
+                projection={"_id": 0, "outstanding_amount": 1},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            if updated is None:
+                raise ValueError("مبلغ الدفعة أكبر من المبلغ المتبقي")
+        except Exception:
+            if session is None:
+                # لا توجد معاملة - حذف ما كتب قبل نقطة الالتزام
+                await self.db.payments.delete_one({"id": payment_doc["id"]})
+                await self.db.financial_transactions.delete_one({"id": transaction_doc["id"]})
+            raise
+
+        # الحالة مشروطة بالرصيد نفسه فلا يهم ترتيب الدفعات المتزامنة
+        await self.db.debts.update_one(
+            {"id": debt["id"], "outstanding_amount.amount": {"$lte": SETTLEMENT_TOLERANCE}},
+            {"$set": {"status": DebtStatus.COLLECTED.value, "settlement_date": payment_doc["payment_date"]}},
+            session=session
+        )
+        await self.db.debts.update_one(
+            {"id": debt["id"], "outstanding_amount.amount": {"$gt": SETTLEMENT_TOLERANCE}},
+            {"$set": {"status": DebtStatus.PARTIALLY_COLLECTED.value}},
+            session=session
+        )
+
+        if debt.get("invoice_id"):
+            await self._apply_to_invoice(debt["invoice_id"], amount, negative, now, session)
+
+        return _decimal(updated["outstanding_amount"]["amount"])
+
+    async def _apply_to_invoice(self, invoice_id: str, amount: Decimal128, negative: Decimal128,
+                                now: datetime, session):
+        """تحديث الفاتورة المرتبطة بنفس الأسلوب"""
+        result = await self.db.invoices.update_one(
+            {"id": invoice_id},
+            {
+                "$inc": {"paid_amount.amount": amount, "outstanding_amount.amount": negative},
+                "$set": {"updated_at": now}
+            },
+            session=session
+        )
+        if not result.matched_count:
+            return
+        await self.db.invoices.update_one(
+            {"id": invoice_id, "outstanding_amount.amount": {"$lte": SETTLEMENT_TOLERANCE}},
+            {"$set": {"status": InvoiceStatus.PAID.value}},
+            session=session
+        )
+        await self.db.invoices.update_one(
+            {"id": invoice_id, "outstanding_amount.amount": {"$gt": SETTLEMENT_TOLERANCE}},
+            {"$set": {"status": InvoiceStatus.PARTIALLY_PAID.value}},
+            session=session
+        )
+
+    async def _replay(self, idempotency_key: str, debt_id: str, amount: Decimal) -> Optional[Dict[str, Any]]:
+        """نتيجة دفعة سابقة بنفس المفتاح - None when the key is new"""
+        payment = await self.db.payments.find_one(
+            {"idempotency_key": idempotency_key},
+            {"_id": 0, "id": 1, "payment_number": 1, "debt_id": 1, "amount": 1}
+        )
+        if not payment:
+            return None
+        if payment["debt_id"] != debt_id or _decimal(payment["amount"]["amount"]) != amount:
+            raise IdempotencyConflict("مفتاح التكرار مستخدم لدفعة مختلفة")
+        debt = await self.db.debts.find_one({"id": debt_id}, {"_id": 0, "outstanding_amount": 1})
+        remaining = _decimal(((debt or {}).get("outstanding_amount") or {}).get("amount"))
+        return {
+            "success": True,
+            "payment_id": payment["id"],
+            "payment_number": payment.get("payment_number"),
+            "remaining_amount": float(remaining),
+            "fully_paid": remaining <= _decimal(SETTLEMENT_TOLERANCE),
+            "replayed": True,
+            "message": "تم تسجيل الدفعة مسبقاً"
+        }
@@ -127,6 +127,23 @@ const ExcelManager = ({ dataType, title, icon, onImportComplete, className = ""
   };
 
   // استيراد البيانات
+  const waitForImportJob = async (backendUrl, jobId) => {
+    while (true) {
+      const { data } = await axios.get(
+        `${backendUrl}/api/excel/import/jobs/${jobId}`,
+        {
+          headers: {
+            'Authorization': `Bearer ${localStorage.getItem('access_token')}`
+          }
+        }
+      );
+      if (data.status === 'completed' || data.status === 'failed') {
+        return data;
+      }
+      await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleImport = async () => {
     if (!selectedFile) {
       alert('⚠️ يرجى اختيار ملف Excel للاستيراد');
@@ -152,10 +169,16 @@ const ExcelManager = ({ dataType, title, icon, onImportComplete, className = ""
         }
       );
 
-      setImportResult(response.data);
+      // متابعة مهمة الاستيراد حتى تنتهي
+      const job = await waitForImportJob(backendUrl, response.data.job_id);
+      if (job.status === 'failed') {
+        throw new Error(job.message);
+      }
+
+      setImportResult(job);
       
       // إشعار بالنجاح
-      alert(`✅ ${response.data.message}\nتم استيراد ${response.data.imported_count} عنصر`);
+      alert(`✅ ${job.message}\nتم استيراد ${job.imported_count} عنصر`);
       
       // إعادة تعيين النموذج
       setSelectedFile(null);
@@ -163,7 +186,7 @@ const ExcelManager = ({ dataType, title, icon, onImportComplete, className = ""
       
       // إشعار المكون الأب بالتحديث
       if (onImportComplete) {
-        onImportComplete(response.data);
+        onImportComplete(job);
       }
       
     } catch (error) {
@@ -337,6 +360,9 @@ const ExcelManager = ({ dataType, title, icon, onImportComplete, className = ""
                 <div className="text-sm text-green-800">
                   <div className="font-bold">✅ تم الاستيراد بنجاح!</div>
                   <div>عدد العناصر المستوردة: {importResult.imported_count}</div>
+                  {importResult.failed_rows > 0 && (
+                    <div>صفوف مرفوضة: {importResult.failed_rows}</div>
+                  )}
                   <div>الطريقة: {importResult.import_mode === 'append' ? 'إضافة' : 'استبدال'}</div>
                 </div>
               </div>
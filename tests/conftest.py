@@ -0,0 +1,60 @@
+"""
+Shared fixtures for the backend service tests - اختبارات خدمات الخادم
+
+Services are exercised against an in-memory Motor database (mongomock-motor),
+so no MongoDB server is needed:
+
+    python -m pytest -q tests
+
+Tests marked `mongodb` depend on server semantics mongomock does not have
+(Decimal128 comparison and $inc). They run against a real server when
+MONGO_TEST_URL is set and are skipped otherwise:
+
+    MONGO_TEST_URL=mongodb://localhost:27017 python -m pytest -q tests
+"""
+
+import os
+import sys
+import uuid
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mongodb: needs a real MongoDB server (MONGO_TEST_URL)")
+
+
+def pytest_collection_modifyitems(config, items):
+    if MONGO_TEST_URL:
+        return
+    skip = pytest.mark.skip(reason="MONGO_TEST_URL not set - mongomock has no Decimal128 arithmetic")
+    for item in items:
+        if "mongodb" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    """قاعدة بيانات جديدة لكل اختبار - a real server when MONGO_TEST_URL is set"""
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    if not MONGO_TEST_URL:
+        yield AsyncMongoMockClient()[name]
+        return
+
+    client = AsyncIOMotorClient(MONGO_TEST_URL)
+    yield client[name]
+    client.close()
+    with MongoClient(MONGO_TEST_URL) as sync_client:
+        sync_client.drop_database(name)
@@ -0,0 +1,76 @@
+"""
+Claims-path authentication tests - المصادقة (auth.py)
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import auth
+from auth import JWT_ALGORITHM, JWT_SECRET_KEY, PrincipalCache, get_current_user_claims, invalidate_user
+
+pytestmark = pytest.mark.anyio
+
+
+def credentials(issued: datetime, role: str = "admin") -> HTTPAuthorizationCredentials:
+    payload = {"user_id": "u1", "username": "ahmed", "role": role, "exp": issued + timedelta(hours=24)}
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=jwt.encode(payload, JWT_SECRET_KEY, JWT_ALGORITHM))
+
+
+def new_worker(monkeypatch, status_ttl_seconds: float = 5) -> PrincipalCache:
+    """عامل آخر - a process with its own, empty principal cache"""
+    cache = PrincipalCache(status_ttl_seconds=status_ttl_seconds)
+    monkeypatch.setattr(auth, "principal_cache", cache)
+    return cache
+
+
+@pytest.fixture
+async def user(db, monkeypatch):
+    new_worker(monkeypatch)
+    await db.users.insert_one({"id": "u1", "username": "ahmed", "role": "admin", "is_active": True})
+
+
+async def test_claims_are_trusted_for_an_active_user(db, user):
+    principal = await get_current_user_claims(credentials(datetime.utcnow()), db)
+    assert (principal["id"], principal["role"]) == ("u1", "admin")
+
+
+async def test_role_change_refuses_older_tokens_on_other_workers(db, user, monkeypatch):
+    token = credentials(datetime.utcnow() - timedelta(minutes=5))
+    await get_current_user_claims(token, db)
+
+    await db.users.update_one({"id": "u1"}, {"$set": {"role": "medical_rep"}})
+    await invalidate_user(db, "u1", expire_tokens=True)
+
+    new_worker(monkeypatch)
+    with pytest.raises(HTTPException) as refused:
+        await get_current_user_claims(token, db)
+    assert refused.value.status_code == 401
+
+    # تسجيل دخول جديد بعد التغيير
+    principal = await get_current_user_claims(credentials(datetime.utcnow() + timedelta(seconds=1), "medical_rep"), db)
+    assert principal["role"] == "medical_rep"
+
+
+async def test_deactivation_reaches_other_workers_after_the_status_ttl(db, user, monkeypatch):
+    token = credentials(datetime.utcnow())
+    new_worker(monkeypatch, status_ttl_seconds=0.05)
+    await get_current_user_claims(token, db)
+
+    # إيقاف من عامل آخر - this worker still holds the status it read
+    await db.users.update_one({"id": "u1"}, {"$set": {"is_active": False}})
+    assert (await get_current_user_claims(token, db))["id"] == "u1"
+
+    await asyncio.sleep(0.06)
+    with pytest.raises(HTTPException, match="deactivated"):
+        await get_current_user_claims(token, db)
+
+
+async def test_deleted_user_is_refused(db, user):
+    await db.users.delete_one({"id": "u1"})
+    with pytest.raises(HTTPException, match="not found"):
+        await get_current_user_claims(credentials(datetime.utcnow()), db)
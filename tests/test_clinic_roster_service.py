@@ -0,0 +1,94 @@
+"""
+Clinic roster tests - قائمة عيادات المندوب (services/clinic_roster_service.py)
+"""
+
+import asyncio
+from datetime import date
+
+import pytest
+
+from indexes import INDEX_REGISTRY
+from services.clinic_roster_service import ClinicRosterService, format_roster_etag, parse_roster_etag
+
+pytestmark = pytest.mark.anyio
+
+TODAY = date(2025, 6, 15)
+
+
+@pytest.fixture
+async def roster(db):
+    for collection in ("rep_clinic_roster", "rep_clinic_roster_state"):
+        await db[collection].create_indexes([spec.to_index_model() for spec in INDEX_REGISTRY[collection]])
+    await db.clinics.insert_one({"id": "c1", "name": "عيادة 1", "assigned_rep_id": "rep-1"})
+    return ClinicRosterService(db)
+
+
+def clinic_ids(result: dict) -> list:
+    return sorted(clinic["id"] for clinic in result["clinics"])
+
+
+async def test_first_fetch_is_full_and_same_version_is_not_modified(roster):
+    full = await roster.fetch("rep-1")
+    assert (full["delta"], full["not_modified"]) == (False, False)
+    assert clinic_ids(full) == ["c1"]
+
+    again = await roster.fetch("rep-1", since=full["version"])
+    assert again["not_modified"] and again["version"] == full["version"]
+
+
+async def test_delta_carries_only_changes_and_tombstones(roster, db):
+    version = (await roster.fetch("rep-1"))["version"]
+
+    await db.clinics.insert_one({"id": "c2", "name": "عيادة 2", "available_reps": ["rep-1"]})
+    await roster.sync_clinic("c2", ["clinics"])
+    await db.clinics.update_one({"id": "c1"}, {"$set": {"assigned_rep_id": "rep-2"}})
+    await roster.sync_clinic("c1", ["clinics"])
+
+    delta = await roster.fetch("rep-1", since=version)
+    assert delta["delta"] and delta["version"] > version
+    assert clinic_ids(delta) == ["c2"]
+    assert delta["removed"] == [{"source": "clinics", "id": "c1"}]
+
+    assert clinic_ids(await roster.fetch("rep-1")) == ["c2"]
+
+
+async def test_unknown_or_future_version_gets_a_full_fetch(roster):
+    version = (await roster.fetch("rep-1"))["version"]
+    future = await roster.fetch("rep-1", since=version + 10)
+    assert not future["delta"] and clinic_ids(future) == ["c1"]
+
+
+async def test_version_in_flight_holds_back_the_etag(roster):
+    version = (await roster.fetch("rep-1"))["version"]
+
+    reserved = await roster._reserve_version("rep-1")
+    assert reserved == version + 1
+    # الإصدار المحجوز لم يُكتب بعد - the ETag stays at the last complete version
+    assert (await roster.fetch("rep-1", since=version))["not_modified"]
+
+    await roster._release_version("rep-1", reserved)
+    assert (await roster.fetch("rep-1", since=version))["version"] == reserved
+
+
+async def test_concurrent_reservations_get_distinct_pending_versions(roster, db):
+    base = (await roster.fetch("rep-1"))["version"]
+
+    versions = await asyncio.gather(*[roster._reserve_version("rep-1") for _ in range(5)])
+
+    assert sorted(versions) == list(range(base + 1, base + 6))
+    state = await db.rep_clinic_roster_state.find_one({"rep_id": "rep-1"})
+    assert sorted(item["version"] for item in state["pending"]) == sorted(versions)
+    assert roster._watermark(state) == base
+
+
+async def test_reps_without_a_roster_reserve_nothing(roster):
+    assert await roster._reserve_version("rep-9") is None
+
+
+def test_etag_is_per_rep_and_per_day():
+    etag = format_roster_etag("rep-1", 7, TODAY)
+    assert parse_roster_etag(etag, "rep-1", TODAY) == 7
+    assert parse_roster_etag(f"W/{etag}", "rep-1", TODAY) == 7
+    assert parse_roster_etag(etag, "rep-2", TODAY) is None
+    assert parse_roster_etag(etag, "rep-1", date(2025, 6, 16)) is None
+    assert parse_roster_etag(None, "rep-1", TODAY) is None
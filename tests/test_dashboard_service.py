@@ -0,0 +1,90 @@
+"""
+Dashboard planner and snapshot cache tests - لوحة التحكم (services/dashboard_service.py)
+"""
+
+import pytest
+
+from services.dashboard_service import DashboardQueryPlanner, DashboardSnapshotCache
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed_visits(db):
+    await db.visits.insert_many([
+        {"id": "v1", "sales_rep_id": "rep-1", "effective": True},
+        {"id": "v2", "sales_rep_id": "rep-1", "effective": False},
+        {"id": "v3", "sales_rep_id": "rep-2", "effective": True},
+    ])
+
+
+async def test_shared_filter_runs_before_the_facet(db):
+    await seed_visits(db)
+    planner = DashboardQueryPlanner(db)
+    visits = planner.count("visits", {"sales_rep_id": "rep-1"})
+    effective = planner.count("visits", {"sales_rep_id": "rep-1", "effective": True})
+
+    shared, faceted, separate = planner._plan_collection("visits", [visits, effective])
+    assert shared == {"sales_rep_id": "rep-1"}
+    assert (faceted, separate) == ([visits, effective], [])
+
+    await planner.execute()
+    assert (visits.value, effective.value) == (2, 1)
+    assert planner.round_trips == 1
+
+
+async def test_indexed_metrics_keep_their_own_query(db):
+    await seed_visits(db)
+    planner = DashboardQueryPlanner(db)
+    total = planner.count("visits")
+    rep_visits = planner.count("visits", {"sales_rep_id": "rep-1"})
+    effective = planner.count("visits", {"effective": True})
+
+    shared, faceted, separate = planner._plan_collection("visits", [total, rep_visits, effective])
+    # sales_rep_id يقود فهرساً مسجلاً - effective does not
+    assert shared is None
+    assert (faceted, separate) == ([total, effective], [rep_visits])
+
+    await planner.execute()
+    assert (total.value, rep_visits.value, effective.value) == (3, 2, 2)
+    assert planner.round_trips == 2
+
+
+async def test_failed_query_raises_instead_of_returning_defaults(db):
+    planner = DashboardQueryPlanner(db)
+    planner.aggregate("visits", [{"$unknownStage": {}}])
+    with pytest.raises(Exception):
+        await planner.execute()
+
+
+async def test_failed_computation_is_not_cached():
+    cache = DashboardSnapshotCache()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise RuntimeError("connection reset")
+
+    async def working():
+        return {"total": 5}, ["visits"]
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_compute(("k",), failing)
+    assert await cache.get_or_compute(("k",), working) == {"total": 5}
+    assert calls == [1]
+
+
+async def test_stale_snapshot_is_served_when_the_refresh_fails():
+    cache = DashboardSnapshotCache(ttl_seconds=0, stale_seconds=300)
+
+    async def working():
+        return {"total": 5}, ["visits"]
+
+    async def failing():
+        raise RuntimeError("connection reset")
+
+    assert await cache.get_or_compute(("k",), working) == {"total": 5}
+    assert await cache.get_or_compute(("k",), failing) == {"total": 5}
+    with pytest.raises(RuntimeError):
+        await cache._inflight[("k",)]
+    # التحديث فشل - the previous snapshot is still served
+    assert await cache.get_or_compute(("k",), working) == {"total": 5}
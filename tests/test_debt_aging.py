@@ -0,0 +1,75 @@
+"""
+Debt aging tests - تقادم الديون (services/debt_aging.py)
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.debt_aging import (
+    AGING_BUCKETS, DEBT_DUE_FIELD, aging_category_filter, aging_for, overdue_filter, with_aging
+)
+
+AS_OF = datetime(2025, 6, 15, 14, 30)
+TODAY = datetime(2025, 6, 15)
+
+# (أيام التأخير، الشريحة) على حدود كل شريحة
+BOUNDARIES = [
+    (0, "current"), (1, "1-30"), (30, "1-30"), (31, "31-60"), (60, "31-60"),
+    (61, "61-90"), (90, "61-90"), (91, "90+"), (400, "90+")
+]
+
+
+@pytest.mark.parametrize("days, category", BOUNDARIES)
+def test_bucket_boundaries(days, category):
+    # وقت الاستحقاق خلال اليوم لا يغير العدد - calendar days
+    due = TODAY - timedelta(days=days) + timedelta(hours=23)
+    assert aging_for(due, AS_OF) == (days, category)
+
+
+def test_not_yet_due_and_missing_due_date_are_current():
+    assert aging_for(TODAY + timedelta(days=10), AS_OF) == (0, "current")
+    assert aging_for(None, AS_OF) == (0, "current")
+    assert aging_for("2025-06-14T08:00:00Z", AS_OF) == (1, "1-30")
+
+
+def test_with_aging_marks_pending_debts_overdue():
+    debt = with_aging({"status": "pending", DEBT_DUE_FIELD: TODAY - timedelta(days=5)}, AS_OF)
+    assert (debt["days_overdue"], debt["aging_category"], debt["status"]) == (5, "1-30", "overdue")
+
+
+def test_settled_debts_keep_their_stored_aging():
+    debt = {"status": "fully_collected", DEBT_DUE_FIELD: TODAY - timedelta(days=200),
+            "days_overdue": 12, "aging_category": "1-30"}
+    assert with_aging(dict(debt), AS_OF) == debt
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("days, category", BOUNDARIES)
+async def test_category_filter_matches_the_computed_bucket(db, days, category):
+    await db.debts.insert_many([
+        {"id": f"d{offset}", "status": "pending", DEBT_DUE_FIELD: TODAY - timedelta(days=offset)}
+        for offset, _ in BOUNDARIES
+    ] + [{"id": "settled", "status": "fully_collected", DEBT_DUE_FIELD: TODAY - timedelta(days=days)}])
+
+    matched = {debt["id"] for debt in await db.debts.find(aging_category_filter(category, as_of=AS_OF)).to_list(None)}
+
+    assert matched == {f"d{offset}" for offset, label in BOUNDARIES if label == category}
+
+
+@pytest.mark.anyio
+async def test_overdue_filter_excludes_current_and_settled_debts(db):
+    await db.debts.insert_many([
+        {"id": "due-today", "status": "pending", DEBT_DUE_FIELD: TODAY},
+        {"id": "late", "status": "pending", DEBT_DUE_FIELD: TODAY - timedelta(days=1)},
+        {"id": "settled", "status": "written_off", DEBT_DUE_FIELD: TODAY - timedelta(days=40)},
+    ])
+    matched = [debt["id"] for debt in await db.debts.find(overdue_filter(as_of=AS_OF)).to_list(None)]
+    assert matched == ["late"]
+
+
+def test_every_bucket_has_a_filter():
+    for _, category in AGING_BUCKETS:
+        assert aging_category_filter(category, as_of=AS_OF)
+    with pytest.raises(ValueError):
+        aging_category_filter("120+", as_of=AS_OF)
@@ -0,0 +1,55 @@
+"""
+Debt collection tests - تحصيل ديون المندوبين (services/debt_repository.py)
+"""
+
+from datetime import datetime
+
+import pytest
+
+from services.debt_repository import REP_COLLECTIONS_COLLECTION, REP_DEBTS_COLLECTION, DebtRepository
+
+pytestmark = pytest.mark.anyio
+
+COLLECTED_AT = datetime(2025, 6, 15, 12, 0)
+
+
+@pytest.fixture
+async def repository(db):
+    await db[REP_DEBTS_COLLECTION].insert_one(
+        {"id": "debt-1", "original_amount": 100.0, "paid_amount": 0.0, "outstanding_amount": 100.0, "status": "outstanding"}
+    )
+    return DebtRepository(db)
+
+
+def collection(amount: float, collection_id: str = "col-1", debt_id: str = "debt-1") -> dict:
+    return {"id": collection_id, "debt_id": debt_id, "collection_amount": amount,
+            "collection_date": COLLECTED_AT, "created_by": "rep-1"}
+
+
+async def record(repository: DebtRepository, entry: dict):
+    return await repository.record_collection(entry, paid_status="paid", partial_status="partial")
+
+
+async def test_partial_then_full_collection(repository, db):
+    debt = await record(repository, collection(40.0))
+    assert (debt["paid_amount"], debt["outstanding_amount"], debt["status"]) == (40.0, 60.0, "partial")
+
+    debt = await record(repository, collection(60.0, "col-2"))
+    assert (debt["outstanding_amount"], debt["status"]) == (0.0, "paid")
+    assert debt["payment_completion_date"] == COLLECTED_AT
+    assert await db[REP_COLLECTIONS_COLLECTION].count_documents({}) == 2
+
+
+async def test_overpayment_is_refused_and_leaves_no_collection(repository, db):
+    await record(repository, collection(70.0))
+
+    assert await record(repository, collection(50.0, "col-2")) is None
+
+    debt = await db[REP_DEBTS_COLLECTION].find_one({"id": "debt-1"})
+    assert (debt["paid_amount"], debt["outstanding_amount"]) == (70.0, 30.0)
+    assert [row["id"] async for row in db[REP_COLLECTIONS_COLLECTION].find({})] == ["col-1"]
+
+
+async def test_collection_for_a_missing_debt_is_rolled_back(repository, db):
+    assert await record(repository, collection(10.0, debt_id="gone")) is None
+    assert await db[REP_COLLECTIONS_COLLECTION].count_documents({}) == 0
@@ -0,0 +1,94 @@
+"""
+Financial rollup tests - ملخصات يومية للسجل المالي (services/financial_rollups.py)
+"""
+
+from datetime import date
+
+import pytest
+
+from services.financial_rollups import (
+    FINANCIAL_ROLLUPS_COLLECTION, rebuild_rollups, record_changed, rollup_match, totals_by_type_and_status
+)
+
+pytestmark = pytest.mark.anyio
+
+COUNTERS = ("count", "net_amount", "outstanding_amount", "large_outstanding_count", "large_outstanding_amount")
+
+
+def record(**fields) -> dict:
+    return {"id": "r1", "issue_date": "2025-06-15T10:30:00", "clinic_id": "c1", "clinic_name": "عيادة 1",
+            "sales_rep_id": "rep-1", "sales_rep_name": "مندوب", "record_type": "invoice", "status": "pending",
+            "net_amount": 500.0, "outstanding_amount": 500.0, **fields}
+
+
+async def cells(db) -> dict:
+    """الخلايا غير الفارغة - {(day, status): counters}"""
+    rows = await db[FINANCIAL_ROLLUPS_COLLECTION].find({}, {"_id": 0}).to_list(None)
+    return {(row["day"], row["status"]): tuple(row[field] for field in COUNTERS) for row in rows if row["count"]}
+
+
+async def test_insert_adds_the_record_to_its_day_cell(db):
+    await record_changed(db, None, record())
+    assert await cells(db) == {("2025-06-15", "pending"): (1, 500.0, 500.0, 0, 0.0)}
+
+
+async def test_update_moves_the_contribution_between_cells(db):
+    before = record()
+    await record_changed(db, None, before)
+    await record_changed(db, None, record(id="r2", net_amount=200.0, outstanding_amount=0.0, status="paid"))
+
+    after = record(status="paid", outstanding_amount=0.0)
+    await record_changed(db, before, after)
+
+    assert await cells(db) == {("2025-06-15", "paid"): (2, 700.0, 0.0, 0, 0.0)}
+
+
+async def test_amount_change_in_the_same_cell_is_a_single_delta(db):
+    before = record()
+    await record_changed(db, None, before)
+    await record_changed(db, before, record(outstanding_amount=1500.0, net_amount=1500.0))
+
+    assert await cells(db) == {("2025-06-15", "pending"): (1, 1500.0, 1500.0, 1, 1500.0)}
+
+
+async def test_delete_removes_the_contribution(db):
+    await record_changed(db, None, record(outstanding_amount=1200.0))
+    await record_changed(db, record(outstanding_amount=1200.0), None)
+    assert await cells(db) == {}
+
+
+async def test_unchanged_record_writes_nothing(db):
+    await record_changed(db, record(), record(notes="تعديل لا يمس الملخص"))
+    assert await db[FINANCIAL_ROLLUPS_COLLECTION].count_documents({}) == 0
+
+
+async def test_incremental_rollups_match_a_rebuild_from_the_ledger(db):
+    history = [
+        (None, record()),
+        (None, record(id="r2", issue_date="2025-06-16", status="overdue", outstanding_amount=2000.0)),
+        (record(), record(status="partial", outstanding_amount=300.0)),
+        (None, record(id="r3", record_type="payment", net_amount=200.0, outstanding_amount=0.0, status="paid")),
+    ]
+    for before, after in history:
+        await record_changed(db, before, after)
+    incremental = await cells(db)
+
+    await db.unified_financial_records.insert_many([
+        record(status="partial", outstanding_amount=300.0),
+        record(id="r2", issue_date="2025-06-16", status="overdue", outstanding_amount=2000.0),
+        record(id="r3", record_type="payment", net_amount=200.0, outstanding_amount=0.0, status="paid"),
+    ])
+    await rebuild_rollups(db)
+
+    assert await cells(db) == incremental
+
+
+async def test_totals_group_the_rollup_rows(db):
+    await record_changed(db, None, record())
+    await record_changed(db, None, record(id="r2", issue_date="2025-06-16"))
+    await record_changed(db, None, record(id="r3", issue_date="2025-07-01"))
+
+    rows = await totals_by_type_and_status(db, rollup_match(date(2025, 6, 1), date(2025, 6, 30)))
+
+    assert rows == [{"record_type": "invoice", "status": "pending", "count": 2,
+                     "net_amount": 1000.0, "outstanding_amount": 1000.0}]
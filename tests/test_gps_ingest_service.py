@@ -0,0 +1,114 @@
+"""
+GPS write buffer tests - استقبال مواقع GPS (services/gps_ingest_service.py)
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from services.gps_ingest_service import GPS_COLLECTION, GPSWriteBuffer, gps_document
+
+pytestmark = pytest.mark.anyio
+
+RECEIVED_AT = datetime(2025, 6, 15, 12, 0)
+
+
+def points(count: int, start: int = 0) -> list:
+    return [{"ts": RECEIVED_AT, "meta": {"user_id": "rep-1"}, "seq": start + i} for i in range(count)]
+
+
+class FlakyDatabase:
+    """قاعدة تفشل أو ترفض مستندات حسب الطلب - stands in for the Motor database"""
+
+    def __init__(self, failures=(), rejected: int = 0):
+        self.failures = list(failures)
+        self.rejected = rejected
+        self.inserted = []
+
+    def __getitem__(self, name):
+        assert name == GPS_COLLECTION
+        return self
+
+    async def insert_many(self, documents, ordered=True):
+        if self.failures:
+            raise self.failures.pop(0)
+        if self.rejected:
+            rejected, self.rejected = self.rejected, 0
+            self.inserted.extend(documents[rejected:])
+            raise BulkWriteError({"writeErrors": [{"index": i, "code": 121} for i in range(rejected)]})
+        self.inserted.extend(documents)
+
+
+def test_document_normalises_the_device_time():
+    aware = datetime(2025, 6, 15, 14, 0, tzinfo=timezone(timedelta(hours=2)))
+    document = gps_document("rep-1", {"latitude": 30.0, "longitude": 31.0, "timestamp": aware, "speed": 0.0},
+                            RECEIVED_AT)
+    assert document["ts"] == datetime(2025, 6, 15, 12, 0)
+    assert document["meta"] == {"user_id": "rep-1"}
+    assert document["speed"] == 0.0 and "accuracy" not in document
+
+
+@pytest.mark.parametrize("timestamp", [None, RECEIVED_AT + timedelta(minutes=6)])
+def test_missing_or_future_device_time_uses_the_receive_time(timestamp):
+    document = gps_document("rep-1", {"latitude": 30.0, "longitude": 31.0, "timestamp": timestamp}, RECEIVED_AT)
+    assert document["ts"] == RECEIVED_AT
+
+
+async def test_points_are_rejected_until_the_buffer_runs():
+    buffer = GPSWriteBuffer()
+    assert not await buffer.put_many(points(3))
+    assert buffer.stats["rejected"] == 3
+
+
+async def test_full_batches_flush_and_stop_flushes_the_rest():
+    db = FlakyDatabase()
+    buffer = GPSWriteBuffer(batch_size=4, flush_interval=60)
+    buffer.start(db)
+
+    assert await buffer.put_many(points(5))
+    await asyncio.sleep(0.05)
+    assert [point["seq"] for point in db.inserted] == [0, 1, 2, 3, 4]
+
+    assert await buffer.put_many(points(2, start=5))
+    await buffer.stop()
+    assert len(db.inserted) == 7
+    assert buffer.stats["accepted"] == buffer.stats["flushed"] == 7
+    assert buffer.pending == 0
+
+
+async def test_full_buffer_rejects_after_the_enqueue_timeout():
+    buffer = GPSWriteBuffer(capacity=4, batch_size=100, flush_interval=60, enqueue_timeout=0.01)
+    buffer.start(FlakyDatabase())
+
+    assert await buffer.put_many(points(3))
+    assert not await buffer.put_many(points(2))
+    assert not await buffer.put_many(points(5))
+    assert buffer.stats["rejected"] == 7 and buffer.pending == 3
+    await buffer.stop()
+
+
+async def test_failed_flush_keeps_the_points_in_order_and_retries():
+    db = FlakyDatabase(failures=[AutoReconnect("primary stepped down")])
+    buffer = GPSWriteBuffer(batch_size=2, flush_interval=0.01, max_backoff=0.01)
+    buffer.start(db)
+
+    assert await buffer.put_many(points(3))
+    await asyncio.sleep(0.2)
+
+    assert [point["seq"] for point in db.inserted] == [0, 1, 2]
+    assert buffer.stats["failed_flushes"] == 1 and buffer.stats["flushed"] == 3
+    await buffer.stop()
+
+
+async def test_documents_mongodb_rejects_are_dropped_and_counted():
+    db = FlakyDatabase(rejected=2)
+    buffer = GPSWriteBuffer(batch_size=5, flush_interval=60)
+    buffer.start(db)
+
+    assert await buffer.put_many(points(5))
+    await buffer.stop()
+
+    assert (buffer.stats["flushed"], buffer.stats["dropped"]) == (3, 2)
+    assert buffer.pending == 0
@@ -0,0 +1,32 @@
+"""
+Import row tests - صفوف استيراد Excel (models/import_models.py)
+"""
+
+import pytest
+from pydantic import ValidationError
+
+from models.clinic_models import ClinicClassification
+from models.import_models import ClinicImportRow, UserImportRow
+
+
+def test_rows_read_the_template_headers_and_domain_defaults():
+    row = ClinicImportRow(**{"اسم العيادة": " عيادة 1 ", "هاتف العيادة": 1234567890.0, "اسم الطبيب": "د. أحمد"})
+
+    assert row.model_dump(exclude_unset=True) == {"name": "عيادة 1", "phone": "1234567890", "doctor_name": "د. أحمد"}
+    assert row.classification == ClinicClassification.NEW
+
+
+def test_only_the_required_columns_must_be_present():
+    # العنوان مطلوب في نموذج العيادة لكنه اختياري عند تحديث عمود واحد
+    assert ClinicImportRow(name="عيادة 1").address is None
+    with pytest.raises(ValidationError):
+        ClinicImportRow(**{"هاتف العيادة": "0100"})
+
+
+def test_user_rows_validate_role_and_active_flag():
+    row = UserImportRow(**{"اسم المستخدم": "ahmed", "الاسم الكامل": "أحمد", "الدور": "admin", "نشط": "لا"})
+    assert (row.role, row.is_active) == ("admin", False)
+    assert UserImportRow(username="sara", full_name="سارة", role="admin").is_active is True
+
+    with pytest.raises(ValidationError, match="Unknown role"):
+        UserImportRow(username="x", full_name="x", role="nobody")
@@ -0,0 +1,80 @@
+"""
+Integrity check tests - فحص سلامة البيانات المالية (services/integrity_checker.py)
+"""
+
+import pytest
+from bson import Decimal128
+
+from services.integrity_checker import check_debt_balance, check_invoice_total
+
+
+def money(amount) -> dict:
+    return {"amount": Decimal128(str(amount)), "currency": "EGP"}
+
+
+def invoice(total, *line_items) -> dict:
+    return {"id": "inv-1", "invoice_number": "INV-000001", "total_amount": money(total), "line_items": list(line_items)}
+
+
+# 2 x 100 = 200، خصم 10% = 180، ضريبة 14% = 205.20
+DISCOUNTED_LINE = {"quantity": 2, "unit_price": money("100.00"), "discount_percentage": 10}
+
+
+@pytest.mark.parametrize("stored", ["205.20", "205.21", "205.19"])
+def test_invoice_total_within_tolerance_passes(stored):
+    assert check_invoice_total(invoice(stored, DISCOUNTED_LINE)) is None
+
+
+def test_invoice_total_mismatch_is_reported():
+    issue = check_invoice_total(invoice("200.00", DISCOUNTED_LINE))
+    assert issue == {
+        "type": "invoice_total_mismatch",
+        "invoice_id": "inv-1",
+        "invoice_number": "INV-000001",
+        "stored_total": 200.0,
+        "calculated_total": 205.2
+    }
+
+
+def test_invoice_discount_amount_applies_without_percentage():
+    # 3 x 50 = 150، خصم 30 = 120، ضريبة = 136.80
+    line = {"quantity": 3, "unit_price": money("50.00"), "discount_amount": money("30.00")}
+    assert check_invoice_total(invoice("136.80", line)) is None
+    assert check_invoice_total(invoice("171.00", line))["calculated_total"] == 136.8
+
+
+def test_invoice_without_line_items_must_be_zero():
+    assert check_invoice_total(invoice("0.00")) is None
+    assert check_invoice_total(invoice("10.00"))["calculated_total"] == 0.0
+
+
+def integrated_debt(outstanding, *payments) -> dict:
+    return {
+        "id": "debt-1",
+        "debt_number": "DBT-000001",
+        "original_amount": money("1000.00"),
+        "outstanding_amount": money(outstanding),
+        "payments": [{"amount": money(amount)} for amount in payments]
+    }
+
+
+def test_integrated_debt_balance_matches_its_payments():
+    assert check_debt_balance(integrated_debt("650.00", "250.00", "100.00")) is None
+    assert check_debt_balance(integrated_debt("1000.00")) is None
+
+
+def test_integrated_debt_balance_mismatch_is_reported():
+    issue = check_debt_balance(integrated_debt("700.00", "250.00", "100.00"))
+    assert issue == {
+        "type": "debt_balance_mismatch",
+        "debt_id": "debt-1",
+        "debt_number": "DBT-000001",
+        "expected_outstanding": 650.0,
+        "actual_outstanding": 700.0
+    }
+
+
+@pytest.mark.parametrize("remaining, consistent", [("400.00", True), ("400.01", True), ("400.02", False)])
+def test_legacy_debt_balance_uses_paid_and_remaining(remaining, consistent):
+    debt = {"id": "debt-2", "original_amount": 1000, "paid_amount": 600, "remaining_amount": remaining}
+    assert (check_debt_balance(debt) is None) == consistent
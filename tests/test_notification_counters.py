@@ -0,0 +1,100 @@
+"""
+Unread counter tests - عدادات الإشعارات غير المقروءة (services/notification_counters.py)
+"""
+
+import pytest
+
+from indexes import INDEX_REGISTRY
+from services.notification_bus import ConnectionRegistry, NotificationBus
+from services.notification_counters import NOTIFICATION_COUNTERS_COLLECTION, UnreadCounters
+
+pytestmark = pytest.mark.anyio
+
+
+class RecordingBus(NotificationBus):
+    """ناقل يسجل الرسائل بدل إرسالها"""
+
+    def __init__(self):
+        super().__init__(ConnectionRegistry())
+        self.published = []
+
+    async def publish(self, deliveries):
+        self.published.extend(deliveries)
+
+
+@pytest.fixture
+async def counters(db):
+    await db[NOTIFICATION_COUNTERS_COLLECTION].create_indexes(
+        [spec.to_index_model() for spec in INDEX_REGISTRY[NOTIFICATION_COUNTERS_COLLECTION]]
+    )
+    await db.notifications.insert_many([
+        {"id": "n1", "recipient_id": "u1", "status": "unread"},
+        {"id": "n2", "recipient_id": "u1", "status": "unread"},
+        {"id": "n3", "recipient_id": "u1", "status": "read"},
+        {"id": "n4", "recipient_id": "u2", "status": "unread"},
+    ])
+    return UnreadCounters(db, bus=RecordingBus())
+
+
+async def stored(db, user_id: str):
+    counter = await db[NOTIFICATION_COUNTERS_COLLECTION].find_one({"user_id": user_id})
+    return counter and counter["unread"]
+
+
+async def test_missing_counter_is_initialised_from_the_notifications(counters, db):
+    assert await counters.get("u1") == 2
+    assert await stored(db, "u1") == 2
+    assert await counters.get("nobody") == 0
+
+
+async def test_add_adjusts_and_pushes_the_new_value(counters, db):
+    await counters.get("u1")
+
+    assert await counters.add("u1", 1) == 3
+    assert await counters.add("u1", -2) == 1
+    assert await stored(db, "u1") == 1
+    assert counters.bus.published[-1] == ("u1", {"event": "unread_count", "unread_count": 1})
+
+
+async def test_add_on_a_missing_counter_counts_the_write_once(counters, db):
+    # الإشعار كُتب قبل العداد - the initial count already includes it
+    await db.notifications.insert_one({"id": "n5", "recipient_id": "u2", "status": "unread"})
+    assert await counters.add("u2", 1) == 2
+    assert await stored(db, "u2") == 2
+
+
+async def test_add_many_counts_repeated_recipients(counters, db):
+    await counters.get("u1")
+    await db.notifications.insert_many([
+        {"id": "n5", "recipient_id": "u1", "status": "unread"},
+        {"id": "n6", "recipient_id": "u1", "status": "unread"},
+        {"id": "n7", "recipient_id": "u2", "status": "unread"},
+    ])
+
+    await counters.add_many(["u1", "u1", "u2"])
+
+    assert await stored(db, "u1") == 4
+    # u2 had no counter: initialised from the notifications, which already hold the new one
+    assert await stored(db, "u2") == 2
+    assert dict(counters.bus.published) == {
+        "u1": {"event": "unread_count", "unread_count": 4},
+        "u2": {"event": "unread_count", "unread_count": 2},
+    }
+
+
+async def test_negative_drift_is_never_reported(counters, db):
+    await db[NOTIFICATION_COUNTERS_COLLECTION].insert_one({"user_id": "u3", "unread": -2})
+    assert await counters.get("u3") == 0
+
+
+async def test_reconcile_corrects_only_drifted_counters(counters, db):
+    await db[NOTIFICATION_COUNTERS_COLLECTION].insert_many([
+        {"user_id": "u1", "unread": 2},
+        {"user_id": "u2", "unread": 7},
+        {"user_id": "gone", "unread": 3},
+    ])
+
+    report = await counters.reconcile()
+
+    assert report == {"counters": 3, "users_with_unread": 2, "corrected": 2}
+    assert (await stored(db, "u1"), await stored(db, "u2"), await stored(db, "gone")) == (2, 1, 0)
@@ -0,0 +1,79 @@
+"""
+Keyset pagination tests - ترقيم الصفحات بالمؤشر (services/pagination.py)
+"""
+
+from datetime import datetime
+
+import pytest
+
+from services.pagination import decode_cursor, encode_cursor, paginate, with_tiebreaker
+
+pytestmark = pytest.mark.anyio
+
+# قيم ترتيب مكررة وفارغة ومفقودة
+SORT_VALUES = [
+    datetime(2025, 1, 3), None, datetime(2025, 1, 1), datetime(2025, 1, 3), None,
+    datetime(2025, 1, 2), datetime(2025, 1, 3), "missing", datetime(2025, 1, 1), None
+]
+
+
+async def seed(db):
+    for i, value in enumerate(SORT_VALUES):
+        document = {"number": i}
+        if value != "missing":
+            document["created_at"] = value
+        await db.items.insert_one(document)
+
+
+async def walk(db, sort, limit):
+    """كل الصفحات بالمؤشر - returns the numbers in page order"""
+    numbers, cursor, pages = [], None, 0
+    while True:
+        page = await paginate(db.items, {}, sort, limit, cursor=cursor, total="none")
+        numbers += [item["number"] for item in page["items"]]
+        pages += 1
+        assert pages <= len(SORT_VALUES), "cursor did not advance"
+        if not page["has_more"]:
+            return numbers
+        cursor = page["next_cursor"]
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+@pytest.mark.parametrize("limit", [1, 2, 3, 4])
+async def test_cursor_pages_cover_nulls_and_duplicates_once(db, direction, limit):
+    await seed(db)
+    sort = [("created_at", direction)]
+    expected = [item["number"] for item in await db.items.find().sort(with_tiebreaker(sort)).to_list(None)]
+
+    numbers = await walk(db, sort, limit)
+
+    assert numbers == expected
+    assert sorted(numbers) == list(range(len(SORT_VALUES)))
+
+
+async def test_cursor_pages_respect_the_query(db):
+    await seed(db)
+    page = await paginate(db.items, {"number": {"$gte": 5}}, [("created_at", -1)], 2, total="exact")
+    assert page["total_count"] == 5
+    rest = await paginate(db.items, {"number": {"$gte": 5}}, [("created_at", -1)], 10,
+                          cursor=page["next_cursor"], total="none")
+    numbers = [item["number"] for item in page["items"] + rest["items"]]
+    assert sorted(numbers) == [5, 6, 7, 8, 9]
+
+
+async def test_projection_hides_sort_fields_it_did_not_ask_for(db):
+    await seed(db)
+    page = await paginate(db.items, {}, [("created_at", -1)], 3, projection={"_id": 0, "number": 1})
+    assert all(set(item) == {"number"} for item in page["items"])
+    assert page["next_cursor"]
+
+
+def test_cursor_round_trips_datetimes_and_nulls():
+    values = [datetime(2025, 1, 3, 12, 30), None, 7]
+    assert decode_cursor(encode_cursor(values), 3) == values
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor([1])])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 2)
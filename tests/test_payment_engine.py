@@ -0,0 +1,150 @@
+"""
+Payment engine tests - ترحيل دفعات الديون (services/payment_engine.py)
+"""
+
+import asyncio
+from decimal import Decimal
+
+import pytest
+from bson import Decimal128
+
+from services import payment_engine
+from services.payment_engine import IdempotencyConflict, PaymentEngine
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def standalone_server(monkeypatch):
+    # بدون جلسات - the standalone commit-point path
+    monkeypatch.setattr(payment_engine, "PAYMENT_TRANSACTIONS", "off")
+
+
+async def create_debt(db, outstanding: str = "100.00", debt_id: str = "debt-1") -> dict:
+    debt = {
+        "id": debt_id,
+        "debt_number": "DBT-000001",
+        "invoice_id": None,
+        "status": "pending",
+        "original_amount": {"amount": Decimal128(outstanding), "currency": "EGP"},
+        "paid_amount": {"amount": Decimal128("0.00"), "currency": "EGP"},
+        "outstanding_amount": {"amount": Decimal128(outstanding), "currency": "EGP"},
+        "payments": [],
+        "audit_trail": []
+    }
+    await db.debts.insert_one(dict(debt))
+    return debt
+
+
+async def outstanding(db, debt_id: str = "debt-1") -> Decimal:
+    debt = await db.debts.find_one({"id": debt_id})
+    return debt["outstanding_amount"]["amount"].to_decimal()
+
+
+async def record_payment(db, idempotency_key: str):
+    """دفعة سابقة بقيمة 25 على debt-1 مسجلة بمفتاح تكرار"""
+    await db.payments.insert_one({
+        "id": "pay-1", "payment_number": "PAY-000001", "debt_id": "debt-1",
+        "amount": {"amount": Decimal128("25.00"), "currency": "EGP"}, "idempotency_key": idempotency_key
+    })
+
+
+@pytest.mark.mongodb
+async def test_partial_then_full_payment_updates_status(db):
+    await create_debt(db)
+    engine = PaymentEngine(db)
+
+    first = await engine.post_debt_payment("debt-1", Decimal("40"), "cash", "user-1")
+    assert first["remaining_amount"] == 60.0 and not first["fully_paid"]
+    assert (await db.debts.find_one({"id": "debt-1"}))["status"] == "partially_collected"
+
+    second = await engine.post_debt_payment("debt-1", Decimal("60"), "cash", "user-1")
+    assert second["fully_paid"]
+    debt = await db.debts.find_one({"id": "debt-1"})
+    assert debt["status"] == "collected"
+    assert len(debt["payments"]) == 2
+    assert await db.financial_transactions.count_documents({"debt_id": "debt-1"}) == 2
+
+
+async def test_idempotent_replay_returns_original_payment(db):
+    await create_debt(db, outstanding="75.00")
+    await record_payment(db, "key-1")
+
+    replayed = await PaymentEngine(db).post_debt_payment(
+        "debt-1", Decimal("25"), "cash", "user-1", idempotency_key="key-1"
+    )
+
+    assert replayed["replayed"]
+    assert replayed["payment_id"] == "pay-1"
+    assert replayed["remaining_amount"] == 75.0
+    assert await db.payments.count_documents({}) == 1
+    assert await outstanding(db) == Decimal("75.00")
+
+
+@pytest.mark.parametrize("debt_id, amount", [("debt-1", "30"), ("debt-2", "25")])
+async def test_idempotency_key_reused_for_another_payment_conflicts(db, debt_id, amount):
+    await create_debt(db)
+    await create_debt(db, debt_id="debt-2")
+    await record_payment(db, "key-1")
+
+    with pytest.raises(IdempotencyConflict):
+        await PaymentEngine(db).post_debt_payment(debt_id, Decimal(amount), "cash", "user-1", idempotency_key="key-1")
+    assert await db.payments.count_documents({}) == 1
+
+
+@pytest.mark.mongodb
+async def test_concurrent_payments_never_overpay(db):
+    await create_debt(db)
+    engine = PaymentEngine(db)
+
+    results = await asyncio.gather(
+        *[engine.post_debt_payment("debt-1", Decimal("60"), "cash", f"user-{i}") for i in range(2)],
+        return_exceptions=True
+    )
+
+    succeeded = [result for result in results if isinstance(result, dict)]
+    rejected = [result for result in results if isinstance(result, ValueError)]
+    assert len(succeeded) == 1 and len(rejected) == 1
+    assert await outstanding(db) == Decimal("40.00")
+    assert await db.payments.count_documents({}) == 1
+    assert await db.financial_transactions.count_documents({}) == 1
+
+
+async def test_overpayment_is_rejected_before_writing(db):
+    await create_debt(db)
+
+    with pytest.raises(ValueError):
+        await PaymentEngine(db).post_debt_payment("debt-1", Decimal("100.01"), "cash", "user-1")
+    assert await db.payments.count_documents({}) == 0
+    assert await outstanding(db) == Decimal("100.00")
+
+
+def apply_documents(amount: str) -> tuple:
+    payment_doc = {"id": "pay-1", "amount": {"amount": Decimal128(amount)}, "audit_trail": [], "payment_date": None}
+    return payment_doc, {"id": "txn-1", "payment_id": "pay-1"}
+
+
+async def assert_rolled_back(db):
+    assert await db.payments.count_documents({}) == 0
+    assert await db.financial_transactions.count_documents({}) == 0
+
+
+async def test_standalone_rollback_when_the_debt_disappears(db):
+    # الدين حُذف بعد الفحص المسبق - the debt update matches nothing
+    debt = await create_debt(db)
+    await db.debts.delete_one({"id": "debt-1"})
+
+    with pytest.raises(ValueError):
+        await PaymentEngine(db)._apply(debt, *apply_documents("10.00"), None)
+    await assert_rolled_back(db)
+
+
+@pytest.mark.mongodb
+async def test_standalone_rollback_when_the_balance_no_longer_covers_the_payment(db):
+    # الرصيد تغير بعد الفحص المسبق - the guarded debt update is the commit point
+    debt = await create_debt(db, outstanding="50.00")
+
+    with pytest.raises(ValueError):
+        await PaymentEngine(db)._apply(debt, *apply_documents("80.00"), None)
+    await assert_rolled_back(db)
+    assert await outstanding(db) == Decimal("50.00")